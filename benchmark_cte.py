@@ -0,0 +1,481 @@
+import os
+import sys
+import json
+import base64
+import time
+import random
+import statistics
+import shutil
+import zipfile
+import argparse
+import builtins
+import platform
+import tempfile
+import subprocess
+
+from paralelo_cte import TAMANHO_BLOCO_PADRAO
+from destino_cte import MAX_ZIPS_ABERTOS
+from entrada_cte import contar_entradas
+from separacao_cte import SeparadorCte
+from particoes_cte import LEIAUTES_DATA, LEIAUTE_DATA_PADRAO, TAMANHO_LOTE
+from compactador_cte import listar_lotes, compactar_em_paralelo, interpretar_compressao, NIVEL_COMPRESSAO_PADRAO
+
+NS_CTE = 'http://www.portalfiscal.inf.br/cte'
+NS_ASSINATURA = 'http://www.w3.org/2000/09/xmldsig#'
+
+# Cada separador: grupo do CNPJ, partição (ver separacao_cte.PARTICIONAMENTOS) e prefixo dos lotes compactados
+# (igual aos scripts)
+SEPARADORES = {
+    'emitente': ('emit', 'data', '20'),
+    'tomador': ('receb', 'lote', 'lote_'),
+}
+# Scripts cuja partida é medida, e módulos que não devem ser carregados só para começar (interface, pool de
+# processos, Parquet): aparecem na medição quando voltam a ser importados no topo de algum módulo
+SCRIPTS = ('separador_cte_emitente_linear', 'separador_cte_tomador_linear', 'separador_cte_visoes')
+MODULOS_PESADOS = ('tqdm', 'win32api', 'win32con', 'win32gui', 'ctypes', 'multiprocessing', 'pyarrow')
+# `python <script> --help` em um processo novo, do início ao fim
+ORCAMENTO_INICIALIZACAO_S = 0.3
+
+# ---------------------------------------------------------------- corpus sintético
+
+def _cnpj(rng):
+    return f"{rng.randrange(10**13, 10**14):014d}"
+
+def _chave(rng, cnpj, data, numero):
+    return f"35{data[2:4]}{data[5:7]}{cnpj}57001{numero:09d}1{rng.randrange(10**8):08d}" + str(rng.randrange(10))
+
+def montar_cte(rng, numero, cnpjs, data, nfes, tamanho_assinatura, chave=None):
+    """Monta um cteProc 4.00 com as partes, nfes chaves de NF-e e assinatura de tamanho_assinatura bytes"""
+    emit, rem, exped, receb, dest, outro = (rng.choice(cnpjs) for _ in range(6))
+    chave = chave or _chave(rng, emit, data, numero)
+    codigo_toma = rng.choice('01234')
+    if codigo_toma == '4':
+        toma = f"<toma4><toma>4</toma><CNPJ>{outro}</CNPJ><xNome>TOMADOR {numero}</xNome></toma4>"
+    else:
+        toma = f"<toma3><toma>{codigo_toma}</toma></toma3>"
+    exped = f"<exped><CNPJ>{exped}</CNPJ><xNome>EXPEDIDOR</xNome></exped>" if rng.random() < 0.3 else ""
+    documentos = "".join(f"<infNFe><chave>{rng.randrange(10**43, 10**44)}</chave></infNFe>" for _ in range(nfes))
+    assinatura = base64.b64encode(rng.randbytes(tamanho_assinatura * 3 // 4 + 3)).decode()[:tamanho_assinatura]
+    return (f'<?xml version="1.0" encoding="UTF-8"?>'
+            f'<cteProc xmlns="{NS_CTE}" versao="4.00"><CTe xmlns="{NS_CTE}">'
+            f'<infCte Id="CTe{chave}" versao="4.00"><ide><cUF>35</cUF><cCT>{numero % 10**8:08d}</cCT>'
+            f'<CFOP>5353</CFOP><natOp>PRESTACAO DE SERVICO DE TRANSPORTE</natOp><mod>57</mod><serie>1</serie>'
+            f'<nCT>{numero}</nCT><dhEmi>{data}T{rng.randrange(24):02d}:{rng.randrange(60):02d}:00-03:00</dhEmi>'
+            f'<tpImp>1</tpImp><tpEmis>1</tpEmis><tpAmb>1</tpAmb><tpCTe>0</tpCTe><modal>01</modal>'
+            f'<tpServ>0</tpServ><UFIni>SP</UFIni><UFFim>RJ</UFFim>{toma}</ide>'
+            f'<emit><CNPJ>{emit}</CNPJ><IE>123456789</IE><xNome>EMITENTE {emit}</xNome>'
+            f'<enderEmit><xLgr>RUA A</xLgr><nro>1</nro><xMun>SAO PAULO</xMun><UF>SP</UF></enderEmit></emit>'
+            f'<rem><CNPJ>{rem}</CNPJ><xNome>REMETENTE</xNome></rem>{exped}'
+            f'<receb><CNPJ>{receb}</CNPJ><xNome>RECEBEDOR</xNome></receb>'
+            f'<dest><CNPJ>{dest}</CNPJ><xNome>DESTINATARIO</xNome></dest>'
+            f'<vPrest><vTPrest>{rng.randrange(10**5) / 100:.2f}</vTPrest><vRec>0.00</vRec></vPrest>'
+            f'<imp><ICMS><ICMS00><CST>00</CST><vBC>0.00</vBC><pICMS>12.00</pICMS><vICMS>0.00</vICMS></ICMS00>'
+            f'</ICMS></imp><infCTeNorm><infCarga><vCarga>0.00</vCarga><proPred>DIVERSOS</proPred></infCarga>'
+            f'<infDoc>{documentos}</infDoc></infCTeNorm></infCte>'
+            f'<Signature xmlns="{NS_ASSINATURA}"><SignedInfo/><SignatureValue>{assinatura}</SignatureValue>'
+            f'</Signature></CTe><protCTe versao="4.00"><infProt><tpAmb>1</tpAmb><chCTe>{chave}</chCTe>'
+            f'<cStat>100</cStat><xMotivo>Autorizado o uso do CT-e</xMotivo></infProt></protCTe></cteProc>')
+
+# Eventos de CT-e sorteados no corpus: código, descrição
+TIPOS_EVENTO = (('110111', 'Cancelamento'), ('110110', 'Carta de Correcao'), ('110180', 'Comprovante de Entrega'))
+
+def montar_evento(rng, chave, tamanho_assinatura):
+    """Monta um procEventoCTe 4.00 (cancelamento, carta de correção...) do CT-e da chave"""
+    codigo, descricao = rng.choice(TIPOS_EVENTO)
+    assinatura = base64.b64encode(rng.randbytes(tamanho_assinatura * 3 // 4 + 3)).decode()[:tamanho_assinatura]
+    return codigo, (f'<?xml version="1.0" encoding="UTF-8"?>'
+                    f'<procEventoCTe xmlns="{NS_CTE}" versao="4.00"><eventoCTe xmlns="{NS_CTE}" versao="4.00">'
+                    f'<infEvento Id="ID{codigo}{chave}01"><cOrgao>35</cOrgao><tpAmb>1</tpAmb>'
+                    f'<CNPJ>{chave[6:20]}</CNPJ><chCTe>{chave}</chCTe><dhEvento>2025-01-01T10:00:00-03:00</dhEvento>'
+                    f'<tpEvento>{codigo}</tpEvento><nSeqEvento>1</nSeqEvento><detEvento versaoEvento="4.00">'
+                    f'<evCTe><descEvento>{descricao}</descEvento></evCTe></detEvento></infEvento>'
+                    f'<Signature xmlns="{NS_ASSINATURA}"><SignedInfo/><SignatureValue>{assinatura}</SignatureValue>'
+                    f'</Signature></eventoCTe><retEventoCTe versao="4.00"><infEvento><tpAmb>1</tpAmb>'
+                    f'<cStat>135</cStat><chCTe>{chave}</chCTe></infEvento></retEventoCTe></procEventoCTe>')
+
+def gerar_corpus(pasta, quantidade, cnpjs=50, dias=30, duplicados=0.02, invalidos=0.005, nfes=3,
+                 tamanho_assinatura=344, fracao_zip=0.0, subpastas=10, semente=0, eventos=0.0):
+    """
+    Gera quantidade arquivos de CT-e 4.00 sintéticos em pasta (reprodutível pela semente).
+    :param cnpjs: Quantidade de CNPJs distintos sorteados para as partes
+    :param dias: Datas de emissão espalhadas por esse número de dias
+    :param duplicados: Fração de cópias (metade idênticas com outro nome de pasta, metade com a chave
+                       repetida e conteúdo diferente)
+    :param invalidos: Fração de arquivos malformados (XML truncado ou sem infCte)
+    :param nfes: Chaves de NF-e em infDoc por CT-e
+    :param tamanho_assinatura: Bytes de SignatureValue
+    :param fracao_zip: Fração dos XMLs gravada dentro de ZIPs na origem em vez de soltos
+    :param eventos: Fração de eventos (procEventoCTe) de CT-es já gerados, como nas pastas baixadas da SEFAZ
+    :return: dict com quantidades e bytes gerados
+    """
+    rng = random.Random(semente)
+    lista_cnpjs = [_cnpj(rng) for _ in range(max(1, cnpjs))]
+    datas = [time.strftime('%Y-%m-%d', time.gmtime(1735700000 + 86400 * dia)) for dia in range(max(1, dias))]
+    pastas = [os.path.join(pasta, f"lote_origem_{i}") for i in range(max(1, subpastas))]
+    for p in pastas:
+        os.makedirs(p, exist_ok=True)
+
+    gerados = []  # (nome, conteúdo) a gravar
+    resumo = {'arquivos': 0, 'bytes': 0, 'duplicados': 0, 'invalidos': 0, 'eventos': 0, 'em_zip': 0}
+    anteriores = []
+    for numero in range(1, quantidade + 1):
+        sorteio = rng.random()
+        if sorteio < invalidos:
+            conteudo = rng.choice([f'<?xml version="1.0"?><cteProc xmlns="{NS_CTE}"><CTe><infCte',
+                                   '<?xml version="1.0"?><nada/>', ''])
+            gerados.append((f"invalido_{numero}.xml", conteudo))
+            resumo['invalidos'] += 1
+        elif sorteio < invalidos + duplicados and anteriores:
+            nome, conteudo, chave, data = rng.choice(anteriores)
+            if rng.random() < 0.5:
+                # Mesma chave, conteúdo diferente (ex.: XML baixado de novo com outro protocolo)
+                conteudo = montar_cte(rng, numero, lista_cnpjs, data, nfes, tamanho_assinatura, chave)
+            gerados.append((nome, conteudo))
+            resumo['duplicados'] += 1
+        elif sorteio < invalidos + duplicados + eventos and anteriores:
+            chave = rng.choice(anteriores)[2]
+            codigo, conteudo = montar_evento(rng, chave, tamanho_assinatura)
+            gerados.append((f"{chave}_{codigo}_01-procEventoCTe.xml", conteudo))
+            resumo['eventos'] += 1
+        else:
+            data = rng.choice(datas)
+            chave = _chave(rng, rng.choice(lista_cnpjs), data, numero)
+            conteudo = montar_cte(rng, numero, lista_cnpjs, data, nfes, tamanho_assinatura, chave)
+            gerado = (f"{chave}-cte.xml", conteudo, chave, data)
+            # Amostra limitada dos já gerados, de onde saem os duplicados
+            if len(anteriores) < 1000:
+                anteriores.append(gerado)
+            else:
+                anteriores[rng.randrange(1000)] = gerado
+            gerados.append(gerado[:2])
+
+    zips = {}  # caminho do ZIP -> (ZipFile, nomes já gravados)
+    for indice, (nome, conteudo) in enumerate(gerados):
+        dados = conteudo.encode('utf-8')
+        pasta_arquivo = pastas[indice % len(pastas)]
+        if rng.random() < fracao_zip:
+            caminho_zip = os.path.join(pasta_arquivo, "pacote.zip")
+            if caminho_zip not in zips:
+                zips[caminho_zip] = (zipfile.ZipFile(caminho_zip, 'w', zipfile.ZIP_DEFLATED), set())
+            zipf, membros = zips[caminho_zip]
+            membro = nome if nome not in membros else f"{indice}_{nome}"
+            membros.add(membro)
+            zipf.writestr(membro, dados)
+            resumo['em_zip'] += 1
+        else:
+            caminho = os.path.join(pasta_arquivo, nome)
+            if os.path.exists(caminho):
+                caminho = os.path.join(pasta_arquivo, f"{indice}_{nome}")
+            with open(caminho, 'wb') as f:
+                f.write(dados)
+        resumo['arquivos'] += 1
+        resumo['bytes'] += len(dados)
+    for zipf, _ in zips.values():
+        zipf.close()
+    return resumo
+
+# ---------------------------------------------------------------- medição
+
+def _rss_pico_kb():
+    """Pico de memória (RSS) deste processo e dos workers já encerrados, em KB (None fora do Unix)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    proprio = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    filhos = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if sys.platform == 'darwin':  # macOS informa em bytes
+        proprio, filhos = proprio // 1024, filhos // 1024
+    return max(proprio, filhos)
+
+class LatenciaSimulada:
+    """
+    Compartilhamento de rede simulado na pasta local: enquanto ativo (with), cada chamada de open e das
+    funções de os em FUNCOES espera `segundos` antes de executar, como uma ida e volta SMB/NFS.
+    A espera libera o GIL, então operações em threads diferentes se sobrepõem como na rede
+    (ver executor_io_cte). Afeta o processo inteiro: usar só em volta da etapa medida.
+    """
+
+    FUNCOES = ('open', 'stat', 'lstat', 'scandir', 'mkdir', 'replace', 'rename', 'remove', 'link', 'utime')
+
+    def __init__(self, segundos):
+        self.segundos = segundos
+        self.originais = {}
+
+    def _atrasar(self, funcao):
+        segundos = self.segundos
+
+        def atrasada(*args, **kwargs):
+            time.sleep(segundos)
+            return funcao(*args, **kwargs)
+        return atrasada
+
+    def __enter__(self):
+        if self.segundos > 0:
+            for nome in self.FUNCOES:
+                self.originais[(os, nome)] = getattr(os, nome)
+            self.originais[(builtins, 'open')] = builtins.open
+            for (modulo, nome), funcao in self.originais.items():
+                setattr(modulo, nome, self._atrasar(funcao))
+        return self
+
+    def __exit__(self, *_):
+        for (modulo, nome), funcao in self.originais.items():
+            setattr(modulo, nome, funcao)
+        self.originais = {}
+        return False
+
+class Cronometro:
+    """Acumula o resultado de cada etapa: tempo, arquivos/s, MB/s e pico de RSS ao final dela"""
+
+    def __init__(self):
+        self.etapas = {}
+
+    def medir(self, nome, funcao, arquivos=None, bytes_=None):
+        inicio = time.perf_counter()
+        retorno = funcao()
+        segundos = time.perf_counter() - inicio
+        if callable(arquivos):
+            arquivos = arquivos(retorno)
+        if callable(bytes_):
+            bytes_ = bytes_(retorno)
+        etapa = {'segundos': round(segundos, 4)}
+        if arquivos is not None:
+            etapa['arquivos'] = arquivos
+            etapa['arquivos_s'] = round(arquivos / segundos, 1) if segundos > 0 else None
+        if bytes_ is not None:
+            etapa['mb_s'] = round(bytes_ / 1048576 / segundos, 2) if segundos > 0 else None
+        etapa['rss_pico_kb'] = _rss_pico_kb()
+        self.etapas[nome] = etapa
+        return retorno
+
+def executar_benchmark(pasta, separador='emitente', processos=1, tamanho_bloco=TAMANHO_BLOCO_PADRAO,
+                       leitura_rapida=False, direto_zip=False, compressao=NIVEL_COMPRESSAO_PADRAO,
+                       processos_compactacao=None, threads_io=0, latencia_ms=0, zips_abertos=MAX_ZIPS_ABERTOS,
+                       leiaute_data=LEIAUTE_DATA_PADRAO, max_arquivos_lote=TAMANHO_LOTE, max_bytes_lote=None,
+                       catalogar=True):
+    """
+    Executa as etapas do separador sobre o corpus em pasta/origem, sem interface:
+    varredura, separação, relatório e compactação.
+    A separação é a dos scripts (SeparadorCte, ver separacao_cte), com as mesmas opções: lotes por CNPJ,
+    diário, catálogo, pasta de erros por motivo e destino em pastas ou direto nos ZIPs. Leitura (parse) e
+    movimentação acontecem juntas, como nos scripts; o tempo de cada uma fica em 'operacoes'.
+    :param threads_io: Threads que movem os arquivos (ver executor_io_cte; 0 = no laço principal)
+    :param latencia_ms: Latência simulada em cada operação de disco da separação (ver LatenciaSimulada)
+    :return: dict de etapas (ver Cronometro)
+    """
+    tag, particao, prefixo = SEPARADORES[separador]
+    origem = os.path.join(pasta, "origem")
+    destino_pasta = os.path.join(pasta, "destino")
+    os.makedirs(destino_pasta, exist_ok=True)
+    cronometro = Cronometro()
+
+    total = cronometro.medir('varredura', lambda: contar_entradas(origem), arquivos=lambda n: n)
+
+    motor = SeparadorCte(origem, destino_pasta, tag, particao, pasta_erros=os.path.join(pasta, "erros"),
+                         pasta_duplicados=os.path.join(pasta, "duplicados"), processos=processos,
+                         tamanho_bloco=tamanho_bloco, leitura_rapida=leitura_rapida, direto_zip=direto_zip,
+                         zips_abertos=zips_abertos, compressao=compressao, threads_io=threads_io,
+                         leiaute_data=leiaute_data, max_arquivos_lote=max_arquivos_lote,
+                         max_bytes_lote=max_bytes_lote, catalogar=catalogar)
+    try:
+        with LatenciaSimulada(latencia_ms / 1000):
+            resultado = cronometro.medir('separacao', motor.separar, arquivos=lambda r: r.encontrados,
+                                         bytes_=lambda r: r.manifesto.total_bytes)
+    finally:
+        motor.fechar()
+    manifesto = resultado.manifesto
+
+    def relatorio():
+        with open(os.path.join(destino_pasta, "0.relatorio.txt"), 'w') as f:
+            f.write(manifesto.relatorio_por_cnpj())
+        manifesto.remover_pastas_vazias(origem)
+    cronometro.medir('relatorio', relatorio, arquivos=manifesto.total_arquivos)
+
+    if not direto_zip:
+        tipo_compressao, nivel = interpretar_compressao(compressao)
+        profundidade = LEIAUTES_DATA[leiaute_data] if particao == 'data' else 1
+        lotes = listar_lotes(destino_pasta, prefixo, profundidade)
+        cronometro.medir('compactacao',
+                         lambda: list(compactar_em_paralelo(lotes, processos_compactacao, False, tipo_compressao, nivel)),
+                         arquivos=manifesto.total_arquivos, bytes_=manifesto.total_bytes)
+        cronometro.etapas['compactacao']['lotes'] = len(lotes)
+
+    cronometro.etapas['operacoes'] = motor.metricas.como_dict()['etapas']
+    # Caminho usado pelas movimentações (renomear no mesmo volume, cópia pelo kernel entre volumes...)
+    movimentador = motor.movimentador
+    cronometro.etapas['movimentos'] = {caminho: {'arquivos': arquivos, 'bytes': movimentador.bytes[caminho],
+                                                 'segundos': round(movimentador.segundos[caminho], 6)}
+                                       for caminho, arquivos in sorted(movimentador.arquivos.items())}
+    cronometro.etapas['totais'] = {'entradas': total, 'erros': resultado.erros, 'colocados': manifesto.total_arquivos,
+                                   'duplicados': resultado.duplicados, 'identicos': resultado.identicos,
+                                   'particoes': manifesto.total_particoes, 'zips_gravados': resultado.zips_gravados}
+    return cronometro.etapas
+
+# Executado em um processo novo: tempo do import do script e módulos pesados carregados por ele
+_MEDIR_IMPORTACAO = (
+    "import json, sys, time\n"
+    "inicio = time.perf_counter()\n"
+    "__import__(sys.argv[1])\n"
+    "print(json.dumps({'segundos': time.perf_counter() - inicio,\n"
+    "                  'pesados': [modulo for modulo in sys.argv[2:] if modulo in sys.modules]}))\n"
+)
+
+def medir_inicializacao(repeticoes=5, orcamento=ORCAMENTO_INICIALIZACAO_S):
+    """
+    Mede a partida de cada script de SCRIPTS em processos novos (mediana de repeticoes): o import, medido
+    dentro do processo, e `python <script> --help` inteiro, medido de fora. Lista os MODULOS_PESADOS que
+    o import carregou; eles devem ficar para quando são usados (ver interface_cte).
+    :return: dict da etapa 'inicializacao' (segundos = o --help mais lento entre os scripts)
+    """
+    pasta = os.path.dirname(os.path.abspath(__file__))
+    scripts = {}
+    for modulo in SCRIPTS:
+        importacoes, ajudas, pesados = [], [], set()
+        for _ in range(repeticoes):
+            saida = subprocess.run([sys.executable, '-c', _MEDIR_IMPORTACAO, modulo, *MODULOS_PESADOS],
+                                   capture_output=True, text=True, cwd=pasta, check=True)
+            medida = json.loads(saida.stdout.splitlines()[-1])
+            importacoes.append(medida['segundos'])
+            pesados.update(medida['pesados'])
+            inicio = time.perf_counter()
+            subprocess.run([sys.executable, f"{modulo}.py", "--help"], capture_output=True, cwd=pasta, check=True)
+            ajudas.append(time.perf_counter() - inicio)
+        scripts[modulo] = {'importacao_s': round(statistics.median(importacoes), 4),
+                           'ajuda_s': round(statistics.median(ajudas), 4), 'modulos_pesados': sorted(pesados)}
+    return {'segundos': max(script['ajuda_s'] for script in scripts.values()),
+            'importacao_s': max(script['importacao_s'] for script in scripts.values()),
+            'orcamento_s': orcamento, 'repeticoes': repeticoes, 'scripts': scripts}
+
+def avisos_inicializacao(etapa):
+    """Linhas de aviso para o que passou do orçamento ou carregou módulos pesados na partida"""
+    linhas = []
+    for modulo, script in etapa['scripts'].items():
+        if script['ajuda_s'] > etapa['orcamento_s']:
+            linhas.append(f"    {modulo}: partida em {script['ajuda_s']:.3f}s, acima do orçamento de "
+                          f"{etapa['orcamento_s']:.3f}s")
+        if script['modulos_pesados']:
+            linhas.append(f"    {modulo}: o import carrega {', '.join(script['modulos_pesados'])}")
+    return "\n".join(linhas)
+
+def _commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def comparar(atual, base):
+    """
+    Linhas com a variação de arquivos/s de cada etapa em relação a um resultado anterior (e do tempo
+    de partida dos scripts, na etapa 'inicializacao')
+    """
+    linhas = []
+    for etapa, dados in atual['etapas'].items():
+        anterior = base.get('etapas', {}).get(etapa, {})
+        if dados.get('arquivos_s') and anterior.get('arquivos_s'):
+            variacao = dados['arquivos_s'] / anterior['arquivos_s'] - 1
+            linhas.append(f"    {etapa}: {anterior['arquivos_s']:.0f} -> {dados['arquivos_s']:.0f} arquivos/s "
+                          f"({variacao:+.1%})")
+        elif etapa == 'inicializacao' and anterior.get('segundos'):
+            variacao = dados['segundos'] / anterior['segundos'] - 1
+            linhas.append(f"    {etapa}: {anterior['segundos']:.3f} -> {dados['segundos']:.3f}s ({variacao:+.1%})")
+    return "\n".join(linhas)
+
+def ler_argumentos():
+    parser = argparse.ArgumentParser(
+        description="Gera um corpus sintético de CT-e e mede cada etapa da separação (sem interface).")
+    corpus = parser.add_argument_group("corpus")
+    corpus.add_argument("--quantidade", type=int, default=10000, help="XMLs gerados (padrão: 10000)")
+    corpus.add_argument("--cnpjs", type=int, default=50, help="CNPJs distintos (padrão: 50)")
+    corpus.add_argument("--dias", type=int, default=30, help="Dias de emissão (padrão: 30)")
+    corpus.add_argument("--duplicados", type=float, default=0.02, help="Fração de duplicados (padrão: 0.02)")
+    corpus.add_argument("--invalidos", type=float, default=0.005, help="Fração de malformados (padrão: 0.005)")
+    corpus.add_argument("--nfes", type=int, default=3, help="Chaves de NF-e por CT-e (padrão: 3)")
+    corpus.add_argument("--assinatura", type=int, default=344, help="Bytes de SignatureValue (padrão: 344)")
+    corpus.add_argument("--fracao-zip", type=float, default=0.0, help="Fração dos XMLs dentro de ZIPs (padrão: 0)")
+    corpus.add_argument("--eventos", type=float, default=0.0,
+                        help="Fração de eventos de CT-e (procEventoCTe) misturados aos CT-es (padrão: 0)")
+    corpus.add_argument("--semente", type=int, default=0, help="Semente do gerador (padrão: 0)")
+    execucao = parser.add_argument_group("execução")
+    execucao.add_argument("--separador", choices=sorted(SEPARADORES), default='emitente')
+    execucao.add_argument("--processos", type=int, default=1)
+    execucao.add_argument("--tamanho-bloco", type=int, default=TAMANHO_BLOCO_PADRAO)
+    execucao.add_argument("--leitura-rapida", action="store_true")
+    execucao.add_argument("--direto-zip", action="store_true")
+    execucao.add_argument("--zips-abertos", type=int, default=MAX_ZIPS_ABERTOS)
+    execucao.add_argument("--compressao", default=str(NIVEL_COMPRESSAO_PADRAO))
+    execucao.add_argument("--processos-compactacao", type=int, default=None)
+    execucao.add_argument("--threads-io", type=int, default=0, help="Threads que movem os arquivos (padrão: 0)")
+    execucao.add_argument("--leiaute-data", choices=sorted(LEIAUTES_DATA), default=LEIAUTE_DATA_PADRAO)
+    execucao.add_argument("--lote-max-arquivos", type=int, default=TAMANHO_LOTE, metavar="N")
+    execucao.add_argument("--lote-max-mb", type=float, default=None, metavar="MB")
+    execucao.add_argument("--sem-catalogo", action="store_true")
+    execucao.add_argument("--latencia-ms", type=float, default=0,
+                          help="Latência simulada por operação de disco na movimentação, como em um "
+                               "compartilhamento de rede (padrão: 0)")
+    inicializacao = parser.add_argument_group("inicialização")
+    inicializacao.add_argument("--repeticoes-inicializacao", type=int, default=5, metavar="N",
+                               help=f"Processos novos por script na medição da partida, comparada ao orçamento "
+                                    f"de {ORCAMENTO_INICIALIZACAO_S}s (0 = não mede; padrão: 5)")
+    inicializacao.add_argument("--apenas-inicializacao", action="store_true",
+                               help="Mede só a partida dos scripts, sem gerar o corpus")
+    parser.add_argument("--pasta", default=None,
+                        help="Pasta de trabalho (padrão: temporária, apagada ao final)")
+    parser.add_argument("--saida", default=None, help="Grava o resultado em JSON neste arquivo (padrão: só na tela)")
+    parser.add_argument("--comparar", default=None, metavar="JSON",
+                        help="Resultado anterior (--saida de outro commit) para comparar arquivos/s por etapa")
+    argumentos = parser.parse_args()
+    if argumentos.apenas_inicializacao and argumentos.repeticoes_inicializacao < 1:
+        parser.error("--apenas-inicializacao precisa de --repeticoes-inicializacao N (N >= 1)")
+    return argumentos
+
+if __name__ == "__main__":
+    argumentos = ler_argumentos()
+    corpus, etapas = None, {}
+    # Antes do corpus, que enche o cache de disco e a memória
+    if argumentos.repeticoes_inicializacao > 0:
+        etapas['inicializacao'] = medir_inicializacao(argumentos.repeticoes_inicializacao)
+    if not argumentos.apenas_inicializacao:
+        pasta = argumentos.pasta or tempfile.mkdtemp(prefix="benchmark_cte_")
+        try:
+            inicio = time.perf_counter()
+            corpus = gerar_corpus(os.path.join(pasta, "origem"), argumentos.quantidade, argumentos.cnpjs,
+                                  argumentos.dias, argumentos.duplicados, argumentos.invalidos, argumentos.nfes,
+                                  argumentos.assinatura, argumentos.fracao_zip, semente=argumentos.semente,
+                                  eventos=argumentos.eventos)
+            corpus['segundos'] = round(time.perf_counter() - inicio, 4)
+            max_bytes_lote = int(argumentos.lote_max_mb * 1048576) if argumentos.lote_max_mb else None
+            etapas.update(executar_benchmark(pasta, argumentos.separador, argumentos.processos,
+                                             argumentos.tamanho_bloco, argumentos.leitura_rapida,
+                                             argumentos.direto_zip, argumentos.compressao,
+                                             argumentos.processos_compactacao, argumentos.threads_io,
+                                             argumentos.latencia_ms, argumentos.zips_abertos,
+                                             argumentos.leiaute_data, argumentos.lote_max_arquivos,
+                                             max_bytes_lote, not argumentos.sem_catalogo))
+        finally:
+            if argumentos.pasta is None:
+                shutil.rmtree(pasta, ignore_errors=True)
+
+    resultado = {
+        'commit': _commit_atual(),
+        'data': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'parametros': {chave: valor for chave, valor in vars(argumentos).items()
+                       if chave not in ('pasta', 'saida', 'comparar')},
+        'corpus': corpus,
+        'etapas': etapas,
+    }
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    print(texto)
+    if argumentos.saida:
+        with open(argumentos.saida, 'w', encoding='utf-8') as f:
+            f.write(texto + "\n")
+    if 'inicializacao' in etapas and avisos_inicializacao(etapas['inicializacao']):
+        print("\nPartida dos scripts:\n" + avisos_inicializacao(etapas['inicializacao']), file=sys.stderr)
+    if argumentos.comparar:
+        with open(argumentos.comparar, encoding='utf-8') as f:
+            print("\nComparação com " + argumentos.comparar + ":", file=sys.stderr)
+            print(comparar(resultado, json.load(f)), file=sys.stderr)
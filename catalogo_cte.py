@@ -0,0 +1,325 @@
+import os
+import sqlite3
+import time
+import zipfile
+from collections import namedtuple
+
+from entrada_cte import ArquivoXml, MembroZip
+from extrator_cte import extrair_partes
+from duplicados_cte import hash_dados
+from paralelo_cte import ExtratorParalelo
+
+# Catálogo dos CT-es separados, na pasta de destino
+ARQUIVO_CATALOGO = "0.catalogo.sqlite"
+# Registros gravados por transação
+LOTE_CATALOGO = 2000
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS cte (
+    chave TEXT,
+    cnpj TEXT NOT NULL,
+    data_emissao TEXT,
+    tamanho INTEGER,
+    hash TEXT,
+    caminho TEXT NOT NULL,
+    membro TEXT NOT NULL DEFAULT '',
+    registrado TEXT,
+    PRIMARY KEY (caminho, membro)
+);
+CREATE INDEX IF NOT EXISTS cte_chave ON cte (chave);
+CREATE INDEX IF NOT EXISTS cte_cnpj_data ON cte (cnpj, data_emissao);
+CREATE TABLE IF NOT EXISTS zip (
+    caminho TEXT PRIMARY KEY,
+    tamanho INTEGER,
+    modificado INTEGER
+);
+CREATE TABLE IF NOT EXISTS zip_membro (
+    caminho TEXT NOT NULL,
+    membro TEXT NOT NULL,
+    posicao INTEGER,
+    tamanho_compactado INTEGER,
+    compressao INTEGER,
+    crc INTEGER,
+    tamanho INTEGER,
+    criptografado INTEGER,
+    PRIMARY KEY (caminho, membro)
+);
+"""
+_COLUNAS = "chave, cnpj, data_emissao, tamanho, hash, caminho, membro, registrado"
+
+# Membro de ZIP no diretório central guardado no catálogo (ver CatalogoCte.diretorio_zip): posição do
+# cabeçalho local, tamanho compactado, método de compressão, CRC-32, tamanho e se é criptografado
+MembroIndexado = namedtuple('MembroIndexado', ['posicao', 'tamanho_compactado', 'compressao', 'crc', 'tamanho',
+                                               'criptografado'])
+
+# Resultado das consultas: caminho absoluto do XML na pasta ou do ZIP (membro '' quando está na pasta)
+LocalCte = namedtuple('LocalCte', ['chave', 'cnpj', 'data_emissao', 'tamanho', 'hash', 'caminho', 'membro'])
+
+class CatalogoCte:
+    """
+    Catálogo (SQLite) de onde cada CT-e separado ficou: chave de acesso, CNPJ, data de emissão, tamanho,
+    hash (BLAKE2b, o mesmo de duplicados_cte) e o XML na pasta ou o ZIP e o nome do membro.
+    Fica em <pasta_destino>/0.catalogo.sqlite, com os caminhos relativos a ela, e é indexado por chave e por
+    CNPJ + data: "onde está a chave X" ou "os CT-es do CNPJ Y em março" são respondidos sem abrir pastas
+    nem ZIPs (ver consultar_cte.py).
+    Um registro por local (caminho + membro): colocar de novo no mesmo lugar substitui o registro anterior.
+    Os registros são gravados em transações de LOTE_CATALOGO; se a execução for interrompida, os últimos
+    voltam pelo índice do diário na retomada (ver recuperar). reconstruir() refaz o catálogo inteiro a partir
+    das pastas e ZIPs do destino.
+    """
+
+    def __init__(self, pasta_destino, somente_leitura=False, shard=None):
+        """
+        :param somente_leitura: Só consulta (não cria o catálogo nem as tabelas)
+        :param shard: Shard (ver shards_cte): catálogo próprio do shard, copiado para o principal na mescla
+        """
+        self.pasta = pasta_destino
+        self.caminho = os.path.join(pasta_destino, shard.arquivo(ARQUIVO_CATALOGO) if shard else ARQUIVO_CATALOGO)
+        self.conexao = sqlite3.connect(self.caminho, timeout=30)
+        self.pendentes = []
+        if not somente_leitura:
+            # Rollback journal (padrão): o WAL não funciona em compartilhamentos de rede
+            self.conexao.execute("PRAGMA synchronous = NORMAL")
+            self.conexao.executescript(_ESQUEMA)
+
+    def _relativo(self, caminho):
+        return os.path.relpath(caminho, self.pasta).replace(os.sep, '/')
+
+    def _absoluto(self, relativo):
+        return os.path.join(self.pasta, *relativo.split('/'))
+
+    def registrar(self, registro, cnpj, caminho, membro=''):
+        """
+        Registra o CT-e (RegistroCte ou RegistroPartes, ver extrator_cte) no local em que ficou.
+        :param caminho: XML na pasta de destino, ou o ZIP em que foi gravado como membro
+        """
+        self.pendentes.append((registro.chave, cnpj, registro.data_emissao, registro.tamanho,
+                               registro.hash.hex() if registro.hash else None, self._relativo(caminho), membro,
+                               time.strftime('%Y-%m-%d %H:%M:%S')))
+        if len(self.pendentes) >= LOTE_CATALOGO:
+            self.descarregar()
+
+    def descarregar(self):
+        """Grava os registros pendentes (chamar antes de encerrar o diário da execução)"""
+        if not self.pendentes:
+            return
+        with self.conexao:
+            self.conexao.executemany(f"INSERT OR REPLACE INTO cte ({_COLUNAS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                     self.pendentes)
+        self.pendentes = []
+
+    def recuperar(self, indice):
+        """
+        Registra os CT-es que a execução interrompida colocou e que não chegaram ao catálogo, a partir do
+        índice de duplicidade do diário (DiarioExecucao.indice: chave -> (caminho,) no modo com pastas ou
+        (ZIP, membro, tamanho, CRC) no modo direto no ZIP). Retorna quantos foram registrados.
+        """
+        recuperados = 0
+        for chave, valor in indice.items():
+            if self.conexao.execute("SELECT 1 FROM cte WHERE chave = ? LIMIT 1", (chave,)).fetchone():
+                continue
+            if len(valor) == 1:
+                entrada, membro = ArquivoXml(valor[0]), ''
+            else:
+                entrada, membro = MembroZip(valor[0], valor[1]), valor[1]
+            try:
+                dados = entrada.ler()
+                registro = extrair_partes(entrada.rotulo, (), dados)._replace(hash=hash_dados(dados))
+            except Exception:
+                continue  # Saiu do destino depois da interrupção: fica para reconstruir()
+            caminho = valor[0]
+            self.registrar(registro, self._relativo(caminho).split('/', 1)[0], caminho, membro)
+            recuperados += 1
+        self.descarregar()
+        return recuperados
+
+    def compactados(self, lotes):
+        """
+        Passa para <lote>.zip os registros dos XMLs das pastas de lote compactadas e apagadas.
+        :param lotes: (pasta do lote, {arquivo na pasta: membro do ZIP}) de compactador_cte.compactar_lote;
+                      o membro pode ter outro nome ("nome (N).xml", ou o membro igual já existente)
+        """
+        self.descarregar()
+        with self.conexao:
+            for lote_path, membros in lotes:
+                relativo = self._relativo(lote_path)
+                for nome, membro in membros.items():
+                    try:
+                        self.conexao.execute(
+                            "UPDATE cte SET caminho = ?, membro = ? WHERE caminho = ? AND membro = ''",
+                            (f"{relativo}.zip", membro, f"{relativo}/{nome}"))
+                    except sqlite3.IntegrityError:
+                        # Conteúdo igual a um membro que já estava no ZIP (e no catálogo): fica só o registro dele
+                        self.conexao.execute("DELETE FROM cte WHERE caminho = ? AND membro = ''",
+                                             (f"{relativo}/{nome}",))
+
+    def mesclar(self, caminho_catalogo, renomear=None):
+        """
+        Copia para este catálogo os registros de outro da mesma pasta de destino (o de um shard, ver shards_cte).
+        :param renomear: {caminho relativo antigo: novo} das pastas de lote renumeradas
+                         ("cnpj/lote_7": "cnpj/lote_3"), que vale também para o ZIP delas (lote_7.zip)
+        :return: [(LocalCte copiado, LocalCte já copiado antes nesta mescla)] das chaves repetidas entre os
+                 catálogos mesclados (ex.: o mesmo CT-e com nomes diferentes em dois shards)
+        """
+        renomear = renomear or {}
+        self.descarregar()
+        # Chaves copiadas pelas chamadas anteriores desta mescla (tabela temporária: some ao fechar)
+        self.conexao.execute("CREATE TEMP TABLE IF NOT EXISTS mesclados (chave TEXT PRIMARY KEY, cnpj TEXT, "
+                             "data_emissao TEXT, tamanho INTEGER, hash TEXT, caminho TEXT, membro TEXT)")
+        repetidos = []
+        copiados = []
+        origem = sqlite3.connect(caminho_catalogo, timeout=30)
+        try:
+            with self.conexao:
+                for linha in origem.execute(f"SELECT {_COLUNAS} FROM cte ORDER BY caminho, membro"):
+                    linha = linha[:5] + (_renomeado(linha[5], renomear),) + linha[6:]
+                    self.conexao.execute(f"INSERT OR REPLACE INTO cte ({_COLUNAS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                         linha)
+                    if not linha[0]:
+                        continue
+                    anterior = self.conexao.execute(
+                        "SELECT chave, cnpj, data_emissao, tamanho, hash, caminho, membro FROM mesclados "
+                        "WHERE chave = ?", (linha[0],)).fetchone()
+                    if anterior is None:
+                        copiados.append(linha[:7])
+                    elif anterior[5:7] != linha[5:7]:
+                        repetidos.append((LocalCte(*linha[:5], self._absoluto(linha[5]), linha[6]),
+                                          LocalCte(*anterior[:5], self._absoluto(anterior[5]), anterior[6])))
+                # Só depois do catálogo inteiro: repetição dentro de um mesmo catálogo não é entre catálogos
+                self.conexao.executemany("INSERT OR IGNORE INTO mesclados VALUES (?, ?, ?, ?, ?, ?, ?)", copiados)
+        finally:
+            origem.close()
+        return repetidos
+
+    def remover(self, local):
+        """Apaga o registro do LocalCte (CT-e que saiu do destino)"""
+        self.descarregar()
+        with self.conexao:
+            self.conexao.execute("DELETE FROM cte WHERE caminho = ? AND membro = ?",
+                                 (self._relativo(local.caminho), local.membro))
+
+    def consultar(self, chave=None, cnpj=None, de=None, ate=None):
+        """
+        Gera LocalCte dos CT-es pela chave de acesso ou pelo CNPJ, no período de/ate (AAAA-MM-DD, inclusive)
+        """
+        condicoes, parametros = [], []
+        for coluna, operador, valor in (('chave', '=', chave), ('cnpj', '=', cnpj),
+                                        ('data_emissao', '>=', de), ('data_emissao', '<=', ate)):
+            if valor:
+                condicoes.append(f"{coluna} {operador} ?")
+                parametros.append(valor)
+        sql = "SELECT chave, cnpj, data_emissao, tamanho, hash, caminho, membro FROM cte"
+        if condicoes:
+            sql += " WHERE " + " AND ".join(condicoes)
+        for linha in self.conexao.execute(sql + " ORDER BY data_emissao, caminho, membro", parametros):
+            yield LocalCte(*linha[:5], self._absoluto(linha[5]), linha[6])
+
+    def localizar(self, chaves):
+        """{chave: LocalCte} das chaves que estão no catálogo (a primeira, se a chave estiver em mais de um local)"""
+        locais = {}
+        chaves = list(dict.fromkeys(chaves))
+        # Em partes: o SQLite limita a quantidade de parâmetros por comando
+        for inicio in range(0, len(chaves), 500):
+            parte = chaves[inicio:inicio + 500]
+            sql = (f"SELECT chave, cnpj, data_emissao, tamanho, hash, caminho, membro FROM cte "
+                   f"WHERE chave IN ({', '.join('?' * len(parte))}) ORDER BY caminho, membro")
+            for linha in self.conexao.execute(sql, parte):
+                if linha[0] not in locais:
+                    locais[linha[0]] = LocalCte(*linha[:5], self._absoluto(linha[5]), linha[6])
+        return locais
+
+    def diretorio_zip(self, caminho_zip):
+        """
+        {membro: MembroIndexado} do ZIP, guardado no catálogo: o diretório central só é lido (inteiro) na
+        primeira vez ou quando o ZIP muda de tamanho ou de data (ex.: compactação incremental).
+        """
+        relativo = self._relativo(caminho_zip)
+        info = os.stat(caminho_zip)
+        assinatura = (info.st_size, info.st_mtime_ns)
+        if self.conexao.execute("SELECT tamanho, modificado FROM zip WHERE caminho = ?",
+                                (relativo,)).fetchone() == assinatura:
+            return {linha[0]: MembroIndexado(*linha[1:]) for linha in self.conexao.execute(
+                "SELECT membro, posicao, tamanho_compactado, compressao, crc, tamanho, criptografado "
+                "FROM zip_membro WHERE caminho = ?", (relativo,))}
+        with zipfile.ZipFile(caminho_zip) as zipf:
+            diretorio = {info_membro.filename: MembroIndexado(info_membro.header_offset, info_membro.compress_size,
+                                                              info_membro.compress_type, info_membro.CRC,
+                                                              info_membro.file_size, info_membro.flag_bits & 0x1)
+                         for info_membro in zipf.infolist() if not info_membro.is_dir()}
+        with self.conexao:
+            self.conexao.execute("DELETE FROM zip_membro WHERE caminho = ?", (relativo,))
+            self.conexao.executemany("INSERT INTO zip_membro VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                     ((relativo, membro, *indexado) for membro, indexado in diretorio.items()))
+            self.conexao.execute("INSERT OR REPLACE INTO zip VALUES (?, ?, ?)", (relativo, *assinatura))
+        return diretorio
+
+    def reconstruir(self, processos=1, ao_avancar=None):
+        """
+        Refaz o catálogo lendo os XMLs das pastas de CNPJ do destino e os membros dos ZIPs delas
+        (catálogo perdido, execução interrompida ou pastas separadas antes de ele existir).
+        Retorna (registrados, erros).
+        """
+        self.pendentes = []
+        with self.conexao:
+            self.conexao.execute("DELETE FROM cte")
+        extrator = ExtratorParalelo((), processos=processos, calcular_hash=True)
+        registrados = erros = 0
+        for entrada, registro, erro in extrator.processar(self._entradas_destino()):
+            if erro is None:
+                caminho = entrada.caminho_zip if entrada.compactada else entrada.caminho
+                cnpj = self._relativo(caminho).split('/', 1)[0]
+                self.registrar(registro, cnpj, caminho, entrada.membro if entrada.compactada else '')
+                registrados += 1
+            else:
+                erros += 1
+            if ao_avancar is not None:
+                ao_avancar()
+        self.descarregar()
+        return registrados, erros
+
+    def _entradas_destino(self):
+        with os.scandir(self.pasta) as pastas:
+            pastas_cnpj = sorted(pasta.path for pasta in pastas if pasta.is_dir() and pasta.name.isdigit())
+        for pasta_cnpj in pastas_cnpj:
+            for root, dirs, files in os.walk(pasta_cnpj):
+                dirs.sort()
+                for file in sorted(files):
+                    caminho = os.path.join(root, file)
+                    nome = file.lower()
+                    if nome.endswith('.xml'):
+                        yield ArquivoXml(caminho)
+                    elif nome.endswith('.zip'):
+                        try:
+                            with zipfile.ZipFile(caminho) as zipf:
+                                membros = [info.filename for info in zipf.infolist()
+                                           if not info.is_dir() and info.filename.lower().endswith('.xml')]
+                        except (zipfile.BadZipFile, OSError):
+                            continue
+                        for membro in membros:
+                            yield MembroZip(caminho, membro)
+
+    def fechar(self):
+        self.descarregar()
+        self.conexao.close()
+
+def _renomeado(caminho, renomear):
+    """Caminho relativo com a pasta de lote (ou o ZIP dela) trocada conforme renomear, ver CatalogoCte.mesclar"""
+    partes = caminho.split('/', 2)
+    if len(partes) == 3:
+        prefixo, resto = f"{partes[0]}/{partes[1]}", f"/{partes[2]}"
+    else:
+        prefixo, resto = os.path.splitext(caminho)
+    novo = renomear.get(prefixo)
+    return caminho if novo is None else novo + resto
+
+def atualizar_compactados(pasta_destino, lotes):
+    """
+    Atualiza o catálogo da pasta de destino (se houver) com os lotes compactados sem manter as pastas
+    :param lotes: (pasta do lote, {arquivo na pasta: membro do ZIP}), ver CatalogoCte.compactados
+    """
+    if lotes and os.path.exists(os.path.join(pasta_destino, ARQUIVO_CATALOGO)):
+        catalogo = CatalogoCte(pasta_destino)
+        try:
+            catalogo.compactados(lotes)
+        finally:
+            catalogo.fechar()
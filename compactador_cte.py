@@ -0,0 +1,178 @@
+import os
+import shutil
+import zipfile
+import zlib
+
+# Situação de cada lote após compactar_lote
+CRIADO = 'criado'            # ZIP novo
+ATUALIZADO = 'atualizado'    # Membros novos acrescentados ao ZIP existente
+SEM_ALTERACAO = 'sem_alteracao'
+
+NIVEL_COMPRESSAO_PADRAO = 6
+
+def interpretar_compressao(valor):
+    """
+    Converte a opção de compressão em (compression, compresslevel) do zipfile.
+    :param valor: 'sem' para armazenar sem compressão (ZIP_STORED) ou nível de 0 a 9 (ZIP_DEFLATED)
+    """
+    if str(valor).lower() in ('sem', 'stored', 'armazenar'):
+        return zipfile.ZIP_STORED, None
+    nivel = int(valor)
+    if not 0 <= nivel <= 9:
+        raise ValueError(f"Nível de compressão inválido: {valor} (use 0 a 9 ou 'sem')")
+    return zipfile.ZIP_DEFLATED, nivel
+
+def listar_lotes(pasta_destino, prefixo, profundidade=1):
+    """
+    Lista as pastas PASTA_DESTINO/<cnpj>/<prefixo...> que podem ser compactadas.
+    :param profundidade: Níveis de pasta da partição abaixo do CNPJ (ex.: 3 para AAAA/MM/DD,
+                         ver particoes_cte.LEIAUTES_DATA); só o primeiro nível precisa começar com prefixo
+    """
+    lotes = []
+    if os.path.exists(pasta_destino):
+        with os.scandir(pasta_destino) as pastas_cnpj:
+            for cnpj in pastas_cnpj:
+                if not cnpj.is_dir():
+                    continue
+                with os.scandir(cnpj.path) as pastas_lote:
+                    for lote in pastas_lote:
+                        if lote.is_dir() and lote.name.startswith(prefixo):
+                            lotes.extend(_pastas_no_nivel(lote.path, profundidade - 1))
+    return sorted(lotes)
+
+def _pastas_no_nivel(pasta, niveis):
+    """A própria pasta (niveis = 0) ou as subpastas niveis abaixo dela"""
+    if niveis <= 0:
+        return [pasta]
+    pastas = []
+    with os.scandir(pasta) as entradas:
+        for entrada in entradas:
+            if entrada.is_dir():
+                pastas.extend(_pastas_no_nivel(entrada.path, niveis - 1))
+    return pastas
+
+def _arquivos_do_lote(lote_path):
+    """Retorna {nome no ZIP: (caminho, tamanho)} dos arquivos da pasta do lote"""
+    arquivos = {}
+    for root, _, files in os.walk(lote_path):
+        for file in files:
+            file_path = os.path.join(root, file)
+            arcname = os.path.relpath(file_path, lote_path).replace(os.sep, '/')
+            arquivos[arcname] = (file_path, os.path.getsize(file_path))
+    return arquivos
+
+def _crc32_arquivo(caminho):
+    """CRC-32 do conteúdo do arquivo, o mesmo que o ZIP guarda para cada membro"""
+    crc = 0
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1048576), b''):
+            crc = zlib.crc32(bloco, crc)
+    return crc
+
+def _nome_livre(arcname, usados):
+    """Retorna "nome (N).ext" ainda não usado no ZIP"""
+    nome_base, extensao = os.path.splitext(arcname)
+    numero = 1
+    while f"{nome_base} ({numero}){extensao}" in usados:
+        numero += 1
+    return f"{nome_base} ({numero}){extensao}"
+
+def compactar_lote(lote_path, manter_pastas=False, compressao=zipfile.ZIP_DEFLATED,
+                   nivel=NIVEL_COMPRESSAO_PADRAO):
+    """
+    Compacta um lote em <lote>.zip ao lado da pasta, de forma incremental:
+    - sem ZIP: cria;
+    - ZIP existente: acrescenta apenas os arquivos cujo conteúdo ainda não está nele
+      (mesmo nome com outro tamanho/CRC entra como "nome (N).xml", sem perder o membro antigo);
+      o CRC só é calculado quando o nome já existe e algum membro tem o mesmo tamanho (sem nenhum, o
+      conteúdo certamente é novo). A pasta só é apagada com o conteúdo de cada arquivo conferido no ZIP;
+    - nada novo: não reescreve o ZIP.
+    O ZIP é gravado em <lote>.zip.parcial (cópia do existente, se houver) e só substitui o final depois
+    do fsync, como em destino_cte: se a compactação for interrompida, o ZIP anterior continua íntegro.
+    :return: Tupla (lote_path, situacao, membros gravados, {arquivo na pasta: membro do ZIP com o conteúdo dele})
+             (o membro pode ser "nome (N).xml" ou, para o arquivo que já estava no ZIP, outro membro igual)
+    """
+    caminho_zip = f"{lote_path}.zip"
+    arquivos = _arquivos_do_lote(lote_path)
+    novos = []  # (caminho, nome no ZIP)
+    membros = {}
+
+    if not os.path.exists(caminho_zip):
+        situacao = CRIADO
+        novos = [(arquivos[arcname][0], arcname) for arcname in sorted(arquivos)]
+        membros = {arcname: arcname for arcname in arquivos}
+    else:
+        with zipfile.ZipFile(caminho_zip, 'r') as zipf:
+            existentes = {info.filename: info for info in zipf.infolist()}
+        conteudos = {}  # (tamanho, CRC) -> primeiro membro com esse conteúdo
+        for info in existentes.values():
+            conteudos.setdefault((info.file_size, info.CRC), info.filename)
+        tamanhos = {info.file_size for info in existentes.values()}
+        usados = set(existentes)
+        for nome in sorted(arquivos):
+            file_path, tamanho = arquivos[nome]
+            arcname = nome
+            if nome in existentes:
+                # Mesmo nome e mesmo tamanho não bastam (outro CT-e com o mesmo nome): só o CRC confirma
+                conteudo = (tamanho, _crc32_arquivo(file_path)) if tamanho in tamanhos else None
+                if conteudo in conteudos:
+                    existente = existentes[nome]
+                    mesmo = (existente.file_size, existente.CRC) == conteudo
+                    membros[nome] = nome if mesmo else conteudos[conteudo]
+                    continue
+                arcname = _nome_livre(nome, usados)
+            usados.add(arcname)
+            novos.append((file_path, arcname))
+            membros[nome] = arcname
+        situacao = ATUALIZADO if novos else SEM_ALTERACAO
+
+    if novos:
+        _gravar_zip(caminho_zip, novos, situacao == CRIADO, compressao, nivel)
+
+    # Remove a pasta original apenas se não for para manter
+    if not manter_pastas:
+        shutil.rmtree(lote_path)
+
+    return lote_path, situacao, len(novos), membros
+
+def _gravar_zip(caminho_zip, novos, criar, compressao, nivel):
+    """Grava os membros novos em uma cópia do ZIP (.parcial) e troca o ZIP final de forma atômica"""
+    caminho_parcial = f"{caminho_zip}.parcial"
+    try:
+        if not criar:
+            shutil.copyfile(caminho_zip, caminho_parcial)
+        with zipfile.ZipFile(caminho_parcial, 'w' if criar else 'a', compressao, compresslevel=nivel) as zipf:
+            for file_path, arcname in novos:
+                zipf.write(file_path, arcname)
+        with open(caminho_parcial, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(caminho_parcial, caminho_zip)
+    except BaseException:
+        if os.path.exists(caminho_parcial):
+            os.remove(caminho_parcial)
+        raise
+
+def compactar_em_paralelo(lotes, processos=None, manter_pastas=False, compressao=zipfile.ZIP_DEFLATED,
+                          nivel=NIVEL_COMPRESSAO_PADRAO):
+    """
+    Compacta vários lotes em um pool de processos (um lote por tarefa).
+    Gera (lote_path, situacao, membros gravados, {arquivo: membro}, erro) conforme cada lote termina.
+    """
+    processos = processos or os.cpu_count() or 1
+    if processos == 1 or len(lotes) <= 1:
+        for lote_path in lotes:
+            try:
+                yield (*compactar_lote(lote_path, manter_pastas, compressao, nivel), None)
+            except Exception as e:
+                yield lote_path, None, 0, {}, f"{type(e).__name__}: {e}"
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    with ProcessPoolExecutor(max_workers=min(processos, len(lotes))) as executor:
+        futuros = {executor.submit(compactar_lote, lote_path, manter_pastas, compressao, nivel): lote_path
+                   for lote_path in lotes}
+        for futuro in as_completed(futuros):
+            try:
+                yield (*futuro.result(), None)
+            except Exception as e:
+                yield futuros[futuro], None, 0, {}, f"{type(e).__name__}: {e}"
@@ -0,0 +1,185 @@
+import os
+import sys
+import glob
+import time
+import calendar
+import argparse
+import contextlib
+
+from catalogo_cte import CatalogoCte, ARQUIVO_CATALOGO
+from recuperacao_cte import RecuperadorCte
+
+# Obtém o diretório onde o script está localizado
+SCRIPT_DIR = os.path.dirname(os.path.abspath(sys.argv[0]))
+
+def configurar_encoding():
+    if sys.stdout.encoding != 'utf-8':
+        try:
+            sys.stdout.reconfigure(encoding='utf-8')
+        except:
+            pass
+
+def pastas_com_catalogo(pastas=None):
+    """Pastas de destino pedidas, ou todas as "0.Por ..." ao lado do script, que têm catálogo"""
+    if not pastas:
+        pastas = sorted(glob.glob(os.path.join(SCRIPT_DIR, "0.Por *")))
+    return [pasta for pasta in pastas if os.path.exists(os.path.join(pasta, ARQUIVO_CATALOGO))]
+
+def somente_digitos(texto):
+    """Aceita chave e CNPJ com pontuação, prefixo "CTe" ou nome de arquivo ("...-procCTe.xml")"""
+    return ''.join(c for c in texto if c.isdigit()) if texto else None
+
+def periodo(mes=None, de=None, ate=None):
+    """(de, ate) em AAAA-MM-DD; --mes AAAA-MM vale do dia 1 ao último dia do mês"""
+    if mes:
+        ano, numero = (int(parte) for parte in mes.split('-'))
+        return f"{mes}-01", f"{mes}-{calendar.monthrange(ano, numero)[1]:02d}"
+    return de, ate
+
+def consultar(pastas, chave=None, cnpj=None, de=None, ate=None, mostrar_hash=False):
+    """Mostra um CT-e por linha (chave, CNPJ, data, tamanho e onde ele está); retorna a quantidade"""
+    encontrados = 0
+    for pasta in pastas:
+        catalogo = CatalogoCte(pasta, somente_leitura=True)
+        try:
+            for local in catalogo.consultar(chave=chave, cnpj=cnpj, de=de, ate=ate):
+                onde = f"{local.caminho} -> {local.membro}" if local.membro else local.caminho
+                extra = f"\t{local.hash}" if mostrar_hash else ""
+                print(f"{local.chave}\t{local.cnpj}\t{local.data_emissao}\t{local.tamanho}{extra}\t{onde}")
+                encontrados += 1
+        finally:
+            catalogo.fechar()
+    return encontrados
+
+def ler_chaves(caminho):
+    """Chaves de acesso do arquivo (uma por linha; '-' lê da entrada padrão)"""
+    with (contextlib.nullcontext(sys.stdin) if caminho == '-' else open(caminho, 'r', encoding='utf-8')) as f:
+        return [chave for chave in (somente_digitos(linha) for linha in f) if chave]
+
+def extrair(pastas, chaves, saida):
+    """
+    Grava o XML de cada chave na pasta saida ('-' = saída padrão), abrindo só os ZIPs que as contêm.
+    Retorna (extraídos, não encontrados, erros); as mensagens vão para stderr.
+    """
+    pendentes = list(dict.fromkeys(chaves))
+    extraidos = erros = 0
+    nomes_usados = set()
+    gravados = {}  # chave -> arquivo de saída (apagado se a extração falhar no meio)
+
+    def abrir_saida(local):
+        if saida == '-':
+            return contextlib.nullcontext(sys.stdout.buffer)
+        nome = os.path.basename(local.membro or local.caminho)
+        if nome in nomes_usados:
+            nome = f"{local.chave}.xml"
+        nomes_usados.add(nome)
+        gravados[local.chave] = os.path.join(saida, nome)
+        return open(gravados[local.chave], 'wb')
+
+    if saida != '-':
+        os.makedirs(saida, exist_ok=True)
+    for pasta in pastas:
+        if not pendentes:
+            break
+        catalogo = CatalogoCte(pasta)
+        try:
+            fora = []
+            for chave, local, erro in RecuperadorCte(catalogo).extrair(pendentes, abrir_saida):
+                if local is None:
+                    fora.append(chave)
+                elif erro is not None:
+                    erros += 1
+                    print(f"Erro ao extrair {chave} de {local.caminho}: {erro}", file=sys.stderr)
+                    if chave in gravados and os.path.exists(gravados[chave]):
+                        os.remove(gravados[chave])
+                else:
+                    extraidos += 1
+            pendentes = fora
+        finally:
+            catalogo.fechar()
+    for chave in pendentes:
+        print(f"Chave não encontrada nos catálogos: {chave}", file=sys.stderr)
+    return extraidos, len(pendentes), erros
+
+def ler_argumentos():
+    """Lê as opções de linha de comando"""
+    parser = argparse.ArgumentParser(
+        description="Consulta no catálogo (0.catalogo.sqlite) onde os CT-es separados ficaram, sem varrer as "
+                    "pastas, e extrai os XMLs deles sem descompactar os ZIPs inteiros.")
+    parser.add_argument("--chave", help="Chave de acesso (44 dígitos; aceita o prefixo CTe ou o nome do arquivo)")
+    parser.add_argument("--cnpj", help="CNPJ da pasta em que o CT-e foi separado")
+    parser.add_argument("--mes", metavar="AAAA-MM", help="Só os CT-es emitidos no mês")
+    parser.add_argument("--de", metavar="AAAA-MM-DD", help="Só os CT-es emitidos a partir da data")
+    parser.add_argument("--ate", metavar="AAAA-MM-DD", help="Só os CT-es emitidos até a data (inclusive)")
+    parser.add_argument("--pasta", action="append", metavar="PASTA",
+                        help="Pasta de destino com o catálogo (pode repetir; padrão: as pastas \"0.Por ...\" "
+                             "ao lado do script)")
+    parser.add_argument("--hash", action="store_true", help="Mostra também o hash (BLAKE2b) de cada CT-e")
+    parser.add_argument("--chaves", metavar="ARQUIVO",
+                        help="Arquivo com uma chave de acesso por linha ('-' = entrada padrão), para --extrair")
+    parser.add_argument("--extrair", metavar="SAIDA",
+                        help="Grava os XMLs das chaves (ou do CNPJ/período) na pasta SAIDA, ou na saída padrão "
+                             "com '-', lendo só os membros necessários de cada ZIP")
+    parser.add_argument("--reconstruir", action="store_true",
+                        help="Refaz o catálogo das pastas lendo os XMLs e ZIPs delas (catálogo perdido ou "
+                             "pastas separadas antes dele)")
+    parser.add_argument("--processos", type=int, default=1,
+                        help="Com --reconstruir, processos usados na leitura dos XMLs (padrão: 1)")
+    argumentos = parser.parse_args()
+    if argumentos.mes and (argumentos.de or argumentos.ate):
+        parser.error("use --mes ou --de/--ate, não os dois")
+    try:
+        argumentos.de, argumentos.ate = periodo(argumentos.mes, argumentos.de, argumentos.ate)
+    except ValueError:
+        parser.error(f"mês inválido: {argumentos.mes} (use AAAA-MM)")
+    if argumentos.chaves and not argumentos.extrair:
+        parser.error("--chaves só vale junto com --extrair")
+    if not argumentos.reconstruir and not (argumentos.chave or argumentos.cnpj or argumentos.chaves):
+        parser.error("informe --chave, --cnpj ou --chaves (ou --reconstruir)")
+    return argumentos
+
+if __name__ == "__main__":
+    configurar_encoding()
+    argumentos = ler_argumentos()
+
+    if argumentos.reconstruir:
+        pastas = argumentos.pasta or sorted(glob.glob(os.path.join(SCRIPT_DIR, "0.Por *")))
+        for pasta in pastas:
+            inicio = time.time()
+            print(f"Reconstruindo o catálogo de {pasta}...")
+            catalogo = CatalogoCte(pasta)
+            try:
+                registrados, erros = catalogo.reconstruir(argumentos.processos)
+            finally:
+                catalogo.fechar()
+            print(f"    {registrados} CT-e(s) catalogado(s), {erros} ilegível(is), em {time.time() - inicio:.2f}s")
+        sys.exit(0)
+
+    pastas = pastas_com_catalogo(argumentos.pasta)
+    if not pastas:
+        print("Nenhum catálogo encontrado (separe os CT-es ou use --reconstruir).")
+        sys.exit(1)
+    inicio = time.perf_counter()
+    if argumentos.extrair:
+        if argumentos.chaves:
+            chaves = ler_chaves(argumentos.chaves)
+        elif argumentos.chave:
+            chaves = [somente_digitos(argumentos.chave)]
+        else:
+            chaves = []
+            for pasta in pastas:
+                catalogo = CatalogoCte(pasta, somente_leitura=True)
+                try:
+                    chaves.extend(local.chave for local in catalogo.consultar(
+                        cnpj=somente_digitos(argumentos.cnpj), de=argumentos.de, ate=argumentos.ate))
+                finally:
+                    catalogo.fechar()
+        extraidos, nao_encontrados, erros = extrair(pastas, chaves, argumentos.extrair)
+        print(f"\n{extraidos} XML(s) extraído(s), {nao_encontrados} chave(s) não encontrada(s), {erros} erro(s) "
+              f"em {(time.perf_counter() - inicio) * 1000:.1f} ms", file=sys.stderr)
+        sys.exit(0 if extraidos and not erros else 1)
+    encontrados = consultar(pastas, chave=somente_digitos(argumentos.chave), cnpj=somente_digitos(argumentos.cnpj),
+                            de=argumentos.de, ate=argumentos.ate, mostrar_hash=argumentos.hash)
+    print(f"\n{encontrados} CT-e(s) em {(time.perf_counter() - inicio) * 1000:.1f} ms "
+          f"({len(pastas)} catálogo(s))")
+    sys.exit(0 if encontrados else 1)
@@ -0,0 +1,466 @@
+import os
+import shutil
+import zipfile
+import zlib
+from collections import OrderedDict
+
+from duplicados_cte import (ControleDuplicados, SimulacaoDuplicados, NomeadorDuplicados, gravar_divergencias,
+                            COLOCADO, IDENTICO, DIVERGENTE, RENOMEADO, RESULTADOS_COLOCADOS)
+from compactador_cte import NIVEL_COMPRESSAO_PADRAO
+from metricas_cte import SEM_METRICAS
+from movimentacao_cte import MovimentadorArquivos
+
+MAX_ZIPS_ABERTOS = 32
+# ZIP suspenso (fora dos max_abertos): membros guardados em memória e acrescentados de uma vez ao .parcial
+LOTE_ESPERA_ZIP = 64
+# Soma dos membros em espera em todos os ZIPs suspensos; acima disso, todos são gravados
+MAX_BYTES_ESPERA_ZIP = 64 * 1048576
+
+class PastasConhecidas:
+    """
+    Nomes existentes em cada pasta de partição, lidos com um único scandir na primeira vez que a pasta
+    aparece (e a pasta criada uma vez só, se faltar). Depois disso, saber se um destino já existe é uma
+    consulta em memória, sem makedirs e exists por arquivo (cada um é uma ida e volta em compartilhamento
+    de rede). Abaixo da raiz, uma pasta que não aparece nos nomes da pasta pai é nova: fica vazia sem
+    scandir nenhum (CNPJ novo, data nova). Supõe que ninguém mais mexe nas pastas de destino durante a execução.
+    """
+
+    def __init__(self, raiz=None, criar=True, executor=None):
+        """
+        :param raiz: Pasta de destino; as pastas abaixo dela são conferidas pelos nomes da pasta pai
+        :param criar: Cria as pastas que faltam (False na simulação)
+        :param executor: ExecutorIO (ver executor_io_cte): as pastas novas são criadas no pool, antes das
+                         movimentações para dentro delas
+        """
+        self.raiz = raiz
+        self.criar = criar
+        self.executor = executor
+        self.nomes = {}     # pasta -> {nomes normalizados}
+        self.novas = set()  # Pastas que ainda não existem no disco
+
+    def _nomes(self, pasta):
+        nomes = self.nomes.get(pasta)
+        if nomes is None:
+            pai, nome = os.path.split(pasta)
+            if self.raiz is not None and (pai == self.raiz or pai.startswith(self.raiz + os.sep)) \
+                    and os.path.normcase(nome) not in self._nomes(pai):
+                self.nomes[pai].add(os.path.normcase(nome))
+                self.novas.add(pasta)
+                nomes = set()
+            else:
+                try:
+                    with os.scandir(pasta) as entradas:
+                        nomes = {os.path.normcase(entrada.name) for entrada in entradas}
+                except FileNotFoundError:
+                    self.novas.add(pasta)
+                    nomes = set()
+            self.nomes[pasta] = nomes
+        return nomes
+
+    def preparar(self, pasta):
+        """Garante a pasta criada (ou agendada no executor) e os nomes dela carregados"""
+        self._nomes(pasta)
+        if pasta not in self.novas:
+            return
+        # makedirs cria as pastas pai que também forem novas
+        ancestral = pasta
+        while ancestral in self.novas:
+            self.novas.discard(ancestral)
+            ancestral = os.path.dirname(ancestral)
+        if not self.criar:
+            return
+        if self.executor is None:
+            os.makedirs(pasta, exist_ok=True)
+        else:
+            self.executor.submeter(pasta, _criar_pasta, pasta)
+
+    def existe(self, caminho):
+        pasta, nome = os.path.split(caminho)
+        return os.path.normcase(nome) in self._nomes(pasta)
+
+    def adicionar(self, caminho):
+        """Registra um arquivo criado (só nas pastas já carregadas)"""
+        pasta, nome = os.path.split(caminho)
+        nomes = self.nomes.get(pasta)
+        if nomes is not None:
+            nomes.add(os.path.normcase(nome))
+
+def _criar_pasta(pasta):
+    os.makedirs(pasta, exist_ok=True)
+
+class DestinoPastas:
+    """Coloca cada XML em PASTA_DESTINO/<cnpj>/<particao>/<nome> (modo original, com pastas)"""
+
+    def __init__(self, pasta_destino, pasta_duplicados, diario=None, metricas=SEM_METRICAS, plano=None,
+                 executor=None, catalogo=None, movimentador=None):
+        """
+        :param diario: DiarioExecucao onde cada movimentação é registrada (opcional)
+        :param metricas: MetricasExecucao onde o tempo de cada operação é registrado (ver metricas_cte)
+        :param plano: PlanoSeparacao (ver plano_cte): simula, registrando as ações sem criar nem mover nada
+        :param executor: ExecutorIO (ver executor_io_cte): mover e apagar acontecem no pool de threads e a
+                         entrada só é dada como concluída no diário quando as operações dela terminam
+        :param catalogo: CatalogoCte (ver catalogo_cte) onde o local de cada CT-e colocado é registrado
+        :param movimentador: MovimentadorArquivos (ver movimentacao_cte) do motor (None = um próprio);
+                             as cópias pendentes dele são descarregadas em finalizar
+        """
+        self.pasta_destino = pasta_destino
+        self.catalogo = catalogo
+        self.metricas = metricas
+        self.movimentador = movimentador or MovimentadorArquivos()
+        self.pastas = PastasConhecidas(pasta_destino, criar=plano is None, executor=executor)
+        if plano is None:
+            self.duplicidade = ControleDuplicados(pasta_duplicados, metricas, self.pastas, executor,
+                                                  self.movimentador)
+        else:
+            self.duplicidade = SimulacaoDuplicados(pasta_duplicados, plano, self.pastas)
+        self.executor = executor
+        self.falhas = []  # (entrada, erro) das operações que falharam no executor; continuam na origem
+        self.diario = diario
+        if diario is not None:
+            # Índice da execução interrompida (só o gravado por este mesmo tipo de destino)
+            self.duplicidade.restaurar_indice({chave: valor[0] for chave, valor in diario.indice.items()
+                                               if len(valor) == 1})
+
+    def colocar(self, entrada, cnpj, particao, chave, contadores=(), ao_colocar=None, registro=None):
+        """
+        Move a entrada (ver entrada_cte) para a pasta da partição tratando duplicidades.
+        :param contadores: Contadores extras registrados no diário junto com a entrada
+        :param ao_colocar: Chamado com (resultado, caminho do conteúdo no destino ou None) antes de
+                           a entrada ser dada como concluída no diário (ex.: vínculos das outras visões)
+        :param registro: Dados do CT-e (ver extrator_cte) registrados no catálogo, se houver
+        :return: COLOCADO, SUBSTITUIDO, IDENTICO ou DIVERGENTE (ver duplicados_cte)
+        """
+        pasta_particao = os.path.join(self.pasta_destino, cnpj, particao)
+        with self.metricas.medir('criar_pastas'):
+            self.pastas.preparar(pasta_particao)
+        caminho_destino = os.path.join(pasta_particao, entrada.nome)
+        n = self.diario.planejar(entrada, cnpj, particao, contadores) if self.diario is not None else None
+        try:
+            resultado = self.duplicidade.colocar(entrada, caminho_destino, chave)
+        finally:
+            # Mesmo se a entrada falhar, as operações já agendadas não passam para a próxima
+            operacoes = self.duplicidade.operacoes_pendentes()
+        if n is not None and resultado not in RESULTADOS_COLOCADOS:
+            self.diario.nao_colocada(n)
+        caminho_conteudo = self._caminho_conteudo(resultado, caminho_destino, chave)
+        indexado = bool(chave) and self.duplicidade.destinos_por_chave.get(chave) == caminho_destino
+
+        def concluir(erro=None):
+            if erro is not None:
+                # Sem a linha C no diário: a próxima execução processa a entrada de novo
+                self.falhas.append((entrada, erro))
+                return
+            if ao_colocar is not None:
+                ao_colocar(resultado, caminho_conteudo)
+            if self.catalogo is not None and registro is not None and caminho_conteudo is not None:
+                self.catalogo.registrar(registro, cnpj, caminho_conteudo)
+            if self.diario is not None:
+                if indexado:
+                    self.diario.concluir(n, chave, caminho_destino)
+                else:
+                    self.diario.concluir(n)
+
+        if operacoes:
+            self.executor.ao_concluir(operacoes, concluir)
+        else:
+            concluir()
+        return resultado
+
+    def _caminho_conteudo(self, resultado, caminho_destino, chave):
+        """Arquivo do destino com o conteúdo da entrada (None se ela foi para duplicados)"""
+        if resultado == IDENTICO:
+            return self.duplicidade.destinos_por_chave.get(chave) or caminho_destino
+        if resultado == DIVERGENTE:
+            return None
+        return caminho_destino
+
+    def finalizar(self):
+        """
+        Espera as operações do executor, faz o fsync das cópias entre volumes (só então as origens delas são
+        apagadas) e grava o índice de divergências; retorna o caminho dele (ou None)
+        """
+        if self.executor is not None:
+            self.executor.encerrar()
+        self.movimentador.descarregar()
+        return self.duplicidade.gravar_divergencias()
+
+    def fechar(self):
+        """Encerra as threads de I/O (esperando as operações já agendadas) antes de o destino ser descartado"""
+        if self.executor is not None:
+            self.executor.encerrar()
+
+class _ZipParticao:
+    """
+    ZIP de uma partição aberto para escrita.
+    Grava em <particao>.zip.parcial (cópia do ZIP existente, se houver) e só substitui o ZIP final
+    ao finalizar. Os XMLs de origem são apagados apenas depois disso: se a execução for interrompida,
+    o ZIP anterior continua íntegro e as entradas continuam na origem para a próxima execução.
+    O ZIP existente é copiado uma vez por execução: suspenso (ver DestinoZip), o .parcial é fechado e
+    os membros seguintes esperam em memória até serem acrescentados em grupo por descarregar.
+    """
+
+    def __init__(self, cnpj, particao, caminho_zip, compressao, nivel):
+        self.cnpj = cnpj
+        self.particao = particao
+        self.caminho_zip = caminho_zip
+        self.caminho_parcial = f"{caminho_zip}.parcial"
+        self.compressao = compressao
+        self.nivel = nivel
+        self.espera = []  # (ZipInfo, conteúdo) gravados enquanto suspenso
+        self.bytes_espera = 0
+        os.makedirs(os.path.dirname(caminho_zip), exist_ok=True)
+        if os.path.exists(caminho_zip):
+            shutil.copyfile(caminho_zip, self.caminho_parcial)
+            modo = 'a'
+        else:
+            modo = 'w'
+        self.zipf = zipfile.ZipFile(self.caminho_parcial, modo, compressao, compresslevel=nivel)
+        self.membros = {info.filename: (info.file_size, info.CRC) for info in self.zipf.infolist()}
+        self.fontes = []  # Entradas a descartar da origem após finalizar
+
+    def gravar(self, entrada, arcname):
+        """
+        Grava a entrada no ZIP e retorna (tamanho, CRC) do membro. Suspenso, o conteúdo é lido agora
+        (uma entrada ilegível falha aqui, não no grupo) e fica em espera até descarregar.
+        """
+        if self.zipf is not None:
+            entrada.gravar_no_zip(self.zipf, arcname)
+            info = self.zipf.getinfo(arcname)
+            self.membros[arcname] = (info.file_size, info.CRC)
+        else:
+            info = entrada.info_zip(arcname)
+            dados = entrada.ler()
+            self.espera.append((info, dados))
+            self.bytes_espera += len(dados)
+            self.membros[arcname] = (len(dados), zlib.crc32(dados))
+        self.fontes.append(entrada)
+        return self.membros[arcname]
+
+    def suspender(self):
+        """Fecha o .parcial (com o índice central) sem trocar o ZIP final nem apagar as origens"""
+        self.zipf.close()
+        self.zipf = None
+
+    def descarregar(self):
+        """Acrescenta ao .parcial os membros em espera, abrindo-o uma vez para o grupo inteiro"""
+        if not self.espera:
+            return
+        with zipfile.ZipFile(self.caminho_parcial, 'a', self.compressao, compresslevel=self.nivel) as zipf:
+            for info, dados in self.espera:
+                zipf.writestr(info, dados, compress_type=self.compressao, compresslevel=self.nivel)
+        self.espera = []
+        self.bytes_espera = 0
+
+    def finalizar(self):
+        """Fecha o ZIP, grava em disco e troca o ZIP final de forma atômica; depois apaga as origens"""
+        if self.zipf is not None:
+            self.zipf.close()
+            self.zipf = None
+        self.descarregar()
+        with open(self.caminho_parcial, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(self.caminho_parcial, self.caminho_zip)
+        for fonte in self.fontes:
+            try:
+                fonte.descartar()
+            except FileNotFoundError:
+                pass
+        self.fontes = []
+
+class DestinoZip:
+    """
+    Grava cada XML direto em PASTA_DESTINO/<cnpj>/<particao>.zip, sem a etapa de pastas.
+    Mantém no máximo max_abertos ZIPs abertos. Os menos usados recentemente são suspensos, não finalizados:
+    reabrir e copiar o ZIP a cada volta da partição tornaria o custo quadrático. Os membros de um ZIP
+    suspenso esperam em memória e são acrescentados em grupos de LOTE_ESPERA_ZIP (ou quando a espera de
+    todos passa de MAX_BYTES_ESPERA_ZIP); todos os ZIPs são finalizados juntos em finalizar.
+    Duplicidade: mesma chave ou mesmo nome com conteúdo igual (tamanho + CRC) é descartado;
+    mesma chave com conteúdo diferente vai para a pasta de duplicados; mesmo nome com outra
+    chave é gravado no ZIP como "nome (N).xml".
+    """
+
+    def __init__(self, pasta_destino, pasta_duplicados, max_abertos=MAX_ZIPS_ABERTOS,
+                 compressao=zipfile.ZIP_DEFLATED, nivel=NIVEL_COMPRESSAO_PADRAO, diario=None, metricas=SEM_METRICAS,
+                 catalogo=None, movimentador=None):
+        """
+        :param diario: DiarioExecucao onde cada entrada e cada ZIP gravado são registrados (opcional)
+        :param metricas: MetricasExecucao onde o tempo de cada operação é registrado (ver metricas_cte)
+        :param catalogo: CatalogoCte (ver catalogo_cte) onde o ZIP e o membro de cada CT-e são registrados
+        :param movimentador: MovimentadorArquivos (ver movimentacao_cte) que leva as chaves divergentes para
+                             duplicados (None = um próprio); descarregado em finalizar
+        """
+        self.pasta_destino = pasta_destino
+        self.catalogo = catalogo
+        self.diario = diario
+        self.metricas = metricas
+        self.movimentador = movimentador or MovimentadorArquivos()
+        self.nomeador = NomeadorDuplicados(pasta_duplicados)
+        self.max_abertos = max(1, max_abertos)
+        self.compressao = compressao
+        self.nivel = nivel
+        self.abertos = OrderedDict()       # caminho do ZIP -> _ZipParticao
+        self.suspensos = {}                # caminho do ZIP -> _ZipParticao com o .parcial fechado
+        self.bytes_espera = 0              # Soma de bytes_espera dos suspensos
+        self.assinaturas_por_chave = {}    # chave -> (caminho do ZIP, arcname, tamanho, CRC)
+        self.divergencias = []
+        self.falhas = []  # Mesma interface de DestinoPastas (aqui as falhas interrompem a entrada na hora)
+        self.zips_finalizados = 0
+        if diario is not None:
+            # Índice da execução interrompida (só o gravado por este mesmo tipo de destino)
+            for chave, valor in diario.indice.items():
+                if len(valor) == 4:
+                    caminho_zip, arcname, tamanho, crc = valor
+                    self.assinaturas_por_chave[chave] = (caminho_zip, arcname, int(tamanho), int(crc))
+
+    def _zip(self, cnpj, particao):
+        """
+        Retorna o ZIP da partição: o aberto ou o suspenso, ou abre um novo (suspendendo o menos usado
+        se já houver max_abertos)
+        """
+        caminho_zip = os.path.join(self.pasta_destino, cnpj, f"{particao}.zip")
+        zip_particao = self.abertos.get(caminho_zip)
+        if zip_particao is not None:
+            self.abertos.move_to_end(caminho_zip)
+            return zip_particao
+        zip_particao = self.suspensos.get(caminho_zip)
+        if zip_particao is not None:
+            return zip_particao
+        while len(self.abertos) >= self.max_abertos:
+            caminho_antigo, antigo = self.abertos.popitem(last=False)
+            with self.metricas.medir('zip_suspender'):
+                antigo.suspender()
+            self.suspensos[caminho_antigo] = antigo
+        with self.metricas.medir('zip_abrir'):
+            zip_particao = self.abertos[caminho_zip] = _ZipParticao(cnpj, particao, caminho_zip,
+                                                                    self.compressao, self.nivel)
+        return zip_particao
+
+    def _descarregar(self, zip_particao):
+        """Grava os membros em espera do ZIP suspenso"""
+        self.bytes_espera -= zip_particao.bytes_espera
+        with self.metricas.medir('zip_descarregar'):
+            zip_particao.descarregar()
+
+    def _finalizar_zip(self, zip_particao):
+        with self.metricas.medir('zip_finalizar'):
+            zip_particao.finalizar()
+        self.zips_finalizados += 1
+        if self.diario is not None:
+            self.diario.particao_gravada(zip_particao.cnpj, zip_particao.particao)
+
+    def _descartar(self, entrada, cnpj, particao, caminho_zip):
+        """Descarta uma cópia idêntica: espera o ZIP que contém o original ser finalizado, se ainda aberto"""
+        zip_particao = self.abertos.get(caminho_zip) or self.suspensos.get(caminho_zip)
+        if zip_particao is not None:
+            # No diário, fica concluída junto com o ZIP que contém o original
+            self._planejar(entrada, zip_particao.cnpj, zip_particao.particao, colocada=False)
+            zip_particao.fontes.append(entrada)
+        else:
+            n = self._planejar(entrada, cnpj, particao, colocada=False)
+            entrada.descartar()
+            self._concluir(n)
+
+    def _planejar(self, entrada, cnpj, particao, colocada=True):
+        """:param colocada: False para cópia idêntica ou divergente, que não conta nos lotes ao retomar"""
+        if self.diario is None:
+            return None
+        n = self.diario.planejar(entrada, cnpj, particao)
+        if not colocada:
+            self.diario.nao_colocada(n)
+        return n
+
+    def _indexar(self, n, chave, caminho_zip, arcname, tamanho, crc):
+        self.assinaturas_por_chave[chave] = (caminho_zip, arcname, tamanho, crc)
+        if self.diario is not None:
+            self.diario.indexar(n, chave, caminho_zip, arcname, tamanho, crc)
+
+    def _concluir(self, n):
+        """Entrada que saiu da origem sem depender de um ZIP ainda aberto"""
+        if self.diario is not None:
+            self.diario.concluir(n)
+
+    def colocar(self, entrada, cnpj, particao, chave, ao_colocar=None, registro=None):
+        """
+        Grava a entrada (ver entrada_cte) no ZIP da partição tratando duplicidades.
+        :param ao_colocar: Chamado com (resultado, (caminho do ZIP, membro) ou None) quando a entrada é gravada
+                           (aqui as falhas interrompem a entrada na hora, então logo em seguida)
+        :param registro: Dados do CT-e (ver extrator_cte) registrados no catálogo, se houver
+        :return: COLOCADO, RENOMEADO, IDENTICO ou DIVERGENTE (ver duplicados_cte)
+        """
+        resultado, local = self._colocar(entrada, cnpj, particao, chave)
+        self.metricas.contar(resultado)
+        if ao_colocar is not None:
+            ao_colocar(resultado, local)
+        if self.catalogo is not None and registro is not None and local is not None:
+            self.catalogo.registrar(registro, cnpj, *local)
+        return resultado
+
+    def _assinatura(self, entrada):
+        with self.metricas.medir('hash'):
+            return entrada.assinatura()
+
+    def _colocar(self, entrada, cnpj, particao, chave):
+        """Retorna (resultado, (caminho do ZIP, membro) com o conteúdo da entrada ou None)"""
+        nome = entrada.nome
+        anterior = self.assinaturas_por_chave.get(chave) if chave else None
+        if anterior is not None:
+            caminho_zip_anterior, arcname_anterior, tamanho, crc = anterior
+            if self._assinatura(entrada) == (tamanho, crc):
+                self._descartar(entrada, cnpj, particao, caminho_zip_anterior)
+                return IDENTICO, (caminho_zip_anterior, arcname_anterior)
+            n = self._planejar(entrada, cnpj, particao, colocada=False)
+            caminho_duplicado = self.nomeador.proximo_caminho(nome)
+            with self.metricas.medir('renomear_duplicado'):
+                entrada.mover(caminho_duplicado, self.movimentador)
+            self._concluir(n)
+            self.divergencias.append((chave, f"{caminho_zip_anterior}:{arcname_anterior}", caminho_duplicado))
+            return DIVERGENTE, None
+
+        zip_particao = self._zip(cnpj, particao)
+        caminho_zip = zip_particao.caminho_zip
+        # A partir daqui a entrada fica concluída quando o ZIP desta partição for gravado
+        n = self._planejar(entrada, cnpj, particao)
+        arcname, resultado = nome, COLOCADO
+        if nome in zip_particao.membros:
+            assinatura = self._assinatura(entrada)
+            if assinatura == zip_particao.membros[nome]:
+                if n is not None:
+                    self.diario.nao_colocada(n)
+                zip_particao.fontes.append(entrada)
+                if chave:
+                    self._indexar(n, chave, caminho_zip, nome, *assinatura)
+                return IDENTICO, (caminho_zip, nome)
+            nome_base, extensao = os.path.splitext(nome)
+            numero = 1
+            while f"{nome_base} ({numero}){extensao}" in zip_particao.membros:
+                numero += 1
+            arcname, resultado = f"{nome_base} ({numero}){extensao}", RENOMEADO
+
+        with self.metricas.medir('zip_gravar'):
+            espera_antes = zip_particao.bytes_espera
+            tamanho, crc = zip_particao.gravar(entrada, arcname)
+            self.bytes_espera += zip_particao.bytes_espera - espera_antes
+        if len(zip_particao.espera) >= LOTE_ESPERA_ZIP:
+            self._descarregar(zip_particao)
+        elif self.bytes_espera > MAX_BYTES_ESPERA_ZIP:
+            for suspenso in self.suspensos.values():
+                self._descarregar(suspenso)
+        if chave:
+            self._indexar(n, chave, caminho_zip, arcname, tamanho, crc)
+        return resultado, (caminho_zip, arcname)
+
+    def finalizar(self):
+        """Finaliza todos os ZIPs abertos e grava o índice de divergências; retorna o caminho dele (ou None)"""
+        while self.abertos:
+            self._finalizar_zip(self.abertos.popitem(last=False)[1])
+        while self.suspensos:
+            self._finalizar_zip(self.suspensos.popitem()[1])
+        self.bytes_espera = 0
+        self.movimentador.descarregar()
+        divergencias, self.divergencias = self.divergencias, []
+        return gravar_divergencias(self.nomeador.pasta, divergencias)
+
+    def fechar(self):
+        """Fecha os .parcial ainda abertos (chamada interrompida) sem trocar os ZIPs finais nem apagar as origens"""
+        while self.abertos:
+            self.abertos.popitem()[1].suspender()
@@ -0,0 +1,213 @@
+import os
+from collections import Counter
+
+from entrada_cte import ArquivoXml, MembroZip
+
+ARQUIVO_DIARIO = "0.diario_execucao.log"
+# Linhas gravadas entre um fsync e outro (cada linha já vai para o sistema operacional na hora)
+SINCRONIZAR_A_CADA = 1000
+
+class DiarioExecucao:
+    """
+    Diário (write-ahead) das movimentações da execução, em PASTA_DESTINO/0.diario_execucao.log.
+    Linhas, separadas por tabulação:
+      P n cnpj particao A caminho           entrada n vai ser colocada (XML solto)
+      P n cnpj particao M caminho_zip membro   idem, membro de ZIP da origem
+      L n contador...                       contadores extras somados quando a entrada n for concluída
+      C n [chave valor...]                  entrada n saiu da origem (modo pastas, duplicados)
+      X n chave valor...                    índice de duplicidade da entrada n, vale quando ela for concluída
+      D n                                   entrada n não ficou na partição (idêntica ou divergente): fora do lote
+      Z cnpj particao n                     ZIP da partição gravado: conclui as entradas < n dessa partição
+      K cnpj quantidade                     ponto de controle: entradas já contadas para o CNPJ
+      F caminho_zip membro                  ponto de controle: membro de ZIP já concluído
+      I chave valor...                      ponto de controle: índice de duplicidade por chave de acesso
+    Se a execução terminar normalmente o diário é apagado. Se ele existir na próxima execução,
+    a anterior foi interrompida: o diário é lido (sem varrer as pastas), os contadores por CNPJ
+    e o índice de chaves já colocadas são retomados, os membros de ZIP já concluídos são pulados
+    e as entradas que estavam em andamento voltam a ser processadas se ainda estiverem na origem.
+    """
+
+    def __init__(self, pasta_destino, somente_leitura=False, shard=None):
+        """
+        :param somente_leitura: Só lê o estado da execução interrompida, sem reescrever o diário (simulação)
+        :param shard: Shard (ver shards_cte): cada shard tem o seu diário (0.diario_execucao.shard_i-n.log)
+        """
+        self.somente_leitura = somente_leitura
+        self.caminho = os.path.join(pasta_destino, shard.arquivo(ARQUIVO_DIARIO) if shard else ARQUIVO_DIARIO)
+        self.contadores_cnpj = Counter()  # CNPJ -> entradas colocadas nas partições (numeração dos lotes)
+        self.membros_concluidos = set()   # MembroZip já concluídos, a pular na listagem
+        self.indice = {}                  # chave de acesso -> valores gravados pelo destino (strings)
+        self.concluidas_antes = 0         # Entradas concluídas pela execução interrompida
+        # XMLs soltos em andamento na interrupção que já tinham saído da origem: (cnpj, particao, entrada)
+        self.movidas_na_interrupcao = []
+        self.retomada = os.path.exists(self.caminho)
+        self._arquivo = None
+        self._proximo = 0
+        self._nao_sincronizadas = 0
+        if self.retomada:
+            self._recuperar()
+
+    def _recuperar(self):
+        """Lê o diário da execução interrompida e o reescreve como ponto de controle"""
+        # n -> [cnpj, particao, entrada, (chave, valor...) ou None, contadores extras, ficou na partição]
+        em_andamento = {}
+        por_particao = {}   # (cnpj, particao) -> {n em andamento}
+        with open(self.caminho, 'r', encoding='utf-8', errors='surrogateescape') as f:
+            for linha in f:
+                if not linha.endswith('\n'):
+                    break  # Última linha gravada pela metade
+                campos = linha[:-1].split('\t')
+                tipo = campos[0]
+                if tipo == 'P':
+                    n, cnpj, particao = int(campos[1]), campos[2], campos[3]
+                    entrada = ArquivoXml(campos[5]) if campos[4] == 'A' else MembroZip(campos[5], campos[6])
+                    em_andamento[n] = [cnpj, particao, entrada, None, (), True]
+                    por_particao.setdefault((cnpj, particao), set()).add(n)
+                    self._proximo = n + 1
+                elif tipo == 'L':
+                    n = int(campos[1])
+                    if n in em_andamento:
+                        em_andamento[n][4] = campos[2:]
+                elif tipo == 'C':
+                    n = int(campos[1])
+                    if len(campos) > 2 and n in em_andamento:
+                        em_andamento[n][3] = campos[2:]
+                    self._concluir_recuperada(em_andamento, por_particao, n)
+                elif tipo == 'X':
+                    n = int(campos[1])
+                    if n in em_andamento:
+                        em_andamento[n][3] = campos[2:]
+                elif tipo == 'D':
+                    n = int(campos[1])
+                    if n in em_andamento:
+                        em_andamento[n][5] = False
+                elif tipo == 'Z':
+                    limite = int(campos[3])
+                    for n in [n for n in por_particao.get((campos[1], campos[2]), ()) if n < limite]:
+                        self._concluir_recuperada(em_andamento, por_particao, n)
+                elif tipo == 'K':
+                    self.contadores_cnpj[campos[1]] += int(campos[2])
+                    self.concluidas_antes += int(campos[2])
+                elif tipo == 'F':
+                    self.membros_concluidos.add(MembroZip(campos[1], campos[2]))
+                elif tipo == 'I':
+                    self.indice[campos[1]] = campos[2:]
+
+        # Em andamento: XML solto que já não está na origem foi movido antes da interrupção;
+        # o restante (inclusive membros de ZIP) é processado de novo
+        for n in list(em_andamento):
+            entrada = em_andamento[n][2]
+            if not entrada.compactada and not os.path.exists(entrada.caminho):
+                self.movidas_na_interrupcao.append(tuple(em_andamento[n][:3]))
+                self._concluir_recuperada(em_andamento, por_particao, n)
+
+        if self.somente_leitura:
+            return
+        # Reescreve o diário só com o que importa para as próximas retomadas
+        caminho_novo = f"{self.caminho}.novo"
+        with open(caminho_novo, 'w', encoding='utf-8', errors='surrogateescape') as f:
+            for cnpj, quantidade in self.contadores_cnpj.items():
+                f.write(f"K\t{cnpj}\t{quantidade}\n")
+            for membro in self.membros_concluidos:
+                f.write(f"F\t{membro.caminho_zip}\t{membro.membro}\n")
+            for chave, valor in self.indice.items():
+                f.write("\t".join(["I", chave, *valor]) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(caminho_novo, self.caminho)
+
+    def _concluir_recuperada(self, em_andamento, por_particao, n):
+        dados = em_andamento.pop(n, None)
+        if dados is None:
+            return
+        cnpj, particao, entrada, indice, extras, colocada = dados
+        pendentes = por_particao[(cnpj, particao)]
+        pendentes.discard(n)
+        if not pendentes:
+            del por_particao[(cnpj, particao)]
+        # Cópia idêntica ou divergente não ocupa lugar no lote (como em AlocadorLotes.devolver)
+        if colocada:
+            self.contadores_cnpj[cnpj] += 1
+            for contador in extras:
+                self.contadores_cnpj[contador] += 1
+        self.concluidas_antes += 1
+        if entrada.compactada:
+            self.membros_concluidos.add(entrada)
+        if indice:
+            self.indice[indice[0]] = indice[1:]
+
+    def _gravar(self, linha):
+        if self._arquivo is None:
+            self._arquivo = open(self.caminho, 'a', encoding='utf-8', errors='surrogateescape')
+        self._arquivo.write(linha)
+        self._arquivo.flush()  # Sobrevive à interrupção do processo; o fsync cobre queda de energia
+        self._nao_sincronizadas += 1
+        if self._nao_sincronizadas >= SINCRONIZAR_A_CADA:
+            self.sincronizar()
+
+    def sincronizar(self):
+        """Força as linhas já gravadas para o disco"""
+        if self._arquivo is not None and self._nao_sincronizadas:
+            os.fsync(self._arquivo.fileno())
+            self._nao_sincronizadas = 0
+
+    def planejar(self, entrada, cnpj, particao, contadores=()):
+        """
+        Registra, antes de mexer na entrada, que ela vai para cnpj/particao; retorna o número dela.
+        :param contadores: Chaves extras de contadores_cnpj somadas quando ela for concluída
+                           (ex.: lotes das outras visões, ver motor_cte)
+        """
+        n = self._proximo
+        self._proximo += 1
+        if entrada.compactada:
+            origem = f"M\t{entrada.caminho_zip}\t{entrada.membro}"
+        else:
+            origem = f"A\t{entrada.caminho}"
+        self._gravar(f"P\t{n}\t{cnpj}\t{particao}\t{origem}\n")
+        if contadores:
+            self._gravar("\t".join(["L", str(n), *contadores]) + "\n")
+        return n
+
+    def concluir(self, n, chave=None, *valor):
+        """
+        Registra que a entrada n saiu definitivamente da origem.
+        :param chave: Chave de acesso a guardar no índice de duplicidade, com os valores do destino
+        """
+        if chave:
+            self._gravar("\t".join(["C", str(n), chave, *map(str, valor)]) + "\n")
+        else:
+            self._gravar(f"C\t{n}\n")
+
+    def nao_colocada(self, n):
+        """Registra que a entrada n não ficou na partição (idêntica ou divergente): não conta nos lotes"""
+        self._gravar(f"D\t{n}\n")
+
+    def indexar(self, n, chave, *valor):
+        """Registra o índice de duplicidade da entrada n (vale quando ela for concluída)"""
+        self._gravar("\t".join(["X", str(n), chave, *map(str, valor)]) + "\n")
+
+    def particao_gravada(self, cnpj, particao):
+        """Registra que o ZIP da partição foi gravado com todas as entradas planejadas até aqui"""
+        self._gravar(f"Z\t{cnpj}\t{particao}\t{self._proximo}\n")
+        self.sincronizar()
+
+    def encerrar(self):
+        """
+        Execução concluída: apaga o diário e esquece o estado da interrompida (membros concluídos, índice,
+        contadores), que não vale para as próximas chamadas do mesmo motor (ex.: um ZIP novo com o mesmo nome)
+        """
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+        try:
+            os.remove(self.caminho)
+        except FileNotFoundError:
+            pass
+        self.contadores_cnpj = Counter()
+        self.membros_concluidos = set()
+        self.indice = {}
+        self.concluidas_antes = 0
+        self.movidas_na_interrupcao = []
+        self.retomada = False
+        self._proximo = 0
+        self._nao_sincronizadas = 0
@@ -0,0 +1,247 @@
+import os
+import re
+import hashlib
+import time
+
+from metricas_cte import SEM_METRICAS
+from movimentacao_cte import MovimentadorArquivos
+
+# Resultado de ControleDuplicados.colocar
+COLOCADO = 'colocado'        # Arquivo novo, movido para o destino
+SUBSTITUIDO = 'substituido'  # Havia outro arquivo com o mesmo nome: o antigo foi para duplicados
+IDENTICO = 'identico'        # Mesmo conteúdo de um arquivo já colocado: descartado
+DIVERGENTE = 'divergente'    # Mesma chave de acesso com conteúdo diferente: foi para duplicados
+RENOMEADO = 'renomeado'      # Nome já usado por outro conteúdo no ZIP: gravado como "nome (N).xml"
+# Resultados em que o arquivo ficou na partição de destino
+RESULTADOS_COLOCADOS = (COLOCADO, SUBSTITUIDO, RENOMEADO)
+
+_NOME_NUMERADO = re.compile(r'^(.*) \((\d+)\)$')
+
+def hash_arquivo(caminho):
+    """Calcula o hash (BLAKE2b de 128 bits) do conteúdo do arquivo"""
+    with open(caminho, 'rb') as f:
+        return _hash_conteudo(f)
+
+def hash_entrada(entrada):
+    """Mesmo hash de hash_arquivo, para uma entrada da origem (XML solto ou membro de ZIP)"""
+    with entrada.abrir() as f:
+        return _hash_conteudo(f)
+
+def hash_dados(dados):
+    """Mesmo hash de hash_arquivo, para um conteúdo já em memória (membro de ZIP lido pelo worker)"""
+    return hashlib.blake2b(dados, digest_size=16).digest()
+
+def _hash_conteudo(f):
+    h = hashlib.blake2b(digest_size=16)
+    for bloco in iter(lambda: f.read(1048576), b''):
+        h.update(bloco)
+    return h.digest()
+
+class NomeadorDuplicados:
+    """
+    Gera nomes "arquivo (N).xml" na pasta de duplicados sem testar os.path.exists em laço.
+    Os contadores por nome são carregados com uma única leitura da pasta.
+    """
+
+    def __init__(self, pasta_duplicados):
+        self.pasta = pasta_duplicados
+        self.contadores = {}  # (nome_base, extensao) -> maior N já usado
+        if os.path.isdir(pasta_duplicados):
+            with os.scandir(pasta_duplicados) as entradas:
+                for entrada in entradas:
+                    nome_base, extensao = os.path.splitext(entrada.name)
+                    numerado = _NOME_NUMERADO.match(nome_base)
+                    if numerado:
+                        chave = (numerado.group(1), extensao)
+                        numero = int(numerado.group(2))
+                        if numero > self.contadores.get(chave, 0):
+                            self.contadores[chave] = numero
+
+    def proximo_caminho(self, nome_arquivo):
+        """Retorna o próximo caminho livre para o nome informado"""
+        nome_base, extensao = os.path.splitext(nome_arquivo)
+        numero = self.contadores.get((nome_base, extensao), 0) + 1
+        self.contadores[(nome_base, extensao)] = numero
+        return os.path.join(self.pasta, f"{nome_base} ({numero}){extensao}")
+
+class ControleDuplicados:
+    """
+    Decide o destino de cada CT-e considerando a chave de acesso (infCte/@Id) e o conteúdo.
+    - Chave já colocada nesta execução com o mesmo conteúdo: o arquivo novo é descartado.
+    - Chave já colocada com conteúdo diferente: o arquivo novo vai para duplicados e é sinalizado.
+    - Nome já existente no destino (ex.: execução anterior): se o conteúdo for igual, descarta;
+      senão o arquivo antigo vai para duplicados e o novo ocupa o lugar (comportamento original).
+    O hash só é calculado quando há colisão de chave ou de nome.
+    """
+
+    def __init__(self, pasta_duplicados, metricas=SEM_METRICAS, pastas=None, executor=None, movimentador=None):
+        """
+        :param metricas: MetricasExecucao onde o tempo de cada operação é registrado (ver metricas_cte)
+        :param pastas: PastasConhecidas (ver destino_cte): a existência de um destino é respondida pelos
+                       nomes já lidos da pasta, sem consultar o disco a cada arquivo
+        :param executor: ExecutorIO (ver executor_io_cte): as decisões continuam aqui, mas mover e apagar
+                         são agendados no pool, na ordem de cada pasta (ver operacoes_pendentes)
+        :param movimentador: MovimentadorArquivos (ver movimentacao_cte) que move os arquivos (None = um próprio)
+        """
+        self.nomeador = NomeadorDuplicados(pasta_duplicados)
+        self.metricas = metricas
+        self.pastas = pastas
+        self.executor = executor
+        self.movimentador = movimentador or MovimentadorArquivos()
+        self.operacoes = []           # Operações agendadas no executor para a entrada atual
+        self.destinos_por_chave = {}  # chave -> caminho de destino do primeiro arquivo colocado
+        self.chaves_por_destino = {}  # caminho de destino -> chave (para desfazer ao substituir)
+        self.hashes = {}              # caminho de destino -> hash, calculado sob demanda
+        self.divergencias = []        # (chave, caminho mantido, caminho enviado para duplicados)
+
+    def _hash_destino(self, caminho_destino):
+        if caminho_destino not in self.hashes:
+            if self.executor is not None:
+                self.executor.aguardar(os.path.dirname(caminho_destino))
+            with self.metricas.medir('hash'):
+                self.hashes[caminho_destino] = hash_arquivo(caminho_destino)
+        return self.hashes[caminho_destino]
+
+    def colocar(self, entrada, caminho_destino, chave):
+        """
+        Move a entrada (ver entrada_cte) para caminho_destino tratando duplicidades.
+        :return: COLOCADO, SUBSTITUIDO, IDENTICO ou DIVERGENTE
+        """
+        resultado = self._colocar(entrada, caminho_destino, chave)
+        self.metricas.contar(resultado)
+        return resultado
+
+    def _hash_entrada(self, entrada):
+        with self.metricas.medir('hash'):
+            return hash_entrada(entrada)
+
+    def _colocar(self, entrada, caminho_destino, chave):
+        metricas = self.metricas
+        destino_chave = self.destinos_por_chave.get(chave) if chave else None
+        if destino_chave is not None and self._existe(destino_chave):
+            if self._hash_entrada(entrada) == self._hash_destino(destino_chave):
+                with metricas.medir('descartar'):
+                    self._descartar_entrada(entrada)
+                return IDENTICO
+            caminho_duplicado = self.nomeador.proximo_caminho(entrada.nome)
+            with metricas.medir('renomear_duplicado'):
+                self._mover_entrada(entrada, caminho_duplicado)
+            self.divergencias.append((chave, destino_chave, caminho_duplicado))
+            return DIVERGENTE
+
+        resultado = COLOCADO
+        with metricas.medir('verificar_existencia'):
+            existe = self._existe(caminho_destino)
+        if existe:
+            if self._hash_entrada(entrada) == self._hash_destino(caminho_destino):
+                with metricas.medir('descartar'):
+                    self._descartar_entrada(entrada)
+                self._indexar(chave, caminho_destino)
+                return IDENTICO
+            with metricas.medir('renomear_duplicado'):
+                self._mover_existente(caminho_destino,
+                                      self.nomeador.proximo_caminho(os.path.basename(caminho_destino)))
+            self.hashes.pop(caminho_destino, None)
+            chave_substituida = self.chaves_por_destino.pop(caminho_destino, None)
+            if chave_substituida is not None:
+                del self.destinos_por_chave[chave_substituida]
+            resultado = SUBSTITUIDO
+
+        with metricas.medir('mover'):
+            self._mover_entrada(entrada, caminho_destino)
+        self._indexar(chave, caminho_destino)
+        return resultado
+
+    # Operações em disco (SimulacaoDuplicados só as registra)
+    def _existe(self, caminho):
+        if self.pastas is None:
+            return os.path.exists(caminho)
+        return self.pastas.existe(caminho)
+
+    def _em_disco(self, pasta, funcao, *args):
+        """Executa a operação já ou, com executor, agenda depois das anteriores na mesma pasta"""
+        if self.executor is None:
+            funcao(*args)
+        else:
+            self.operacoes.append(self.executor.submeter(pasta, funcao, *args))
+
+    def _mover_entrada(self, entrada, caminho):
+        if entrada.compactada and self.executor is not None:
+            # Membros de ZIP são lidos pelos ZIPs de origem abertos nesta thread: gravados aqui mesmo
+            self.executor.aguardar(os.path.dirname(caminho))
+            entrada.mover(caminho, self.movimentador)
+        else:
+            self._em_disco(os.path.dirname(caminho), entrada.mover, caminho, self.movimentador)
+        if self.pastas is not None:
+            self.pastas.adicionar(caminho)
+
+    def _descartar_entrada(self, entrada):
+        self._em_disco(os.path.dirname(entrada.caminho_origem), entrada.descartar)
+
+    def _mover_existente(self, caminho, caminho_duplicado):
+        self._em_disco(os.path.dirname(caminho), self.movimentador.mover, caminho, caminho_duplicado)
+
+    def operacoes_pendentes(self):
+        """Operações agendadas no executor desde a última chamada (as da entrada recém-colocada)"""
+        operacoes, self.operacoes = self.operacoes, []
+        return operacoes
+
+    def restaurar_indice(self, destinos_por_chave):
+        """Recarrega o índice chave -> caminho de destino (ex.: retomada de execução interrompida)"""
+        for chave, caminho_destino in destinos_por_chave.items():
+            self._indexar(chave, caminho_destino)
+
+    def _indexar(self, chave, caminho_destino):
+        if chave:
+            self.destinos_por_chave[chave] = caminho_destino
+            self.chaves_por_destino[caminho_destino] = chave
+
+    def gravar_divergencias(self):
+        """Acrescenta ao índice da pasta de duplicados as chaves divergentes ainda não gravadas"""
+        divergencias, self.divergencias = self.divergencias, []
+        return gravar_divergencias(self.nomeador.pasta, divergencias)
+
+class SimulacaoDuplicados(ControleDuplicados):
+    """
+    Mesmas decisões de ControleDuplicados sem mexer em nada: cada operação vira uma ação do plano
+    (ver plano_cte). Arquivos que só existiriam no destino são comparados pelo conteúdo da origem.
+    """
+
+    def __init__(self, pasta_duplicados, plano, pastas):
+        super().__init__(pasta_duplicados, pastas=pastas)
+        self.plano = plano
+        self.simulados = {}  # caminho de destino -> entrada que estaria lá
+
+    def _hash_destino(self, caminho_destino):
+        if caminho_destino in self.simulados and caminho_destino not in self.hashes:
+            self.hashes[caminho_destino] = hash_entrada(self.simulados[caminho_destino])
+        return super()._hash_destino(caminho_destino)
+
+    def _mover_entrada(self, entrada, caminho):
+        self.simulados[caminho] = entrada
+        self.pastas.adicionar(caminho)
+        self.plano.registrar('mover', entrada.rotulo, caminho)
+
+    def _descartar_entrada(self, entrada):
+        self.plano.registrar('descartar', entrada.rotulo)
+
+    def _mover_existente(self, caminho, caminho_duplicado):
+        self.simulados.pop(caminho, None)
+        self.plano.registrar('para_duplicados', caminho, caminho_duplicado)
+
+    def gravar_divergencias(self):
+        return None
+
+def gravar_divergencias(pasta_duplicados, divergencias):
+    """
+    Acrescenta (chave, caminho mantido, caminho duplicado) ao arquivo 0.Divergentes.txt da pasta de duplicados.
+    :return: Caminho do arquivo, ou None se não houver divergências
+    """
+    if not divergencias:
+        return None
+    caminho_indice = os.path.join(pasta_duplicados, "0.Divergentes.txt")
+    with open(caminho_indice, 'a', encoding='utf-8') as f:
+        f.write(f"Data do processamento: {time.strftime('%d/%m/%Y %H:%M:%S')}\n")
+        for chave, mantido, duplicado in divergencias:
+            f.write(f"{chave}\tmantido: {mantido}\tduplicado: {duplicado}\n")
+    return caminho_indice
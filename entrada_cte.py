@@ -0,0 +1,448 @@
+import os
+import posixpath
+import queue
+import shutil
+import threading
+import time
+import zipfile
+import zlib
+from collections import OrderedDict, namedtuple
+
+
+# ZIPs de entrada mantidos abertos por thread (o índice central de um ZIP grande é lido uma vez só)
+MAX_ZIPS_ORIGEM_ABERTOS = 4
+# Entradas descobertas à frente do processamento (ver em_segundo_plano)
+LIMITE_FILA_DESCOBERTA = 10000
+
+_local = threading.local()
+
+def _zips_abertos():
+    """caminho do ZIP -> zipfile.ZipFile abertos por esta thread deste processo"""
+    if getattr(_local, 'pid', None) != os.getpid():
+        # Worker criado por fork herda os ZIPs do processo principal, mas a posição de leitura
+        # do descritor é compartilhada entre os dois: cada processo (e cada thread) abre os seus
+        _local.zips = OrderedDict()
+        _local.pid = os.getpid()
+    return _local.zips
+
+def _zip_origem(caminho_zip):
+    """Retorna o ZIP de entrada aberto para leitura, reaproveitando o que já estiver aberto"""
+    abertos = _zips_abertos()
+    zipf = abertos.get(caminho_zip)
+    if zipf is not None:
+        abertos.move_to_end(caminho_zip)
+        return zipf
+    while len(abertos) >= MAX_ZIPS_ORIGEM_ABERTOS:
+        abertos.popitem(last=False)[1].close()
+    zipf = abertos[caminho_zip] = zipfile.ZipFile(caminho_zip, 'r')
+    return zipf
+
+def fechar_zips_origem():
+    """Fecha os ZIPs de entrada abertos nesta thread (necessário antes de apagá-los no Windows)"""
+    abertos = _zips_abertos()
+    while abertos:
+        abertos.popitem()[1].close()
+
+class ArquivoXml(namedtuple('ArquivoXml', ['caminho'])):
+    """XML solto na pasta de origem"""
+    __slots__ = ()
+    compactada = False
+
+    @property
+    def nome(self):
+        return os.path.basename(self.caminho)
+
+    @property
+    def rotulo(self):
+        """Identificação usada em mensagens e na amostragem da conferência"""
+        return self.caminho
+
+    @property
+    def caminho_origem(self):
+        """Arquivo que sai da pasta de origem quando a entrada é concluída"""
+        return self.caminho
+
+    def abrir(self):
+        return open(self.caminho, 'rb')
+
+    def ler(self):
+        with self.abrir() as f:
+            return f.read()
+
+    def assinatura(self):
+        """(tamanho, CRC-32) do conteúdo, comparável com os membros de um ZIP"""
+        crc = 0
+        with self.abrir() as f:
+            for bloco in iter(lambda: f.read(1048576), b''):
+                crc = zlib.crc32(bloco, crc)
+            return f.tell(), crc
+
+    def mover(self, caminho_destino, movimentador):
+        """:param movimentador: MovimentadorArquivos (ver movimentacao_cte) de quem está separando"""
+        movimentador.mover(self.caminho, caminho_destino)
+
+    def mover_para_erros(self, caminho_destino, movimentador):
+        """Move o XML para caminho_destino na pasta de erros (ver erros_cte); retorna True quando ele sai da origem"""
+        self.mover(caminho_destino, movimentador)
+        return True
+
+    def descartar(self):
+        os.remove(self.caminho)
+
+    def info_zip(self, arcname):
+        """ZipInfo do membro arcname com a data do arquivo (para gravar o conteúdo lido com writestr)"""
+        return zipfile.ZipInfo.from_file(self.caminho, arcname)
+
+    def gravar_no_zip(self, zipf, arcname):
+        zipf.write(self.caminho, arcname)
+
+class MembroZip(namedtuple('MembroZip', ['caminho_zip', 'membro'])):
+    """
+    XML dentro de um ZIP deixado na pasta de origem, lido direto do ZIP sem extrair para o disco.
+    O membro não é apagado individualmente: o ZIP inteiro sai da origem quando todos os membros
+    forem concluídos (ver ZipsOrigem).
+    """
+    __slots__ = ()
+    compactada = True
+
+    @property
+    def nome(self):
+        return posixpath.basename(self.membro)
+
+    @property
+    def rotulo(self):
+        return f"{self.caminho_zip}:{self.membro}"
+
+    @property
+    def caminho_origem(self):
+        return self.caminho_zip
+
+    def _info(self):
+        return _zip_origem(self.caminho_zip).getinfo(self.membro)
+
+    def abrir(self):
+        return _zip_origem(self.caminho_zip).open(self.membro)
+
+    def ler(self):
+        return _zip_origem(self.caminho_zip).read(self.membro)  # Confere o CRC ao terminar a leitura
+
+    def assinatura(self):
+        """(tamanho, CRC-32) direto do índice central, sem descompactar"""
+        info = self._info()
+        return info.file_size, info.CRC
+
+    def mover(self, caminho_destino, movimentador=None):
+        """Grava o conteúdo do membro em caminho_destino, com a data do membro (sem usar o movimentador)"""
+        dados = self.ler()  # Lido por inteiro antes: membro corrompido não deixa arquivo pela metade
+        with open(caminho_destino, 'wb') as f:
+            f.write(dados)
+        data_membro = time.mktime(self._info().date_time + (0, 0, -1))
+        os.utime(caminho_destino, (data_membro, data_membro))
+
+    def mover_para_erros(self, caminho_destino, movimentador=None):
+        """
+        Grava o membro em caminho_destino na pasta de erros. Se nem o conteúdo puder ser lido (ZIP corrompido),
+        o membro fica no ZIP de origem e retorna False, o que impede o ZIP de ser apagado.
+        """
+        try:
+            self.mover(caminho_destino)
+        except (zipfile.BadZipFile, zlib.error, EOFError):
+            return False
+        return True
+
+    def descartar(self):
+        pass
+
+    def info_zip(self, arcname):
+        """ZipInfo do membro arcname com a data do membro de origem"""
+        return zipfile.ZipInfo(arcname, date_time=self._info().date_time)
+
+    def gravar_no_zip(self, zipf, arcname):
+        zipf.writestr(self.info_zip(arcname), self.ler(), compress_type=zipf.compression,
+                      compresslevel=zipf.compresslevel)
+
+# ioctl FICLONE do Linux (Btrfs, XFS...): cópia que compartilha os blocos do original
+_FICLONE = 0x40049409
+
+def vincular(origem, destino):
+    """
+    Cria destino com o mesmo conteúdo de origem sem gastar bytes a mais, quando possível:
+    hardlink; se o sistema de arquivos não permitir (ex.: outro volume), reflink; senão cópia.
+    :return: 'hardlink', 'reflink' ou 'copia'
+    """
+    try:
+        os.link(origem, destino)
+        return 'hardlink'
+    except OSError:
+        pass
+    try:
+        _reflink(origem, destino)
+        return 'reflink'
+    except (OSError, ImportError):
+        pass
+    shutil.copy2(origem, destino)
+    return 'copia'
+
+def _reflink(origem, destino):
+    import fcntl  # Não existe no Windows
+    with open(origem, 'rb') as f_origem, open(destino, 'wb') as f_destino:
+        try:
+            fcntl.ioctl(f_destino.fileno(), _FICLONE, f_origem.fileno())
+        except OSError:
+            f_destino.close()
+            os.remove(destino)
+            raise
+
+class VinculoXml(namedtuple('VinculoXml', ['caminho', 'modos'])):
+    """
+    XML já colocado em outra visão (ver motor_cte): entra nesta visão por vincular(),
+    sem sair de onde está. Descartar não apaga nada.
+    modos: Counter onde cada vínculo criado é contado ('hardlink', 'reflink' ou 'copia').
+    """
+    __slots__ = ()
+    compactada = False
+    nome = ArquivoXml.nome
+    rotulo = ArquivoXml.rotulo
+    caminho_origem = ArquivoXml.caminho_origem
+    abrir = ArquivoXml.abrir
+    ler = ArquivoXml.ler
+
+    def mover(self, caminho_destino, movimentador=None):
+        self.modos[vincular(self.caminho, caminho_destino)] += 1
+
+    def descartar(self):
+        pass
+
+def _e_xml(nome):
+    return nome.lower().endswith('.xml')
+
+def _e_zip(nome):
+    return nome.lower().endswith('.zip')
+
+def _membros_zip(caminho_zip):
+    """(nomes dos membros XML do ZIP, na ordem do índice central; quantidade de outros arquivos)"""
+    xmls, outros = [], 0
+    for info in _zip_origem(caminho_zip).infolist():
+        if info.is_dir():
+            continue
+        if _e_xml(info.filename):
+            xmls.append(info.filename)
+        else:
+            outros += 1
+    return xmls, outros
+
+def _membros_xml(caminho_zip):
+    """Nomes dos membros XML do ZIP, na ordem do índice central"""
+    return _membros_zip(caminho_zip)[0]
+
+def contar_entradas(pasta, ignorar=(), concluidos=(), shard=None, zips_concluidos=()):
+    """
+    Conta os XMLs em uma pasta e subpastas, incluindo os que estão dentro de arquivos ZIP
+    (só o índice central de cada ZIP é lido). Pastas de nome em ignorar não são percorridas.
+    :param concluidos: MembroZip já concluídos por uma execução interrompida (não são contados)
+    :param shard, zips_concluidos: Só as entradas do shard (ver ZipsOrigem)
+    """
+    count = 0
+    for root, dirs, files in os.walk(pasta):
+        dirs[:] = [d for d in dirs if d not in ignorar]
+        for f in files:
+            if _e_xml(f):
+                if shard is None or shard.contem(f):
+                    count += 1
+            elif _e_zip(f):
+                caminho = os.path.join(root, f)
+                if caminho in zips_concluidos:
+                    continue
+                try:
+                    count += sum(1 for m in _membros_xml(caminho) if MembroZip(caminho, m) not in concluidos
+                                 and (shard is None or shard.contem(posixpath.basename(m))))
+                except (zipfile.BadZipFile, OSError):
+                    pass  # ZIP ilegível: é apontado na listagem
+    return count
+
+def existem_entradas(pasta, ignorar=(), concluidos=(), shard=None, zips_concluidos=()):
+    """Há ao menos uma entrada a processar? Para na primeira, sem percorrer a pasta inteira"""
+    for _ in ZipsOrigem(shard, zips_concluidos).listar(pasta, ignorar, concluidos):
+        return True
+    return False
+
+class ContagemEmSegundoPlano:
+    """
+    contar_entradas em uma thread: o processamento começa na hora e a barra de progresso ganha o total
+    quando a contagem termina (total fica None até lá).
+    """
+
+    def __init__(self, pasta, ignorar=(), concluidos=(), shard=None, zips_concluidos=()):
+        self.total = None
+        self._thread = threading.Thread(target=self._contar, args=(pasta, ignorar, concluidos, shard, zips_concluidos),
+                                        name='contagem', daemon=True)
+        self._thread.start()
+
+    def _contar(self, pasta, ignorar, concluidos, shard, zips_concluidos):
+        try:
+            self.total = contar_entradas(pasta, ignorar, concluidos, shard, zips_concluidos)
+        finally:
+            fechar_zips_origem()
+
+    def aguardar(self):
+        """Espera a contagem terminar e retorna o total"""
+        self._thread.join()
+        return self.total
+
+_FIM = object()
+
+class DescobertaEmSegundoPlano:
+    """
+    Percorre o iterável (ex.: ZipsOrigem.listar) em uma thread, entregando os itens por uma fila de
+    até limite itens: a descoberta das próximas entradas (scandir, índices de ZIP) acontece enquanto as
+    anteriores são lidas e movidas, e a memória não cresce com o tamanho da pasta de origem.
+    descobertas: itens entregues até agora (ao final, o total exato de entradas).
+    Uma exceção na descoberta é repassada a quem consome.
+    """
+
+    def __init__(self, iteravel, limite=LIMITE_FILA_DESCOBERTA):
+        self.descobertas = 0
+        self._fila = queue.Queue(maxsize=max(1, limite))
+        threading.Thread(target=self._produzir, args=(iteravel,), name='descoberta', daemon=True).start()
+
+    def _produzir(self, iteravel):
+        try:
+            for item in iteravel:
+                self._fila.put(item)
+        except BaseException as erro:
+            self._fila.put(_FalhaDescoberta(erro))
+        finally:
+            fechar_zips_origem()  # Os ZIPs abertos por esta thread
+            self._fila.put(_FIM)
+
+    def __iter__(self):
+        while True:
+            item = self._fila.get()
+            if item is _FIM:
+                return
+            if isinstance(item, _FalhaDescoberta):
+                raise item.erro
+            self.descobertas += 1
+            yield item
+
+class _FalhaDescoberta:
+    __slots__ = ('erro',)
+
+    def __init__(self, erro):
+        self.erro = erro
+
+class ZipsOrigem:
+    """
+    Lista as entradas da pasta de origem (XMLs soltos e membros XML de ZIPs) e acompanha,
+    para cada ZIP, quantos membros ainda faltam concluir. Um ZIP só é apagado da origem quando
+    todos os seus membros foram colocados no destino, descartados como duplicados ou gravados em erros;
+    se a execução for interrompida antes, ele continua na origem e é lido de novo na próxima.
+    ZIPs com outros arquivos além dos XMLs (ex.: PDFs do DACTE) nunca são apagados: os XMLs são separados
+    e o ZIP fica em pendentes, mantido na origem. ZIPs sem nenhum XML não são entradas e ficam intocados.
+    Com um shard (ver shards_cte), só são listados os XMLs e membros cujo nome é do shard, e os ZIPs
+    não são apagados (os outros shards leem os outros membros): os concluídos ficam em concluidos
+    até a mescla dos shards, que apaga os que todos concluíram.
+    """
+
+    def __init__(self, shard=None, zips_concluidos=()):
+        """:param zips_concluidos: ZIPs cujos membros do shard já foram concluídos por uma execução anterior dele"""
+        self.shard = shard
+        self.zips_concluidos = zips_concluidos
+        self.concluidos = set()  # ZIPs concluídos pelo shard nesta execução (mantidos na origem)
+        self.pendentes = {}   # caminho do ZIP -> membros ainda não concluídos
+        self.com_outros = set()  # ZIPs com arquivos que não são XML (nunca apagados)
+        self.invalidos = []   # (caminho do ZIP, erro) dos ZIPs que não puderam ser abertos
+        self.invalidos_movidos = 0
+        self.removidos = 0
+
+    def listar(self, pasta, ignorar=(), concluidos=()):
+        """
+        Gera ArquivoXml e MembroZip para cada XML da pasta e subpastas.
+        :param concluidos: MembroZip já concluídos por uma execução interrompida (não são gerados de novo)
+        """
+        for root, dirs, files in os.walk(pasta):
+            dirs[:] = [d for d in dirs if d not in ignorar]
+            for f in files:
+                if _e_xml(f):
+                    if self.shard is None or self.shard.contem(f):
+                        yield ArquivoXml(os.path.join(root, f))
+                elif _e_zip(f):
+                    yield from self._membros(os.path.join(root, f), concluidos)
+
+    def listar_arquivos(self, caminhos, concluidos=()):
+        """
+        Gera as entradas só dos XMLs e ZIPs indicados (ex.: os lotes do modo vigia, ver vigia_cte).
+        Caminhos que já não existem (movidos por outro processo) são ignorados.
+        """
+        for caminho in caminhos:
+            nome = os.path.basename(caminho)
+            if not os.path.exists(caminho):
+                continue
+            if _e_xml(nome):
+                if self.shard is None or self.shard.contem(nome):
+                    yield ArquivoXml(caminho)
+            elif _e_zip(nome):
+                yield from self._membros(caminho, concluidos)
+
+    def _membros(self, caminho, concluidos):
+        if caminho in self.zips_concluidos:
+            return
+        try:
+            membros, outros = _membros_zip(caminho)
+        except (zipfile.BadZipFile, OSError) as e:
+            # Entre shards, o ZIP ilegível vai para erros pelo shard do nome do ZIP
+            if self.shard is None or self.shard.contem(os.path.basename(caminho)):
+                self.invalidos.append((caminho, f"{type(e).__name__}: {e}"))
+            return
+        if not membros:
+            return  # Nenhum XML: não é um pacote de CT-es, fica na origem como está
+        if outros:
+            self.com_outros.add(caminho)
+        else:
+            self.com_outros.discard(caminho)
+        if concluidos:
+            membros = [m for m in membros if MembroZip(caminho, m) not in concluidos]
+        if self.shard is not None:
+            membros = [m for m in membros if self.shard.contem(posixpath.basename(m))]
+        self.pendentes[caminho] = len(membros)
+        for membro in membros:
+            yield MembroZip(caminho, membro)
+
+    def concluir(self, entrada):
+        """Registra que a entrada saiu da origem (para XMLs soltos não há nada a fazer)"""
+        if entrada.compactada:
+            self.pendentes[entrada.caminho_zip] -= 1
+
+    def mover_invalidos(self, erros):
+        """
+        Move para a pasta de erros os ZIPs que não puderam ser abertos e ainda não tinham sido movidos
+        (o modo vigia chama a cada lote); retorna quantos foram movidos agora
+        :param erros: PastaErros (ver erros_cte)
+        """
+        novos = self.invalidos[self.invalidos_movidos:]
+        for caminho_zip, erro in novos:
+            erros.mover_zip(caminho_zip, erro)
+        self.invalidos_movidos = len(self.invalidos)
+        return len(novos)
+
+    def remover_concluidos(self):
+        """
+        Apaga da origem os ZIPs com todos os membros concluídos. Os que têm outros arquivos além dos XMLs
+        continuam em pendentes (mantidos na origem), mesmo com todos os XMLs concluídos.
+        Deve ser chamado depois que o destino foi finalizado (no modo direto_zip, os ZIPs de destino gravados).
+        Um ZIP que não pode ser apagado (ex.: aberto por outro programa no Windows) fica na origem, em pendentes.
+        :return: Quantidade de ZIPs removidos
+        """
+        fechar_zips_origem()
+        for caminho_zip, restantes in list(self.pendentes.items()):
+            if restantes == 0 and caminho_zip not in self.com_outros:
+                if self.shard is None:
+                    try:
+                        os.remove(caminho_zip)
+                    except OSError:
+                        continue
+                    self.removidos += 1
+                else:
+                    self.concluidos.add(caminho_zip)
+                del self.pendentes[caminho_zip]
+        return self.removidos
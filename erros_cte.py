@@ -0,0 +1,131 @@
+import os
+import time
+from collections import Counter, namedtuple
+from xml.etree import ElementTree as ET
+
+from extrator_cte import DocumentoRecusado
+from duplicados_cte import NomeadorDuplicados
+from movimentacao_cte import MovimentadorArquivos
+
+# Índice da pasta de erros: uma linha por arquivo (data, motivo, origem, arquivo em erros, mensagem)
+ARQUIVO_INDICE_ERROS = "0.indice_erros.txt"
+
+# Motivo -> (subpasta dentro da pasta de erros, descrição). Documentos que não são CT-e (ou sem CNPJ)
+# ficam separados por tipo; os ilegíveis continuam na raiz da pasta de erros, como antes.
+MOTIVOS = {
+    'evento': ("Eventos", "Eventos de CT-e"),
+    'cte_os': ("CT-e OS", "CT-e OS (modelo 67)"),
+    'nfe': ("NF-e", "NF-e e eventos de NF-e"),
+    'outro': ("Outros documentos", "Outros documentos (não CT-e)"),
+    'cpf': ("CPF", "CT-es com CPF no lugar do CNPJ"),
+    'incompleto': ("", "CT-es sem CNPJ ou data de emissão"),
+    'invalido': ("", "XMLs malformados, truncados ou vazios"),
+    'zip': ("", "ZIPs ilegíveis"),
+    'erro': ("", "Outros erros"),
+}
+
+class FalhaLeitura(namedtuple('FalhaLeitura', ['motivo', 'mensagem'])):
+    """Erro de leitura devolvido pelos workers (ver paralelo_cte) no lugar do registro; str() é a mensagem"""
+    __slots__ = ()
+
+    def __str__(self):
+        return self.mensagem
+
+def motivo_da_falha(falha):
+    """Motivo (chave de MOTIVOS) de uma FalhaLeitura ou exceção"""
+    if isinstance(falha, FalhaLeitura):
+        return falha.motivo
+    if isinstance(falha, DocumentoRecusado):
+        return falha.motivo
+    if isinstance(falha, ET.ParseError):
+        return 'invalido'
+    return 'erro'
+
+def falha_leitura(excecao):
+    """FalhaLeitura da exceção levantada ao ler uma entrada"""
+    return FalhaLeitura(motivo_da_falha(excecao), f"{type(excecao).__name__}: {excecao}")
+
+def relatorio_motivos(contagem):
+    """Uma linha por motivo com arquivos em contagem (motivo -> arquivos), na ordem de MOTIVOS"""
+    return "\n".join(f"    {MOTIVOS[motivo][1]}: {contagem[motivo]}" for motivo in MOTIVOS if contagem.get(motivo))
+
+class PastaErros:
+    """
+    Pasta de erros com uma subpasta por tipo de documento recusado (ver MOTIVOS) e um índice do que foi
+    gravado nela (0.indice_erros.txt, acrescentado a cada execução). Arquivos com o mesmo nome não se
+    sobrescrevem: o segundo recebe "nome (N).xml", como na pasta de duplicados.
+    """
+
+    def __init__(self, pasta_erros, shard=None, movimentador=None):
+        """
+        :param shard: Shard (ver shards_cte): o índice do shard fica à parte até a mescla
+        :param movimentador: MovimentadorArquivos (ver movimentacao_cte) do motor (None = um próprio);
+                             as cópias pendentes dele são descarregadas em fechar
+        """
+        self.pasta = pasta_erros
+        self.movimentador = movimentador or MovimentadorArquivos()
+        self.arquivo_indice = shard.arquivo(ARQUIVO_INDICE_ERROS) if shard else ARQUIVO_INDICE_ERROS
+        self.contagem = Counter()  # motivo -> arquivos nesta execução
+        self._nomes = {}           # subpasta -> (nomes já usados, NomeadorDuplicados)
+        self._indice = None
+
+    def _caminho_livre(self, motivo, nome):
+        """Caminho na subpasta do motivo para o nome, numerado se já existir"""
+        pasta = os.path.join(self.pasta, MOTIVOS[motivo][0]) if MOTIVOS[motivo][0] else self.pasta
+        usados = self._nomes.get(pasta)
+        if usados is None:
+            # Uma leitura da pasta por execução, como o NomeadorDuplicados, sem os.path.exists a cada arquivo
+            os.makedirs(pasta, exist_ok=True)
+            with os.scandir(pasta) as entradas:
+                usados = self._nomes[pasta] = ({os.path.normcase(e.name) for e in entradas},
+                                               NomeadorDuplicados(pasta))
+        nomes, nomeador = usados
+        caminho = os.path.join(pasta, nome)
+        while os.path.normcase(os.path.basename(caminho)) in nomes:
+            caminho = nomeador.proximo_caminho(nome)
+        nomes.add(os.path.normcase(os.path.basename(caminho)))
+        return caminho
+
+    def mover(self, entrada, falha):
+        """
+        Grava a entrada (ArquivoXml ou MembroZip) na subpasta do motivo da falha e registra no índice.
+        :param falha: FalhaLeitura (do extrator) ou a exceção levantada ao colocar a entrada
+        :return: True quando a entrada saiu da origem (membro de ZIP ilegível fica no ZIP)
+        """
+        motivo = motivo_da_falha(falha)
+        caminho = self._caminho_livre(motivo, entrada.nome)
+        saiu = entrada.mover_para_erros(caminho, self.movimentador)
+        self.registrar(motivo, entrada.rotulo, caminho if saiu else None, falha)
+        return saiu
+
+    def mover_zip(self, caminho_zip, erro):
+        """Move para a pasta de erros um ZIP da origem que não pôde ser aberto"""
+        caminho = self._caminho_livre('zip', os.path.basename(caminho_zip))
+        self.movimentador.mover(caminho_zip, caminho)
+        self.registrar('zip', caminho_zip, caminho, erro)
+
+    def registrar(self, motivo, origem, caminho, mensagem):
+        """Conta o motivo e acrescenta a linha no índice (caminho None: ficou na origem)"""
+        self.contagem[motivo] += 1
+        if self._indice is None:
+            os.makedirs(self.pasta, exist_ok=True)
+            self._indice = open(os.path.join(self.pasta, self.arquivo_indice), 'a', encoding='utf-8')
+        destino = os.path.relpath(caminho, self.pasta) if caminho else "(mantido na origem)"
+        if isinstance(mensagem, Exception):
+            mensagem = f"{type(mensagem).__name__}: {mensagem}"
+        mensagem = ' '.join(str(mensagem).split())
+        self._indice.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')}\t{motivo}\t{origem}\t{destino}\t{mensagem}\n")
+
+    @property
+    def total(self):
+        return sum(self.contagem.values())
+
+    def relatorio(self):
+        """Uma linha por motivo, na ordem de MOTIVOS"""
+        return relatorio_motivos(self.contagem)
+
+    def fechar(self):
+        self.movimentador.descarregar()
+        if self._indice is not None:
+            self._indice.close()
+            self._indice = None
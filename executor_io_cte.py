@@ -0,0 +1,78 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Operações em andamento por thread antes de o laço principal esperar (contrapressão)
+PENDENTES_POR_THREAD = 64
+
+class ExecutorIO:
+    """
+    Executa as operações de disco (mover, apagar) em um pool de threads, para que as idas e voltas
+    de um compartilhamento de rede (SMB/NFS) aconteçam ao mesmo tempo em vez de uma por arquivo.
+    - Ordem por pasta: operações na mesma pasta rodam na ordem em que foram submetidas (ex.: o arquivo
+      antigo vai para duplicados antes de o novo ocupar o nome), pastas diferentes rodam em paralelo.
+    - Contrapressão: com max_pendentes operações em andamento, submeter espera a mais antiga terminar;
+      o laço principal para de pedir entradas e a leitura (paralelo_cte) para junto.
+    - ao_concluir: funções chamadas no laço principal, na ordem de registro, quando as operações de uma
+      entrada terminam (ex.: gravar no diário que a entrada saiu da origem só depois de ela sair mesmo).
+    Depois de encerrar, o próximo submeter abre outro pool (motor reaproveitado entre lotes, ver separacao_cte).
+    """
+
+    def __init__(self, threads, max_pendentes=None):
+        self.threads = max(1, threads)
+        self.pool = None
+        self.max_pendentes = max_pendentes or max(1, threads) * PENDENTES_POR_THREAD
+        self.ultimo_por_pasta = {}  # pasta -> última operação submetida nela
+        self.em_andamento = set()
+        self.conclusoes = deque()   # (operações, função)
+
+    def submeter(self, pasta, funcao, *args):
+        """Agenda funcao(*args) depois das operações já submetidas na mesma pasta; retorna o Future"""
+        while len(self.em_andamento) >= self.max_pendentes:
+            _, self.em_andamento = wait(self.em_andamento, return_when=FIRST_COMPLETED)
+            self.processar_concluidos()
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='io')
+        anterior = self.ultimo_por_pasta.get(pasta)
+        futuro = self.pool.submit(_em_ordem, anterior, funcao, args)
+        self.ultimo_por_pasta[pasta] = futuro
+        self.em_andamento.add(futuro)
+        return futuro
+
+    def aguardar(self, pasta):
+        """Espera as operações da pasta (antes de ler ou mexer nela fora do pool)"""
+        futuro = self.ultimo_por_pasta.pop(pasta, None)
+        if futuro is not None:
+            wait((futuro,))
+
+    def ao_concluir(self, futuros, funcao):
+        """Chama funcao(erro) no laço principal quando todas as operações terminarem (erro: a primeira falha)"""
+        self.conclusoes.append((futuros, funcao))
+        self.processar_concluidos()
+
+    def processar_concluidos(self, bloquear=False):
+        """Chama as funções de ao_concluir já prontas (com bloquear, espera todas)"""
+        while self.conclusoes:
+            futuros, funcao = self.conclusoes[0]
+            if bloquear:
+                wait(futuros)
+            elif not all(futuro.done() for futuro in futuros):
+                return
+            self.conclusoes.popleft()
+            erros = [futuro.exception() for futuro in futuros if futuro.exception() is not None]
+            funcao(erros[0] if erros else None)
+
+    def encerrar(self):
+        """Espera todas as operações e conclusões e fecha o pool"""
+        self.processar_concluidos(bloquear=True)
+        wait(self.em_andamento)
+        self.em_andamento.clear()
+        self.ultimo_por_pasta.clear()
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+def _em_ordem(anterior, funcao, args):
+    # Falha da operação anterior na pasta não impede esta (cada entrada trata a sua)
+    if anterior is not None:
+        wait((anterior,))
+    return funcao(*args)
@@ -0,0 +1,408 @@
+import io
+import mmap
+import os
+import re
+from collections import namedtuple
+from xml.etree import ElementTree as ET
+
+NS_CTE = 'http://www.portalfiscal.inf.br/cte'
+
+# Bytes lidos por vez; os campos usados ficam no início do XML, antes de Signature e protCTe
+TAMANHO_LEITURA = 4096
+# Bytes do fim do XML onde o fechamento do elemento raiz é procurado quando a leitura para antes do fim
+TAMANHO_CAUDA = 512
+
+_INF_CTE = f'{{{NS_CTE}}}infCte'
+_IDE = f'{{{NS_CTE}}}ide'
+_DH_EMI = f'{{{NS_CTE}}}dhEmi'
+_CNPJ = f'{{{NS_CTE}}}CNPJ'
+_CPF = f'{{{NS_CTE}}}CPF'
+
+# Registro mínimo compartilhado pelos separadores: CNPJ da chave de separação,
+# data de emissão (AAAA-MM-DD), chave de acesso (44 dígitos, sem o prefixo "CTe")
+# e tamanho do arquivo em bytes (usado no manifesto da execução); hash do conteúdo (BLAKE2b, ver
+# duplicados_cte.hash_arquivo) só quando pedido ao ExtratorParalelo (catálogo, ver catalogo_cte);
+# fiscal: valores dos campos fiscais pedidos (ver fiscal_cte), só na exportação fiscal
+RegistroCte = namedtuple('RegistroCte', ['cnpj', 'data_emissao', 'chave', 'tamanho', 'hash', 'fiscal'],
+                         defaults=(None, None))
+
+# Tipo de documento pelo elemento raiz (sem o prefixo de namespace); raízes fora daqui seguem para o parser
+TIPOS_POR_RAIZ = {
+    'cteProc': 'cte', 'CTe': 'cte',
+    'cteOSProc': 'cte_os', 'CTeOS': 'cte_os',
+    'procEventoCTe': 'evento', 'eventoCTe': 'evento', 'retEventoCTe': 'evento',
+    'nfeProc': 'nfe', 'NFe': 'nfe', 'procEventoNFe': 'nfe', 'resNFe': 'nfe', 'resEvento': 'nfe',
+    'GTVeProc': 'outro', 'GTVe': 'outro', 'mdfeProc': 'outro', 'MDFe': 'outro', 'procEventoMDFe': 'outro',
+}
+# Modelo do CT-e (ide/mod) quando a raiz não diz: 57 = CT-e, 67 = CT-e OS, 64 = GT-Ve
+TIPOS_POR_MODELO = {b'57': 'cte', b'67': 'cte_os', b'64': 'outro'}
+
+_NOME_RAIZ = re.compile(rb'<(?:[A-Za-z_][\w.\-]*:)?([A-Za-z_][\w.\-]*)')
+_FECHAMENTO_RAIZ = re.compile(rb'</(?:[A-Za-z_][\w.\-]*:)?([A-Za-z_][\w.\-]*)\s*>\s*$')
+_MODELO = re.compile(rb'<(?:\w+:)?mod>\s*(\d+)\s*</')
+
+class DocumentoRecusado(ValueError):
+    """
+    XML que não entra na separação por ser de outro tipo (evento, CT-e OS, NF-e...) ou por não ter o CNPJ
+    pedido (ex.: CPF); motivo diz para qual pasta de erros ele vai (ver erros_cte.MOTIVOS)
+    """
+
+    def __init__(self, motivo, mensagem):
+        super().__init__(mensagem)
+        self.motivo = motivo
+
+def _raiz(cabeca):
+    """Match de _NOME_RAIZ no elemento raiz (depois de BOM, declaração, comentários e DOCTYPE), ou None"""
+    posicao = 0
+    while True:
+        posicao = cabeca.find(b'<', posicao)
+        if posicao < 0:
+            return None
+        if cabeca.startswith(b'<?', posicao):
+            fim, pulo = cabeca.find(b'?>', posicao), 2
+        elif cabeca.startswith(b'<!--', posicao):
+            fim, pulo = cabeca.find(b'-->', posicao), 3
+        elif cabeca.startswith(b'<!', posicao):
+            fim, pulo = cabeca.find(b'>', posicao), 1
+        else:
+            break
+        if fim < 0:
+            return None
+        posicao = fim + pulo
+    return _NOME_RAIZ.match(cabeca, posicao)
+
+def identificar_documento(cabeca):
+    """
+    Tipo do documento ('cte', 'cte_os', 'evento', 'nfe', 'outro') pelos primeiros bytes do XML, sem parser:
+    pula BOM, declaração, comentários e DOCTYPE e lê o nome do elemento raiz; nos CT-es, confere ide/mod
+    se ele aparecer no trecho. Retorna None quando o trecho não permite decidir (outra codificação,
+    raiz desconhecida...): o parser decide.
+    """
+    raiz = _raiz(cabeca)
+    if raiz is None:
+        return None
+    tipo = TIPOS_POR_RAIZ.get(raiz.group(1).decode('ascii'))
+    if tipo == 'cte':
+        modelo = _MODELO.search(cabeca, raiz.end())
+        if modelo is not None:
+            tipo = TIPOS_POR_MODELO.get(modelo.group(1), 'outro')
+    return tipo
+
+_DESCRICOES_TIPO = {
+    'cte_os': "CT-e OS (modelo 67)",
+    'evento': "evento de CT-e",
+    'nfe': "NF-e ou evento de NF-e",
+    'outro': "documento que não é CT-e",
+}
+
+def conferir_documento(cabeca):
+    """:raises DocumentoRecusado: Os primeiros bytes (ver identificar_documento) são de outro documento"""
+    tipo = identificar_documento(cabeca)
+    if tipo is not None and tipo != 'cte':
+        raise DocumentoRecusado(tipo, f"Não é CT-e modelo 57: {_DESCRICOES_TIPO[tipo]}")
+
+def extrair_registro(caminho, tag_cnpj, dados=None, coletor=None):
+    """
+    Lê o XML de forma incremental e para assim que CNPJ, dhEmi e chave forem encontrados.
+    Os caminhos são ancorados em infCte (infCte/ide/dhEmi e infCte/<tag_cnpj>/CNPJ),
+    então blocos como Signature e protCTe normalmente nem chegam a ser lidos. Antes de aceitar o XML,
+    o fim dele é conferido (ver conferir_fim): arquivo truncado depois dos campos não passa.
+    :param tag_cnpj: Grupo do CNPJ desejado ('emit' para emitente, 'receb' para recebedor)
+    :param dados: Conteúdo já em memória (membro de ZIP); nesse caso caminho não é aberto
+    :param coletor: ColetorFiscal (ver fiscal_cte): a leitura vai até o fim do infCte, na mesma passada,
+                    e os campos fiscais vão em registro.fiscal
+    :return: RegistroCte
+    :raises DocumentoRecusado: Evento, NF-e, CT-e OS (pelo primeiro bloco), CPF no grupo ou campos ausentes
+    """
+    if dados is not None:
+        return _extrair(io.BytesIO(dados), len(dados), tag_cnpj, coletor)
+    with open(caminho, 'rb') as f:
+        return _extrair(f, os.fstat(f.fileno()).st_size, tag_cnpj, coletor)
+
+def _extrair(f, tamanho, tag_cnpj, coletor=None):
+    """Leitura incremental propriamente dita, a partir de um arquivo binário aberto"""
+    grupo = f'{{{NS_CTE}}}{tag_cnpj}'
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    pilha = []
+    raiz = None
+    cnpj = data_emissao = chave = None
+    cpf = inf_cte = False
+
+    # Evento, NF-e, CT-e OS...: recusado pelo primeiro bloco, sem passar pelo parser
+    bloco = f.read(TAMANHO_LEITURA)
+    conferir_documento(bloco)
+    while bloco:
+        parser.feed(bloco)
+        for evento, elem in parser.read_events():
+            if evento == 'start':
+                if elem.tag == _INF_CTE and not inf_cte:
+                    inf_cte = True
+                    chave = (elem.get('Id') or '')[3:] or None
+                if not pilha:
+                    raiz = elem.tag
+                pilha.append(elem.tag)
+                continue
+
+            tag = pilha.pop()
+            if tag == _INF_CTE:
+                # Fim do infCte sem todos os campos: não adianta ler o restante
+                conferir_fim(f, parser, tamanho, raiz)
+                return _montar_registro(cnpj, data_emissao, chave, tamanho, tag_cnpj, cpf, inf_cte, coletor)
+            if coletor is not None and tag in coletor.folhas:
+                coletor.coletar(pilha, tag, elem.text)
+            if len(pilha) >= 2 and pilha[-2] == _INF_CTE:
+                if tag == _DH_EMI and pilha[-1] == _IDE and data_emissao is None:
+                    data_emissao = (elem.text or '').split("T")[0]  # Pega só a parte da data
+                elif tag == _CNPJ and pilha[-1] == grupo and cnpj is None:
+                    cnpj = elem.text
+                elif tag == _CPF and pilha[-1] == grupo:
+                    cpf = True
+            elem.clear()
+
+            if cnpj and data_emissao and chave and coletor is None:
+                conferir_fim(f, parser, tamanho, raiz)
+                return RegistroCte(cnpj, data_emissao, chave, tamanho)
+        bloco = f.read(TAMANHO_LEITURA)
+
+    parser.close()  # Fim do arquivo: acusa XML truncado ou vazio antes de reclamar dos campos
+    return _montar_registro(cnpj, data_emissao, chave, tamanho, tag_cnpj, cpf, inf_cte, coletor)
+
+def conferir_fim(f, parser, tamanho, raiz):
+    """
+    Confere que o XML cuja leitura parou nos campos usados vai até o fim, sem passar o meio pelo parser:
+    os últimos TAMANHO_CAUDA bytes devem terminar com o fechamento do elemento raiz. Se não terminarem
+    (arquivo truncado, lixo depois da raiz, comentário no fim...), o restante é lido pelo parser, que
+    acusa o XML truncado ou malformado e aceita o que for válido. Corrupção no meio de um arquivo que
+    termina certo não é detectada, como antes.
+    :param f: Arquivo binário aberto, posicionado logo depois do último bloco entregue ao parser
+    :param raiz: Elemento raiz ({namespace}nome) visto pelo parser
+    :raises ET.ParseError: XML truncado ou malformado depois dos campos lidos
+    """
+    posicao = f.tell()
+    if tamanho - posicao > TAMANHO_CAUDA:
+        f.seek(tamanho - TAMANHO_CAUDA)
+        fechamento = _FECHAMENTO_RAIZ.search(f.read(TAMANHO_CAUDA))
+        if fechamento is not None and fechamento.group(1).decode('ascii') == raiz.rpartition('}')[2]:
+            return
+        f.seek(posicao)
+    for bloco in iter(lambda: f.read(TAMANHO_LEITURA), b''):
+        parser.feed(bloco)
+    parser.close()
+
+# Leitura de várias partes de uma vez (separação em várias visões)
+GRUPOS_PARTES = ('emit', 'rem', 'exped', 'receb', 'dest')
+# ide/toma3/toma indica qual parte é o tomador do serviço; 4 = outros, com CNPJ em ide/toma4
+TOMADOR_POR_CODIGO = {'0': 'rem', '1': 'exped', '2': 'receb', '3': 'dest'}
+
+_TOMA3 = f'{{{NS_CTE}}}toma3'
+_TOMA4 = f'{{{NS_CTE}}}toma4'
+_TOMA = f'{{{NS_CTE}}}toma'
+_GRUPOS = {f'{{{NS_CTE}}}{grupo}': grupo for grupo in GRUPOS_PARTES}
+
+# cnpjs: {tag: CNPJ, '' se a parte tem CPF, ou None} para cada tag pedida ('toma' é o tomador real, via toma3/toma4)
+RegistroPartes = namedtuple('RegistroPartes', ['cnpjs', 'data_emissao', 'chave', 'tamanho', 'hash'],
+                            defaults=(None,))
+
+def extrair_partes(caminho, tags, dados=None):
+    """
+    Lê o XML uma vez só e extrai o CNPJ de cada parte pedida (emit, rem, exped, receb, dest, toma).
+    Para assim que todas forem resolvidas ou ao fim do infCte (grupos opcionais podem faltar),
+    depois de conferir o fim do XML (ver conferir_fim).
+    :param dados: Conteúdo já em memória (membro de ZIP); nesse caso caminho não é aberto
+    :return: RegistroPartes (partes ausentes ficam None; com CPF, '')
+    :raises DocumentoRecusado: Evento, NF-e, CT-e OS ou XML sem infCte
+    """
+    if dados is not None:
+        return _extrair_partes(io.BytesIO(dados), len(dados), tags)
+    with open(caminho, 'rb') as f:
+        return _extrair_partes(f, os.fstat(f.fileno()).st_size, tags)
+
+def _resolver_partes(tags, cnpjs, codigo_toma, cnpj_toma4):
+    """Monta {tag: CNPJ} das tags pedidas a partir dos grupos já lidos"""
+    partes = {}
+    for tag in tags:
+        if tag == 'toma':
+            partes[tag] = cnpj_toma4 if codigo_toma == '4' else cnpjs.get(TOMADOR_POR_CODIGO.get(codigo_toma))
+        else:
+            partes[tag] = cnpjs.get(tag)
+    return partes
+
+def _extrair_partes(f, tamanho, tags):
+    """Leitura incremental de extrair_partes, a partir de um arquivo binário aberto"""
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    pilha = []
+    raiz = None
+    cnpjs = {}
+    codigo_toma = cnpj_toma4 = data_emissao = chave = None
+    inf_cte = False
+
+    bloco = f.read(TAMANHO_LEITURA)
+    conferir_documento(bloco)
+    while bloco:
+        parser.feed(bloco)
+        for evento, elem in parser.read_events():
+            if evento == 'start':
+                if elem.tag == _INF_CTE and not inf_cte:
+                    inf_cte = True
+                    chave = (elem.get('Id') or '')[3:] or None
+                if not pilha:
+                    raiz = elem.tag
+                pilha.append(elem.tag)
+                continue
+
+            tag = pilha.pop()
+            if tag == _INF_CTE:
+                # Fim do infCte: as partes que faltam não existem neste CT-e
+                conferir_fim(f, parser, tamanho, raiz)
+                return _montar_partes(tags, cnpjs, codigo_toma, cnpj_toma4, data_emissao, chave, tamanho, inf_cte)
+            if len(pilha) >= 2 and pilha[-2] == _INF_CTE:
+                if tag == _DH_EMI and pilha[-1] == _IDE and data_emissao is None:
+                    data_emissao = (elem.text or '').split("T")[0]
+                elif tag in (_CNPJ, _CPF) and pilha[-1] in _GRUPOS:
+                    cnpjs.setdefault(_GRUPOS[pilha[-1]], elem.text if tag == _CNPJ else '')
+            elif len(pilha) >= 3 and pilha[-2] == _IDE and pilha[-3] == _INF_CTE:
+                if tag == _TOMA and pilha[-1] in (_TOMA3, _TOMA4):
+                    codigo_toma = (elem.text or '').strip()
+                elif tag in (_CNPJ, _CPF) and pilha[-1] == _TOMA4:
+                    cnpj_toma4 = elem.text if tag == _CNPJ else ''
+            elem.clear()
+
+            if data_emissao and chave:
+                partes = _resolver_partes(tags, cnpjs, codigo_toma, cnpj_toma4)
+                if all(partes.values()):
+                    conferir_fim(f, parser, tamanho, raiz)
+                    return RegistroPartes(partes, data_emissao, chave, tamanho)
+        bloco = f.read(TAMANHO_LEITURA)
+
+    parser.close()
+    return _montar_partes(tags, cnpjs, codigo_toma, cnpj_toma4, data_emissao, chave, tamanho, inf_cte)
+
+def _montar_partes(tags, cnpjs, codigo_toma, cnpj_toma4, data_emissao, chave, tamanho, inf_cte):
+    if not inf_cte:
+        raise DocumentoRecusado('outro', "Não é CT-e: infCte não encontrado")
+    if not data_emissao:
+        raise DocumentoRecusado('incompleto', "dhEmi não encontrado em infCte/ide")
+    return RegistroPartes(_resolver_partes(tags, cnpjs, codigo_toma, cnpj_toma4), data_emissao, chave, tamanho)
+
+def _montar_registro(cnpj, data_emissao, chave, tamanho, tag_cnpj, cpf=False, inf_cte=True, coletor=None):
+    """Valida os campos obrigatórios e monta o registro (com os campos fiscais, se houver coletor)"""
+    if not inf_cte:
+        raise DocumentoRecusado('outro', "Não é CT-e: infCte não encontrado")
+    if not cnpj:
+        if cpf:
+            raise DocumentoRecusado('cpf', f"Grupo {tag_cnpj} com CPF no lugar do CNPJ")
+        raise DocumentoRecusado('incompleto', f"CNPJ do grupo {tag_cnpj} não encontrado em infCte")
+    if not data_emissao:
+        raise DocumentoRecusado('incompleto', "dhEmi não encontrado em infCte/ide")
+    return RegistroCte(cnpj, data_emissao, chave, tamanho, fiscal=coletor.valores() if coletor is not None else None)
+
+# Varredura de bytes (modo rápido): só olha o início do arquivo
+LIMITE_VARREDURA = 32768
+
+_DECLARACAO_NS = f'xmlns="{NS_CTE}"'.encode()
+_ID_CHAVE = re.compile(rb'\sId="CTe(\d{44})"')
+_DATA = re.compile(rb'\d{4}-\d{2}-\d{2}')
+_CNPJ_VALIDO = re.compile(rb'\d{14}')
+
+def varrer_registro(caminho, tag_cnpj, dados=None):
+    """
+    Localiza infCte/@Id, ide/dhEmi e <tag_cnpj>/CNPJ por busca de bytes em um mmap do arquivo,
+    sem montar árvore XML, e confere que ele termina com o fechamento da raiz (como conferir_fim).
+    Feita para o leiaute fixo dos XMLs baixados da SEFAZ.
+    :param dados: Conteúdo já em memória (membro de ZIP), varrido no lugar do mmap
+    :return: RegistroCte, ou None quando a varredura não é conclusiva (prefixos de namespace,
+             CDATA, comentários, CPF no lugar do CNPJ, valores fora do padrão...)
+    :raises DocumentoRecusado: Evento, NF-e, CT-e OS... (ver identificar_documento)
+    """
+    if dados is not None:
+        return _varrer(dados, tag_cnpj)
+    with open(caminho, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Arquivo vazio não pode ser mapeado
+            return None
+        with mm:
+            return _varrer(mm, tag_cnpj)
+
+def _varrer(mm, tag_cnpj):
+    """Faz a varredura propriamente dita (mm pode ser mmap ou bytes); qualquer dúvida retorna None"""
+    conferir_documento(mm[:TAMANHO_LEITURA])
+    limite = min(len(mm), LIMITE_VARREDURA)
+
+    inicio_inf = mm.find(b'<infCte ', 0, limite)
+    if inicio_inf < 0 or mm.find(_DECLARACAO_NS, 0, inicio_inf) < 0:
+        return None
+    fim_inf = mm.find(b'>', inicio_inf, limite)
+    if fim_inf < 0:
+        return None
+    id_chave = _ID_CHAVE.search(mm[inicio_inf:fim_inf])
+    if id_chave is None:
+        return None
+
+    # ide é o primeiro filho de infCte e contém dhEmi
+    inicio_ide = mm.find(b'<ide>', fim_inf, limite)
+    if inicio_ide < 0 or mm[fim_inf + 1:inicio_ide].strip():
+        return None
+    fim_ide = mm.find(b'</ide>', inicio_ide, limite)
+    if fim_ide < 0:
+        return None
+    dh_emi = _texto_entre(mm, b'dhEmi', inicio_ide, fim_ide)
+    if dh_emi is None:
+        return None
+    data_emissao = dh_emi.split(b'T')[0]
+    if not _DATA.fullmatch(data_emissao):
+        return None
+
+    # Grupo da chave de separação (emit, receb...) depois de ide, com CNPJ direto
+    inicio_grupo = mm.find(b'<' + tag_cnpj.encode() + b'>', fim_ide, limite)
+    if inicio_grupo < 0:
+        return None
+    fim_grupo = mm.find(b'</' + tag_cnpj.encode() + b'>', inicio_grupo, limite)
+    if fim_grupo < 0:
+        return None
+    cnpj = _texto_entre(mm, b'CNPJ', inicio_grupo, fim_grupo)
+    if cnpj is None or not _CNPJ_VALIDO.fullmatch(cnpj):
+        return None
+
+    # Construções que a busca de bytes não interpreta: deixa para o parser
+    trecho = mm[:fim_grupo]
+    if b'<![CDATA[' in trecho or b'<!--' in trecho or b'xmlns:' in trecho:
+        return None
+
+    # Arquivo que não termina com o fechamento da raiz (truncado...): o parser confere e acusa
+    raiz = _raiz(mm[:TAMANHO_LEITURA])
+    fechamento = _FECHAMENTO_RAIZ.search(mm[max(0, len(mm) - TAMANHO_CAUDA):])
+    if raiz is None or fechamento is None or fechamento.group(1) != raiz.group(1):
+        return None
+
+    return RegistroCte(cnpj.decode('ascii'), data_emissao.decode('ascii'), id_chave.group(1).decode('ascii'), len(mm))
+
+def _texto_entre(mm, tag, inicio, fim):
+    """Retorna o conteúdo de <tag>...</tag> dentro de [inicio, fim), ou None se ausente ou suspeito"""
+    abertura = mm.find(b'<' + tag + b'>', inicio, fim)
+    if abertura < 0:
+        return None
+    abertura += len(tag) + 2
+    fechamento = mm.find(b'</' + tag + b'>', abertura, fim)
+    if fechamento < 0:
+        return None
+    texto = mm[abertura:fechamento]
+    if b'<' in texto or b'&' in texto:
+        return None
+    return texto
+
+def extrair_registro_rapido(caminho, tag_cnpj, conferir=False, dados=None):
+    """
+    Tenta a varredura de bytes e recorre ao parser quando ela não é conclusiva.
+    :param conferir: Se True, lê também pelo parser e compara (modo estrito); vale o resultado do parser
+    :param dados: Conteúdo já em memória (membro de ZIP); nesse caso caminho não é aberto
+    :return: Tupla (registro, origem) com origem 'varredura', 'parser' ou 'divergente'
+    """
+    registro = varrer_registro(caminho, tag_cnpj, dados)
+    if registro is None:
+        return extrair_registro(caminho, tag_cnpj, dados), 'parser'
+    if conferir:
+        esperado = extrair_registro(caminho, tag_cnpj, dados)
+        if esperado != registro:
+            return esperado, 'divergente'
+    return registro, 'varredura'
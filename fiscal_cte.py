@@ -0,0 +1,215 @@
+import csv
+import os
+import time
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+from extrator_cte import NS_CTE
+
+# Linhas guardadas em memória antes de cada gravação (uma escrita no CSV e um row group no Parquet)
+LOTE_EXPORTACAO = 5000
+PREFIXO_ARQUIVO = "0.fiscal"
+# Colunas que toda linha tem, antes dos campos pedidos
+COLUNAS_FIXAS = ('chave', 'cnpj', 'data_emissao', 'particao')
+
+# caminhos: um ou mais caminhos a partir de infCte (nomes sem namespace; '*' vale qualquer grupo, ex.:
+# ICMS00, ICMS20, ICMSSN...); tipo 'valor' vira decimal no Parquet; multiplo junta as ocorrências com ';'
+CampoFiscal = namedtuple('CampoFiscal', ['caminhos', 'tipo', 'multiplo'], defaults=('texto', False))
+
+CAMPOS_FISCAIS = {
+    'nCT': CampoFiscal([('ide', 'nCT')]),
+    'serie': CampoFiscal([('ide', 'serie')]),
+    'CFOP': CampoFiscal([('ide', 'CFOP')]),
+    'natOp': CampoFiscal([('ide', 'natOp')]),
+    'tpCTe': CampoFiscal([('ide', 'tpCTe')]),
+    'tpServ': CampoFiscal([('ide', 'tpServ')]),
+    'modal': CampoFiscal([('ide', 'modal')]),
+    'cMunIni': CampoFiscal([('ide', 'cMunIni')]),
+    'UFIni': CampoFiscal([('ide', 'UFIni')]),
+    'cMunFim': CampoFiscal([('ide', 'cMunFim')]),
+    'UFFim': CampoFiscal([('ide', 'UFFim')]),
+    'vTPrest': CampoFiscal([('vPrest', 'vTPrest')], 'valor'),
+    'vRec': CampoFiscal([('vPrest', 'vRec')], 'valor'),
+    'CST': CampoFiscal([('imp', 'ICMS', '*', 'CST')]),
+    'vBC': CampoFiscal([('imp', 'ICMS', '*', 'vBC'), ('imp', 'ICMS', 'ICMSOutraUF', 'vBCOutraUF')], 'valor'),
+    'pICMS': CampoFiscal([('imp', 'ICMS', '*', 'pICMS'), ('imp', 'ICMS', 'ICMSOutraUF', 'pICMSOutraUF')], 'valor'),
+    'vICMS': CampoFiscal([('imp', 'ICMS', '*', 'vICMS'), ('imp', 'ICMS', 'ICMSOutraUF', 'vICMSOutraUF')], 'valor'),
+    'vTotTrib': CampoFiscal([('imp', 'vTotTrib')], 'valor'),
+    'vCarga': CampoFiscal([('infCTeNorm', 'infCarga', 'vCarga')], 'valor'),
+    'chaves_nfe': CampoFiscal([('infCTeNorm', 'infDoc', 'infNFe', 'chave')], multiplo=True),
+}
+# Os campos que o financeiro lê de cada CT-e separado
+CAMPOS_PADRAO = ('vTPrest', 'CFOP', 'UFIni', 'UFFim', 'modal', 'CST', 'vBC', 'pICMS', 'vICMS', 'chaves_nfe')
+
+_INF_CTE = f'{{{NS_CTE}}}infCte'
+
+def interpretar_campos(texto):
+    """
+    Converte "vTPrest,CFOP,chaves_nfe" em tupla de nomes de CAMPOS_FISCAIS ("padrao" = CAMPOS_PADRAO)
+    :raises ValueError: Campo desconhecido ou lista vazia
+    """
+    campos = []
+    for nome in (texto or '').split(','):
+        nome = nome.strip()
+        if not nome:
+            continue
+        if nome == 'padrao':
+            campos.extend(CAMPOS_PADRAO)
+        elif nome in CAMPOS_FISCAIS:
+            campos.append(nome)
+        else:
+            raise ValueError(f"Campo fiscal desconhecido: {nome} (use {', '.join(CAMPOS_FISCAIS)} ou padrao)")
+    if not campos:
+        raise ValueError("Nenhum campo fiscal informado")
+    return tuple(dict.fromkeys(campos))
+
+@lru_cache(maxsize=None)
+def _compilar(campos):
+    """Elemento final (com namespace) -> [(índice do campo, grupos acima dele até infCte)]"""
+    folhas = {}
+    for indice, nome in enumerate(campos):
+        for caminho in CAMPOS_FISCAIS[nome].caminhos:
+            grupos = tuple(grupo if grupo == '*' else f'{{{NS_CTE}}}{grupo}' for grupo in caminho[:-1])
+            folhas.setdefault(f'{{{NS_CTE}}}{caminho[-1]}', []).append((indice, grupos))
+    return folhas
+
+class ColetorFiscal:
+    """
+    Junta os campos fiscais de um CT-e durante a leitura incremental do extrator (ver
+    extrator_cte.extrair_registro): a cada elemento fechado dentro de infCte, o extrator passa a pilha
+    de elementos acima dele, e só os elementos finais dos campos pedidos são conferidos.
+    """
+
+    __slots__ = ('campos', 'folhas', '_valores')
+
+    def __init__(self, campos):
+        """:param campos: Tupla de nomes de CAMPOS_FISCAIS (ver interpretar_campos)"""
+        self.campos = campos
+        self.folhas = _compilar(campos)
+        self._valores = [None] * len(campos)
+
+    def coletar(self, pilha, tag, texto):
+        """Guarda o texto do elemento tag se ele for um dos campos, com os grupos da pilha até infCte"""
+        for indice, grupos in self.folhas[tag]:
+            profundidade = len(grupos)
+            if len(pilha) <= profundidade or pilha[-profundidade - 1] != _INF_CTE:
+                continue
+            if any(grupo != '*' and grupo != acima for grupo, acima in zip(grupos, pilha[-profundidade:])):
+                continue
+            texto = (texto or '').strip()
+            if CAMPOS_FISCAIS[self.campos[indice]].multiplo:
+                if self._valores[indice] is None:
+                    self._valores[indice] = []
+                self._valores[indice].append(texto)
+            elif self._valores[indice] is None:
+                self._valores[indice] = texto
+            return
+
+    def valores(self):
+        """Tupla com um texto por campo ('' quando ausente; múltiplos separados por ';')"""
+        return tuple(';'.join(valor) if isinstance(valor, list) else valor or '' for valor in self._valores)
+
+_ESCALA = Decimal('0.0001')
+
+def _decimal(texto):
+    """Valor do XML com a escala da coluna decimal do Parquet; None se vazio ou inválido"""
+    try:
+        return Decimal(texto).quantize(_ESCALA) if texto else None
+    except InvalidOperation:
+        return None
+
+class ExportacaoFiscal:
+    """
+    Grava os campos fiscais dos CT-es separados em um arquivo por execução (0.fiscal_AAAAMMDD_HHMMSS.csv,
+    separado por ';' e com BOM para abrir direto no Excel), e também em .parquet quando o pyarrow está
+    instalado. As linhas são acumuladas em lotes de até LOTE_EXPORTACAO e gravadas de uma vez: a memória
+    não cresce com a quantidade de CT-es. Numa execução interrompida, o último lote ainda não gravado se
+    perde; os CT-es dele já estão no destino e não são lidos de novo na retomada.
+    """
+
+    def __init__(self, pasta_destino, campos, shard=None, lote=LOTE_EXPORTACAO, parquet=True):
+        """
+        :param campos: Tupla de nomes de CAMPOS_FISCAIS, na ordem das colunas
+        :param shard: Shard (ver shards_cte): o nome do arquivo leva o shard
+        :param parquet: Grava também o .parquet se o pyarrow estiver disponível
+        """
+        self.campos = campos
+        self.lote = max(1, lote)
+        nome = f"{PREFIXO_ARQUIVO}_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+        self.caminho_csv = os.path.join(pasta_destino, shard.arquivo(nome) if shard else nome)
+        # Duas execuções no mesmo segundo (motor chamado a cada lote, ver separacao_cte): "_2", "_3"...
+        base, extensao = os.path.splitext(self.caminho_csv)
+        numero = 1
+        while os.path.exists(self.caminho_csv):
+            numero += 1
+            self.caminho_csv = f"{base}_{numero}{extensao}"
+        self.caminho_parquet = None
+        self.linhas = 0
+        self._pendentes = []
+        self._csv = None
+        self._escritor = None
+        self._pa = self._pq = self._esquema = self._parquet = None
+        if parquet:
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                pass
+            else:
+                self._pa, self._pq = pyarrow, pyarrow.parquet
+                self.caminho_parquet = os.path.splitext(self.caminho_csv)[0] + ".parquet"
+
+    def registrar(self, registro, cnpj, particao):
+        """Acrescenta a linha do CT-e colocado no destino (registro.fiscal vem do extrator)"""
+        if registro.fiscal is None:
+            return
+        self._pendentes.append((registro.chave, cnpj, registro.data_emissao, particao) + registro.fiscal)
+        if len(self._pendentes) >= self.lote:
+            self.descarregar()
+
+    def descarregar(self):
+        """Grava as linhas acumuladas (CSV e, se houver, Parquet)"""
+        if not self._pendentes:
+            return
+        if self._csv is None:
+            os.makedirs(os.path.dirname(self.caminho_csv), exist_ok=True)
+            self._csv = open(self.caminho_csv, 'w', encoding='utf-8-sig', newline='')
+            self._escritor = csv.writer(self._csv, delimiter=';')
+            self._escritor.writerow(COLUNAS_FIXAS + self.campos)
+        self._escritor.writerows(self._pendentes)
+        self._csv.flush()
+        if self._pa is not None:
+            self._gravar_parquet()
+        self.linhas += len(self._pendentes)
+        self._pendentes = []
+
+    def _gravar_parquet(self):
+        """Um row group por lote, com os campos do tipo 'valor' em decimal"""
+        pa = self._pa
+        if self._parquet is None:
+            self._esquema = pa.schema(
+                [(coluna, pa.string()) for coluna in COLUNAS_FIXAS] +
+                [(nome, pa.decimal128(18, 4) if CAMPOS_FISCAIS[nome].tipo == 'valor' else pa.string())
+                 for nome in self.campos])
+            self._parquet = self._pq.ParquetWriter(self.caminho_parquet, self._esquema)
+        colunas = []
+        for indice, campo in enumerate(self._esquema):
+            valores = [linha[indice] for linha in self._pendentes]
+            if pa.types.is_decimal(campo.type):
+                valores = [_decimal(valor) for valor in valores]
+            colunas.append(pa.array(valores, type=campo.type))
+        self._parquet.write_table(pa.Table.from_arrays(colunas, schema=self._esquema))
+
+    def fechar(self):
+        """Grava o que falta e fecha os arquivos; retorna os caminhos gravados"""
+        self.descarregar()
+        if self._csv is not None:
+            self._csv.close()
+            self._csv = None
+        if self._parquet is not None:
+            self._parquet.close()
+            self._parquet = None
+        if not self.linhas:
+            return []
+        return [caminho for caminho in (self.caminho_csv, self.caminho_parquet) if caminho]
@@ -0,0 +1,209 @@
+import os
+import sys
+
+# Respostas de InterfaceNula.escolher e das outras interfaces (Sim / Não / Cancelar)
+SIM = 'sim'
+NAO = 'nao'
+CANCELAR = 'cancelar'
+
+INTERFACES = ('auto', 'windows', 'console', 'nula')
+# Interface usada quando --interface não é informado (ex.: SEPARADOR_CTE_INTERFACE=nula nos workers)
+VARIAVEL_INTERFACE = 'SEPARADOR_CTE_INTERFACE'
+
+class _BarraNula:
+    """Mesma interface da barra do tqdm usada pelos scripts (ver metricas_cte.ProgressoLimitado), sem saída"""
+
+    def __init__(self, total=None):
+        self.total = total
+        self.n = 0
+
+    def update(self, quantidade=1):
+        self.n += quantidade
+
+    def set_postfix(self, *args, **kwargs):
+        pass
+
+    def refresh(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+        return False
+
+class InterfaceNula:
+    """
+    Interface sem janelas nem barra de progresso, para execução em lote (workers, agendador, shards):
+    avisos são ignorados, confirmações são recusadas e escolhas canceladas, como quando um popup
+    não pode ser mostrado.
+    """
+
+    nome = 'nula'
+
+    def avisar(self, mensagem, titulo="Alerta"):
+        pass
+
+    def confirmar(self, mensagem, titulo="Confirmação"):
+        """True se o usuário respondeu Sim"""
+        return False
+
+    def escolher(self, mensagem, titulo="Opções"):
+        """SIM, NAO ou CANCELAR"""
+        return CANCELAR
+
+    def barra(self, total=None, unit='it', desc=None):
+        """Barra de progresso com update, set_postfix, refresh e uso em with"""
+        return _BarraNula(total)
+
+    def abrir(self, caminho):
+        """Abre o arquivo com o aplicativo padrão do sistema"""
+        pass
+
+class InterfaceConsole(InterfaceNula):
+    """
+    Mensagens e perguntas no terminal, barra do tqdm (importado só quando a primeira barra é criada).
+    Sem terminal na entrada, as perguntas ficam com a resposta padrão (Não / Cancelar).
+    """
+
+    nome = 'console'
+
+    def avisar(self, mensagem, titulo="Alerta"):
+        print(f"\n=== {titulo} ===\n{mensagem}\n")
+
+    def _perguntar(self, mensagem, titulo, opcoes):
+        """Resposta digitada entre as opções ({letra: resposta}), ou None sem terminal"""
+        self.avisar(mensagem, titulo)
+        if not sys.stdin or not sys.stdin.isatty():
+            return None
+        letras = "/".join(opcoes)
+        while True:
+            try:
+                texto = input(f"[{letras}] ").strip().lower()
+            except EOFError:
+                return None
+            if texto[:1] in opcoes:
+                return opcoes[texto[:1]]
+
+    def confirmar(self, mensagem, titulo="Confirmação"):
+        return self._perguntar(mensagem, titulo, {'s': SIM, 'n': NAO}) == SIM
+
+    def escolher(self, mensagem, titulo="Opções"):
+        return self._perguntar(mensagem, titulo, {'s': SIM, 'n': NAO, 'c': CANCELAR}) or CANCELAR
+
+    def barra(self, total=None, unit='it', desc=None):
+        try:
+            from tqdm import tqdm
+        except ImportError:
+            return _BarraNula(total)
+        return tqdm(total=total, unit=unit, desc=desc)
+
+    def abrir(self, caminho):
+        print(f"Relatório: {caminho}")
+
+class InterfaceWindows(InterfaceConsole):
+    """
+    Popups do Windows (pywin32) que piscam na barra de tarefas até receber foco; a barra continua no
+    console. Se um popup falhar, a mensagem vai para o console, como antes.
+    :raises ImportError: pywin32 não instalado (ao criar)
+    """
+
+    nome = 'windows'
+
+    def __init__(self):
+        import win32api
+        import win32con
+        import win32gui
+        self._api, self._con, self._gui = win32api, win32con, win32gui
+
+    def _piscar(self):
+        """Faz a janela em primeiro plano piscar na barra de tarefas até receber foco"""
+        try:
+            import ctypes
+
+            class FLASHWINFO(ctypes.Structure):
+                _fields_ = [
+                    ('cbSize', ctypes.c_uint),
+                    ('hwnd', ctypes.c_void_p),
+                    ('dwFlags', ctypes.c_uint),
+                    ('uCount', ctypes.c_uint),
+                    ('dwTimeout', ctypes.c_uint)
+                ]
+
+            flash_info = FLASHWINFO()
+            flash_info.cbSize = ctypes.sizeof(FLASHWINFO)
+            flash_info.hwnd = self._gui.GetForegroundWindow()
+            flash_info.dwFlags = self._con.FLASHW_ALL | self._con.FLASHW_TIMERNOFG
+            flash_info.uCount = 0  # 0 = até receber foco
+            flash_info.dwTimeout = 0
+            ctypes.windll.user32.FlashWindowEx(ctypes.byref(flash_info))
+        except Exception as e:
+            print(f"Erro ao piscar janela: {e}")
+
+    def _popup(self, mensagem, titulo, botoes):
+        resposta = self._api.MessageBox(0, mensagem, titulo,
+                                        botoes | self._con.MB_ICONQUESTION | self._con.MB_SETFOREGROUND)
+        self._piscar()
+        return resposta
+
+    def avisar(self, mensagem, titulo="Alerta"):
+        try:
+            self._api.MessageBox(0, mensagem, titulo,
+                                 self._con.MB_OK | self._con.MB_ICONINFORMATION | self._con.MB_SETFOREGROUND)
+            self._piscar()
+        except Exception:
+            super().avisar(mensagem, titulo)
+
+    def confirmar(self, mensagem, titulo="Confirmação"):
+        try:
+            return self._popup(mensagem, titulo, self._con.MB_YESNO) == self._con.IDYES
+        except Exception:
+            super().avisar(mensagem, titulo)
+            return False
+
+    def escolher(self, mensagem, titulo="Opções"):
+        try:
+            resposta = self._popup(mensagem, titulo, self._con.MB_YESNOCANCEL)
+        except Exception:
+            super().avisar(mensagem, titulo)
+            return CANCELAR
+        return {self._con.IDYES: SIM, self._con.IDNO: NAO}.get(resposta, CANCELAR)
+
+    def abrir(self, caminho):
+        try:
+            if os.path.exists(caminho):
+                os.startfile(caminho)
+            else:
+                print(f"Arquivo não encontrado: {caminho}")
+        except Exception as e:
+            print(f"Erro ao abrir arquivos: {str(e)}")
+
+def obter_interface(nome=None):
+    """
+    Cria a interface pelo nome (INTERFACES; None = variável SEPARADOR_CTE_INTERFACE ou 'auto').
+    'auto': popups no Windows com pywin32, console em um terminal e nula sem terminal (execução em lote).
+    Nada de janela ou tqdm é importado antes disso: o script começa sem pagar pela interface.
+    :raises ValueError: Nome desconhecido
+    :raises ImportError: 'windows' pedido sem pywin32 instalado
+    """
+    nome = nome or os.environ.get(VARIAVEL_INTERFACE) or 'auto'
+    if nome not in INTERFACES:
+        raise ValueError(f"Interface desconhecida: {nome} (use {', '.join(INTERFACES)})")
+    if nome == 'windows':
+        return InterfaceWindows()
+    if nome == 'console':
+        return InterfaceConsole()
+    if nome == 'nula':
+        return InterfaceNula()
+    if sys.platform == 'win32':
+        try:
+            return InterfaceWindows()
+        except ImportError:
+            pass
+    if sys.stdout is not None and sys.stdout.isatty():
+        return InterfaceConsole()
+    return InterfaceNula()
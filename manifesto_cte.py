@@ -0,0 +1,110 @@
+import os
+from array import array
+
+class ManifestoExecucao:
+    """
+    Registro compacto do que foi movido durante a execução.
+    Guarda apenas totais por partição (CNPJ + pasta de data/lote) e as pastas de origem tocadas,
+    de modo que o relatório, a validação e a limpeza de pastas vazias não precisam varrer as árvores
+    de novo. O consumo de memória depende da quantidade de partições, não de arquivos.
+    """
+
+    __slots__ = ('_indices', '_particoes', '_arquivos', '_bytes', 'pastas_origem')
+
+    def __init__(self):
+        self._indices = {}              # (cnpj, particao) -> posição nos arrays
+        self._particoes = []            # posição -> (cnpj, particao)
+        self._arquivos = array('Q')     # arquivos colocados por partição
+        self._bytes = array('Q')        # bytes colocados por partição
+        self.pastas_origem = set()      # pastas de onde saiu ao menos um arquivo
+
+    def registrar_movimento(self, caminho_origem, cnpj, particao, tamanho):
+        """Registra um arquivo movido com sucesso para PASTA_DESTINO/cnpj/particao"""
+        chave = (cnpj, particao)
+        indice = self._indices.get(chave)
+        if indice is None:
+            indice = self._indices[chave] = len(self._particoes)
+            self._particoes.append(chave)
+            self._arquivos.append(0)
+            self._bytes.append(0)
+        self._arquivos[indice] += 1
+        self._bytes[indice] += tamanho or 0
+        self.pastas_origem.add(os.path.dirname(caminho_origem))
+
+    def somar_particao(self, cnpj, particao, arquivos, tamanho):
+        """Soma à partição totais já apurados (ex.: os relatórios parciais dos shards, ver shards_cte)"""
+        chave = (cnpj, particao)
+        indice = self._indices.get(chave)
+        if indice is None:
+            indice = self._indices[chave] = len(self._particoes)
+            self._particoes.append(chave)
+            self._arquivos.append(0)
+            self._bytes.append(0)
+        self._arquivos[indice] += arquivos
+        self._bytes[indice] += tamanho
+
+    def registrar_saida(self, caminho_origem):
+        """Registra a pasta de um arquivo que saiu da origem sem ir para uma partição (ex.: erros)"""
+        self.pastas_origem.add(os.path.dirname(caminho_origem))
+
+    @property
+    def total_arquivos(self):
+        """Total de arquivos efetivamente colocados nas partições"""
+        return sum(self._arquivos)
+
+    @property
+    def total_bytes(self):
+        """Total de bytes colocados nas partições"""
+        return sum(self._bytes)
+
+    @property
+    def total_particoes(self):
+        """Quantidade de partições (CNPJ + data/lote) que receberam arquivos"""
+        return len(self._particoes)
+
+    def particoes(self):
+        """Gera (cnpj, particao, arquivos, bytes) ordenado por CNPJ e partição"""
+        for indice in sorted(range(len(self._particoes)), key=self._particoes.__getitem__):
+            cnpj, particao = self._particoes[indice]
+            yield cnpj, particao, self._arquivos[indice], self._bytes[indice]
+
+    def relatorio_por_cnpj(self):
+        """
+        Gera o texto do relatório por CNPJ e partição (mesmo formato do relatório por pastas),
+        considerando os arquivos colocados nesta execução.
+        """
+        relatorio = []
+        cnpj_atual = None
+        linhas = []
+        for cnpj, particao, arquivos, _ in self.particoes():
+            if cnpj != cnpj_atual:
+                if cnpj_atual is not None:
+                    relatorio.append(f"- CNPJ {cnpj_atual}:\n" + "\n".join(linhas))
+                cnpj_atual, linhas = cnpj, []
+            linhas.append(f"    {particao}: {arquivos} arquivo(s)")
+        if cnpj_atual is not None:
+            relatorio.append(f"- CNPJ {cnpj_atual}:\n" + "\n".join(linhas))
+        return "\n\n".join(relatorio)
+
+    def remover_pastas_vazias(self, pasta_origem, preservar=()):
+        """
+        Remove as pastas de origem que ficaram vazias, subindo até pasta_origem (que é mantida).
+        Só olha as pastas tocadas nesta execução, sem varrer a árvore de origem.
+        :param preservar: Nomes de pastas que nunca devem ser removidas
+        :return: Quantidade de pastas removidas
+        """
+        raiz = os.path.normcase(os.path.abspath(pasta_origem)) + os.sep
+        removidas = 0
+        # Mais profundas primeiro, para que a remoção das filhas libere as mães
+        for pasta in sorted(self.pastas_origem, key=lambda p: p.count(os.sep), reverse=True):
+            pasta = os.path.abspath(pasta)
+            while os.path.normcase(pasta).startswith(raiz) and os.path.basename(pasta) not in preservar:
+                try:
+                    os.rmdir(pasta)  # Só remove se estiver vazia
+                    removidas += 1
+                except FileNotFoundError:
+                    pass  # Já removida a partir de outra pasta filha
+                except OSError:
+                    break
+                pasta = os.path.dirname(pasta)
+        return removidas
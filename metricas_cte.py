@@ -0,0 +1,238 @@
+import os
+import json
+import time
+from collections import Counter
+
+# Limites superiores (segundos) das faixas dos histogramas de latência; a última faixa é "acima de tudo"
+LIMITES_LATENCIA = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+# Intervalo mínimo entre duas atualizações da barra de progresso
+INTERVALO_PROGRESSO = 0.2
+
+ARQUIVO_METRICAS_JSON = "0.metricas.json"
+ARQUIVO_METRICAS_PROM = "0.metricas.prom"
+
+class Histograma:
+    """Contagem de latências por faixa (LIMITES_LATENCIA), com soma e máximo. Pode ir e voltar de workers."""
+
+    __slots__ = ('faixas', 'quantidade', 'soma', 'maximo')
+
+    def __init__(self):
+        self.faixas = [0] * (len(LIMITES_LATENCIA) + 1)
+        self.quantidade = 0
+        self.soma = 0.0
+        self.maximo = 0.0
+
+    def registrar(self, segundos):
+        indice = 0
+        while indice < len(LIMITES_LATENCIA) and segundos > LIMITES_LATENCIA[indice]:
+            indice += 1
+        self.faixas[indice] += 1
+        self.quantidade += 1
+        self.soma += segundos
+        if segundos > self.maximo:
+            self.maximo = segundos
+
+    def mesclar(self, outro):
+        for indice, quantidade in enumerate(outro.faixas):
+            self.faixas[indice] += quantidade
+        self.quantidade += outro.quantidade
+        self.soma += outro.soma
+        self.maximo = max(self.maximo, outro.maximo)
+
+    def percentil(self, fracao):
+        """Limite da faixa onde cai o percentil pedido (aproximação pelo histograma)"""
+        alvo = fracao * self.quantidade
+        acumulado = 0
+        for indice, quantidade in enumerate(self.faixas):
+            acumulado += quantidade
+            if acumulado >= alvo and quantidade:
+                return LIMITES_LATENCIA[indice] if indice < len(LIMITES_LATENCIA) else self.maximo
+        return 0.0
+
+    def __getstate__(self):
+        return self.faixas, self.quantidade, self.soma, self.maximo
+
+    def __setstate__(self, estado):
+        self.faixas, self.quantidade, self.soma, self.maximo = estado
+
+class _Medicao:
+    """Bloco with que registra o tempo gasto na etapa"""
+
+    __slots__ = ('histograma', 'inicio')
+
+    def __init__(self, histograma):
+        self.histograma = histograma
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.histograma.registrar(time.perf_counter() - self.inicio)
+        return False
+
+class _SemMedicao:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+_SEM_MEDICAO = _SemMedicao()
+
+class MetricasExecucao:
+    """
+    Latências por etapa (listagem, leitura, criar_pastas, verificar_existencia, mover, hash,
+    renomear_duplicado, erros, zip...) e contadores da execução.
+    Exportadas em JSON e no formato textfile do Prometheus (node_exporter) ao lado de 0.relatorio.txt,
+    para saber se uma execução lenta gastou o tempo em CPU (leitura) ou no disco/compartilhamento (mover).
+    Com ativa=False (SEM_METRICAS) as medições não fazem nada.
+    """
+
+    def __init__(self, ativa=True):
+        self.ativa = ativa
+        self.etapas = {}          # etapa -> Histograma
+        self.contadores = Counter()
+        self.inicio = time.time()
+
+    def histograma(self, etapa):
+        histograma = self.etapas.get(etapa)
+        if histograma is None:
+            histograma = self.etapas[etapa] = Histograma()
+        return histograma
+
+    def medir(self, etapa):
+        """Uso: with metricas.medir('mover'): ..."""
+        if not self.ativa:
+            return _SEM_MEDICAO
+        return _Medicao(self.histograma(etapa))
+
+    def registrar(self, etapa, segundos):
+        if self.ativa:
+            self.histograma(etapa).registrar(segundos)
+
+    def contar(self, contador, quantidade=1):
+        if self.ativa:
+            self.contadores[contador] += quantidade
+
+    def definir(self, contador, quantidade):
+        """Substitui o valor do contador (totais que são regravados a cada lote, ver vigia_cte)"""
+        if self.ativa:
+            self.contadores[contador] = quantidade
+
+    def medir_iteracao(self, etapa, iteravel):
+        """Repassa os itens do iterável medindo o tempo de cada next() (ex.: os.walk da listagem)"""
+        if not self.ativa:
+            yield from iteravel
+            return
+        histograma = self.histograma(etapa)
+        iterador = iter(iteravel)
+        while True:
+            inicio = time.perf_counter()
+            try:
+                item = next(iterador)
+            except StopIteration:
+                return
+            histograma.registrar(time.perf_counter() - inicio)
+            yield item
+
+    def como_dict(self):
+        etapas = {}
+        for etapa, histograma in sorted(self.etapas.items()):
+            etapas[etapa] = {
+                'quantidade': histograma.quantidade,
+                'segundos': round(histograma.soma, 6),
+                'media_ms': round(histograma.soma / histograma.quantidade * 1000, 4) if histograma.quantidade else 0,
+                'p50_ms': round(histograma.percentil(0.5) * 1000, 4),
+                'p99_ms': round(histograma.percentil(0.99) * 1000, 4),
+                'maximo_ms': round(histograma.maximo * 1000, 4),
+                'faixas': {(f"{limite:g}" if indice < len(LIMITES_LATENCIA) else "+Inf"): quantidade
+                           for indice, (limite, quantidade)
+                           in enumerate(zip(LIMITES_LATENCIA + (None,), histograma.faixas))},
+            }
+        return {'inicio': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.inicio)),
+                'duracao_segundos': round(time.time() - self.inicio, 3),
+                'contadores': dict(sorted(self.contadores.items())),
+                'etapas': etapas}
+
+    def como_prometheus(self, prefixo='separador_cte'):
+        linhas = [f"# HELP {prefixo}_etapa_segundos Latência de cada operação por etapa",
+                  f"# TYPE {prefixo}_etapa_segundos histogram"]
+        for etapa, histograma in sorted(self.etapas.items()):
+            acumulado = 0
+            for indice, quantidade in enumerate(histograma.faixas):
+                acumulado += quantidade
+                limite = f"{LIMITES_LATENCIA[indice]:g}" if indice < len(LIMITES_LATENCIA) else "+Inf"
+                linhas.append(f'{prefixo}_etapa_segundos_bucket{{etapa="{etapa}",le="{limite}"}} {acumulado}')
+            linhas.append(f'{prefixo}_etapa_segundos_sum{{etapa="{etapa}"}} {histograma.soma:.6f}')
+            linhas.append(f'{prefixo}_etapa_segundos_count{{etapa="{etapa}"}} {histograma.quantidade}')
+        linhas.append(f"# TYPE {prefixo}_total counter")
+        for contador, quantidade in sorted(self.contadores.items()):
+            linhas.append(f'{prefixo}_total{{contador="{contador}"}} {quantidade}')
+        linhas.append(f"# TYPE {prefixo}_duracao_segundos gauge")
+        linhas.append(f"{prefixo}_duracao_segundos {time.time() - self.inicio:.3f}")
+        linhas.append(f"# TYPE {prefixo}_fim_timestamp_segundos gauge")
+        linhas.append(f"{prefixo}_fim_timestamp_segundos {time.time():.0f}")
+        return "\n".join(linhas) + "\n"
+
+    def gravar(self, pasta, shard=None):
+        """
+        Grava 0.metricas.json e 0.metricas.prom na pasta; retorna os dois caminhos
+        :param shard: Shard (ver shards_cte): arquivos do shard (0.metricas.shard_i-n.json...)
+        """
+        nomes = (ARQUIVO_METRICAS_JSON, ARQUIVO_METRICAS_PROM)
+        if shard is not None:
+            nomes = [shard.arquivo(nome) for nome in nomes]
+        caminho_json, caminho_prom = (os.path.join(pasta, nome) for nome in nomes)
+        with open(caminho_json, 'w', encoding='utf-8') as f:
+            json.dump(self.como_dict(), f, indent=2, ensure_ascii=False)
+        # O coletor textfile lê o arquivo a qualquer momento: grava ao lado e troca de uma vez
+        with open(f"{caminho_prom}.tmp", 'w', encoding='utf-8') as f:
+            f.write(self.como_prometheus())
+        os.replace(f"{caminho_prom}.tmp", caminho_prom)
+        return caminho_json, caminho_prom
+
+SEM_METRICAS = MetricasExecucao(ativa=False)
+
+class ProgressoLimitado:
+    """
+    Atualiza uma barra de progresso (tqdm, ver interface_cte) no máximo a cada intervalo segundos, em vez
+    de a cada arquivo.
+    O texto ao lado da barra (postfix) e o total só são consultados quando a barra é de fato atualizada.
+    """
+
+    def __init__(self, barra, postfix=None, intervalo=INTERVALO_PROGRESSO, total=None):
+        """
+        :param postfix: Função sem argumentos que retorna o dict mostrado ao lado da barra
+        :param total: Função sem argumentos que retorna o total, ou None enquanto ele ainda não é conhecido
+                      (ex.: ContagemEmSegundoPlano, ver entrada_cte)
+        """
+        self.barra = barra
+        self.postfix = postfix
+        self.total = total
+        self.intervalo = intervalo
+        self.pendentes = 0
+        self.proxima = 0.0
+
+    def avancar(self, quantidade=1):
+        self.pendentes += quantidade
+        agora = time.perf_counter()
+        if agora >= self.proxima:
+            self.proxima = agora + self.intervalo
+            self.descarregar()
+
+    def descarregar(self):
+        """Mostra o que ainda não foi mostrado (chamar ao final do laço)"""
+        if self.total is not None:
+            total = self.total()
+            if total is not None and total != self.barra.total:
+                self.barra.total = total
+        if self.postfix is not None:
+            self.barra.set_postfix(self.postfix(), refresh=False)
+        if self.pendentes:
+            self.barra.update(self.pendentes)
+            self.pendentes = 0
+        else:
+            self.barra.refresh()
@@ -0,0 +1,302 @@
+import os
+import time
+from collections import Counter, namedtuple
+
+from paralelo_cte import ExtratorParalelo, TAMANHO_BLOCO_PADRAO
+from manifesto_cte import ManifestoExecucao
+from duplicados_cte import COLOCADO, IDENTICO, RESULTADOS_COLOCADOS, hash_arquivo
+from destino_cte import DestinoPastas
+from entrada_cte import VinculoXml, ZipsOrigem, DescobertaEmSegundoPlano
+from diario_cte import DiarioExecucao
+from extrator_cte import DocumentoRecusado, extrair_partes
+from metricas_cte import MetricasExecucao, SEM_METRICAS
+from movimentacao_cte import MovimentadorArquivos
+from particoes_cte import AlocadorLotes, particao_data, TAMANHO_LOTE, LEIAUTE_DATA_PADRAO
+from catalogo_cte import CatalogoCte
+from erros_cte import PastaErros
+
+# Partes do CT-e que podem virar visão; 'toma' é o tomador real (ide/toma3 ou ide/toma4)
+NOMES_PARTES = {
+    'emit': 'Emitente',
+    'rem': 'Remetente',
+    'exped': 'Expedidor',
+    'receb': 'Recebedor',
+    'dest': 'Destinatario',
+    'toma': 'Tomador',
+}
+# Partição dentro de cada CNPJ: data de emissão (leiaute em particoes_cte.LEIAUTES_DATA) ou lote_N
+# (ver particoes_cte.AlocadorLotes)
+PARTICOES = ('data', 'lote')
+PREFIXOS_PARTICAO = {'data': '20', 'lote': 'lote_'}
+
+# tag da parte, pasta da visão (<pasta>/<cnpj>/<particao>/<nome>) e tipo de partição
+Visao = namedtuple('Visao', ['tag', 'pasta_destino', 'particao'])
+
+def interpretar_visoes(texto, pasta_base):
+    """
+    Converte "emit,receb:lote,toma" em lista de Visao, com as pastas "0.Por <Parte>" em pasta_base.
+    A partição padrão é por data. A primeira visão é a principal (recebe o arquivo; as demais, vínculos).
+    """
+    visoes = []
+    for item in texto.split(','):
+        tag, _, particao = item.strip().partition(':')
+        particao = particao or 'data'
+        if tag not in NOMES_PARTES:
+            raise ValueError(f"Parte desconhecida: {tag} (use {', '.join(NOMES_PARTES)})")
+        if particao not in PARTICOES:
+            raise ValueError(f"Partição desconhecida: {particao} (use {' ou '.join(PARTICOES)})")
+        if any(visao.tag == tag for visao in visoes):
+            raise ValueError(f"Parte repetida: {tag}")
+        visoes.append(Visao(tag, os.path.join(pasta_base, f"0.Por {NOMES_PARTES[tag]}"), particao))
+    return visoes
+
+class SeparadorVisoes:
+    """
+    Separa os CT-es em várias visões (emitente, recebedor, tomador...) em uma passada só:
+    cada XML é lido uma vez, com todas as partes pedidas (extrator_cte.extrair_partes).
+    O arquivo vai para a visão principal (a primeira) como nos separadores de uma visão só;
+    nas demais entra por hardlink (reflink ou cópia quando não for possível, ver entrada_cte.vincular),
+    então visões no mesmo volume não ocupam bytes a mais.
+    Cada visão tem a sua pasta de duplicados e o seu relatório; o diário da execução fica na principal
+    e a entrada só é dada como concluída depois que todas as visões a receberam.
+    CT-e sem o CNPJ da parte principal vai para erros (ver erros_cte); sem o de outra parte, só não entra
+    naquela visão.
+    """
+
+    def __init__(self, visoes, pasta_erros, processos=1, tamanho_bloco=TAMANHO_BLOCO_PADRAO,
+                 leiaute_data=LEIAUTE_DATA_PADRAO, max_arquivos_lote=TAMANHO_LOTE, max_bytes_lote=None,
+                 catalogar=True):
+        """
+        :param leiaute_data: Pastas das visões por data: 'dia', 'mes' ou 'ano' (ver particoes_cte.LEIAUTES_DATA)
+        :param max_arquivos_lote: Arquivos por lote nas visões por lote
+        :param max_bytes_lote: Bytes por lote nas visões por lote (None = só pela quantidade de arquivos)
+        :param catalogar: Registra cada CT-e no catálogo de cada visão (ver catalogo_cte)
+        """
+        self.visoes = visoes
+        self.principal = visoes[0]
+        self.tags = tuple(visao.tag for visao in visoes)
+        # Caminho (renomear / cópia) de cada movimentação deste motor, em todas as visões
+        self.movimentador = MovimentadorArquivos()
+        # Eventos, NF-e, CT-e OS... em subpastas por tipo, com índice por motivo
+        self.pasta_erros = PastaErros(pasta_erros, movimentador=self.movimentador)
+        for visao in visoes:
+            os.makedirs(os.path.join(visao.pasta_destino, "1.Duplicados"), exist_ok=True)
+        os.makedirs(pasta_erros, exist_ok=True)
+        # Diário da execução: se existir, a anterior foi interrompida e é retomada de onde parou
+        self.diario = DiarioExecucao(self.principal.pasta_destino)
+        # Lotes de cada visão por lote, continuando os das execuções anteriores (e os da interrompida,
+        # contados no diário por "parte:cnpj")
+        self.leiaute_data = leiaute_data
+        self.alocadores = {}
+        for visao in visoes:
+            if visao.particao == 'lote':
+                alocador = self.alocadores[visao.tag] = AlocadorLotes(visao.pasta_destino, max_arquivos_lote,
+                                                                      max_bytes_lote)
+                prefixo = f"{visao.tag}:"
+                alocador.retomar({contador[len(prefixo):]: quantidade
+                                  for contador, quantidade in self.diario.contadores_cnpj.items()
+                                  if contador.startswith(prefixo)})
+        # Tempo de cada etapa; nas outras visões, a colocação inteira conta como 'vincular'
+        self.metricas = MetricasExecucao()
+        self.catalogos = [CatalogoCte(visao.pasta_destino) for visao in visoes] if catalogar else []
+        if self.catalogos and self.diario.retomada:
+            # Só na principal (o diário indexa só ela); nas outras, os vínculos que ficaram fora do catálogo
+            # voltam com CatalogoCte.reconstruir (consultar_cte.py --reconstruir)
+            self.catalogos[0].recuperar(self.diario.indice)
+        self.destinos = [DestinoPastas(visao.pasta_destino, os.path.join(visao.pasta_destino, "1.Duplicados"),
+                                       *((self.diario, self.metricas) if visao is self.principal
+                                         else (None, SEM_METRICAS)),
+                                       catalogo=self.catalogos[indice] if catalogar else None,
+                                       movimentador=self.movimentador)
+                         for indice, visao in enumerate(visoes)]
+        self.manifestos = [ManifestoExecucao() for _ in visoes]
+        self.extrator = ExtratorParalelo(self.tags, processos=processos, tamanho_bloco=tamanho_bloco,
+                                         metricas=self.metricas, calcular_hash=catalogar)
+        self.zips_origem = ZipsOrigem()
+        self.descoberta = None       # DescobertaEmSegundoPlano da separação em andamento
+        self.encontradas = 0         # Entradas lidas desde o início (somando os lotes do modo vigia)
+        self._interrompidas_concluidas = False
+        self.vinculos = Counter()    # hardlink / reflink / copia
+        self.sem_parte = Counter()   # tag -> CT-es sem CNPJ daquela parte (fora daquela visão)
+        self.processados = 0
+        self.erros = 0
+        self.duplicados = 0
+        self.identicos = 0
+        self.divergentes = []        # Índices de divergências gravados (um por visão, se houver)
+
+    def separar(self, pasta_origem, ignorar=(), ao_avancar=None):
+        """
+        Separa todas as entradas da pasta de origem (XMLs soltos e membros de ZIPs) nas visões.
+        :param ignorar: Nomes de pastas da origem que não são lidas
+        :param ao_avancar: Chamado após cada entrada (ex.: barra de progresso)
+        """
+        self._concluir_interrompidas()
+        # A origem é percorrida em segundo plano, à frente da leitura, por uma fila limitada
+        self.descoberta = DescobertaEmSegundoPlano(
+            self.zips_origem.listar(pasta_origem, ignorar=ignorar, concluidos=self.diario.membros_concluidos))
+        self._separar_entradas(self.descoberta, ao_avancar)
+        self._finalizar()
+
+    def separar_arquivos(self, caminhos, ao_avancar=None):
+        """
+        Separa só os XMLs e ZIPs indicados, como uma execução completa: ao final o diário é encerrado
+        e os ZIPs de origem concluídos são apagados. Pode ser chamado várias vezes (lotes do modo vigia,
+        ver vigia_cte); contadores, manifestos e índice de duplicidade continuam de um lote para o outro.
+        """
+        self._concluir_interrompidas()
+        self._separar_entradas(self.zips_origem.listar_arquivos(caminhos, self.diario.membros_concluidos),
+                               ao_avancar)
+        self._finalizar()
+
+    def _separar_entradas(self, entradas, ao_avancar):
+        entradas = self.metricas.medir_iteracao('listagem', entradas)
+        for entrada, registro, erro in self.extrator.processar(entradas):
+            self.encontradas += 1
+            try:
+                if erro is not None:
+                    raise ValueError(erro)
+                self._colocar(entrada, registro)
+                self.processados += 1
+                self.zips_origem.concluir(entrada)
+            except Exception as e:
+                self.erros += 1
+                # Membro de ZIP ilegível fica no ZIP de origem, que então não é apagado
+                with self.metricas.medir('erros'):
+                    if self.pasta_erros.mover(entrada, erro if erro is not None else e):
+                        self.zips_origem.concluir(entrada)
+                self.manifestos[0].registrar_saida(entrada.caminho_origem)
+            if ao_avancar is not None:
+                ao_avancar()
+
+    def _finalizar(self):
+        self.divergentes = [caminho for caminho in (destino.finalizar() for destino in self.destinos) if caminho]
+        # ZIPs de entrada saem da origem só depois que todos os seus membros foram colocados
+        if self.zips_origem.pendentes or self.zips_origem.invalidos:
+            self.zips_origem.remover_concluidos()
+            self.erros += self.zips_origem.mover_invalidos(self.pasta_erros)
+        for catalogo in self.catalogos:
+            catalogo.descarregar()
+        self.pasta_erros.fechar()
+        for alocador in self.alocadores.values():
+            alocador.gravar()
+        # Tudo concluído: a próxima execução começa do zero
+        self.diario.encerrar()
+
+    @property
+    def descobertas(self):
+        """Entradas entregues pela descoberta até agora (ao final, o total exato da origem)"""
+        return self.descoberta.descobertas if self.descoberta is not None else 0
+
+    def _particao(self, visao, cnpj, registro, contar=True):
+        """Partição da visão para o CNPJ; nas visões por lote, conta o arquivo no lote atual"""
+        if visao.particao == 'data':
+            return particao_data(registro.data_emissao, self.leiaute_data)
+        alocador = self.alocadores[visao.tag]
+        return alocador.alocar(cnpj, registro.tamanho) if contar else alocador.atual(cnpj)
+
+    def _alvos(self, registro, visoes, contar=True):
+        """(índice da visão, cnpj, particao) de cada visão em que o CT-e entra"""
+        alvos = []
+        for indice, visao in visoes:
+            cnpj = registro.cnpjs[visao.tag]
+            if not cnpj:
+                self.sem_parte[visao.tag] += 1
+                continue
+            alvos.append((indice, cnpj, self._particao(visao, cnpj, registro, contar)))
+        return alvos
+
+    def _colocar(self, entrada, registro):
+        tag_principal = self.principal.tag
+        if not registro.cnpjs[tag_principal]:
+            if registro.cnpjs[tag_principal] == '':
+                raise DocumentoRecusado('cpf', f"Grupo {tag_principal} com CPF no lugar do CNPJ")
+            raise DocumentoRecusado('incompleto', f"CNPJ do grupo {tag_principal} não encontrado em infCte")
+        alvos = self._alvos(registro, enumerate(self.visoes))
+        _, cnpj, particao = alvos[0]
+        # Lotes das visões contados no diário junto com a entrada (retomados se a execução for interrompida)
+        contadores = [f"{self.visoes[indice].tag}:{cnpj_visao}" for indice, cnpj_visao, _ in alvos
+                      if self.visoes[indice].particao == 'lote']
+
+        def vincular_visoes(resultado, caminho_conteudo):
+            self._vincular(alvos[1:], caminho_conteudo, registro, entrada.caminho_origem)
+
+        resultado = self.destinos[0].colocar(entrada, cnpj, particao, registro.chave, contadores, vincular_visoes,
+                                             registro)
+        if resultado in RESULTADOS_COLOCADOS:
+            self.manifestos[0].registrar_movimento(entrada.caminho_origem, cnpj, particao, registro.tamanho)
+        else:
+            self.manifestos[0].registrar_saida(entrada.caminho_origem)
+            # Cópia idêntica ou divergente não conta nos lotes das visões, como na retomada pelo diário
+            for indice, cnpj_visao, _ in alvos:
+                if self.visoes[indice].particao == 'lote':
+                    self.alocadores[self.visoes[indice].tag].devolver(cnpj_visao, registro.tamanho)
+        if resultado != COLOCADO:
+            self.duplicados += 1
+        if resultado == IDENTICO:
+            self.identicos += 1
+
+    def _vincular(self, alvos, caminho_conteudo, registro, caminho_origem):
+        """Coloca nas outras visões o arquivo que ficou na principal (nada, se ele foi para duplicados)"""
+        if caminho_conteudo is None:
+            return
+        vinculo = VinculoXml(caminho_conteudo, self.vinculos)
+        for indice, cnpj, particao in alvos:
+            with self.metricas.medir('vincular'):
+                resultado = self.destinos[indice].colocar(vinculo, cnpj, particao, registro.chave,
+                                                          registro=registro)
+            if resultado in RESULTADOS_COLOCADOS:
+                self.manifestos[indice].registrar_movimento(caminho_origem, cnpj, particao, registro.tamanho)
+
+    def _concluir_interrompidas(self):
+        """
+        XMLs que a execução interrompida já tinha colocado na visão principal, mas talvez não nas outras:
+        são lidos de novo a partir da principal e vinculados (os lotes já foram contados pelo diário).
+        """
+        if self._interrompidas_concluidas:
+            return
+        self._interrompidas_concluidas = True
+        outras = list(enumerate(self.visoes))[1:]
+        for cnpj, particao, entrada in self.diario.movidas_na_interrupcao:
+            caminho = os.path.join(self.principal.pasta_destino, cnpj, particao, entrada.nome)
+            if not outras or not os.path.exists(caminho):
+                continue
+            registro = extrair_partes(caminho, self.tags)
+            if self.catalogos:
+                registro = registro._replace(hash=hash_arquivo(caminho))
+            self._vincular(self._alvos(registro, outras, contar=False), caminho, registro, entrada.caminho_origem)
+
+    def gravar_relatorios(self, total_arquivos):
+        """
+        Grava 0.relatorio.txt em cada visão com o que foi colocado nela nesta execução,
+        e as métricas por etapa (0.metricas.json / 0.metricas.prom) na visão principal.
+        Pode ser chamado de novo com os totais atualizados (modo vigia: a cada lote)
+        """
+        self.metricas.definir('processados', self.processados)
+        self.metricas.definir('erros', self.erros)
+        self.metricas.definir('duplicados', self.duplicados)
+        for modo, quantidade in self.vinculos.items():
+            self.metricas.definir(f"vinculo_{modo}", quantidade)
+        self.movimentador.contar_em(self.metricas)
+        self.metricas.gravar(self.principal.pasta_destino)
+        for visao, manifesto in zip(self.visoes, self.manifestos):
+            nome_particao = "Data de Emissão" if visao.particao == 'data' else "Lote"
+            with open(os.path.join(visao.pasta_destino, "0.relatorio.txt"), 'w') as f:
+                f.write(f"Data do processamento: {time.strftime('%d/%m/%Y %H:%M:%S')}\n")
+                f.write(f"Visão: {NOMES_PARTES[visao.tag]} ({visao.tag}), "
+                        f"{'principal' if visao is self.principal else 'vinculada à principal'}\n")
+                f.write(f"Total de arquivos XML encontrados: {total_arquivos}\n")
+                f.write(f"Total de arquivos XML processados: {self.processados}\n")
+                f.write(f"Total de arquivos XML com erros: {self.erros}\n")
+                f.write(f"Total de CT-es sem CNPJ desta parte: {self.sem_parte[visao.tag]}\n")
+                f.write(f"Total de arquivos XML efetivamente separados: {manifesto.total_arquivos}\n")
+                f.write(f"Tamanho total separado: {manifesto.total_bytes / 1048576:.2f} MB "
+                        f"em {manifesto.total_particoes} pasta(s) de CNPJ/{visao.particao}\n")
+                f.write("|"+"--"*30 +"|"+"\n"*3)
+                f.write(f"Relatório de arquivos separados nesta execução por CNPJ e {nome_particao}:\n\n")
+                f.write(manifesto.relatorio_por_cnpj())
+
+    def relatorio_vinculos(self):
+        """Resume como os arquivos entraram nas visões além da principal"""
+        if not self.vinculos:
+            return "    Nenhum vínculo criado"
+        return "\n".join(f"    {modo}: {quantidade} arquivo(s)" for modo, quantidade in sorted(self.vinculos.items()))
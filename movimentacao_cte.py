@@ -0,0 +1,176 @@
+import os
+import errno
+import shutil
+import time
+import threading
+from collections import Counter
+
+# Arquivos copiados entre volumes que aguardam o fsync antes de a origem ser apagada
+LOTE_FSYNC = 256
+# Bytes pedidos ao kernel por chamada de cópia
+BLOCO_COPIA = 8 * 1048576
+
+# Erros de copy_file_range/sendfile que valem para todas as cópias seguintes (sem suporte, não uma falha de I/O)
+RECUSAS_KERNEL = (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP)
+
+# Caminho usado por movimentação
+RENOMEAR = 'renomear'          # Mesmo volume: os.replace (atômico, sem copiar bytes)
+COPIA_KERNEL = 'copia_kernel'  # Outro volume: copy_file_range/sendfile, sem passar os bytes pelo Python
+COPIA = 'copia'                # Outro volume sem cópia no kernel (ex.: Windows): shutil.move
+
+class MovimentadorArquivos:
+    """
+    Move arquivos escolhendo o caminho mais barato, decidido uma vez por par de pastas
+    (os.stat de cada pasta só na primeira vez que ela aparece):
+    - mesmo volume: os.replace;
+    - volumes diferentes: cópia feita pelo kernel (os.copy_file_range, ou os.sendfile), conferida pelo
+      tamanho. Os fsync são feitos em lotes de LOTE_FSYNC arquivos e as origens só são apagadas depois
+      deles; se a execução for interrompida antes, a origem continua lá e a próxima execução a descarta
+      como idêntica ao que já está no destino. Um movimento para uma origem ainda pendente (ex.: arquivo do
+      destino levado a 1.Duplicados e substituído por um novo) descarrega o lote antes, para que a remoção
+      adiada não apague o arquivo novo. Se o kernel recusar a cópia entre volumes, a chamada recusada não
+      é tentada de novo;
+    - sem cópia no kernel: shutil.move (comportamento original).
+    Conta arquivos, bytes e tempo por caminho, para saber qual deles cada execução usou.
+    Pode ser usado por várias threads ao mesmo tempo (ver executor_io_cte). Cada motor (ver separacao_cte)
+    tem o seu: contadores e cópias pendentes de um não se misturam com os de outro.
+    """
+
+    def __init__(self, lote_fsync=LOTE_FSYNC):
+        self.lote_fsync = max(1, lote_fsync)
+        self.dispositivos = {}     # pasta -> st_dev
+        self.arquivos = Counter()  # caminho usado -> arquivos
+        self.bytes = Counter()     # caminho usado -> bytes
+        self.segundos = Counter()  # caminho usado -> segundos
+        self.pendentes = []        # (descritor do destino, origem) aguardando fsync
+        self._origens = set()      # origens de pendentes (normalizadas), apagadas em descarregar
+        self._copy_file_range = hasattr(os, 'copy_file_range')
+        self._sendfile = hasattr(os, 'sendfile')
+        self._copia_kernel = self._copy_file_range or self._sendfile
+        self._trava = threading.Lock()
+
+    def _dispositivo(self, pasta):
+        dispositivo = self.dispositivos.get(pasta)
+        if dispositivo is None:
+            dispositivo = self.dispositivos[pasta] = os.stat(pasta or os.curdir).st_dev
+        return dispositivo
+
+    def mover(self, origem, destino):
+        """Move origem para destino (substituindo destino, se existir); retorna o caminho usado"""
+        inicio = time.perf_counter()
+        if self._origens:
+            self._liberar(destino)
+        if self._dispositivo(os.path.dirname(origem)) == self._dispositivo(os.path.dirname(destino)):
+            tamanho = os.stat(origem).st_size
+            try:
+                os.replace(origem, destino)
+                return self._contar(RENOMEAR, tamanho, inicio)
+            except OSError as e:
+                # Ex.: bind mount do mesmo volume segue como volumes diferentes; as outras falhas sobem
+                if e.errno != errno.EXDEV:
+                    raise
+        if self._copia_kernel:
+            tamanho = self._copiar(origem, destino)
+            return self._contar(COPIA_KERNEL, tamanho, inicio)
+        tamanho = os.stat(origem).st_size
+        shutil.move(origem, destino)
+        return self._contar(COPIA, tamanho, inicio)
+
+    def _liberar(self, destino):
+        """Descarrega as cópias pendentes se destino é a origem de uma delas (a remoção adiada o apagaria)"""
+        caminho = os.path.normcase(os.path.abspath(destino))
+        with self._trava:
+            pendente = caminho in self._origens
+        if pendente:
+            self.descarregar()
+
+    def _contar(self, caminho, tamanho, inicio):
+        with self._trava:
+            self.arquivos[caminho] += 1
+            self.bytes[caminho] += tamanho
+            self.segundos[caminho] += time.perf_counter() - inicio
+        return caminho
+
+    def _copiar(self, origem, destino):
+        """Copia pelo kernel e deixa destino aberto até o próximo fsync em lote; retorna o tamanho"""
+        with open(origem, 'rb') as f_origem:
+            entrada = f_origem.fileno()
+            tamanho = os.fstat(entrada).st_size
+            saida = os.open(destino, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+            try:
+                copiados = 0
+                while copiados < tamanho:
+                    n = self._copiar_bloco(entrada, saida, copiados, min(BLOCO_COPIA, tamanho - copiados))
+                    if n == 0:
+                        break
+                    copiados += n
+                if copiados != tamanho or os.fstat(saida).st_size != tamanho:
+                    raise OSError(f"Cópia incompleta de {origem}: {copiados} de {tamanho} bytes")
+            except BaseException:
+                os.close(saida)
+                os.remove(destino)
+                raise
+        shutil.copystat(origem, destino)
+        with self._trava:
+            self.pendentes.append((saida, origem))
+            self._origens.add(os.path.normcase(os.path.abspath(origem)))
+            cheio = len(self.pendentes) >= self.lote_fsync
+        if cheio:
+            self.descarregar()
+        return tamanho
+
+    def _copiar_bloco(self, entrada, saida, posicao, quantidade):
+        if self._copy_file_range:
+            try:
+                return os.copy_file_range(entrada, saida, quantidade, posicao, posicao)
+            except OSError as e:
+                # Kernel antigo ou sistema de arquivos sem suporte entre volumes: não muda até o fim da execução
+                if e.errno in RECUSAS_KERNEL:
+                    self._copy_file_range = False
+        if self._sendfile:
+            try:
+                os.lseek(saida, posicao, os.SEEK_SET)
+                return os.sendfile(saida, entrada, posicao, quantidade)
+            except OSError as e:
+                if e.errno in RECUSAS_KERNEL:
+                    self._sendfile = False
+        os.lseek(entrada, posicao, os.SEEK_SET)
+        os.lseek(saida, posicao, os.SEEK_SET)
+        return os.write(saida, os.read(entrada, quantidade))
+
+    def descarregar(self):
+        """
+        Faz o fsync das cópias pendentes e só então apaga as origens.
+        Chamar ao final da separação, antes de encerrar o diário e de limpar as pastas de origem.
+        """
+        with self._trava:
+            pendentes, self.pendentes = self.pendentes, []
+            self._origens = set()
+        for saida, _ in pendentes:
+            try:
+                os.fsync(saida)
+            finally:
+                os.close(saida)
+        for _, origem in pendentes:
+            try:
+                os.remove(origem)
+            except FileNotFoundError:
+                pass
+
+    def relatorio(self):
+        """Arquivos, volume e vazão por caminho usado nesta execução"""
+        if not self.arquivos:
+            return "    Nenhum arquivo movido"
+        linhas = []
+        for caminho, arquivos in sorted(self.arquivos.items()):
+            mb = self.bytes[caminho] / 1048576
+            segundos = self.segundos[caminho]
+            vazao = f"{mb / segundos:.1f} MB/s, {arquivos / segundos:.0f} arquivos/s" if segundos else "-"
+            linhas.append(f"    {caminho}: {arquivos} arquivo(s), {mb:.2f} MB ({vazao})")
+        return "\n".join(linhas)
+
+    def contar_em(self, metricas):
+        """Grava os contadores desta execução em MetricasExecucao (ver metricas_cte)"""
+        for caminho, arquivos in self.arquivos.items():
+            metricas.definir(f"mover_{caminho}_arquivos", arquivos)
+            metricas.definir(f"mover_{caminho}_bytes", self.bytes[caminho])
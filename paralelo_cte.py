@@ -0,0 +1,186 @@
+import os
+import time
+import zlib
+from collections import Counter, deque
+
+from extrator_cte import extrair_partes, extrair_registro, extrair_registro_rapido
+from duplicados_cte import hash_entrada, hash_dados
+from entrada_cte import fechar_zips_origem
+from erros_cte import falha_leitura
+from fiscal_cte import ColetorFiscal
+from metricas_cte import Histograma, SEM_METRICAS
+
+TAMANHO_BLOCO_PADRAO = 500
+MAX_DIVERGENCIAS_LISTADAS = 20
+
+def _conferir(rotulo, conferencia):
+    """Decide de forma determinística se o arquivo entra na amostra do modo estrito (1 a cada N)"""
+    return conferencia > 0 and zlib.crc32(rotulo.encode('utf-8', 'surrogateescape')) % conferencia == 0
+
+def _processar_bloco(entradas, tag_cnpj, leitura_rapida=False, conferencia=0, calcular_hash=False,
+                     campos_fiscais=()):
+    """
+    Executado no processo worker: extrai os dados de um bloco de entradas (XMLs ou membros de ZIP).
+    Com calcular_hash, o registro leva o hash do conteúdo (o membro de ZIP já está em memória).
+    Com campos_fiscais, o parser lê o infCte inteiro e o registro leva os campos (sem leitura rápida).
+    Entradas que falham vêm com FalhaLeitura (motivo e mensagem, ver erros_cte) no lugar do registro
+    """
+    inicio = time.perf_counter()
+    resultados = []
+    origens = Counter()
+    divergencias = []
+    latencias = Histograma()
+    for entrada in entradas:
+        inicio_entrada = time.perf_counter()
+        try:
+            # Membro de ZIP é lido para a memória; XML solto é lido direto do disco pelo extrator
+            dados = entrada.ler() if entrada.compactada else None
+            if isinstance(tag_cnpj, tuple):
+                registro, origem = extrair_partes(entrada.rotulo, tag_cnpj, dados), 'parser'
+            elif campos_fiscais:
+                registro, origem = extrair_registro(entrada.rotulo, tag_cnpj, dados,
+                                                    ColetorFiscal(campos_fiscais)), 'parser'
+            elif leitura_rapida:
+                registro, origem = extrair_registro_rapido(entrada.rotulo, tag_cnpj,
+                                                           _conferir(entrada.rotulo, conferencia), dados)
+                if origem == 'divergente':
+                    divergencias.append(entrada.rotulo)
+            else:
+                registro, origem = extrair_registro(entrada.rotulo, tag_cnpj, dados), 'parser'
+            if calcular_hash:
+                registro = registro._replace(hash=hash_dados(dados) if dados is not None else hash_entrada(entrada))
+            origens[origem] += 1
+            resultados.append((entrada, registro, None))
+        except Exception as e:
+            resultados.append((entrada, None, falha_leitura(e)))
+        latencias.registrar(time.perf_counter() - inicio_entrada)
+    # Os workers ficam vivos entre as chamadas (manter_processos): um ZIP de origem aberto aqui impediria
+    # o processo principal de apagá-lo no Windows
+    fechar_zips_origem()
+    return os.getpid(), time.perf_counter() - inicio, resultados, origens, divergencias, latencias
+
+def _agrupar_em_blocos(entradas, tamanho_bloco):
+    """Agrupa as entradas em listas de até tamanho_bloco itens"""
+    bloco = []
+    for entrada in entradas:
+        bloco.append(entrada)
+        if len(bloco) >= tamanho_bloco:
+            yield bloco
+            bloco = []
+    if bloco:
+        yield bloco
+
+class ExtratorParalelo:
+    """
+    Distribui a leitura dos XMLs (RegistroCte com CNPJ, data de emissão e chave) entre processos.
+    A movimentação dos arquivos e o tratamento de duplicados continuam com quem consome
+    os resultados, que chegam na mesma ordem em que os arquivos foram encontrados.
+    """
+
+    def __init__(self, tag_cnpj, processos=1, tamanho_bloco=TAMANHO_BLOCO_PADRAO,
+                 leitura_rapida=False, conferencia=0, metricas=SEM_METRICAS, calcular_hash=False,
+                 campos_fiscais=(), manter_processos=False):
+        """
+        :param tag_cnpj: Grupo do CNPJ ('emit', 'receb'...) ou tupla de tags lidas de uma vez só,
+                         gerando RegistroPartes (ver extrator_cte.extrair_partes; sem leitura rápida)
+        :param leitura_rapida: Usa a varredura de bytes (mmap) antes do parser XML
+        :param conferencia: Modo estrito da leitura rápida: confere 1 a cada N arquivos com o parser (0 = desligado)
+        :param metricas: MetricasExecucao que recebe a latência de leitura de cada arquivo ('leitura')
+                         e a espera do processo principal pelos workers ('espera_workers')
+        :param calcular_hash: Calcula nos workers o hash do conteúdo de cada entrada (registro.hash)
+        :param campos_fiscais: Nomes de fiscal_cte.CAMPOS_FISCAIS lidos na mesma passada (registro.fiscal);
+                               o infCte é lido até o fim pelo parser, então a leitura rápida não se aplica
+        :param manter_processos: Os processos continuam abertos de uma chamada de processar para a outra
+                                 (motor reaproveitado entre lotes, ver separacao_cte) até fechar()
+        """
+        self.metricas = metricas
+        self.tag_cnpj = tag_cnpj
+        self.leitura_rapida = leitura_rapida
+        self.conferencia = conferencia
+        self.calcular_hash = calcular_hash
+        self.campos_fiscais = tuple(campos_fiscais)
+        self.manter_processos = manter_processos
+        self._executor = None
+        self.processos = max(1, processos)
+        self.tamanho_bloco = max(1, tamanho_bloco)
+        # Limita os blocos enviados e ainda não consumidos para não acumular resultados em memória
+        self.blocos_em_andamento = self.processos * 2
+        self.estatisticas = {}  # pid -> [arquivos, segundos]
+        self.origens = Counter()  # varredura / parser / divergente
+        self.divergencias = []
+
+    def processar(self, entradas):
+        """
+        Gera tuplas (entrada, dados, erro) para cada entrada, preservando a ordem.
+        :param entradas: ArquivoXml / MembroZip (ver entrada_cte)
+        """
+        if self.processos == 1:
+            # Modo linear: sem blocos, para a barra de progresso andar arquivo a arquivo
+            for entrada in entradas:
+                yield from self._registrar(*_processar_bloco([entrada], *self._argumentos()))
+            return
+
+        # Importado só aqui: o modo linear (e o início de todo script) não carrega o multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        executor, self._executor = self._executor or ProcessPoolExecutor(max_workers=self.processos), None
+        pendentes = deque()
+        concluido = False
+        try:
+            for bloco in _agrupar_em_blocos(entradas, self.tamanho_bloco):
+                pendentes.append(executor.submit(_processar_bloco, bloco, *self._argumentos()))
+                if len(pendentes) >= self.blocos_em_andamento:
+                    yield from self._registrar(*self._aguardar(pendentes.popleft()))
+            while pendentes:
+                yield from self._registrar(*self._aguardar(pendentes.popleft()))
+            concluido = True
+        finally:
+            if concluido and self.manter_processos:
+                self._executor = executor
+            else:
+                # Consumo interrompido ou worker perdido: os blocos ainda não iniciados não são lidos
+                for futuro in pendentes:
+                    futuro.cancel()
+                executor.shutdown()
+
+    def fechar(self):
+        """Encerra os processos mantidos abertos (manter_processos)"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _aguardar(self, futuro):
+        """Resultado do bloco; o tempo parado aqui indica workers mais lentos que o consumo"""
+        with self.metricas.medir('espera_workers'):
+            return futuro.result()
+
+    def _argumentos(self):
+        return self.tag_cnpj, self.leitura_rapida, self.conferencia, self.calcular_hash, self.campos_fiscais
+
+    def _registrar(self, pid, segundos, resultados, origens, divergencias, latencias):
+        """Acumula arquivos e tempo gasto por worker e a origem de cada leitura"""
+        estatistica = self.estatisticas.setdefault(pid, [0, 0.0])
+        estatistica[0] += len(resultados)
+        estatistica[1] += segundos
+        self.origens.update(origens)
+        if self.metricas.ativa:
+            self.metricas.histograma('leitura').mesclar(latencias)
+        espaco = MAX_DIVERGENCIAS_LISTADAS - len(self.divergencias)
+        self.divergencias.extend(divergencias[:max(0, espaco)])
+        return resultados
+
+    def relatorio_throughput(self):
+        """Retorna uma linha por worker com a quantidade de arquivos e arquivos/s"""
+        linhas = []
+        for pid, (arquivos, segundos) in sorted(self.estatisticas.items()):
+            taxa = arquivos / segundos if segundos > 0 else 0.0
+            linhas.append(f"    Worker {pid}: {arquivos} arquivo(s) em {segundos:.2f}s ({taxa:.0f} arquivos/s)")
+        return "\n".join(linhas)
+
+    def relatorio_leitura_rapida(self):
+        """Resume quantos arquivos saíram da varredura de bytes, do parser e das conferências"""
+        linhas = [f"    Varredura de bytes: {self.origens['varredura']} arquivo(s)",
+                  f"    Parser XML (varredura inconclusiva): {self.origens['parser']} arquivo(s)"]
+        if self.conferencia:
+            linhas.append(f"    Divergências na conferência (1 a cada {self.conferencia}): {self.origens['divergente']}")
+            linhas.extend(f"        {rotulo}" for rotulo in self.divergencias)
+        return "\n".join(linhas)
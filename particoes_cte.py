@@ -0,0 +1,123 @@
+import os
+
+# Estado dos lotes de cada CNPJ, na pasta de destino, entre uma execução e outra
+ARQUIVO_LOTES = "0.lotes.txt"
+# Arquivos por lote (lote_N) quando não há outro limite
+TAMANHO_LOTE = 50000
+PREFIXO_LOTE = 'lote_'
+
+# Leiautes das pastas de data dentro de cada CNPJ -> níveis de pasta até a partição
+LEIAUTES_DATA = {
+    'dia': 1,  # AAAA-MM-DD: uma pasta por dia direto no CNPJ (original)
+    'mes': 2,  # AAAA-MM/DD: no máximo 31 pastas por mês
+    'ano': 3,  # AAAA/MM/DD: no máximo 12 meses por ano e 31 dias por mês
+}
+LEIAUTE_DATA_PADRAO = 'dia'
+
+def particao_data(data_emissao, leiaute=LEIAUTE_DATA_PADRAO):
+    """Partição (caminho relativo ao CNPJ) da data de emissão AAAA-MM-DD no leiaute pedido"""
+    if leiaute == 'dia':
+        return data_emissao
+    ano, mes, dia = data_emissao.split('-')
+    if leiaute == 'mes':
+        return os.path.join(f"{ano}-{mes}", dia)
+    return os.path.join(ano, mes, dia)
+
+class AlocadorLotes:
+    """
+    Escolhe o lote (lote_N) de cada arquivo por CNPJ, continuando de uma execução para a outra:
+    o lote aberto de cada CNPJ (número, arquivos e bytes) fica em <pasta_destino>/0.lotes.txt,
+    gravado ao final da separação. Um lote novo é aberto quando o atual chega a max_arquivos arquivos
+    ou quando o próximo arquivo passaria de max_bytes, então nenhuma pasta de lote (nem o ZIP dela)
+    cresce além do limite a cada execução, como acontecia com a contagem reiniciada em lote_1.
+    Se a execução for interrompida, o estado gravado é o da anterior e os arquivos já colocados voltam
+    pelos contadores do diário (ver retomar).
+    Em um shard i de n (ver shards_cte), o estado fica em 0.lotes.shard_i-n.txt e os lotes novos de cada
+    CNPJ são base+i, base+i+n, base+i+2n..., com base o último lote de 0.lotes.txt: shards diferentes
+    nunca abrem o mesmo lote, e a mescla dos shards renumera os lotes em sequência.
+    """
+
+    def __init__(self, pasta_destino, max_arquivos=TAMANHO_LOTE, max_bytes=None, shard=None):
+        """
+        :param max_bytes: Tamanho máximo de cada lote em bytes (None = só pela quantidade de arquivos)
+        :param shard: Shard (ver shards_cte) ou None
+        """
+        self.caminho = os.path.join(pasta_destino, ARQUIVO_LOTES)
+        self.max_arquivos = max(1, max_arquivos)
+        self.max_bytes = max_bytes or None
+        self.base = {}  # cnpj -> último lote antes dos shards (só em shard)
+        self.primeiro = 1
+        self.passo = 1
+        if shard is not None:
+            self.base = {cnpj: lote[0] for cnpj, lote in ler_lotes(self.caminho).items()}
+            self.caminho = os.path.join(pasta_destino, shard.arquivo(ARQUIVO_LOTES))
+            self.primeiro, self.passo = shard.indice, shard.total
+        self.lotes = ler_lotes(self.caminho)  # cnpj -> [número do lote aberto, arquivos, bytes]
+
+    def _novo(self, cnpj):
+        return [self.base.get(cnpj, 0) + self.primeiro, 0, 0]
+
+    def retomar(self, contadores):
+        """
+        Soma os arquivos que a execução interrompida colocou nas partições (DiarioExecucao.contadores_cnpj).
+        O diário não guarda o tamanho deles: nesse trecho os lotes seguem só a quantidade de arquivos.
+        """
+        for cnpj, arquivos in contadores.items():
+            lote = self.lotes.get(cnpj)
+            if lote is None:
+                lote = self.lotes[cnpj] = self._novo(cnpj)
+            lote[1] += arquivos
+            while lote[1] > self.max_arquivos:
+                lote[0] += self.passo
+                lote[1] -= self.max_arquivos
+                lote[2] = 0
+
+    def atual(self, cnpj):
+        """Lote aberto do CNPJ, sem contar arquivo nenhum"""
+        return f"{PREFIXO_LOTE}{(self.lotes.get(cnpj) or self._novo(cnpj))[0]}"
+
+    def alocar(self, cnpj, tamanho=0):
+        """Conta um arquivo de tamanho bytes no lote aberto do CNPJ (abrindo o próximo, se cheio); retorna o lote"""
+        lote = self.lotes.get(cnpj)
+        if lote is None:
+            lote = self.lotes[cnpj] = self._novo(cnpj)
+        elif lote[1] and (lote[1] >= self.max_arquivos
+                          or (self.max_bytes is not None and lote[2] + (tamanho or 0) > self.max_bytes)):
+            lote[0] += self.passo
+            lote[1] = lote[2] = 0
+        lote[1] += 1
+        lote[2] += tamanho or 0
+        return f"{PREFIXO_LOTE}{lote[0]}"
+
+    def devolver(self, cnpj, tamanho=0):
+        """Desconta um arquivo contado por alocar que não ficou no lote (idêntico ou divergente)"""
+        lote = self.lotes.get(cnpj)
+        if lote is not None and lote[1]:
+            lote[1] -= 1
+            lote[2] = max(0, lote[2] - (tamanho or 0))
+
+    def gravar(self):
+        """Grava o estado dos lotes (troca o arquivo de uma vez: uma interrupção aqui mantém o anterior)"""
+        if self.lotes:
+            gravar_lotes(self.caminho, self.lotes)
+
+def ler_lotes(caminho):
+    """{cnpj: [número do lote aberto, arquivos, bytes]} do arquivo de estado dos lotes (vazio se não existir)"""
+    lotes = {}
+    try:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            for linha in f:
+                campos = linha.rstrip('\n').split('\t')
+                if len(campos) == 4:
+                    lotes[campos[0]] = [int(campos[1]), int(campos[2]), int(campos[3])]
+    except FileNotFoundError:
+        pass
+    return lotes
+
+def gravar_lotes(caminho, lotes):
+    """Grava o estado dos lotes trocando o arquivo de uma vez"""
+    caminho_novo = f"{caminho}.novo"
+    with open(caminho_novo, 'w', encoding='utf-8') as f:
+        for cnpj, (numero, arquivos, tamanho) in sorted(lotes.items()):
+            f.write(f"{cnpj}\t{numero}\t{arquivos}\t{tamanho}\n")
+    os.replace(caminho_novo, caminho)
@@ -0,0 +1,110 @@
+from collections import Counter
+
+from manifesto_cte import ManifestoExecucao
+from duplicados_cte import COLOCADO, RESULTADOS_COLOCADOS
+from destino_cte import DestinoPastas
+from erros_cte import MOTIVOS, motivo_da_falha
+
+# Ações mostradas no console ao final da simulação (o plano completo vai para o arquivo, se pedido)
+ACOES_LISTADAS = 20
+
+class PlanoSeparacao:
+    """
+    Plano de uma separação simulada (--simular): cada ação que a execução faria, na ordem,
+    e o relatório esperado por CNPJ e partição. Nada é criado, movido ou apagado; os XMLs são lidos
+    (e, em colisão de chave ou de nome, comparados pelo conteúdo) como na execução real.
+    Ações: mover (origem -> destino), descartar (idêntico a um já colocado),
+    para_duplicados (arquivo existente no destino substituído) e erro (origem -> mensagem; eventos, NF-e,
+    CT-e OS... contados por motivo, ver erros_cte).
+    """
+
+    def __init__(self, caminho_plano=None):
+        """:param caminho_plano: Arquivo onde o plano completo é gravado, uma ação por linha (opcional)"""
+        self.caminho_plano = caminho_plano
+        self._arquivo = open(caminho_plano, 'w', encoding='utf-8') if caminho_plano else None
+        self.primeiras = []         # Primeiras ACOES_LISTADAS ações, para o console
+        self.acoes = Counter()      # ação -> quantidade
+        self.resultados = Counter() # resultado de ControleDuplicados.colocar -> quantidade
+        self.manifesto = ManifestoExecucao()
+        self.erros = 0
+        self.motivos = Counter()    # motivo do erro (ver erros_cte.MOTIVOS) -> quantidade
+
+    def registrar(self, acao, origem, destino=''):
+        self.acoes[acao] += 1
+        if len(self.primeiras) < ACOES_LISTADAS:
+            self.primeiras.append((acao, origem, destino))
+        if self._arquivo is not None:
+            self._arquivo.write(f"{acao}\t{origem}\t{destino}\n")
+
+    def registrar_erro(self, entrada, erro):
+        self.erros += 1
+        self.motivos[motivo_da_falha(erro)] += 1
+        self.registrar('erro', entrada.rotulo, erro)
+        self.manifesto.registrar_saida(entrada.caminho_origem)
+
+    def registrar_resultado(self, entrada, cnpj, particao, tamanho, resultado):
+        self.resultados[resultado] += 1
+        if resultado in RESULTADOS_COLOCADOS:
+            self.manifesto.registrar_movimento(entrada.caminho_origem, cnpj, particao, tamanho)
+        else:
+            self.manifesto.registrar_saida(entrada.caminho_origem)
+
+    def encerrar(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+
+    @property
+    def processados(self):
+        return sum(self.resultados.values())
+
+    @property
+    def duplicados(self):
+        return self.processados - self.resultados[COLOCADO]
+
+    def resumo(self):
+        """Texto mostrado no console: totais, primeiras ações e relatório esperado"""
+        linhas = ["Simulação: nenhuma pasta foi criada e nenhum arquivo foi movido ou apagado.",
+                  f"    Arquivos a separar: {self.processados}",
+                  f"    Arquivos com erro: {self.erros}",
+                  *(f"        {MOTIVOS[motivo][1]}: {self.motivos[motivo]}" for motivo in MOTIVOS
+                    if self.motivos[motivo]),
+                  f"    Duplicados: {self.duplicados}",
+                  f"    Partições que receberiam arquivos: {self.manifesto.total_particoes}",
+                  "    Ações: " + (", ".join(f"{quantidade} {acao}"
+                                            for acao, quantidade in sorted(self.acoes.items())) or "nenhuma")]
+        if self.primeiras:
+            linhas.append(f"\nPrimeiras {len(self.primeiras)} ações:")
+            linhas.extend(f"    {acao}: {origem}" + (f" -> {destino}" if destino else "")
+                          for acao, origem, destino in self.primeiras)
+        if self.manifesto.total_particoes:
+            linhas.append("\nRelatório esperado por CNPJ e partição:\n")
+            linhas.append(self.manifesto.relatorio_por_cnpj())
+        if self.caminho_plano:
+            linhas.append(f"\nPlano completo gravado em: {self.caminho_plano}")
+        return "\n".join(linhas)
+
+def simular_separacao(extrator, entradas, pasta_destino, pasta_duplicados, particionar, caminho_plano=None,
+                      ao_avancar=None):
+    """
+    Percorre as entradas como a separação em pastas faria, mas só monta o plano.
+    :param extrator: ExtratorParalelo (ver paralelo_cte)
+    :param particionar: Função registro -> partição (data de emissão, lote...), chamada uma vez por CT-e
+    :param ao_avancar: Chamado após cada entrada (ex.: barra de progresso)
+    :return: PlanoSeparacao
+    """
+    plano = PlanoSeparacao(caminho_plano)
+    destino = DestinoPastas(pasta_destino, pasta_duplicados, plano=plano)
+    try:
+        for entrada, registro, erro in extrator.processar(entradas):
+            if erro is not None:
+                plano.registrar_erro(entrada, erro)
+            else:
+                particao = particionar(registro)
+                resultado = destino.colocar(entrada, registro.cnpj, particao, registro.chave)
+                plano.registrar_resultado(entrada, registro.cnpj, particao, registro.tamanho, resultado)
+            if ao_avancar is not None:
+                ao_avancar()
+    finally:
+        plano.encerrar()
+    return plano
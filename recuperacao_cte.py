@@ -0,0 +1,126 @@
+import os
+import struct
+import zipfile
+import zlib
+
+# Bytes lidos por vez ao copiar um XML para a saída
+BLOCO_LEITURA = 1048576
+
+# Cabeçalho local de cada membro do ZIP (assinatura, versão, flags, método, hora, data, CRC, tamanhos,
+# tamanho do nome, tamanho do campo extra); os dados começam logo depois do nome e do campo extra
+_CABECALHO_LOCAL = struct.Struct('<4s5H3L2H')
+_ASSINATURA_LOCAL = b'PK\x03\x04'
+
+def ler_membro(arquivo, indexado, bloco=BLOCO_LEITURA):
+    """
+    Gera o conteúdo do membro em blocos, lendo só os bytes dele no ZIP já aberto (sem o diretório central).
+    :param indexado: MembroIndexado (ver catalogo_cte.CatalogoCte.diretorio_zip)
+    :raises zipfile.BadZipFile: Cabeçalho local ou CRC não conferem (ZIP mudou depois de indexado)
+    """
+    arquivo.seek(indexado.posicao)
+    cabecalho = arquivo.read(_CABECALHO_LOCAL.size)
+    if len(cabecalho) != _CABECALHO_LOCAL.size or cabecalho[:4] != _ASSINATURA_LOCAL:
+        raise zipfile.BadZipFile(f"Cabeçalho local não encontrado na posição {indexado.posicao}")
+    campos = _CABECALHO_LOCAL.unpack(cabecalho)
+    arquivo.seek(campos[9] + campos[10], os.SEEK_CUR)
+    # Tamanho compactado do diretório central: o do cabeçalho local é zero quando há data descriptor
+    restante = indexado.tamanho_compactado
+    descompressor = zlib.decompressobj(-zlib.MAX_WBITS) if indexado.compressao == zipfile.ZIP_DEFLATED else None
+    crc = 0
+    while restante > 0:
+        dados = arquivo.read(min(bloco, restante))
+        if not dados:
+            raise zipfile.BadZipFile("ZIP truncado")
+        restante -= len(dados)
+        if descompressor is not None:
+            dados = descompressor.decompress(dados)
+        crc = zlib.crc32(dados, crc)
+        yield dados
+    if descompressor is not None:
+        dados = descompressor.flush()
+        crc = zlib.crc32(dados, crc)
+        if dados:
+            yield dados
+    if crc != indexado.crc:
+        raise zipfile.BadZipFile("CRC do membro não confere")
+
+def _leitura_direta(indexado):
+    """Membros que ler_membro sabe ler: armazenados ou deflate, sem criptografia"""
+    return not indexado.criptografado and indexado.compressao in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+
+class RecuperadorCte:
+    """
+    Tira do destino os XMLs de CT-es escolhidos pela chave de acesso, sem descompactar os ZIPs inteiros:
+    o catálogo (ver catalogo_cte) diz em que ZIP e membro cada chave está e guarda o diretório central de
+    cada ZIP, então cada XML é lido com um seek até o membro e só os bytes dele são descompactados.
+    Em lote, as chaves são agrupadas por ZIP: cada ZIP é aberto uma vez só e lido em ordem de posição.
+    XMLs ainda nas pastas são copiados direto.
+    """
+
+    def __init__(self, catalogo):
+        """:param catalogo: CatalogoCte da pasta de destino (aberto com escrita: guarda os diretórios dos ZIPs)"""
+        self.catalogo = catalogo
+
+    def extrair(self, chaves, abrir_saida):
+        """
+        Grava o XML de cada chave na saída aberta por abrir_saida(local) (arquivo binário, usado com "with").
+        Gera (chave, LocalCte ou None se fora do catálogo, erro ou None), agrupados por arquivo de origem.
+        """
+        locais = self.catalogo.localizar(chaves)
+        for chave in dict.fromkeys(chaves):
+            if chave not in locais:
+                yield chave, None, None
+        por_arquivo = {}
+        for local in locais.values():
+            por_arquivo.setdefault(local.caminho, []).append(local)
+        for caminho, locais_arquivo in sorted(por_arquivo.items()):
+            if locais_arquivo[0].membro:
+                yield from self._extrair_do_zip(caminho, locais_arquivo, abrir_saida)
+            else:
+                for local in locais_arquivo:
+                    yield local.chave, local, self._copiar(local, abrir_saida)
+
+    def _copiar(self, local, abrir_saida):
+        try:
+            with open(local.caminho, 'rb') as origem, abrir_saida(local) as saida:
+                for dados in iter(lambda: origem.read(BLOCO_LEITURA), b''):
+                    saida.write(dados)
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"
+        return None
+
+    def _extrair_do_zip(self, caminho_zip, locais, abrir_saida):
+        try:
+            diretorio = self.catalogo.diretorio_zip(caminho_zip)
+            arquivo = open(caminho_zip, 'rb')
+        except Exception as e:
+            for local in locais:
+                yield local.chave, local, f"{type(e).__name__}: {e}"
+            return
+        zipf = None  # Só para métodos de compressão que ler_membro não trata (ex.: LZMA)
+        try:
+            # Em ordem de posição no ZIP: a leitura anda sempre para frente
+            for local in sorted(locais, key=lambda local: diretorio[local.membro].posicao
+                                if local.membro in diretorio else -1):
+                indexado = diretorio.get(local.membro)
+                try:
+                    if indexado is None:
+                        raise KeyError(f"Membro {local.membro} não está no ZIP (catálogo desatualizado)")
+                    with abrir_saida(local) as saida:
+                        if _leitura_direta(indexado):
+                            for dados in ler_membro(arquivo, indexado):
+                                saida.write(dados)
+                        else:
+                            if zipf is None:
+                                zipf = zipfile.ZipFile(caminho_zip)
+                            with zipf.open(local.membro) as membro:
+                                for dados in iter(lambda: membro.read(BLOCO_LEITURA), b''):
+                                    saida.write(dados)
+                    erro = None
+                except Exception as e:
+                    erro = f"{type(e).__name__}: {e}"
+                yield local.chave, local, erro
+        finally:
+            arquivo.close()
+            if zipf is not None:
+                zipf.close()
@@ -0,0 +1,321 @@
+import os
+import time
+from collections import Counter, namedtuple
+
+from paralelo_cte import ExtratorParalelo, TAMANHO_BLOCO_PADRAO
+from manifesto_cte import ManifestoExecucao
+from duplicados_cte import COLOCADO, IDENTICO, RESULTADOS_COLOCADOS
+from destino_cte import DestinoPastas, DestinoZip, MAX_ZIPS_ABERTOS
+from entrada_cte import ZipsOrigem, DescobertaEmSegundoPlano
+from diario_cte import DiarioExecucao
+from executor_io_cte import ExecutorIO
+from metricas_cte import MetricasExecucao
+from movimentacao_cte import MovimentadorArquivos
+from particoes_cte import AlocadorLotes, particao_data, TAMANHO_LOTE, LEIAUTE_DATA_PADRAO
+from catalogo_cte import CatalogoCte
+from erros_cte import PastaErros
+from shards_cte import gravar_parcial, zips_concluidos, TOTAIS
+from fiscal_cte import ExportacaoFiscal
+from compactador_cte import interpretar_compressao, NIVEL_COMPRESSAO_PADRAO
+
+# Partição dentro de cada CNPJ (data de emissão ou lote_N) e o nome dela nos relatórios
+PARTICIONAMENTOS = {'data': "Data de Emissão", 'lote': "Lote"}
+
+# O que uma chamada de separar / separar_arquivos fez (só ela, não as anteriores do mesmo SeparadorCte):
+# encontrados...identicos: totais da chamada (ver shards_cte.TOTAIS)
+# segundos: duração da chamada; etapas: etapa -> segundos gastos nela (ver metricas_cte)
+# manifesto: ManifestoExecucao com o que foi colocado; erros_por_motivo: Counter motivo -> arquivos em erros
+# caminho_divergentes: índice de chaves com conteúdo divergente gravado (ou None)
+# falhas: (entrada, erro) das movimentações das threads de I/O que falharam (entradas mantidas na origem)
+# zips_removidos: ZIPs de entrada apagados da origem; zips_concluidos: os concluídos por um shard (mantidos)
+# zips_pendentes: ZIPs mantidos por membros ilegíveis, por arquivos que não são XML ou não apagáveis
+# zips_invalidos: (ZIP, erro) dos movidos para erros
+# zips_gravados: ZIPs de destino gravados no modo direto_zip
+# caminhos_fiscais, linhas_fiscais: arquivos e linhas da exportação fiscal (ver fiscal_cte)
+ResultadoSeparacao = namedtuple('ResultadoSeparacao', [
+    'encontrados', 'processados', 'erros', 'duplicados', 'identicos', 'segundos', 'etapas', 'manifesto',
+    'erros_por_motivo', 'caminho_divergentes', 'falhas', 'zips_removidos', 'zips_concluidos', 'zips_pendentes',
+    'zips_invalidos', 'zips_gravados', 'caminhos_fiscais', 'linhas_fiscais'])
+
+class SeparadorCte:
+    """
+    Motor dos separadores de uma visão (por emitente, por tomador...) sem interface: nada de popups, barra de
+    progresso ou caminhos relativos ao script. Serve aos scripts e a quem chama a separação de dentro de
+    outro programa, um lote de arquivos por vez (como SeparadorVisoes no modo vigia, ver vigia_cte).
+    Cada chamada de separar / separar_arquivos é uma execução completa (diário encerrado, ZIPs de origem
+    concluídos apagados, catálogo e lotes gravados) e devolve um ResultadoSeparacao só com o que ela fez.
+    Entre uma chamada e outra continuam abertos os processos de leitura, o pool de threads de I/O,
+    o catálogo e as pastas e nomes já conhecidos do destino, então o custo de cada lote é o dos arquivos dele.
+    Se o destino for alterado por fora (ex.: compactação dos lotes), chame descartar_caches antes da próxima.
+    """
+
+    def __init__(self, pasta_origem, pasta_destino, tag_cnpj='emit', particao='data', pasta_erros=None,
+                 pasta_duplicados=None, ignorar=(), processos=1, tamanho_bloco=TAMANHO_BLOCO_PADRAO,
+                 leitura_rapida=False, conferencia=0, direto_zip=False, zips_abertos=MAX_ZIPS_ABERTOS,
+                 compressao=NIVEL_COMPRESSAO_PADRAO, threads_io=0, leiaute_data=LEIAUTE_DATA_PADRAO,
+                 max_arquivos_lote=TAMANHO_LOTE, max_bytes_lote=None, catalogar=True, shard=None,
+                 campos_fiscais=()):
+        """
+        :param tag_cnpj: Grupo do CNPJ que define a pasta ('emit', 'receb'...)
+        :param particao: 'data' (leiaute_data) ou 'lote' (max_arquivos_lote / max_bytes_lote), ver PARTICIONAMENTOS
+        :param pasta_erros: Padrão: <pasta_destino>/0.Erros
+        :param pasta_duplicados: Padrão: <pasta_destino>/1.Duplicados
+        :param ignorar: Nomes de pastas da origem que não são lidas
+        :param direto_zip: Grava os XMLs direto no ZIP de cada partição (zips_abertos, compressao)
+        :param threads_io: Threads que movem os arquivos no modo com pastas (0 = no laço principal)
+        :param catalogar: Registra onde cada CT-e ficou no catálogo da pasta de destino (ver catalogo_cte)
+        :param shard: Shard (ver shards_cte): só os arquivos do shard, com o relatório parcial para a mescla
+        :param campos_fiscais: Campos de fiscal_cte.CAMPOS_FISCAIS exportados (um arquivo por chamada)
+        """
+        if particao not in PARTICIONAMENTOS:
+            raise ValueError(f"Partição desconhecida: {particao} (use {' ou '.join(PARTICIONAMENTOS)})")
+        self.pasta_origem = pasta_origem
+        self.pasta_destino = pasta_destino
+        self.pasta_duplicados = pasta_duplicados or os.path.join(pasta_destino, "1.Duplicados")
+        self.tag_cnpj = tag_cnpj
+        self.particao = particao
+        self.ignorar = tuple(ignorar)
+        self.processos = processos
+        self.tamanho_bloco = tamanho_bloco
+        self.leitura_rapida = leitura_rapida
+        self.conferencia = conferencia
+        self.direto_zip = direto_zip
+        self.zips_abertos = zips_abertos
+        self.compressao = compressao
+        self.threads_io = threads_io
+        self.leiaute_data = leiaute_data
+        self.catalogar = catalogar
+        self.shard = shard
+        self.campos_fiscais = tuple(campos_fiscais)
+        os.makedirs(self.pasta_duplicados, exist_ok=True)
+        # Diário da execução: se existir, a anterior foi interrompida e a primeira chamada a retoma
+        self.diario = DiarioExecucao(pasta_destino, shard=shard)
+        # Tempo de cada etapa (leitura, mover, duplicados, erros...) somado entre as chamadas
+        self.metricas = MetricasExecucao()
+        # Caminho (renomear / cópia) de cada movimentação deste motor, somado entre as chamadas
+        self.movimentador = MovimentadorArquivos()
+        # Lote aberto de cada CNPJ, continuando o das execuções anteriores e o da interrompida
+        self.alocador = None
+        if particao == 'lote':
+            self.alocador = AlocadorLotes(pasta_destino, max_arquivos_lote, max_bytes_lote, shard=shard)
+            self.alocador.retomar(self.diario.contadores_cnpj)
+        # Em um shard, ZIPs cujos membros dele já foram separados ficam na origem até a mescla: não são relidos
+        self.zips_feitos = set(zips_concluidos(pasta_destino, shard, pasta_origem)) if shard else set()
+        self.zips_origem = ZipsOrigem(shard, self.zips_feitos)
+        # Eventos, NF-e, CT-e OS, CPF... em subpastas da pasta de erros, sem sobrescrever nomes iguais
+        self.pasta_erros = PastaErros(pasta_erros or os.path.join(pasta_destino, "0.Erros"), shard=shard,
+                                      movimentador=self.movimentador)
+        # Criados na primeira chamada e mantidos nas seguintes (ver _preparar)
+        self.catalogo = None
+        self.destino = None
+        self.extrator = None
+        self.descoberta = None    # DescobertaEmSegundoPlano da chamada de separar em andamento
+        self.manifesto = None     # ManifestoExecucao da chamada em andamento
+        self.exportacao = None    # ExportacaoFiscal da chamada em andamento
+        # Totais desde a criação do motor
+        self.encontrados = 0
+        self.processados = 0
+        self.erros = 0
+        self.duplicados = 0
+        self.identicos = 0
+
+    def separar(self, ao_avancar=None):
+        """
+        Separa todas as entradas da pasta de origem (XMLs soltos e membros de ZIPs).
+        :param ao_avancar: Chamado após cada entrada (ex.: barra de progresso)
+        :return: ResultadoSeparacao
+        """
+        # A origem é percorrida em segundo plano, à frente da leitura, por uma fila limitada
+        self.zips_origem = ZipsOrigem(self.shard, self.zips_feitos)
+        self.descoberta = DescobertaEmSegundoPlano(self.zips_origem.listar(
+            self.pasta_origem, ignorar=self.ignorar, concluidos=self.diario.membros_concluidos))
+        return self._separar(self.descoberta, ao_avancar)
+
+    def separar_arquivos(self, caminhos, ao_avancar=None):
+        """
+        Separa só os XMLs e ZIPs indicados (ex.: os que chegaram desde a última chamada).
+        :return: ResultadoSeparacao
+        """
+        self.zips_origem = ZipsOrigem(self.shard, self.zips_feitos)
+        self.descoberta = None
+        return self._separar(self.zips_origem.listar_arquivos(caminhos, self.diario.membros_concluidos),
+                             ao_avancar)
+
+    @property
+    def descobertas(self):
+        """Entradas entregues pela descoberta de separar até agora (ao final, o total exato da origem)"""
+        return self.descoberta.descobertas if self.descoberta is not None else 0
+
+    def _preparar(self):
+        """Catálogo, destino e extrator: abertos na primeira chamada e reaproveitados nas seguintes"""
+        if self.catalogar and self.catalogo is None:
+            # Onde cada CT-e ficou (pasta, ou ZIP e membro), consultado sem varrer o destino
+            self.catalogo = CatalogoCte(self.pasta_destino, shard=self.shard)
+            if self.diario.retomada:
+                # Registros da execução interrompida que ainda não tinham sido gravados no catálogo
+                self.catalogo.recuperar(self.diario.indice)
+        if self.destino is None:
+            # Pastas por partição ou direto nos ZIPs (duplicidade por chave e conteúdo nos dois)
+            if self.direto_zip:
+                tipo_compressao, nivel = interpretar_compressao(self.compressao)
+                self.destino = DestinoZip(self.pasta_destino, self.pasta_duplicados, self.zips_abertos,
+                                          tipo_compressao, nivel, self.diario, self.metricas, catalogo=self.catalogo,
+                                          movimentador=self.movimentador)
+            else:
+                # Em compartilhamentos de rede, mover vários arquivos ao mesmo tempo esconde a latência de cada um
+                executor = ExecutorIO(self.threads_io) if self.threads_io > 0 else None
+                self.destino = DestinoPastas(self.pasta_destino, self.pasta_duplicados, self.diario, self.metricas,
+                                             executor=executor, catalogo=self.catalogo,
+                                             movimentador=self.movimentador)
+        if self.extrator is None:
+            # A leitura dos XMLs pode ser distribuída entre processos, que ficam abertos até fechar()
+            self.extrator = ExtratorParalelo(self.tag_cnpj, processos=self.processos,
+                                             tamanho_bloco=self.tamanho_bloco, leitura_rapida=self.leitura_rapida,
+                                             conferencia=self.conferencia, metricas=self.metricas,
+                                             calcular_hash=self.catalogar, campos_fiscais=self.campos_fiscais,
+                                             manter_processos=True)
+
+    def _totais(self):
+        return {nome: getattr(self, nome) for nome in TOTAIS}
+
+    def _separar(self, entradas, ao_avancar):
+        inicio = time.perf_counter()
+        totais_antes = self._totais()
+        etapas_antes = {etapa: histograma.soma for etapa, histograma in self.metricas.etapas.items()}
+        erros_antes = Counter(self.pasta_erros.contagem)
+        self._preparar()
+        zips_gravados_antes = self.destino.zips_finalizados if self.direto_zip else 0
+        # Registro do que foi movido: alimenta relatório, validação e limpeza sem varrer as pastas de novo
+        self.manifesto = ManifestoExecucao()
+        # Campos fiscais dos CT-es colocados, gravados em lotes em um arquivo por chamada (ver fiscal_cte)
+        self.exportacao = (ExportacaoFiscal(self.pasta_destino, self.campos_fiscais, shard=self.shard)
+                           if self.campos_fiscais else None)
+
+        for entrada, registro, erro in self.extrator.processar(self.metricas.medir_iteracao('listagem', entradas)):
+            self.encontrados += 1
+            try:
+                if erro is not None:
+                    raise ValueError(erro)
+                self._colocar(entrada, registro)
+                self.processados += 1
+            except Exception as e:
+                self.erros += 1
+                # Membro de ZIP ilegível fica no ZIP de origem, que então não é apagado
+                with self.metricas.medir('erros'):
+                    if self.pasta_erros.mover(entrada, erro if erro is not None else e):
+                        self.zips_origem.concluir(entrada)
+                self.manifesto.registrar_saida(entrada.caminho_origem)
+            if ao_avancar is not None:
+                ao_avancar()
+
+        # No modo direto_zip, os XMLs de origem só são apagados aqui, depois que cada ZIP é gravado;
+        # as cópias entre volumes, depois do fsync em lote (ver movimentacao_cte)
+        caminho_divergentes = self.destino.finalizar()
+        # Movimentações feitas pelas threads de I/O que falharam: as entradas continuam na origem
+        falhas, self.destino.falhas = self.destino.falhas, []
+        self.processados -= len(falhas)
+        self.erros += len(falhas)
+        # ZIPs de entrada saem da origem só depois que todos os seus membros foram colocados
+        if self.zips_origem.pendentes or self.zips_origem.invalidos:
+            self.zips_origem.remover_concluidos()
+            self.erros += self.zips_origem.mover_invalidos(self.pasta_erros)
+        self.zips_feitos |= self.zips_origem.concluidos
+        # Locais dos CT-es separados, gravados antes de o diário ser encerrado
+        if self.catalogo is not None:
+            self.catalogo.descarregar()
+        self.pasta_erros.fechar()
+        caminhos_fiscais = self.exportacao.fechar() if self.exportacao is not None else []
+        # Lotes abertos de cada CNPJ: a próxima execução continua neles
+        if self.alocador is not None:
+            self.alocador.gravar()
+        totais = {nome: valor - totais_antes[nome] for nome, valor in self._totais().items()}
+        erros_por_motivo = self.pasta_erros.contagem - erros_antes
+        if self.shard is not None:
+            # Totais, lotes e partições deste shard, somados aos das execuções dele ainda não mescladas
+            base_lotes = ({cnpj: self.alocador.base.get(cnpj, 0) for cnpj in self.alocador.lotes}
+                          if self.alocador is not None else ())
+            gravar_parcial(self.pasta_destino, self.shard, PARTICIONAMENTOS[self.particao], totais, self.manifesto,
+                           erros_por_motivo, base_lotes=base_lotes, concluidos=self.zips_origem.concluidos,
+                           pasta_origem=self.pasta_origem)
+        # Tudo concluído: a próxima execução (ou chamada) começa do zero
+        self.diario.encerrar()
+
+        etapas = {}
+        for etapa, histograma in self.metricas.etapas.items():
+            segundos = histograma.soma - etapas_antes.get(etapa, 0.0)
+            if segundos > 0:
+                etapas[etapa] = segundos
+        return ResultadoSeparacao(
+            segundos=time.perf_counter() - inicio, etapas=etapas, manifesto=self.manifesto,
+            erros_por_motivo=erros_por_motivo, caminho_divergentes=caminho_divergentes, falhas=falhas,
+            zips_removidos=self.zips_origem.removidos, zips_concluidos=set(self.zips_origem.concluidos),
+            zips_pendentes=list(self.zips_origem.pendentes), zips_invalidos=list(self.zips_origem.invalidos),
+            zips_gravados=(self.destino.zips_finalizados if self.direto_zip else 0) - zips_gravados_antes,
+            caminhos_fiscais=caminhos_fiscais,
+            linhas_fiscais=self.exportacao.linhas if self.exportacao is not None else 0,
+            **totais)
+
+    def _colocar(self, entrada, registro):
+        cnpj = registro.cnpj
+        if self.alocador is None:
+            particao = particao_data(registro.data_emissao, self.leiaute_data)
+        else:
+            # Lote aberto do CNPJ; um novo quando ele chega ao limite de arquivos ou de bytes
+            particao = self.alocador.alocar(cnpj, registro.tamanho)
+        # Manifesto, exportação e ZIP de origem só quando a entrada saiu mesmo da origem (com threads de I/O,
+        # depois de o movimento terminar; se ele falhar, a entrada vai para falhas e continua na origem)
+        def registrar(resultado, _local):
+            if resultado in RESULTADOS_COLOCADOS:
+                self.manifesto.registrar_movimento(entrada.caminho_origem, cnpj, particao, registro.tamanho)
+                if self.exportacao is not None:
+                    self.exportacao.registrar(registro, cnpj, particao)
+            else:
+                self.manifesto.registrar_saida(entrada.caminho_origem)
+            if resultado != COLOCADO:
+                self.duplicados += 1
+            if resultado == IDENTICO:
+                self.identicos += 1
+            self.zips_origem.concluir(entrada)
+
+        # Pasta <destino>/cnpj/particao ou ZIP <destino>/cnpj/particao.zip, tratando nome repetido,
+        # chave repetida e cópias idênticas
+        resultado = self.destino.colocar(entrada, cnpj, particao, registro.chave, ao_colocar=registrar,
+                                         registro=registro)
+        if self.alocador is not None and resultado not in RESULTADOS_COLOCADOS:
+            # Cópia idêntica ou divergente não fica no lote: o lugar volta para a próxima entrada
+            self.alocador.devolver(cnpj, registro.tamanho)
+
+    def descartar_caches(self):
+        """
+        Esquece as pastas, nomes e índice de duplicidade conhecidos do destino, relidos na próxima chamada
+        (depois de o destino ser alterado por fora, ex.: lotes compactados e as pastas apagadas)
+        """
+        self._descartar_destino()
+
+    def _descartar_destino(self):
+        # As threads de I/O do destino (ExecutorIO) não sobrevivem a ele
+        if self.destino is not None:
+            self.destino.fechar()
+            self.destino = None
+
+    def gravar_metricas(self):
+        """
+        Grava as métricas por etapa de todas as chamadas (0.metricas.json / 0.metricas.prom no destino);
+        pode ser chamado de novo com os totais atualizados
+        """
+        self.metricas.definir('processados', self.processados)
+        self.metricas.definir('erros', self.erros)
+        self.metricas.definir('duplicados', self.duplicados)
+        self.movimentador.contar_em(self.metricas)
+        return self.metricas.gravar(self.pasta_destino, self.shard)
+
+    def fechar(self):
+        """Encerra os processos de leitura e fecha o catálogo (reabertos se o motor for usado de novo)"""
+        if self.extrator is not None:
+            self.extrator.fechar()
+        # Antes do catálogo: as operações de I/O ainda agendadas registram nele ao terminar
+        self._descartar_destino()
+        if self.catalogo is not None:
+            self.catalogo.fechar()
+            self.catalogo = None
+        self.pasta_erros.fechar()
@@ -1,19 +1,30 @@
 import os
 import shutil
-import zipfile
-from xml.etree import ElementTree as ET
 import time
-from tqdm import tqdm
-import win32api
-import win32con
-import win32gui
 import sys
-import ctypes
+import argparse
+
+from paralelo_cte import ExtratorParalelo, TAMANHO_BLOCO_PADRAO
+from destino_cte import MAX_ZIPS_ABERTOS
+from entrada_cte import ZipsOrigem, ContagemEmSegundoPlano, DescobertaEmSegundoPlano, existem_entradas
+from diario_cte import DiarioExecucao
+from plano_cte import simular_separacao
+from metricas_cte import ProgressoLimitado, SEM_METRICAS
+from particoes_cte import particao_data, LEIAUTES_DATA, LEIAUTE_DATA_PADRAO
+from catalogo_cte import atualizar_compactados
+from erros_cte import ARQUIVO_INDICE_ERROS, relatorio_motivos
+from shards_cte import interpretar_shard, mesclar_shards, zips_concluidos
+from fiscal_cte import interpretar_campos, CAMPOS_FISCAIS, CAMPOS_PADRAO
+from separacao_cte import SeparadorCte
+from interface_cte import obter_interface, INTERFACES, SIM, NAO
+from compactador_cte import listar_lotes, compactar_em_paralelo, interpretar_compressao, NIVEL_COMPRESSAO_PADRAO
 
 # Obtém o diretório onde o script está localizado
 SCRIPT_DIR = os.path.dirname(os.path.abspath(sys.argv[0]))
 PASTA_ORIGEM = os.path.join(SCRIPT_DIR, "1.A Separar")
 PASTA_DESTINO = os.path.join(SCRIPT_DIR, "0.Por CNPJ")
+# Pastas de data (AAAA-MM-DD) que são compactadas
+PREFIXO_LOTE = '20'
 PASTA_ERROS = os.path.join(PASTA_DESTINO, "0.Erros")
 PASTA_DUPLICADOS = os.path.join(PASTA_DESTINO, "1.Duplicados")
 RELATORIO_DIR = os.path.join(PASTA_DESTINO, f"0.relatorio.txt")
@@ -25,63 +36,6 @@ def criar_pastas_necessarias():
     os.makedirs(os.path.join(PASTA_DESTINO, "0.Erros"), exist_ok=True)
     os.makedirs(PASTA_DUPLICADOS, exist_ok=True) 
 
-class FLASHWINFO(ctypes.Structure):
-    _fields_ = [
-        ('cbSize', ctypes.c_uint),
-        ('hwnd', ctypes.c_void_p),
-        ('dwFlags', ctypes.c_uint),
-        ('uCount', ctypes.c_uint),
-        ('dwTimeout', ctypes.c_uint)
-    ]
-
-def flash_window(hwnd):
-    """Faz a janela piscar na barra de tarefas até receber foco"""
-    try:
-        flash_info = FLASHWINFO()
-        flash_info.cbSize = ctypes.sizeof(FLASHWINFO)
-        flash_info.hwnd = hwnd
-        flash_info.dwFlags = win32con.FLASHW_ALL | win32con.FLASHW_TIMERNOFG
-        flash_info.uCount = 0  # 0 = até receber foco
-        flash_info.dwTimeout = 0
-
-        ctypes.windll.user32.FlashWindowEx(ctypes.byref(flash_info))
-    except Exception as e:
-        print(f"Erro ao piscar janela: {e}")
-
-def mostrar_popup(mensagem, titulo="Alerta"):
-    """Mostra popup informativo com efeito de piscar"""
-    try:
-        hwnd = win32api.MessageBox(0, mensagem, titulo, 
-                                 win32con.MB_OK | win32con.MB_ICONINFORMATION | 
-                                 win32con.MB_SETFOREGROUND)
-        flash_window(hwnd)
-    except Exception as e:
-        print(f"\n=== {titulo} ===\n{mensagem}\n")
-
-def mostrar_popup_confirmacao(mensagem, titulo="Confirmação"):
-    """Mostra popup com botões Sim/Não que pisca na barra de tarefas"""
-    try:
-        resposta = win32api.MessageBox(0, mensagem, titulo, 
-                                     win32con.MB_YESNO | win32con.MB_ICONQUESTION | 
-                                     win32con.MB_SETFOREGROUND)
-        flash_window(win32gui.GetForegroundWindow())
-        return resposta == win32con.IDYES
-    except Exception as e:
-        print(f"\n=== {titulo} ===\n{mensagem}\n")
-        return False
-
-def mostrar_popup_opcoes_compactacao(mensagem, titulo="Opções de Compactação"):
-    """Mostra popup com três opções de ação para compactação"""
-    try:
-        resposta = win32api.MessageBox(0, mensagem, titulo,
-                                     win32con.MB_ICONQUESTION | win32con.MB_SETFOREGROUND | 
-                                     win32con.MB_YESNOCANCEL)
-        flash_window(win32gui.GetForegroundWindow())
-        return resposta
-    except Exception as e:
-        print(f"\n=== {titulo} ===\n{mensagem}\n")
-        return win32con.IDCANCEL
-
 def configurar_encoding():
     if sys.stdout.encoding != 'utf-8':
         try:
@@ -89,249 +43,268 @@ def configurar_encoding():
         except:
             pass
 
-def contar_xmls(pasta):
-    """Conta todos os arquivos XML em uma pasta e subpastas"""
-    count = 0
-    for root, _, files in os.walk(pasta):
-        count += sum(1 for f in files if f.lower().endswith('.xml'))
-    return count
-
-def criar_arquivo_log_erros(PASTA_ERROS, qtd_erros):
-    """Cria um arquivo de log com a quantidade de erros encontrados"""
+def criar_arquivo_log_erros(PASTA_ERROS, qtd_erros, por_motivo=""):
+    """Cria um arquivo de log com a quantidade de erros encontrados (e quantos de cada motivo, ver erros_cte)"""
     caminho_log = os.path.join(PASTA_ERROS, f"0.Erros_{qtd_erros}.txt")
-    with open(caminho_log, 'w') as f:
+    with open(caminho_log, 'w', encoding='utf-8') as f:
         f.write(f"Total de arquivos com erro: {qtd_erros}\n")
         f.write(f"Data do processamento: {time.strftime('%d/%m/%Y %H:%M:%S')}\n")
+        if por_motivo:
+            f.write(f"\nPor motivo (arquivo a arquivo em {ARQUIVO_INDICE_ERROS}):\n{por_motivo}\n")
 
-def contar_lotes_para_compactar(pasta_destino):
-    """Conta quantos lotes existem para compactar"""
-    lotes = 0
-    if os.path.exists(pasta_destino):
-        for cnpj_folder in os.listdir(pasta_destino):
-            cnpj_path = os.path.join(pasta_destino, cnpj_folder)
-            if os.path.isdir(cnpj_path):
-                for lote_folder in os.listdir(cnpj_path):
-                    lote_path = os.path.join(cnpj_path, lote_folder)
-                    if os.path.isdir(lote_path) and lote_folder.startswith('20'):
-                        lotes += 1
-    return lotes
+def contar_lotes_para_compactar(pasta_destino, profundidade=1):
+    """Conta quantos lotes existem para compactar (profundidade: níveis da pasta de data, ver particoes_cte)"""
+    return len(listar_lotes(pasta_destino, PREFIXO_LOTE, profundidade))
 
-def compactar_lotes(pasta_destino, manter_pastas=False):
+def compactar_lotes(pasta_destino, manter_pastas=False, processos=None, compressao=NIVEL_COMPRESSAO_PADRAO,
+                    metricas=SEM_METRICAS, profundidade=1, interface=None):
     """
-    Compacta todos os lotes em arquivos ZIP com barra de progresso
+    Compacta todos os lotes em arquivos ZIP com barra de progresso.
+    Os lotes são compactados em paralelo e ZIPs existentes só recebem os arquivos novos.
     :param manter_pastas: Se True, mantém as pastas originais após compactação
+    :param processos: Lotes compactados ao mesmo tempo (padrão: quantidade de CPUs)
+    :param compressao: Nível de 0 a 9 ou 'sem' (apenas armazena, útil para lotes pequenos)
+    :param metricas: MetricasExecucao que recebe o tempo entre um lote concluído e o próximo ('compactacao')
+    :param profundidade: Níveis da pasta de data abaixo do CNPJ (ver particoes_cte.LEIAUTES_DATA)
+    :param interface: Mostra a barra de progresso (ver interface_cte; padrão: obter_interface())
+    Sem manter_pastas, o catálogo (se houver) passa a apontar para os ZIPs (ver catalogo_cte).
     """
-    lotes_compactados = 0
-    lotes_para_compactar = []
-    
-    if os.path.exists(pasta_destino):
-        for cnpj_folder in os.listdir(pasta_destino):
-            cnpj_path = os.path.join(pasta_destino, cnpj_folder)
-            if os.path.isdir(cnpj_path):
-                for lote_folder in os.listdir(cnpj_path):
-                    lote_path = os.path.join(cnpj_path, lote_folder)
-                    if os.path.isdir(lote_path) and lote_folder.startswith('lote_'):
-                        lotes_para_compactar.append(lote_path)
+    interface = interface or obter_interface()
+    lotes_para_compactar = listar_lotes(pasta_destino, PREFIXO_LOTE, profundidade)
     
     if not lotes_para_compactar:
         print("\nNenhum lote encontrado para compactar!")
         return 0
     
-    with tqdm(total=len(lotes_para_compactar), unit='lote', desc="Compactando") as pbar:
-        for lote_path in lotes_para_compactar:
-            nome_zip = f"{os.path.basename(lote_path)}.zip"
-            caminho_zip = os.path.join(os.path.dirname(lote_path), nome_zip)
-            
-            # Verifica se o ZIP já existe e remove para recriar
-            if os.path.exists(caminho_zip):
-                os.remove(caminho_zip)
-            
-            with zipfile.ZipFile(caminho_zip, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for root, _, files in os.walk(lote_path):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, lote_path)
-                        zipf.write(file_path, arcname)
-            
-            # Remove a pasta original apenas se não for para manter
-            if not manter_pastas:
-                shutil.rmtree(lote_path)
-            
-            lotes_compactados += 1
+    tipo_compressao, nivel = interpretar_compressao(compressao)
+    lotes_compactados = 0
+    situacoes = {}
+    compactados = []
+    with interface.barra(total=len(lotes_para_compactar), unit='lote', desc="Compactando") as pbar:
+        lotes = compactar_em_paralelo(lotes_para_compactar, processos, manter_pastas, tipo_compressao, nivel)
+        for lote_path, situacao, _, membros, erro in metricas.medir_iteracao('compactacao', lotes):
+            if erro is not None:
+                print(f"\nErro ao compactar {lote_path}: {erro}")
+            else:
+                lotes_compactados += 1
+                situacoes[situacao] = situacoes.get(situacao, 0) + 1
+                compactados.append((lote_path, membros))
             pbar.update(1)
     
+    if not manter_pastas:
+        atualizar_compactados(pasta_destino, compactados)
+    print("\nLotes: " + ", ".join(f"{qtd} {situacao}" for situacao, qtd in sorted(situacoes.items())))
     return lotes_compactados
 
-def abrir_arquivos():
-    """Abre a planilha de controle e o arquivo de erros usando o aplicativo padrão do sistema"""
-    try:
-        # Abrir a planilha de controle
-        if os.path.exists(RELATORIO_DIR):
-            os.startfile(RELATORIO_DIR)
-        else:
-            print(f"Arquivo da planilha não encontrado: {RELATORIO_DIR}")
-            
-    except Exception as e:
-        print(f"Erro ao abrir arquivos: {str(e)}")
-
-def renomear_arquivo_existente(caminho_destino, PASTA_DUPLICADOS):
-    """Renomeia arquivo existente com contador sequencial e move para pasta de duplicados"""
-    try:
-        # Extrai nome e extensão do arquivo
-        nome_arquivo = os.path.basename(caminho_destino)
-        nome_base, extensao = os.path.splitext(nome_arquivo)
-        
-        # Contador para nomes duplicados
-        duplicados = 1
-        novo_caminho = os.path.join(PASTA_DUPLICADOS, f"{nome_base} ({duplicados}){extensao}")
-        
-        # Encontra o próximo número disponível
-        while os.path.exists(novo_caminho):
-            duplicados += 1
-            novo_caminho = os.path.join(PASTA_DUPLICADOS, f"{nome_base} ({duplicados}){extensao}")
-        
-        # Move o arquivo existente para a pasta de duplicados
-        shutil.move(caminho_destino, novo_caminho)
-        return True
-    except Exception as e:
-        print(f"Erro ao renomear arquivo existente: {e}")
-        return False
-
-def gerar_relatorio_por_cnpj(pasta_destino):
+def organizar_cte_por_emitente(processos=1, tamanho_bloco=TAMANHO_BLOCO_PADRAO, leitura_rapida=False, conferencia=0,
+                               processos_compactacao=None, compressao=NIVEL_COMPRESSAO_PADRAO,
+                               direto_zip=False, zips_abertos=MAX_ZIPS_ABERTOS, simular=False, caminho_plano=None,
+                               threads_io=0, leiaute_data=LEIAUTE_DATA_PADRAO,
+                               catalogar=True, shard=None, campos_fiscais=(), interface=None):
     """
-    Gera um relatório com a quantidade de pastas de data e arquivos XML em cada pasta de CNPJ.
-    Retorna uma string formatada para incluir no relatório.
-    """
-    relatorio = []
-    if os.path.exists(pasta_destino):
-        for cnpj_folder in sorted(os.listdir(pasta_destino)):
-            cnpj_path = os.path.join(pasta_destino, cnpj_folder)
-            if os.path.isdir(cnpj_path):
-                datas = []
-                for data_folder in sorted(os.listdir(cnpj_path)):
-                    data_path = os.path.join(cnpj_path, data_folder)
-                    if os.path.isdir(data_path):
-                        qtd_xml = sum(1 for f in os.listdir(data_path) if f.lower().endswith('.xml'))
-                        datas.append(f"    {data_folder}: {qtd_xml} arquivo(s)")
-                relatorio.append(f"- CNPJ {cnpj_folder}:\n" + "\n".join(datas))
-    return "\n\n".join(relatorio)
-
-def organizar_cte_por_emitente():
-    """
-    Organiza arquivos XML de CT-e em pastas por CNPJ e data de emissão (AAAA-MM-DD).
+    Organiza arquivos XML de CT-e em pastas por CNPJ e data de emissão (AAAA-MM-DD, ou AAAA-MM/DD e
+    AAAA/MM/DD conforme leiaute_data).
     Usa pastas relativas ao local onde o script está salvo.
+    :param processos: Quantidade de processos que leem os XMLs (1 = linear)
+    :param tamanho_bloco: Arquivos enviados por vez a cada processo
+    :param leitura_rapida: Tenta localizar os campos por varredura de bytes antes do parser XML
+    :param conferencia: Confere 1 a cada N leituras rápidas com o parser (0 = sem conferência)
+    :param processos_compactacao: Lotes compactados ao mesmo tempo (padrão: quantidade de CPUs)
+    :param compressao: Nível de compressão dos ZIPs (0 a 9) ou 'sem'
+    :param direto_zip: Grava os XMLs direto no ZIP de cada partição, sem criar as pastas
+    :param zips_abertos: Máximo de ZIPs abertos ao mesmo tempo no modo direto_zip
+    :param simular: Só mostra o plano e o relatório esperado, sem criar pastas nem mover arquivos
+    :param caminho_plano: Com simular, arquivo onde o plano completo é gravado
+    :param threads_io: Threads que movem os arquivos ao mesmo tempo no modo com pastas (0 = no laço principal)
+    :param catalogar: Registra onde cada CT-e ficou no catálogo da pasta de destino (ver catalogo_cte)
+    :param leiaute_data: 'dia', 'mes' ou 'ano': níveis de pasta por data (ver particoes_cte.LEIAUTES_DATA)
+    :param shard: Shard (ver shards_cte): separa só os arquivos do shard, sem compactar nem mostrar popups,
+                  e grava o relatório parcial para a mescla (--mesclar-shards)
+    :param campos_fiscais: Campos de fiscal_cte.CAMPOS_FISCAIS exportados dos CT-es separados, lidos na mesma
+                           passada do parser (sem leitura rápida); vazio = sem exportação
+    :param interface: Popups e barras de progresso (ver interface_cte; padrão: obter_interface())
     """
 
+    inicio = time.time()
+    interface = interface or obter_interface()
     print(f"\nVerificando arquivos na pasta: {PASTA_ORIGEM}")
-    total_arquivos = contar_xmls(PASTA_ORIGEM)
-    tem_xmls = total_arquivos > 0
-    total_lotes = contar_lotes_para_compactar(PASTA_DESTINO)
+    if simular:
+        # Só o estado da execução interrompida, sem reescrever o diário
+        diario = DiarioExecucao(PASTA_DESTINO, somente_leitura=True, shard=shard)
+        # Em um shard, ZIPs cujos membros dele já foram separados ficam na origem até a mescla: não são relidos
+        zips_feitos = zips_concluidos(PASTA_DESTINO, shard, PASTA_ORIGEM) if shard else ()
+    else:
+        # Diário, catálogo, destino e leitura dos XMLs: o mesmo motor usado de dentro de outros programas
+        # (ver separacao_cte); aqui ficam só a barra, os popups, o relatório e a compactação
+        separador = SeparadorCte(PASTA_ORIGEM, PASTA_DESTINO, 'emit', 'data', pasta_erros=PASTA_ERROS,
+                                 pasta_duplicados=PASTA_DUPLICADOS, processos=processos, tamanho_bloco=tamanho_bloco,
+                                 leitura_rapida=leitura_rapida, conferencia=conferencia, direto_zip=direto_zip,
+                                 zips_abertos=zips_abertos, compressao=compressao, threads_io=threads_io,
+                                 leiaute_data=leiaute_data, catalogar=catalogar, shard=shard,
+                                 campos_fiscais=campos_fiscais)
+        diario, zips_feitos = separador.diario, separador.zips_feitos
+    if diario.retomada:
+        print(f"Retomando execução interrompida: {diario.concluidas_antes} arquivo(s) já separado(s)")
+    # O total só alimenta a barra de progresso: é contado em segundo plano, sem atrasar o primeiro arquivo
+    tem_xmls = diario.retomada or existem_entradas(PASTA_ORIGEM, concluidos=diario.membros_concluidos,
+                                                   shard=shard, zips_concluidos=zips_feitos)
+    contagem = ContagemEmSegundoPlano(PASTA_ORIGEM, concluidos=diario.membros_concluidos, shard=shard,
+                                      zips_concluidos=zips_feitos)
+    total_arquivos = 0
+
+    if simular:
+        # Lê os XMLs e decide cada movimentação como a execução real, mas só monta o plano
+        extrator = ExtratorParalelo('emit', processos=processos, tamanho_bloco=tamanho_bloco,
+                                    leitura_rapida=leitura_rapida, conferencia=conferencia)
+        entradas = DescobertaEmSegundoPlano(ZipsOrigem(shard, zips_feitos).listar(
+            PASTA_ORIGEM, concluidos=diario.membros_concluidos))
+        with interface.barra(total=None, unit='arquivo', desc="Simulando") as barra:
+            progresso = ProgressoLimitado(barra, total=lambda: contagem.total)
+            plano = simular_separacao(extrator, entradas, PASTA_DESTINO, PASTA_DUPLICADOS,
+                                      lambda registro: particao_data(registro.data_emissao, leiaute_data),
+                                      caminho_plano, progresso.avancar)
+            contagem.aguardar()
+            progresso.descarregar()
+        print("\n" + plano.resumo())
+        return
+    # Nível das pastas de data que viram ZIP (AAAA-MM-DD, AAAA-MM/DD ou AAAA/MM/DD)
+    profundidade = LEIAUTES_DATA[leiaute_data]
+    # Os shards não compactam: os outros ainda podem estar gravando nas mesmas pastas de data
+    total_lotes = contar_lotes_para_compactar(PASTA_DESTINO, profundidade) if shard is None else 0
     tem_lotes = total_lotes > 0
     
-    if not tem_xmls and not tem_lotes:
-        mostrar_popup("Nenhum arquivo XML encontrado para separar e nenhum lote para compactar!", "Aviso")
+    if not tem_xmls and not tem_lotes and shard is None:
+        interface.avisar("Nenhum arquivo XML encontrado para separar e nenhum lote para compactar!", "Aviso")
         return
     
-    processados = 0
-    erros = 0
-    duplicados = 0
-    
+    # Relatório desta execução (o do shard, em um shard), aberto no final mesmo sem XMLs novos
+    caminho_relatorio = os.path.join(PASTA_DESTINO, shard.arquivo("0.relatorio.txt") if shard else "0.relatorio.txt")
     if tem_xmls:
-        print(f"\nProcessando {total_arquivos} arquivos XML de {PASTA_ORIGEM}...")
+        print(f"\nProcessando arquivos XML de {PASTA_ORIGEM}...")
+
+        # Descoberta -> leitura -> movimentação, ligadas por filas limitadas: o primeiro arquivo é movido
+        # enquanto a origem ainda está sendo percorrida, e a memória não depende do tamanho da origem
+        with interface.barra(total=None, unit='arquivo', desc="Separando CT-es") as barra:
+            # A barra é redesenhada no máximo a cada INTERVALO_PROGRESSO segundos, não a cada arquivo;
+            # o total aparece quando a contagem em segundo plano termina
+            progresso = ProgressoLimitado(barra, lambda: {'OK': separador.processados, 'Erros': separador.erros,
+                                                          'Duplicados': separador.duplicados},
+                                          total=lambda: contagem.total and max(contagem.total, separador.descobertas))
+            resultado = separador.separar(ao_avancar=progresso.avancar)
+            contagem.aguardar()
+            progresso.descarregar()
+        # Total exato: as entradas que a descoberta entregou
+        total_arquivos = resultado.encontrados
 
-        with tqdm(total=total_arquivos, unit='arquivo', desc="Separando CT-es") as progresso:
-            for raiz, _, arquivos in os.walk(PASTA_ORIGEM):
-                for arquivo in arquivos:
-                    if arquivo.lower().endswith('.xml'):
-                        caminho_completo = os.path.join(raiz, arquivo)
-                        try:
-                            tree = ET.parse(caminho_completo)
-                            root = tree.getroot()
-                            ns = {'ns': 'http://www.portalfiscal.inf.br/cte'}
-                            
-                            cnpj = root.find('.//ns:emit/ns:CNPJ', ns).text
-                            
-                            # Obtém a data de emissão no formato AAAA-MM-DD
-                            dhEmi = root.find('.//ns:ide/ns:dhEmi', ns).text
-                            data_emissao = dhEmi.split("T")[0]  # Pega só a parte da data
+        if resultado.caminho_divergentes:
+            print(f"\nChaves com conteúdo divergente registradas em: {resultado.caminho_divergentes}")
+        if resultado.falhas:
+            # Movimentações feitas pelas threads de I/O que falharam: as entradas continuam na origem
+            print(f"\nMovimentações que falharam ({len(resultado.falhas)}), "
+                  f"mantidas na origem para a próxima execução:")
+            for entrada_falha, erro_falha in resultado.falhas:
+                print(f"    {entrada_falha.rotulo}: {erro_falha}")
 
-                            pasta_cnpj = os.path.join(PASTA_DESTINO, cnpj)
-                            pasta_data = os.path.join(pasta_cnpj, data_emissao)
-                            os.makedirs(pasta_data, exist_ok=True)
-                            
-                            caminho_destino = os.path.join(pasta_data, arquivo)
-                            
-                            if os.path.exists(caminho_destino):
-                                if renomear_arquivo_existente(caminho_destino, PASTA_DUPLICADOS):
-                                    duplicados += 1
-                            
-                            shutil.move(caminho_completo, caminho_destino)
-                            processados += 1
-                            
-                        except Exception as e:
-                            erros += 1
-                            shutil.move(caminho_completo, os.path.join(PASTA_ERROS, arquivo))
-                        
-                        progresso.update(1)
-                        progresso.set_postfix({'OK': processados, 'Erros': erros, 'Duplicados': duplicados})
+        # ZIPs de entrada saem da origem só depois que todos os seus membros foram colocados
+        if resultado.zips_removidos or resultado.zips_concluidos or resultado.zips_pendentes or resultado.zips_invalidos:
+            if shard is None:
+                print(f"\nZIPs de entrada concluídos e removidos da origem: {resultado.zips_removidos}")
+            else:
+                print(f"\nZIPs de entrada concluídos por este shard (apagados na mescla): "
+                      f"{len(resultado.zips_concluidos)}")
+            for caminho_zip in resultado.zips_pendentes:
+                print(f"    Mantido na origem (membros ilegíveis ou arquivos que não são XML): {caminho_zip}")
+            for caminho_zip, erro_zip in resultado.zips_invalidos:
+                print(f"    ZIP ilegível movido para erros: {caminho_zip} ({erro_zip})")
+        if resultado.erros_por_motivo:
+            print(f"\nArquivos que foram para {PASTA_ERROS}, por motivo:")
+            print(relatorio_motivos(resultado.erros_por_motivo))
+        if campos_fiscais:
+            print(f"\nCampos fiscais de {resultado.linhas_fiscais} CT-e(s) exportados em: "
+                  f"{', '.join(resultado.caminhos_fiscais) or '(nenhum CT-e separado)'}")
+
+        if processos > 1:
+            print(f"\nDesempenho por worker ({processos} processos):")
+            print(separador.extrator.relatorio_throughput())
+        if leitura_rapida:
+            print("\nLeitura rápida:")
+            print(separador.extrator.relatorio_leitura_rapida())
+        print("\nMovimentações por caminho:")
+        print(separador.movimentador.relatorio())
 
         # Relatório final
-        relatorio_cnpj = gerar_relatorio_por_cnpj(PASTA_DESTINO)
-        validador = contar_xmls(PASTA_DESTINO)
+        manifesto = resultado.manifesto
+        relatorio_cnpj = manifesto.relatorio_por_cnpj()
+        validador = manifesto.total_arquivos
         """Cria um arquivo de registro dos xmls separados"""
-        RELATORIO_DIR = os.path.join(PASTA_DESTINO, f"0.relatorio.txt")
-        with open(RELATORIO_DIR, 'w') as f:
+        with open(caminho_relatorio, 'w') as f:
             f.write(f"Data do processamento: {time.strftime('%d/%m/%Y %H:%M:%S')}\n")
             f.write(f"Total de arquivos XML encontrados: {total_arquivos}\n")
-            f.write(f"Total de arquivos XML processados: {processados}\n")
-            f.write(f"Total de arquivos XML com erros: {erros}\n")
-            f.write(f"Total de arquivos XML duplicados: {duplicados}\n")
+            f.write(f"Total de arquivos XML processados: {resultado.processados}\n")
+            f.write(f"Total de arquivos XML com erros: {resultado.erros}\n")
+            f.write(f"Total de arquivos XML duplicados: {resultado.duplicados}\n")
+            f.write(f"Total de arquivos XML idênticos descartados: {resultado.identicos}\n")
             f.write(f"Total de arquivos XML efetivamente separados: {validador}\n")
+            f.write(f"Tamanho total separado: {manifesto.total_bytes / 1048576:.2f} MB "
+                    f"em {manifesto.total_particoes} pasta(s) de CNPJ/data\n")
             f.write("|"+"--"*30 +"|"+"\n"*3)
-            f.write("Relatório de arquivos separados por CNPJ e Data de Emissão:\n\n")
+            f.write("Relatório de arquivos separados nesta execução por CNPJ e Data de Emissão:\n\n")
             f.write(relatorio_cnpj)
 
-        # Remove pastas vazias
-        for raiz, dirs, _ in os.walk(PASTA_ORIGEM, topdown=False):
-            for dir in dirs:
-                dir_path = os.path.join(raiz, dir)
-                if dir not in ["0.Erros", "1.Duplicados"]:
-                    try:
-                        if not os.listdir(dir_path):
-                            os.rmdir(dir_path)
-                    except:
-                        pass
+        # Remove pastas vazias (apenas as que tiveram arquivos movidos nesta execução)
+        manifesto.remover_pastas_vazias(PASTA_ORIGEM, preservar=["0.Erros", "1.Duplicados"])
         mensagem_pos_separacao = f"Todos os {total_arquivos} arquivos XML foram separados.\n\n"
+        if direto_zip:
+            mensagem_pos_separacao += f"Gravados direto em {resultado.zips_gravados} arquivo(s) ZIP.\n\n"
     else:
         mensagem_pos_separacao = "Nenhum arquivo XML encontrado para separar.\n\n"
-    
+        if shard is not None:
+            # Sem arquivos para o shard: o parcial vazio diz à mescla que ele terminou, e a separação
+            # (sem entradas) dá como concluídos os ZIPs da origem sem membros dele, que a mescla apaga
+            separador.separar()
+    # Processos de leitura e catálogo: a compactação abaixo atualiza o catálogo por conta própria
+    separador.fechar()
+    processados, erros, duplicados = separador.processados, separador.erros, separador.duplicados
+
+    if shard is not None:
+        # Sem compactação, log de erros nem popups: a mescla junta os shards quando todos terminarem
+        separador.gravar_metricas()
+        print(f"\nShard {shard} concluído em {time.time() - inicio:.2f}s: {processados} processado(s), "
+              f"{erros} com erro, {duplicados} duplicado(s).")
+        print(f"Quando todos os shards terminarem, junte-os com --mesclar-shards {shard.total}")
+        return
+
     # Verifica novamente lotes após processamento
-    total_lotes = contar_lotes_para_compactar(PASTA_DESTINO)
+    total_lotes = contar_lotes_para_compactar(PASTA_DESTINO, profundidade)
     tem_lotes = total_lotes > 0
     if tem_lotes:
         mensagem_pos_separacao += f"Foram encontrados {total_lotes} lotes.\nDeseja compactá-los agora?"
         
-        if mostrar_popup_confirmacao(mensagem_pos_separacao, "Manter pastas?"):
-            resposta = win32api.MessageBox(
-                0,
+        if interface.confirmar(mensagem_pos_separacao, "Manter pastas?"):
+            resposta = interface.escolher(
                 "Deseja manter as pastas após a compactação?\n\n"
                 "• Sim: Manter pastas e arquivos ZIP (ambos)\n"
                 "• Não: Manter apenas arquivos ZIP (pastas serão excluídas)",
-                "Opções de Compactação",
-                win32con.MB_YESNOCANCEL | win32con.MB_ICONQUESTION | win32con.MB_SETFOREGROUND
+                "Opções de Compactação"
             )
             
-            if resposta == win32con.IDYES:  # Manter ambos
+            if resposta == SIM:  # Manter ambos
                 print("\nCompactando e mantendo pastas lotes...")
-                lotes_compactados = compactar_lotes(PASTA_DESTINO, manter_pastas=True)
+                lotes_compactados = compactar_lotes(PASTA_DESTINO, manter_pastas=True,
+                                                    processos=processos_compactacao, compressao=compressao,
+                                                    metricas=separador.metricas, profundidade=profundidade,
+                                                    interface=interface)
                 opcao = "Mantidas pastas e ZIPs"
                 
-            elif resposta == win32con.IDNO:  # Manter apenas ZIP
+            elif resposta == NAO:  # Manter apenas ZIP
                 print("\nCompactando e removendo pastas lotes...")
-                lotes_compactados = compactar_lotes(PASTA_DESTINO, manter_pastas=False)
+                lotes_compactados = compactar_lotes(PASTA_DESTINO, manter_pastas=False,
+                                                    processos=processos_compactacao, compressao=compressao,
+                                                    metricas=separador.metricas, profundidade=profundidade,
+                                                    interface=interface)
                 opcao = "Mantidos apenas ZIPs"
                 
-            else:  # IDCANCEL
+            else:  # CANCELAR
                 print("\nCompactação cancelada pelo usuário.")
                 opcao = "Nenhuma opção de compactação"
                 lotes_compactados = 0
@@ -341,13 +314,16 @@ def organizar_cte_por_emitente():
             lotes_compactados = 0
     else:
         mensagem_pos_separacao += "Nenhum lote encontrado para compactar."
-        mostrar_popup(mensagem_pos_separacao, "Status")
+        interface.avisar(mensagem_pos_separacao, "Status")
         opcao = "Nenhuma opção de compactação"
         lotes_compactados = 0
     
     # Cria log de erros se necessário
     if erros > 0:
-        criar_arquivo_log_erros(PASTA_ERROS, erros)
+        criar_arquivo_log_erros(PASTA_ERROS, erros, separador.pasta_erros.relatorio())
+
+    # Métricas por etapa (JSON e textfile do Prometheus) na pasta de destino, ao lado do relatório
+    separador.gravar_metricas()
 
     # Popup final com resultados
     tempo_total = time.time() - inicio
@@ -368,12 +344,114 @@ def organizar_cte_por_emitente():
     print(mensagem_console)
     print("="*50)
     
-    if mostrar_popup_confirmacao(mensagem_final, "Processo Concluído"):
-            abrir_arquivos()
+    if interface.confirmar(mensagem_final, "Processo Concluído"):
+        interface.abrir(caminho_relatorio)
+
+def mesclar_execucao_shards(total):
+    """Junta relatórios, catálogos e índices dos shards 1 a total (ver shards_cte.mesclar_shards)"""
+    print(f"\nMesclando {total} shard(s) em {PASTA_DESTINO}...")
+    try:
+        resultado = mesclar_shards(PASTA_DESTINO, total, PASTA_ERROS, PASTA_DUPLICADOS, PASTA_ORIGEM,
+                                   os.path.join(PASTA_DESTINO, "0.relatorio.txt"))
+    except ValueError as e:
+        print(f"Mescla não realizada:\n{e}")
+        return False
+    totais = resultado.totais
+    if totais['erros']:
+        criar_arquivo_log_erros(PASTA_ERROS, totais['erros'], relatorio_motivos(resultado.erros_por_motivo))
+    print(f"Processados: {totais['processados']}, com erro: {totais['erros']}, duplicados: {totais['duplicados']}, "
+          f"separados: {resultado.manifesto.total_arquivos}")
+    print(f"Chaves repetidas entre shards: {resultado.repetidas}; "
+          f"ZIPs de entrada removidos da origem: {resultado.zips_removidos}")
+    print(f"Relatório: {os.path.join(PASTA_DESTINO, '0.relatorio.txt')}")
+    return True
+
+def ler_argumentos():
+    """Lê as opções de linha de comando (sem opções o comportamento é o mesmo do duplo clique)"""
+    parser = argparse.ArgumentParser(description="Separa XMLs de CT-e por CNPJ do emitente e data de emissão.")
+    parser.add_argument("--processos", type=int, default=1,
+                        help="Processos usados na leitura dos XMLs (padrão: 1, modo linear)")
+    parser.add_argument("--tamanho-bloco", type=int, default=TAMANHO_BLOCO_PADRAO,
+                        help=f"Arquivos enviados por vez a cada processo (padrão: {TAMANHO_BLOCO_PADRAO})")
+    parser.add_argument("--leitura-rapida", action="store_true",
+                        help="Localiza CNPJ, data e chave por varredura de bytes, usando o parser XML só quando necessário")
+    parser.add_argument("--conferir-amostra", type=int, default=0, metavar="N",
+                        help="Com --leitura-rapida, confere 1 a cada N arquivos com o parser XML (1 = todos)")
+    parser.add_argument("--processos-compactacao", type=int, default=None,
+                        help="Lotes compactados ao mesmo tempo (padrão: quantidade de CPUs)")
+    parser.add_argument("--compressao", default=str(NIVEL_COMPRESSAO_PADRAO),
+                        help=f"Nível de compressão dos ZIPs, de 0 a 9, ou 'sem' para apenas armazenar "
+                             f"(padrão: {NIVEL_COMPRESSAO_PADRAO})")
+    parser.add_argument("--direto-zip", action="store_true",
+                        help="Grava os XMLs direto no ZIP de cada partição, sem criar as pastas")
+    parser.add_argument("--zips-abertos", type=int, default=MAX_ZIPS_ABERTOS,
+                        help=f"Máximo de ZIPs abertos ao mesmo tempo com --direto-zip (padrão: {MAX_ZIPS_ABERTOS})")
+    parser.add_argument("--threads-io", type=int, default=0,
+                        help="Threads que movem os arquivos ao mesmo tempo, útil quando origem ou destino ficam "
+                             "em compartilhamento de rede (padrão: 0, no laço principal)")
+    parser.add_argument("--leiaute-data", choices=sorted(LEIAUTES_DATA), default=LEIAUTE_DATA_PADRAO,
+                        help="Pastas por data: dia (AAAA-MM-DD), mes (AAAA-MM/DD) ou ano (AAAA/MM/DD), "
+                             "para o CNPJ não acumular milhares de pastas (padrão: dia)")
+    parser.add_argument("--sem-catalogo", action="store_true",
+                        help="Não registra os CT-es no catálogo da pasta de destino "
+                             "(0.catalogo.sqlite, ver consultar_cte.py)")
+    parser.add_argument("--simular", action="store_true",
+                        help="Mostra o plano (movimentações, duplicados, erros) e o relatório esperado "
+                             "sem criar pastas nem mover arquivos")
+    parser.add_argument("--plano", metavar="ARQUIVO", default=None,
+                        help="Com --simular, grava o plano completo no arquivo (uma ação por linha)")
+    parser.add_argument("--shard", metavar="i/n", default=None,
+                        help="Separa só a parte i de n da origem (pelo nome de cada arquivo), para rodar n "
+                             "instâncias ao mesmo tempo nas mesmas pastas, sem compactar nem mostrar popups")
+    parser.add_argument("--mesclar-shards", type=int, default=None, metavar="N",
+                        help="Junta os relatórios, catálogos e erros dos N shards em um único 0.relatorio.txt")
+    parser.add_argument("--exportar-fiscal", nargs="?", const="padrao", default=None, metavar="CAMPOS",
+                        help=f"Exporta campos fiscais de cada CT-e separado, lidos na mesma passada, para "
+                             f"0.fiscal_<data>.csv na pasta de destino (e .parquet, se o pyarrow estiver "
+                             f"instalado). CAMPOS separados por vírgula (padrão: {','.join(CAMPOS_PADRAO)}; "
+                             f"disponíveis: {', '.join(CAMPOS_FISCAIS)}). Usa sempre o parser XML")
+    parser.add_argument("--interface", choices=INTERFACES, default=None,
+                        help="Popups e barra de progresso: windows (popups do pywin32), console (perguntas no "
+                             "terminal), nula (sem perguntas nem barra, para execução em lote) ou auto, pelo "
+                             "sistema e pelo terminal (padrão: variável SEPARADOR_CTE_INTERFACE ou auto)")
+    argumentos = parser.parse_args()
+    try:
+        interpretar_compressao(argumentos.compressao)
+    except ValueError as e:
+        parser.error(str(e))
+    if argumentos.simular and argumentos.direto_zip:
+        parser.error("--simular mostra o plano do modo com pastas; não use junto com --direto-zip")
+    if argumentos.plano and not argumentos.simular:
+        parser.error("--plano só vale junto com --simular")
+    if argumentos.shard:
+        try:
+            argumentos.shard = interpretar_shard(argumentos.shard)
+        except ValueError as e:
+            parser.error(str(e))
+        if argumentos.direto_zip:
+            parser.error("--direto-zip não vale com --shard: os shards gravariam no mesmo ZIP de cada data")
+    if argumentos.mesclar_shards is not None and (argumentos.mesclar_shards < 1 or argumentos.shard):
+        parser.error("--mesclar-shards N (N >= 1) é executado sozinho, depois que os N shards terminam")
+    if argumentos.exportar_fiscal:
+        try:
+            argumentos.exportar_fiscal = interpretar_campos(argumentos.exportar_fiscal)
+        except ValueError as e:
+            parser.error(str(e))
+        if argumentos.simular or argumentos.mesclar_shards:
+            parser.error("--exportar-fiscal só vale em uma separação (sem --simular e --mesclar-shards)")
+    try:
+        argumentos.interface = obter_interface(argumentos.interface)
+    except ValueError as e:
+        parser.error(str(e))
+    except ImportError as e:
+        parser.error(f"--interface windows precisa do pywin32 ({e})")
+    return argumentos
 
 if __name__ == "__main__":
     configurar_encoding()
-    criar_pastas_necessarias()
+    argumentos = ler_argumentos()
+    if not argumentos.simular:
+        criar_pastas_necessarias()
 
     print("=== ORGANIZADOR DE CT-es PORTÁTIL ===")
     print(f"Local do script: {SCRIPT_DIR}")
@@ -381,5 +459,16 @@ if __name__ == "__main__":
     print(f"Pasta destino (CNPJ): {PASTA_DESTINO}")
     print(f"Pasta duplicados: {PASTA_DUPLICADOS}\n")
 
-    inicio = time.time()
-    organizar_cte_por_emitente()
\ No newline at end of file
+    if argumentos.mesclar_shards:
+        sys.exit(0 if mesclar_execucao_shards(argumentos.mesclar_shards) else 1)
+    if argumentos.shard:
+        print(f"Shard: {argumentos.shard}\n")
+
+    organizar_cte_por_emitente(processos=argumentos.processos, tamanho_bloco=argumentos.tamanho_bloco,
+                               leitura_rapida=argumentos.leitura_rapida, conferencia=argumentos.conferir_amostra,
+                               processos_compactacao=argumentos.processos_compactacao, compressao=argumentos.compressao,
+                               direto_zip=argumentos.direto_zip, zips_abertos=argumentos.zips_abertos,
+                               simular=argumentos.simular, caminho_plano=argumentos.plano,
+                               threads_io=argumentos.threads_io, leiaute_data=argumentos.leiaute_data,
+                               catalogar=not argumentos.sem_catalogo, shard=argumentos.shard,
+                               campos_fiscais=argumentos.exportar_fiscal or (), interface=argumentos.interface)
\ No newline at end of file
@@ -0,0 +1,313 @@
+import os
+import time
+import sys
+import signal
+import argparse
+
+from paralelo_cte import TAMANHO_BLOCO_PADRAO
+from entrada_cte import ContagemEmSegundoPlano, existem_entradas
+from motor_cte import SeparadorVisoes, interpretar_visoes, NOMES_PARTES, PREFIXOS_PARTICAO
+from metricas_cte import ProgressoLimitado
+from interface_cte import obter_interface, INTERFACES
+from particoes_cte import LEIAUTES_DATA, LEIAUTE_DATA_PADRAO, TAMANHO_LOTE
+from catalogo_cte import atualizar_compactados
+from erros_cte import ARQUIVO_INDICE_ERROS
+from vigia_cte import VigiaOrigem, ESPERA_PADRAO, ESTABILIDADE_PADRAO, INTERVALO_VARREDURA_PADRAO
+from compactador_cte import listar_lotes, compactar_em_paralelo, interpretar_compressao, NIVEL_COMPRESSAO_PADRAO
+
+# Obtém o diretório onde o script está localizado
+SCRIPT_DIR = os.path.dirname(os.path.abspath(sys.argv[0]))
+PASTA_ORIGEM = os.path.join(SCRIPT_DIR, "1.A Separar")
+PASTA_ERROS = os.path.join(PASTA_ORIGEM, "0.Erros")
+# Pastas de serviço dentro da origem que não devem ser lidas como entrada
+PASTAS_IGNORADAS = ("0.Erros",)
+# Mesmas separações dos scripts por emitente (data) e por recebedor (lote), em uma passada só
+VISOES_PADRAO = "emit,receb:lote"
+
+def configurar_encoding():
+    if sys.stdout.encoding != 'utf-8':
+        try:
+            sys.stdout.reconfigure(encoding='utf-8')
+        except:
+            pass
+
+def criar_arquivo_log_erros(pasta_erros, qtd_erros, por_motivo=""):
+    """Cria um arquivo de log com a quantidade de erros encontrados (e quantos de cada motivo, ver erros_cte)"""
+    caminho_log = os.path.join(pasta_erros, f"0.Erros_{qtd_erros}.txt")
+    with open(caminho_log, 'w', encoding='utf-8') as f:
+        f.write(f"Total de arquivos com erro: {qtd_erros}\n")
+        f.write(f"Data do processamento: {time.strftime('%d/%m/%Y %H:%M:%S')}\n")
+        if por_motivo:
+            f.write(f"\nPor motivo (arquivo a arquivo em {ARQUIVO_INDICE_ERROS}):\n{por_motivo}\n")
+
+def compactar_visoes(visoes, manter_pastas=False, processos=None, compressao=NIVEL_COMPRESSAO_PADRAO,
+                     leiaute_data=LEIAUTE_DATA_PADRAO, interface=None):
+    """
+    Compacta as partições de todas as visões (cada visão tem os seus ZIPs).
+    Sem manter_pastas, cada visão apaga apenas os próprios vínculos; o conteúdo continua nas outras,
+    e o catálogo de cada visão passa a apontar para os ZIPs (ver catalogo_cte).
+    :param leiaute_data: Leiaute das pastas de data, que define em que nível estão as partições
+    :param interface: Mostra a barra de progresso (ver interface_cte; padrão: obter_interface())
+    """
+    interface = interface or obter_interface()
+    lotes = [lote for visao in visoes
+             for lote in listar_lotes(visao.pasta_destino, PREFIXOS_PARTICAO[visao.particao],
+                                      LEIAUTES_DATA[leiaute_data] if visao.particao == 'data' else 1)]
+    if not lotes:
+        print("\nNenhum lote encontrado para compactar!")
+        return 0
+
+    tipo_compressao, nivel = interpretar_compressao(compressao)
+    lotes_compactados = 0
+    situacoes = {}
+    compactados = []
+    with interface.barra(total=len(lotes), unit='lote', desc="Compactando") as pbar:
+        for lote_path, situacao, _, membros, erro in compactar_em_paralelo(lotes, processos, manter_pastas,
+                                                                            tipo_compressao, nivel):
+            if erro is not None:
+                print(f"\nErro ao compactar {lote_path}: {erro}")
+            else:
+                lotes_compactados += 1
+                situacoes[situacao] = situacoes.get(situacao, 0) + 1
+                compactados.append((lote_path, membros))
+            pbar.update(1)
+
+    if not manter_pastas:
+        for visao in visoes:
+            atualizar_compactados(visao.pasta_destino, [(lote_path, membros) for lote_path, membros in compactados
+                                                        if lote_path.startswith(visao.pasta_destino + os.sep)])
+    print("\nLotes: " + ", ".join(f"{qtd} {situacao}" for situacao, qtd in sorted(situacoes.items())))
+    return lotes_compactados
+
+def organizar_cte_em_visoes(visoes, processos=1, tamanho_bloco=TAMANHO_BLOCO_PADRAO, compactar=False,
+                            manter_pastas=False, processos_compactacao=None, compressao=NIVEL_COMPRESSAO_PADRAO,
+                            leiaute_data=LEIAUTE_DATA_PADRAO, max_arquivos_lote=TAMANHO_LOTE, max_bytes_lote=None,
+                            catalogar=True, interface=None):
+    """
+    Separa os XMLs de CT-e em várias visões (uma pasta "0.Por <Parte>" por parte) lendo cada XML uma vez.
+    :param visoes: Lista de Visao (ver motor_cte.interpretar_visoes); a primeira recebe os arquivos
+    :param processos: Quantidade de processos que leem os XMLs (1 = linear)
+    :param tamanho_bloco: Arquivos enviados por vez a cada processo
+    :param compactar: Compacta as partições de todas as visões ao final
+    :param manter_pastas: Mantém as pastas após a compactação
+    :param processos_compactacao: Lotes compactados ao mesmo tempo (padrão: quantidade de CPUs)
+    :param compressao: Nível de compressão dos ZIPs (0 a 9) ou 'sem'
+    :param leiaute_data: Pastas das visões por data: 'dia', 'mes' ou 'ano' (ver particoes_cte.LEIAUTES_DATA)
+    :param max_arquivos_lote: Arquivos por lote nas visões por lote
+    :param max_bytes_lote: Bytes por lote nas visões por lote (None = só pela quantidade de arquivos)
+    :param catalogar: Registra os CT-es no catálogo de cada visão (ver catalogo_cte)
+    :param interface: Barras de progresso (ver interface_cte; padrão: obter_interface())
+    """
+    inicio = time.time()
+    interface = interface or obter_interface()
+    print(f"\nVerificando arquivos na pasta: {PASTA_ORIGEM}")
+    separador = SeparadorVisoes(visoes, PASTA_ERROS, processos=processos, tamanho_bloco=tamanho_bloco,
+                                leiaute_data=leiaute_data, max_arquivos_lote=max_arquivos_lote,
+                                max_bytes_lote=max_bytes_lote, catalogar=catalogar)
+    if separador.diario.retomada:
+        print(f"Retomando execução interrompida: {separador.diario.concluidas_antes} arquivo(s) já separado(s)")
+    concluidos = separador.diario.membros_concluidos
+    tem_xmls = separador.diario.retomada or existem_entradas(PASTA_ORIGEM, ignorar=PASTAS_IGNORADAS,
+                                                             concluidos=concluidos)
+
+    if tem_xmls:
+        print(f"\nProcessando arquivos XML de {PASTA_ORIGEM}...")
+        # O total só alimenta a barra de progresso: é contado em segundo plano, sem atrasar o primeiro arquivo
+        contagem = ContagemEmSegundoPlano(PASTA_ORIGEM, ignorar=PASTAS_IGNORADAS, concluidos=concluidos)
+        with interface.barra(total=None, unit='arquivo', desc="Separando CT-es") as barra:
+            # A barra é redesenhada no máximo a cada INTERVALO_PROGRESSO segundos, não a cada arquivo
+            progresso = ProgressoLimitado(barra, lambda: {'OK': separador.processados, 'Erros': separador.erros,
+                                                          'Duplicados': separador.duplicados},
+                                          total=lambda: contagem.total and max(contagem.total, separador.descobertas))
+            separador.separar(PASTA_ORIGEM, ignorar=PASTAS_IGNORADAS, ao_avancar=progresso.avancar)
+            contagem.aguardar()
+            progresso.descarregar()
+        # Total exato: as entradas que a descoberta entregou
+        total_arquivos = separador.descobertas
+
+        for caminho_divergentes in separador.divergentes:
+            print(f"\nChaves com conteúdo divergente registradas em: {caminho_divergentes}")
+        for caminho_zip in separador.zips_origem.pendentes:
+            print(f"    Mantido na origem (membros ilegíveis ou arquivos que não são XML): {caminho_zip}")
+        for caminho_zip, erro_zip in separador.zips_origem.invalidos:
+            print(f"    ZIP ilegível movido para erros: {caminho_zip} ({erro_zip})")
+        if separador.pasta_erros.total:
+            print(f"\nArquivos que foram para {PASTA_ERROS}, por motivo:")
+            print(separador.pasta_erros.relatorio())
+        if processos > 1:
+            print(f"\nDesempenho por worker ({processos} processos):")
+            print(separador.extrator.relatorio_throughput())
+        print("\nMovimentações por caminho:")
+        print(separador.movimentador.relatorio())
+        if len(visoes) > 1:
+            print("\nArquivos nas visões além da principal:")
+            print(separador.relatorio_vinculos())
+
+        separador.gravar_relatorios(total_arquivos)
+        # Remove pastas vazias (apenas as que tiveram arquivos movidos nesta execução)
+        separador.manifestos[0].remover_pastas_vazias(PASTA_ORIGEM, preservar=PASTAS_IGNORADAS)
+        if separador.erros > 0:
+            criar_arquivo_log_erros(PASTA_ERROS, separador.erros, separador.pasta_erros.relatorio())
+    else:
+        print("\nNenhum arquivo XML encontrado para separar.")
+
+    lotes_compactados = 0
+    if compactar:
+        print("\nCompactando partições das visões...")
+        lotes_compactados = compactar_visoes(visoes, manter_pastas, processos_compactacao, compressao,
+                                             leiaute_data, interface)
+
+    print("\n" + "="*50)
+    print(f"Processo finalizado!\n\n"
+          f"[PROCESSADOS] Arquivos processados: {separador.processados}\n"
+          f"[ERRO] Arquivos com erro: {separador.erros}\n"
+          f"[DUPLICADOS] Arquivos duplicados: {separador.duplicados}\n"
+          f"[COMPACTADOS] Lotes compactados: {lotes_compactados}\n"
+          f"[TEMPO] Tempo total: {time.time() - inicio:.2f}s\n")
+    for visao, manifesto in zip(visoes, separador.manifestos):
+        print(f"    {NOMES_PARTES[visao.tag]}: {manifesto.total_arquivos} arquivo(s) em {visao.pasta_destino}")
+    print("="*50)
+
+def vigiar_cte_em_visoes(visoes, processos=1, tamanho_bloco=TAMANHO_BLOCO_PADRAO, espera=ESPERA_PADRAO,
+                         estabilidade=ESTABILIDADE_PADRAO, intervalo=INTERVALO_VARREDURA_PADRAO, varredura=False,
+                         leiaute_data=LEIAUTE_DATA_PADRAO, max_arquivos_lote=TAMANHO_LOTE, max_bytes_lote=None,
+                         catalogar=True):
+    """
+    Modo vigia: fica em execução separando nas visões os XMLs que chegam na pasta de origem, em pequenos
+    lotes (ver vigia_cte.VigiaOrigem), sem janelas nem barra de progresso. Relatórios e métricas das visões
+    são regravados a cada lote com os totais desde o início. Encerrado com Ctrl+C ou SIGTERM; um lote
+    interrompido no meio é retomado pelo diário na próxima execução.
+    As pastas vazias da origem não são removidas: podem estar recebendo arquivos.
+    """
+    inicio = time.time()
+    separador = SeparadorVisoes(visoes, PASTA_ERROS, processos=processos, tamanho_bloco=tamanho_bloco,
+                                leiaute_data=leiaute_data, max_arquivos_lote=max_arquivos_lote,
+                                max_bytes_lote=max_bytes_lote, catalogar=catalogar)
+    if separador.diario.retomada:
+        print(f"Retomando execução interrompida: {separador.diario.concluidas_antes} arquivo(s) já separado(s)")
+    vigia = VigiaOrigem(PASTA_ORIGEM, ignorar=PASTAS_IGNORADAS, espera=espera, estabilidade=estabilidade,
+                        intervalo=intervalo, varredura=varredura)
+    print(f"\nVigiando {PASTA_ORIGEM} ({vigia.modo}). Ctrl+C para encerrar.")
+    lotes = 0
+    try:
+        for caminhos, chegada in vigia.lotes():
+            inicio_lote = time.time()
+            antes = (separador.processados, separador.erros, separador.duplicados)
+            separador.separar_arquivos(caminhos)
+            # Da chegada do primeiro arquivo do lote na origem até todo o lote estar nas visões
+            latencia = time.monotonic() - chegada
+            separador.metricas.registrar('vigia_chegada_ate_destino', latencia)
+            separador.gravar_relatorios(separador.encontradas)
+            lotes += 1
+            print(f"[{time.strftime('%H:%M:%S')}] Lote {lotes}: {len(caminhos)} arquivo(s) em "
+                  f"{time.time() - inicio_lote:.2f}s - {separador.processados - antes[0]} separado(s), "
+                  f"{separador.erros - antes[1]} com erro, {separador.duplicados - antes[2]} duplicado(s); "
+                  f"chegada -> destino: {latencia:.1f}s")
+            for caminho_divergentes in separador.divergentes:
+                print(f"    Chaves com conteúdo divergente registradas em: {caminho_divergentes}")
+    except KeyboardInterrupt:
+        print("\nEncerrando o modo vigia...")
+    finally:
+        vigia.fechar()
+
+    if separador.erros > 0:
+        criar_arquivo_log_erros(PASTA_ERROS, separador.erros, separador.pasta_erros.relatorio())
+    print("\n" + "="*50)
+    print(f"Modo vigia encerrado após {lotes} lote(s)\n\n"
+          f"[PROCESSADOS] Arquivos processados: {separador.processados}\n"
+          f"[ERRO] Arquivos com erro: {separador.erros}\n"
+          f"[DUPLICADOS] Arquivos duplicados: {separador.duplicados}\n"
+          f"[TEMPO] Tempo total: {time.time() - inicio:.2f}s\n")
+    for visao, manifesto in zip(visoes, separador.manifestos):
+        print(f"    {NOMES_PARTES[visao.tag]}: {manifesto.total_arquivos} arquivo(s) em {visao.pasta_destino}")
+    print("="*50)
+
+def ler_argumentos():
+    """Lê as opções de linha de comando"""
+    parser = argparse.ArgumentParser(
+        description="Separa XMLs de CT-e por CNPJ de várias partes ao mesmo tempo, lendo cada XML uma vez.")
+    parser.add_argument("--visoes", default=VISOES_PADRAO,
+                        help=f"Partes separadas, a primeira recebe os arquivos e as demais vínculos (hardlinks): "
+                             f"{', '.join(NOMES_PARTES)}, cada uma com :data ou :lote (padrão: {VISOES_PADRAO})")
+    parser.add_argument("--processos", type=int, default=1,
+                        help="Processos usados na leitura dos XMLs (padrão: 1, modo linear)")
+    parser.add_argument("--tamanho-bloco", type=int, default=TAMANHO_BLOCO_PADRAO,
+                        help=f"Arquivos enviados por vez a cada processo (padrão: {TAMANHO_BLOCO_PADRAO})")
+    parser.add_argument("--compactar", action="store_true",
+                        help="Compacta as partições de todas as visões ao final")
+    parser.add_argument("--manter-pastas", action="store_true",
+                        help="Com --compactar, mantém as pastas além dos ZIPs")
+    parser.add_argument("--processos-compactacao", type=int, default=None,
+                        help="Lotes compactados ao mesmo tempo (padrão: quantidade de CPUs)")
+    parser.add_argument("--compressao", default=str(NIVEL_COMPRESSAO_PADRAO),
+                        help=f"Nível de compressão dos ZIPs, de 0 a 9, ou 'sem' para apenas armazenar "
+                             f"(padrão: {NIVEL_COMPRESSAO_PADRAO})")
+    parser.add_argument("--leiaute-data", choices=sorted(LEIAUTES_DATA), default=LEIAUTE_DATA_PADRAO,
+                        help="Pastas das visões por data: dia (AAAA-MM-DD), mes (AAAA-MM/DD) ou ano (AAAA/MM/DD), "
+                             "para o CNPJ não acumular milhares de pastas (padrão: dia)")
+    parser.add_argument("--lote-max-arquivos", type=int, default=TAMANHO_LOTE, metavar="N",
+                        help=f"Arquivos por lote nas visões por lote (padrão: {TAMANHO_LOTE})")
+    parser.add_argument("--lote-max-mb", type=float, default=None, metavar="MB",
+                        help="Tamanho máximo de cada lote nas visões por lote (padrão: sem limite)")
+    parser.add_argument("--sem-catalogo", action="store_true",
+                        help="Não registra os CT-es no catálogo das visões (0.catalogo.sqlite, ver consultar_cte.py)")
+    parser.add_argument("--vigiar", action="store_true",
+                        help="Fica em execução separando os XMLs à medida que chegam na pasta de origem")
+    parser.add_argument("--espera", type=float, default=ESPERA_PADRAO, metavar="SEGUNDOS",
+                        help=f"Com --vigiar, silêncio na origem que fecha um lote (padrão: {ESPERA_PADRAO})")
+    parser.add_argument("--estabilidade", type=float, default=ESTABILIDADE_PADRAO, metavar="SEGUNDOS",
+                        help=f"Com --vigiar, tempo sem mudar para um arquivo ser considerado completo "
+                             f"(padrão: {ESTABILIDADE_PADRAO})")
+    parser.add_argument("--varredura", action="store_true",
+                        help="Com --vigiar, varre a origem periodicamente em vez de usar inotify "
+                             "(necessário em compartilhamentos gravados por outras máquinas)")
+    parser.add_argument("--intervalo-varredura", type=float, default=INTERVALO_VARREDURA_PADRAO, metavar="SEGUNDOS",
+                        help=f"Com --vigiar, intervalo entre varreduras da origem sem nada pendente "
+                             f"(padrão: {INTERVALO_VARREDURA_PADRAO})")
+    parser.add_argument("--interface", choices=INTERFACES, default=None,
+                        help="Barra de progresso: console ou windows (a mesma barra no terminal), nula (sem barra, "
+                             "para execução em lote) ou auto (padrão: variável SEPARADOR_CTE_INTERFACE ou auto)")
+    argumentos = parser.parse_args()
+    try:
+        interpretar_compressao(argumentos.compressao)
+        argumentos.visoes = interpretar_visoes(argumentos.visoes, SCRIPT_DIR)
+    except ValueError as e:
+        parser.error(str(e))
+    argumentos.max_bytes_lote = int(argumentos.lote_max_mb * 1048576) if argumentos.lote_max_mb else None
+    if argumentos.vigiar and argumentos.compactar:
+        parser.error("--compactar não pode ser usado com --vigiar (as partições continuam recebendo arquivos)")
+    try:
+        argumentos.interface = obter_interface(argumentos.interface)
+    except ValueError as e:
+        parser.error(str(e))
+    except ImportError as e:
+        parser.error(f"--interface windows precisa do pywin32 ({e})")
+    return argumentos
+
+if __name__ == "__main__":
+    configurar_encoding()
+    argumentos = ler_argumentos()
+    os.makedirs(PASTA_ORIGEM, exist_ok=True)
+
+    print("=== ORGANIZADOR DE CT-es POR VÁRIAS PARTES ===")
+    print(f"Local do script: {SCRIPT_DIR}")
+    print(f"Pasta origem (XMLs): {PASTA_ORIGEM}")
+    for visao in argumentos.visoes:
+        print(f"Visão {NOMES_PARTES[visao.tag]} ({visao.particao}): {visao.pasta_destino}")
+
+    if argumentos.vigiar:
+        # Parada pelo gerenciador de serviços (systemd, docker stop) segue o mesmo caminho do Ctrl+C
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        vigiar_cte_em_visoes(argumentos.visoes, processos=argumentos.processos, tamanho_bloco=argumentos.tamanho_bloco,
+                             espera=argumentos.espera, estabilidade=argumentos.estabilidade,
+                             intervalo=argumentos.intervalo_varredura, varredura=argumentos.varredura,
+                             leiaute_data=argumentos.leiaute_data, max_arquivos_lote=argumentos.lote_max_arquivos,
+                             max_bytes_lote=argumentos.max_bytes_lote, catalogar=not argumentos.sem_catalogo)
+        sys.exit(0)
+
+    organizar_cte_em_visoes(argumentos.visoes, processos=argumentos.processos, tamanho_bloco=argumentos.tamanho_bloco,
+                            compactar=argumentos.compactar, manter_pastas=argumentos.manter_pastas,
+                            processos_compactacao=argumentos.processos_compactacao, compressao=argumentos.compressao,
+                            leiaute_data=argumentos.leiaute_data, max_arquivos_lote=argumentos.lote_max_arquivos,
+                            max_bytes_lote=argumentos.max_bytes_lote, catalogar=not argumentos.sem_catalogo,
+                            interface=argumentos.interface)
@@ -0,0 +1,344 @@
+import json
+import os
+import time
+import zlib
+from collections import Counter, namedtuple
+
+from catalogo_cte import CatalogoCte, ARQUIVO_CATALOGO
+from diario_cte import ARQUIVO_DIARIO
+from duplicados_cte import NomeadorDuplicados, gravar_divergencias
+from erros_cte import ARQUIVO_INDICE_ERROS
+from manifesto_cte import ManifestoExecucao
+from movimentacao_cte import MovimentadorArquivos
+from particoes_cte import ARQUIVO_LOTES, PREFIXO_LOTE, ler_lotes, gravar_lotes
+
+# Relatório parcial de cada shard na pasta de destino, até a mescla (0.parcial.shard_i-n.json)
+ARQUIVO_PARCIAL = "0.parcial.json"
+# Lotes já renumerados por uma mescla interrompida (apagado ao final da mescla)
+ARQUIVO_MESCLA = "0.mescla_shards.log"
+# Chaves de acesso colocadas por mais de um shard, acrescentadas a cada mescla
+ARQUIVO_REPETIDAS = "0.chaves_repetidas_shards.txt"
+# Totais de cada relatório parcial
+TOTAIS = ('encontrados', 'processados', 'erros', 'duplicados', 'identicos')
+
+class Shard(namedtuple('Shard', ['indice', 'total'])):
+    """
+    Parte i de n (1 <= i <= n) da pasta de origem, separada por uma instância independente (outro processo ou
+    outra máquina com as mesmas pastas). Cada XML é do shard dado pelo nome do arquivo (shard_do_nome; membros
+    de ZIP pelo nome do membro): arquivos de mesmo nome caem sempre no mesmo shard, então dois shards nunca
+    disputam o mesmo caminho no destino, na pasta de duplicados ou na de erros. O estado que cada execução
+    guarda na pasta de destino (diário, lotes, catálogo, métricas, índice de erros) fica em arquivos do shard
+    (ver arquivo), e mesclar_shards junta tudo quando os n terminam.
+    """
+    __slots__ = ()
+
+    def contem(self, nome):
+        """O arquivo de nome nome é deste shard?"""
+        return shard_do_nome(nome, self.total) == self.indice
+
+    def arquivo(self, nome):
+        """Nome do arquivo de estado do shard: 0.lotes.txt -> 0.lotes.shard_2-4.txt"""
+        base, extensao = os.path.splitext(nome)
+        return f"{base}.shard_{self.indice}-{self.total}{extensao}"
+
+    def __str__(self):
+        return f"{self.indice}/{self.total}"
+
+def shard_do_nome(nome, total):
+    """
+    Shard (1 a total) do nome de arquivo: CRC-32 do nome em minúsculas (no Windows, nomes que só diferem
+    na caixa são o mesmo arquivo), o mesmo em qualquer máquina e em qualquer caminho de montagem
+    """
+    return zlib.crc32(nome.lower().encode('utf-8', 'surrogateescape')) % total + 1
+
+def interpretar_shard(texto):
+    """Shard de "i/n" (ex.: --shard 2/4); ValueError se não for válido"""
+    try:
+        indice, total = (int(parte) for parte in texto.split('/'))
+    except ValueError:
+        raise ValueError(f"shard inválido: {texto} (use i/n, ex.: 2/4)") from None
+    if not 1 <= indice <= total:
+        raise ValueError(f"shard inválido: {texto} (i vai de 1 a n)")
+    return Shard(indice, total)
+
+def _relativo(caminho, pasta):
+    return os.path.relpath(caminho, pasta).replace(os.sep, '/')
+
+def ler_parcial(pasta_destino, shard):
+    """Relatório parcial do shard ainda não mesclado (dict), ou None"""
+    try:
+        with open(os.path.join(pasta_destino, shard.arquivo(ARQUIVO_PARCIAL)), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def zips_concluidos(pasta_destino, shard, pasta_origem):
+    """ZIPs da origem que execuções anteriores do shard já concluíram (ver entrada_cte.ZipsOrigem)"""
+    parcial = ler_parcial(pasta_destino, shard) or {}
+    return {os.path.join(pasta_origem, *relativo.split('/')) for relativo in parcial.get('zips_concluidos', ())}
+
+def gravar_parcial(pasta_destino, shard, particionamento, totais, manifesto, erros_por_motivo=(), base_lotes=(),
+                   concluidos=(), pasta_origem=None):
+    """
+    Grava o relatório parcial do shard, somado ao das execuções anteriores dele que ainda não foram mescladas.
+    :param particionamento: Partição do relatório ("Data de Emissão" ou "Lote")
+    :param totais: {total: quantidade} (ver TOTAIS)
+    :param manifesto: ManifestoExecucao da execução (arquivos e bytes por CNPJ e partição)
+    :param erros_por_motivo: Counter motivo -> arquivos na pasta de erros (ver erros_cte)
+    :param base_lotes: {cnpj: último lote de 0.lotes.txt} dos CNPJs com lotes deste shard (ver AlocadorLotes)
+    :param concluidos: ZIPs da origem com os membros deste shard concluídos (apagados na mescla)
+    """
+    parcial = ler_parcial(pasta_destino, shard) or {'shard': str(shard), 'execucoes': 0, 'totais': {},
+                                                    'erros_por_motivo': {}, 'base_lotes': {}, 'particoes': [],
+                                                    'zips_concluidos': []}
+    parcial['particionamento'] = particionamento
+    parcial['execucoes'] += 1
+    for nome in TOTAIS:
+        parcial['totais'][nome] = parcial['totais'].get(nome, 0) + totais.get(nome, 0)
+    for motivo, quantidade in dict(erros_por_motivo).items():
+        parcial['erros_por_motivo'][motivo] = parcial['erros_por_motivo'].get(motivo, 0) + quantidade
+    for cnpj, numero in dict(base_lotes).items():
+        parcial['base_lotes'].setdefault(cnpj, numero)
+    particoes = {(cnpj, particao): [arquivos, tamanho] for cnpj, particao, arquivos, tamanho in parcial['particoes']}
+    for cnpj, particao, arquivos, tamanho in manifesto.particoes():
+        soma = particoes.setdefault((cnpj, particao.replace(os.sep, '/')), [0, 0])
+        soma[0] += arquivos
+        soma[1] += tamanho
+    parcial['particoes'] = [[cnpj, particao, *soma] for (cnpj, particao), soma in sorted(particoes.items())]
+    parcial['zips_concluidos'] = sorted(set(parcial['zips_concluidos'])
+                                        | {_relativo(caminho, pasta_origem) for caminho in concluidos})
+    caminho = os.path.join(pasta_destino, shard.arquivo(ARQUIVO_PARCIAL))
+    with open(f"{caminho}.novo", 'w', encoding='utf-8') as f:
+        json.dump(parcial, f, indent=1, ensure_ascii=False)
+    os.replace(f"{caminho}.novo", caminho)
+    return caminho
+
+def pendencias_mescla(pasta_destino, total):
+    """Motivos que impedem a mescla dos shards 1 a total (lista vazia: todos terminaram)"""
+    pendencias = []
+    for indice in range(1, total + 1):
+        shard = Shard(indice, total)
+        if os.path.exists(os.path.join(pasta_destino, shard.arquivo(ARQUIVO_DIARIO))):
+            pendencias.append(f"Shard {shard} interrompido: execute-o de novo para concluir antes de mesclar")
+        elif not os.path.exists(os.path.join(pasta_destino, shard.arquivo(ARQUIVO_PARCIAL))):
+            pendencias.append(f"Shard {shard} sem relatório parcial: ainda não foi executado")
+    return pendencias
+
+ResultadoMescla = namedtuple('ResultadoMescla', ['totais', 'erros_por_motivo', 'manifesto', 'repetidas',
+                                                 'lotes_renumerados', 'zips_removidos'])
+
+def mesclar_shards(pasta_destino, total, pasta_erros, pasta_duplicados, pasta_origem, caminho_relatorio):
+    """
+    Junta o que os shards 1 a total gravaram na pasta de destino, como se uma única execução tivesse separado
+    todos os arquivos:
+    - lotes: os de cada CNPJ são renumerados em sequência a partir do último de 0.lotes.txt (cada shard
+      numerou os seus de n em n, ver AlocadorLotes), e 0.lotes.txt passa a apontar o último deles;
+    - catálogo: os dos shards são copiados para o principal; a mesma chave colocada por dois shards (nomes de
+      arquivo diferentes) é tratada como na execução única: idêntica, a segunda cópia é descartada;
+      divergente, vai para a pasta de duplicados (0.Divergentes.txt). As duas ficam em 0.chaves_repetidas_shards.txt;
+    - índices de erros dos shards no índice da pasta de erros; ZIPs da origem concluídos por todos apagados;
+    - relatório único (caminho_relatorio) com os totais, uma linha por shard e os arquivos por CNPJ e partição.
+    Uma mescla interrompida pode ser repetida: os parciais só são apagados ao final.
+    :raises ValueError: Algum shard não terminou (ver pendencias_mescla) ou começou com outro 0.lotes.txt
+    """
+    pendencias = pendencias_mescla(pasta_destino, total)
+    if pendencias:
+        raise ValueError("\n".join(pendencias))
+    shards = [Shard(indice, total) for indice in range(1, total + 1)]
+    parciais = [ler_parcial(pasta_destino, shard) for shard in shards]
+
+    # Partições somadas (o nome da partição de lote já renumerado)
+    renomear = _renumerar_lotes(pasta_destino, parciais)
+    particoes = Counter()
+    tamanhos = Counter()
+    for parcial in parciais:
+        for cnpj, particao, arquivos, tamanho in parcial['particoes']:
+            particao = renomear.get(f"{cnpj}/{particao}", f"{cnpj}/{particao}").split('/', 1)[1]
+            particoes[cnpj, particao] += arquivos
+            tamanhos[cnpj, particao] += tamanho
+    totais = Counter()
+    erros_por_motivo = Counter()
+    for parcial in parciais:
+        totais.update(parcial['totais'])
+        erros_por_motivo.update(parcial['erros_por_motivo'])
+
+    repetidas = _mesclar_catalogos(pasta_destino, shards, renomear, pasta_duplicados, particoes, tamanhos, totais)
+    _mesclar_indices_erros(pasta_erros, shards)
+
+    # Último lote de cada CNPJ com lotes nos shards
+    lotes = ler_lotes(os.path.join(pasta_destino, ARQUIVO_LOTES))
+    ultimos = {}
+    for novo in renomear.values():
+        cnpj, particao = novo.split('/', 1)
+        ultimos[cnpj] = max(ultimos.get(cnpj, 0), int(particao[len(PREFIXO_LOTE):]))
+    for cnpj, numero in ultimos.items():
+        particao = f"{PREFIXO_LOTE}{numero}"
+        lotes[cnpj] = [numero, particoes[cnpj, particao], tamanhos[cnpj, particao]]
+    if ultimos:
+        gravar_lotes(os.path.join(pasta_destino, ARQUIVO_LOTES), lotes)
+
+    # ZIPs da origem: cada shard leu só os seus membros; saem quando todos concluíram
+    zips_removidos = 0
+    concluidos = [set(parcial['zips_concluidos']) for parcial in parciais]
+    for relativo in set.intersection(*concluidos):
+        caminho_zip = os.path.join(pasta_origem, *relativo.split('/'))
+        if os.path.exists(caminho_zip):
+            os.remove(caminho_zip)
+            zips_removidos += 1
+
+    manifesto = ManifestoExecucao()
+    for (cnpj, particao), arquivos in sorted(particoes.items()):
+        if arquivos > 0:
+            manifesto.somar_particao(cnpj, particao.replace('/', os.sep), arquivos, tamanhos[cnpj, particao])
+    resultado = ResultadoMescla(totais, erros_por_motivo, manifesto, len(repetidas),
+                                sum(1 for antigo, novo in renomear.items() if antigo != novo), zips_removidos)
+    _escrever_relatorio(caminho_relatorio, parciais, resultado)
+
+    for shard in shards:
+        for nome in (ARQUIVO_PARCIAL, ARQUIVO_LOTES, os.path.basename(caminho_relatorio)):
+            caminho = os.path.join(pasta_destino, shard.arquivo(nome))
+            if os.path.exists(caminho):
+                os.remove(caminho)
+    if os.path.exists(os.path.join(pasta_destino, ARQUIVO_MESCLA)):
+        os.remove(os.path.join(pasta_destino, ARQUIVO_MESCLA))
+    return resultado
+
+def _renumerar_lotes(pasta_destino, parciais):
+    """
+    Renomeia as pastas (e ZIPs) de lote dos shards para base+1, base+2... de cada CNPJ, na ordem dos números.
+    Cada número novo é menor ou igual ao antigo e os anteriores já saíram do caminho, então o destino está
+    sempre livre. Os lotes renomeados vão para ARQUIVO_MESCLA, para uma mescla interrompida não renomear
+    de novo o que já foi renomeado. Retorna {"cnpj/lote_antigo": "cnpj/lote_novo"}.
+    """
+    base = {}
+    numeros = {}
+    for parcial in parciais:
+        for cnpj, numero in parcial['base_lotes'].items():
+            if base.setdefault(cnpj, numero) != numero:
+                raise ValueError(f"Os shards começaram com lotes diferentes para o CNPJ {cnpj} ({base[cnpj]} e "
+                                 f"{numero}): 0.lotes.txt mudou entre um shard e outro")
+        for cnpj, particao, _, _ in parcial['particoes']:
+            if particao.startswith(PREFIXO_LOTE) and particao[len(PREFIXO_LOTE):].isdigit():
+                numeros.setdefault(cnpj, set()).add(int(particao[len(PREFIXO_LOTE):]))
+
+    caminho_mescla = os.path.join(pasta_destino, ARQUIVO_MESCLA)
+    feitos = set()
+    if os.path.exists(caminho_mescla):
+        with open(caminho_mescla, 'r', encoding='utf-8') as f:
+            feitos = {linha.rstrip('\n') for linha in f if linha.endswith('\n')}
+    renomear = {}
+    with open(caminho_mescla, 'a', encoding='utf-8') as registro:
+        for cnpj, numeros_cnpj in sorted(numeros.items()):
+            for posicao, numero in enumerate(sorted(numeros_cnpj), 1):
+                antigo = f"{cnpj}/{PREFIXO_LOTE}{numero}"
+                novo = f"{cnpj}/{PREFIXO_LOTE}{base.get(cnpj, 0) + posicao}"
+                renomear[antigo] = novo
+                if antigo == novo or antigo in feitos:
+                    continue
+                for extensao in ('', '.zip'):
+                    origem = os.path.join(pasta_destino, *f"{antigo}{extensao}".split('/'))
+                    destino = os.path.join(pasta_destino, *f"{novo}{extensao}".split('/'))
+                    if os.path.exists(origem):
+                        if os.path.exists(destino):
+                            raise FileExistsError(f"Lote {destino} já existe: não é possível renumerar {origem}")
+                        os.rename(origem, destino)
+                registro.write(f"{antigo}\n")
+                registro.flush()
+    return renomear
+
+def _mesclar_catalogos(pasta_destino, shards, renomear, pasta_duplicados, particoes, tamanhos, totais):
+    """
+    Copia os catálogos dos shards para o principal e resolve as chaves colocadas por mais de um shard
+    (ver mesclar_shards), descontando as cópias retiradas das partições e somando-as aos duplicados.
+    Retorna [(chave, local mantido, local repetido, destino do repetido)].
+    """
+    caminhos = [os.path.join(pasta_destino, shard.arquivo(ARQUIVO_CATALOGO)) for shard in shards]
+    caminhos = [caminho for caminho in caminhos if os.path.exists(caminho)]
+    if not caminhos:
+        return []
+    repetidas = []
+    divergencias = []
+    nomeador = None
+    movimentador = MovimentadorArquivos()
+    catalogo = CatalogoCte(pasta_destino)
+    try:
+        for caminho in caminhos:
+            for repetido, mantido in catalogo.mesclar(caminho, renomear):
+                if repetido.membro or mantido.membro or not os.path.exists(repetido.caminho):
+                    # Membro de ZIP gravado direto (ou já retirado): as duas cópias ficam onde estão
+                    repetidas.append((repetido.chave, mantido, repetido, "mantido"))
+                    continue
+                if repetido.hash and repetido.hash == mantido.hash:
+                    os.remove(repetido.caminho)
+                    totais['identicos'] += 1
+                    destino = "descartado (idêntico)"
+                else:
+                    if nomeador is None:
+                        os.makedirs(pasta_duplicados, exist_ok=True)
+                        nomeador = NomeadorDuplicados(pasta_duplicados)
+                    caminho_duplicado = nomeador.proximo_caminho(os.path.basename(repetido.caminho))
+                    movimentador.mover(repetido.caminho, caminho_duplicado)
+                    divergencias.append((repetido.chave, mantido.caminho, caminho_duplicado))
+                    destino = caminho_duplicado
+                catalogo.remover(repetido)
+                totais['duplicados'] += 1
+                cnpj, particao = _relativo(os.path.dirname(repetido.caminho), pasta_destino).split('/', 1)
+                particoes[cnpj, particao] -= 1
+                tamanhos[cnpj, particao] -= repetido.tamanho or 0
+                repetidas.append((repetido.chave, mantido, repetido, destino))
+            os.remove(caminho)
+    finally:
+        catalogo.fechar()
+    movimentador.descarregar()
+    gravar_divergencias(pasta_duplicados, divergencias)
+    if repetidas:
+        with open(os.path.join(pasta_destino, ARQUIVO_REPETIDAS), 'a', encoding='utf-8') as f:
+            f.write(f"Data do processamento: {time.strftime('%d/%m/%Y %H:%M:%S')}\n")
+            for chave, mantido, repetido, destino in repetidas:
+                f.write(f"{chave}\tmantido: {_local(mantido)}\trepetido: {_local(repetido)}\t{destino}\n")
+    return repetidas
+
+def _local(local):
+    return f"{local.caminho} -> {local.membro}" if local.membro else local.caminho
+
+def _mesclar_indices_erros(pasta_erros, shards):
+    """Acrescenta os índices da pasta de erros de cada shard ao índice principal"""
+    for shard in shards:
+        caminho = os.path.join(pasta_erros, shard.arquivo(ARQUIVO_INDICE_ERROS))
+        if not os.path.exists(caminho):
+            continue
+        with open(caminho, 'r', encoding='utf-8') as origem, \
+                open(os.path.join(pasta_erros, ARQUIVO_INDICE_ERROS), 'a', encoding='utf-8') as destino:
+            for linha in origem:
+                destino.write(linha)
+        os.remove(caminho)
+
+def _escrever_relatorio(caminho, parciais, resultado):
+    """Relatório da execução em shards, no formato do relatório de uma execução única"""
+    totais, manifesto = resultado.totais, resultado.manifesto
+    particionamento = parciais[0].get('particionamento', "Partição")
+    with open(caminho, 'w') as f:
+        f.write(f"Data do processamento: {time.strftime('%d/%m/%Y %H:%M:%S')}\n")
+        f.write(f"Execução em {len(parciais)} shards, mesclada\n")
+        f.write(f"Total de arquivos XML encontrados: {totais['encontrados']}\n")
+        f.write(f"Total de arquivos XML processados: {totais['processados']}\n")
+        f.write(f"Total de arquivos XML com erros: {totais['erros']}\n")
+        f.write(f"Total de arquivos XML duplicados: {totais['duplicados']}\n")
+        f.write(f"Total de arquivos XML idênticos descartados: {totais['identicos']}\n")
+        f.write(f"Total de arquivos XML efetivamente separados: {manifesto.total_arquivos}\n")
+        f.write(f"Tamanho total separado: {manifesto.total_bytes / 1048576:.2f} MB "
+                f"em {manifesto.total_particoes} partição(ões) de CNPJ e {particionamento}\n")
+        f.write(f"Chaves de acesso repetidas entre shards: {resultado.repetidas}\n")
+        f.write(f"Lotes renumerados: {resultado.lotes_renumerados}\n")
+        f.write("|"+"--"*30 +"|"+"\n"*3)
+        f.write("Relatório por shard:\n\n")
+        for parcial in parciais:
+            totais_shard = parcial['totais']
+            separados = sum(particao[2] for particao in parcial['particoes'])
+            f.write(f"    Shard {parcial['shard']}: {totais_shard['encontrados']} encontrado(s), "
+                    f"{totais_shard['processados']} processado(s), {totais_shard['erros']} com erro, "
+                    f"{totais_shard['duplicados']} duplicado(s), {separados} separado(s) "
+                    f"em {parcial['execucoes']} execução(ões)\n")
+        f.write("\n\n")
+        f.write(f"Relatório de arquivos separados nesta execução por CNPJ e {particionamento}:\n\n")
+        f.write(manifesto.relatorio_por_cnpj())
@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+# Os módulos ficam soltos na raiz do repositório (os scripts também os importam assim)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+NS = 'http://www.portalfiscal.inf.br/cte'
+
+def chave_cte(numero, emitente='12345678000190', data='2025-08-01'):
+    """Chave de acesso do CT-e gerado por cte_xml"""
+    return f"35{data[2:4]}{data[5:7]}{emitente}57001{numero:09d}1{numero:08d}0"
+
+def cte_xml(numero, emitente='12345678000190', recebedor='33333333000133', data='2025-08-01', nome='E'):
+    """CT-e mínimo com o que o extrator lê (chave, data de emissão e os grupos de CNPJ)"""
+    chave = chave_cte(numero, emitente, data)
+    return (f'<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<cteProc xmlns="{NS}" versao="4.00"><CTe xmlns="{NS}"><infCte Id="CTe{chave}" versao="4.00">'
+            f'<ide><cUF>35</cUF><mod>57</mod><nCT>{numero}</nCT><dhEmi>{data}T10:00:00-03:00</dhEmi></ide>'
+            f'<emit><CNPJ>{emitente}</CNPJ><xNome>{nome}</xNome></emit><rem><CNPJ>11111111000111</CNPJ></rem>'
+            f'<receb><CNPJ>{recebedor}</CNPJ></receb><dest><CNPJ>22222222000122</CNPJ></dest>'
+            f'<vPrest><vTPrest>100.00</vTPrest></vPrest></infCte></CTe>'
+            f'<protCTe versao="4.00"><infProt><chCTe>{chave}</chCTe></infProt></protCTe></cteProc>')
+
+@pytest.fixture
+def gerar_ctes():
+    """Grava CT-es cte_<n>.xml na pasta; retorna os caminhos"""
+    def gerar(pasta, numeros, **kwargs):
+        os.makedirs(pasta, exist_ok=True)
+        caminhos = []
+        for numero in numeros:
+            caminho = os.path.join(pasta, f"cte_{numero}.xml")
+            with open(caminho, 'w', encoding='utf-8') as f:
+                f.write(cte_xml(numero, **kwargs))
+            caminhos.append(caminho)
+        return caminhos
+    return gerar
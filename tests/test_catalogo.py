@@ -0,0 +1,83 @@
+import io
+import os
+import zipfile
+
+from catalogo_cte import CatalogoCte, atualizar_compactados
+from compactador_cte import compactar_lote
+from conftest import chave_cte, cte_xml
+from recuperacao_cte import RecuperadorCte
+from separacao_cte import SeparadorCte
+
+CNPJ = '33333333000133'
+
+class _Saida(io.BytesIO):
+    def close(self):
+        pass
+
+def _separar_e_compactar(origem, destino, conteudo):
+    os.makedirs(origem, exist_ok=True)
+    with open(os.path.join(origem, 'nota.xml'), 'w', encoding='utf-8') as f:
+        f.write(conteudo)
+    separador = SeparadorCte(origem, destino, tag_cnpj='receb', particao='lote')
+    try:
+        separador.separar()
+    finally:
+        separador.fechar()
+    lote_path, _, _, membros = compactar_lote(os.path.join(destino, CNPJ, 'lote_1'))
+    atualizar_compactados(destino, [(lote_path, membros)])
+    return membros
+
+def _extrair(destino, chaves):
+    catalogo = CatalogoCte(destino)
+    saidas = {}
+    try:
+        for chave, local, erro in RecuperadorCte(catalogo).extrair(chaves, lambda local: saidas.setdefault(
+                local.chave, _Saida())):
+            assert erro is None
+            assert local is not None
+    finally:
+        catalogo.fechar()
+    return {chave: saida.getvalue().decode('utf-8') for chave, saida in saidas.items()}
+
+def test_extrai_do_lote_compactado_o_membro_renomeado(tmp_path):
+    origem, destino = str(tmp_path / 'origem'), str(tmp_path / 'destino')
+    # Duas execuções, cada uma com um CT-e diferente chamado nota.xml no mesmo lote
+    assert _separar_e_compactar(origem, destino, cte_xml(1, recebedor=CNPJ)) == {'nota.xml': 'nota.xml'}
+    assert _separar_e_compactar(origem, destino, cte_xml(2, recebedor=CNPJ)) == {'nota.xml': 'nota (1).xml'}
+
+    with zipfile.ZipFile(os.path.join(destino, CNPJ, 'lote_1.zip')) as z:
+        assert sorted(z.namelist()) == ['nota (1).xml', 'nota.xml']
+    catalogo = CatalogoCte(destino)
+    try:
+        locais = catalogo.localizar([chave_cte(1), chave_cte(2)])
+    finally:
+        catalogo.fechar()
+    assert {chave: local.membro for chave, local in locais.items()} == {chave_cte(1): 'nota.xml',
+                                                                       chave_cte(2): 'nota (1).xml'}
+    assert _extrair(destino, [chave_cte(1), chave_cte(2)]) == {chave_cte(1): cte_xml(1, recebedor=CNPJ),
+                                                               chave_cte(2): cte_xml(2, recebedor=CNPJ)}
+
+def test_compactacao_com_pastas_mantidas_e_depois_apagadas(tmp_path, gerar_ctes):
+    origem, destino = str(tmp_path / 'origem'), str(tmp_path / 'destino')
+    gerar_ctes(origem, range(3), recebedor=CNPJ)
+    separador = SeparadorCte(origem, destino, tag_cnpj='receb', particao='lote')
+    try:
+        separador.separar()
+    finally:
+        separador.fechar()
+    lote = os.path.join(destino, CNPJ, 'lote_1')
+    compactar_lote(lote, manter_pastas=True)
+    # Já estão no ZIP: nada é gravado, mas o catálogo passa a apontar os membros
+    lote_path, _, gravados, membros = compactar_lote(lote)
+    assert gravados == 0
+    atualizar_compactados(destino, [(lote_path, membros)])
+
+    catalogo = CatalogoCte(destino)
+    try:
+        locais = list(catalogo.consultar(cnpj=CNPJ))
+    finally:
+        catalogo.fechar()
+    assert sorted((os.path.basename(local.caminho), local.membro) for local in locais) == [
+        ('lote_1.zip', f"cte_{numero}.xml") for numero in range(3)]
+    assert _extrair(destino, [chave_cte(numero) for numero in range(3)]) == {
+        chave_cte(numero): cte_xml(numero, recebedor=CNPJ) for numero in range(3)}
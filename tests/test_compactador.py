@@ -0,0 +1,45 @@
+import os
+import zipfile
+
+from compactador_cte import compactar_lote, CRIADO, ATUALIZADO, SEM_ALTERACAO
+from conftest import cte_xml
+
+def _gravar(pasta, nome, conteudo):
+    os.makedirs(pasta, exist_ok=True)
+    with open(os.path.join(pasta, nome), 'w', encoding='utf-8') as f:
+        f.write(conteudo)
+
+def _membros(caminho_zip):
+    with zipfile.ZipFile(caminho_zip) as z:
+        assert z.testzip() is None
+        return {nome: z.read(nome).decode('utf-8') for nome in z.namelist()}
+
+def test_mesmo_nome_e_tamanho_com_outro_conteudo_entra_renomeado(tmp_path):
+    lote = str(tmp_path / '1' / 'lote_1')
+    # Dois CT-es diferentes com o mesmo nome e o mesmo tamanho, em execuções seguidas
+    primeiro, segundo = cte_xml(1), cte_xml(2)
+    assert len(primeiro) == len(segundo)
+    _gravar(lote, 'nota.xml', primeiro)
+    assert compactar_lote(lote)[1:3] == (CRIADO, 1)
+    _gravar(lote, 'nota.xml', segundo)
+    os.utime(os.path.join(lote, 'nota.xml'), (0, os.path.getmtime(f"{lote}.zip")))
+
+    assert compactar_lote(lote)[1:3] == (ATUALIZADO, 1)
+    assert _membros(f"{lote}.zip") == {'nota.xml': primeiro, 'nota (1).xml': segundo}
+    assert not os.path.exists(lote)
+
+def test_lote_ja_compactado_nao_regrava_o_zip(tmp_path):
+    lote = str(tmp_path / '1' / 'lote_1')
+    for numero in range(3):
+        _gravar(lote, f"cte_{numero}.xml", cte_xml(numero))
+    compactar_lote(lote, manter_pastas=True)
+    # Nome novo entra mesmo com o conteúdo de um membro; o mesmo conteúdo regravado não
+    _gravar(lote, 'copia.xml', cte_xml(1))
+    assert compactar_lote(lote, manter_pastas=True)[1:3] == (ATUALIZADO, 1)
+    _gravar(lote, 'cte_0.xml', cte_xml(0))
+    modificado = os.stat(f"{lote}.zip").st_mtime_ns
+
+    assert compactar_lote(lote, manter_pastas=True)[1:3] == (SEM_ALTERACAO, 0)
+    assert os.stat(f"{lote}.zip").st_mtime_ns == modificado
+    assert sorted(_membros(f"{lote}.zip")) == ['copia.xml', 'cte_0.xml', 'cte_1.xml', 'cte_2.xml']
+    assert not os.path.exists(f"{lote}.zip.parcial")
@@ -0,0 +1,63 @@
+import os
+import shutil
+import zipfile
+
+import destino_cte
+from conftest import cte_xml
+from particoes_cte import particao_data
+from separacao_cte import SeparadorCte
+
+CNPJ = '12345678000190'
+DATAS = ('2025-08-01', '2025-09-01')
+
+def _separar(origem, destino):
+    separador = SeparadorCte(origem, destino, direto_zip=True, zips_abertos=1)
+    try:
+        return separador.separar()
+    finally:
+        separador.fechar()
+
+def _membros(caminho_zip):
+    with zipfile.ZipFile(caminho_zip) as z:
+        assert z.testzip() is None
+        return sorted(z.namelist())
+
+def test_zip_suspenso_e_reaberto_recebe_todos_os_membros(tmp_path, gerar_ctes, monkeypatch):
+    origem, destino = str(tmp_path / 'origem'), str(tmp_path / 'destino')
+    # Entradas alternando entre duas partições com um só ZIP aberto: cada troca suspende o outro
+    for numero in range(12):
+        gerar_ctes(origem, [numero], data=DATAS[numero % 2])
+    zips = [os.path.join(destino, CNPJ, f"{particao_data(data)}.zip") for data in DATAS]
+    # ZIP de uma execução anterior: copiado para o .parcial uma única vez, não a cada reabertura
+    os.makedirs(os.path.dirname(zips[0]))
+    with zipfile.ZipFile(zips[0], 'w') as z:
+        z.writestr('anterior.xml', cte_xml(99, data=DATAS[0]))
+    copias = []
+    copiar = shutil.copyfile
+
+    def copyfile(origem_copia, destino_copia, *args, **kwargs):
+        copias.append(origem_copia)
+        return copiar(origem_copia, destino_copia, *args, **kwargs)
+
+    monkeypatch.setattr(destino_cte.shutil, 'copyfile', copyfile)
+    resultado = _separar(origem, destino)
+
+    assert resultado.processados == 12
+    assert copias == [zips[0]]
+    assert _membros(zips[0]) == sorted(['anterior.xml'] + [f"cte_{n}.xml" for n in range(0, 12, 2)])
+    assert _membros(zips[1]) == sorted(f"cte_{n}.xml" for n in range(1, 12, 2))
+    assert not [nome for nome in os.listdir(os.path.join(destino, CNPJ)) if nome.endswith('.parcial')]
+    assert not os.listdir(origem)
+
+def test_zip_da_execucao_anterior_recebe_os_novos(tmp_path, gerar_ctes):
+    origem, destino = str(tmp_path / 'origem'), str(tmp_path / 'destino')
+    gerar_ctes(origem, range(3), data=DATAS[0])
+    _separar(origem, destino)
+    gerar_ctes(origem, range(3, 5), data=DATAS[0])
+    # Cópia idêntica de um CT-e já gravado: descartada, sem repetir o membro
+    gerar_ctes(os.path.join(origem, 'sub'), [1], data=DATAS[0])
+    resultado = _separar(origem, destino)
+
+    assert (resultado.processados, resultado.identicos) == (3, 1)
+    caminho_zip = os.path.join(destino, CNPJ, f"{particao_data(DATAS[0])}.zip")
+    assert _membros(caminho_zip) == [f"cte_{n}.xml" for n in range(5)]
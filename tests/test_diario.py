@@ -0,0 +1,110 @@
+import os
+import shutil
+import zipfile
+
+import pytest
+
+import destino_cte
+from diario_cte import DiarioExecucao
+from entrada_cte import ArquivoXml
+from particoes_cte import AlocadorLotes
+from conftest import cte_xml
+from separacao_cte import SeparadorCte
+
+class Interrupcao(BaseException):
+    """Simula o processo morto no meio da separação (não é tratada como erro da entrada)"""
+
+def test_retomada_conta_nos_lotes_so_as_colocadas(tmp_path, gerar_ctes):
+    caminhos = gerar_ctes(str(tmp_path / 'origem'), range(4))
+    destino = str(tmp_path / 'destino')
+    os.makedirs(destino)
+    diario = DiarioExecucao(destino)
+    colocada, identica, movida, pendente = (diario.planejar(ArquivoXml(c), '1', 'lote_1') for c in caminhos)
+    diario.concluir(colocada)
+    diario.nao_colocada(identica)
+    diario.concluir(identica)
+    # Em andamento na interrupção, mas já fora da origem: conta como colocada
+    os.remove(caminhos[movida])
+
+    retomado = DiarioExecucao(destino)
+    assert retomado.retomada
+    assert retomado.contadores_cnpj == {'1': 2}
+    assert retomado.concluidas_antes == 3
+    assert [entrada.caminho for _, _, entrada in retomado.movidas_na_interrupcao] == [caminhos[movida]]
+    alocador = AlocadorLotes(destino, max_arquivos=3)
+    alocador.retomar(retomado.contadores_cnpj)
+    assert [alocador.alocar('1') for _ in range(3)] == ['lote_1', 'lote_2', 'lote_2']
+
+def _lotes(destino):
+    return {(cnpj, lote): len(os.listdir(os.path.join(destino, cnpj, lote)))
+            for cnpj in os.listdir(destino) if cnpj.isdigit()
+            for lote in os.listdir(os.path.join(destino, cnpj))}
+
+def _separar(origem, destino):
+    separador = SeparadorCte(origem, destino, tag_cnpj='receb', particao='lote', max_arquivos_lote=3)
+    try:
+        return separador.separar()
+    finally:
+        separador.fechar()
+
+@pytest.mark.parametrize('interromper_apos', [2, 5, 9])
+def test_retomada_preenche_lotes_como_execucao_completa(tmp_path, gerar_ctes, monkeypatch, interromper_apos):
+    modelo = str(tmp_path / 'modelo')
+    gerar_ctes(modelo, range(10), recebedor='33333333000133')
+    gerar_ctes(modelo, range(10, 14), recebedor='44444444000144')
+    # Cópias idênticas com outro nome: vão para duplicados e não ocupam lugar no lote
+    for numero in (1, 4, 11):
+        shutil.copy(os.path.join(modelo, f"cte_{numero}.xml"), os.path.join(modelo, f"copia_{numero}.xml"))
+
+    shutil.copytree(modelo, str(tmp_path / 'origem_completa'))
+    completa = str(tmp_path / 'completa')
+    _separar(str(tmp_path / 'origem_completa'), completa)
+
+    origem, destino = str(tmp_path / 'origem'), str(tmp_path / 'destino')
+    shutil.copytree(modelo, origem)
+    colocar = destino_cte.DestinoPastas.colocar
+    chamadas = []
+
+    def colocar_e_interromper(self, *args, **kwargs):
+        chamadas.append(1)
+        if len(chamadas) > interromper_apos:
+            raise Interrupcao()
+        return colocar(self, *args, **kwargs)
+
+    monkeypatch.setattr(destino_cte.DestinoPastas, 'colocar', colocar_e_interromper)
+    with pytest.raises(Interrupcao):
+        SeparadorCte(origem, destino, tag_cnpj='receb', particao='lote', max_arquivos_lote=3).separar()
+    monkeypatch.undo()
+    assert os.path.exists(os.path.join(destino, '0.diario_execucao.log'))
+
+    _separar(origem, destino)
+    assert _lotes(completa) == {('33333333000133', 'lote_1'): 3, ('33333333000133', 'lote_2'): 3,
+                                ('33333333000133', 'lote_3'): 3, ('33333333000133', 'lote_4'): 1,
+                                ('44444444000144', 'lote_1'): 3, ('44444444000144', 'lote_2'): 1}
+    assert _lotes(destino) == _lotes(completa)
+    assert not os.path.exists(os.path.join(destino, '0.diario_execucao.log'))
+
+def test_estado_retomado_nao_vale_para_as_chamadas_seguintes(tmp_path):
+    origem, destino = str(tmp_path / 'origem'), str(tmp_path / 'destino')
+    os.makedirs(origem)
+    os.makedirs(destino)
+    caminho_zip = os.path.join(origem, 'download.zip')
+    with zipfile.ZipFile(caminho_zip, 'w') as z:
+        z.writestr('cte_1.xml', cte_xml(1))
+    # Execução interrompida depois de concluir o membro cte_1.xml do download.zip
+    with open(os.path.join(destino, '0.diario_execucao.log'), 'w', encoding='utf-8') as f:
+        f.write(f"F\t{caminho_zip}\tcte_1.xml\n")
+
+    separador = SeparadorCte(origem, destino)
+    try:
+        primeira = separador.separar()
+        assert (primeira.processados, primeira.zips_removidos) == (0, 1)
+        # Outro download com o mesmo nome de ZIP e de membro: é um CT-e novo
+        with zipfile.ZipFile(caminho_zip, 'w') as z:
+            z.writestr('cte_1.xml', cte_xml(2))
+        segunda = separador.separar()
+    finally:
+        separador.fechar()
+
+    assert (segunda.processados, segunda.zips_removidos) == (1, 1)
+    assert not separador.diario.retomada
@@ -0,0 +1,69 @@
+import os
+
+from conftest import chave_cte, cte_xml
+from duplicados_cte import ControleDuplicados, NomeadorDuplicados, COLOCADO, SUBSTITUIDO, IDENTICO, DIVERGENTE
+from entrada_cte import ArquivoXml
+
+def _gravar(pasta, nome, conteudo):
+    os.makedirs(pasta, exist_ok=True)
+    caminho = os.path.join(pasta, nome)
+    with open(caminho, 'w', encoding='utf-8') as f:
+        f.write(conteudo)
+    return ArquivoXml(caminho)
+
+def _ler(caminho):
+    with open(caminho, encoding='utf-8') as f:
+        return f.read()
+
+def test_nomeador_continua_a_numeracao_da_pasta(tmp_path):
+    duplicados = str(tmp_path / 'duplicados')
+    for nome in ('cte_1 (1).xml', 'cte_1 (3).xml', 'cte_2 (5).txt', 'cte_3.xml'):
+        _gravar(duplicados, nome, '')
+    nomeador = NomeadorDuplicados(duplicados)
+
+    assert nomeador.proximo_caminho('cte_1.xml') == os.path.join(duplicados, 'cte_1 (4).xml')
+    assert nomeador.proximo_caminho('cte_1.xml') == os.path.join(duplicados, 'cte_1 (5).xml')
+    assert nomeador.proximo_caminho('cte_2.xml') == os.path.join(duplicados, 'cte_2 (1).xml')
+    assert nomeador.proximo_caminho('cte_3.xml') == os.path.join(duplicados, 'cte_3 (1).xml')
+
+def test_mesma_chave_decide_pelo_conteudo(tmp_path):
+    origem, destino, duplicados = (str(tmp_path / nome) for nome in ('origem', 'destino', 'duplicados'))
+    os.makedirs(destino)
+    os.makedirs(duplicados)
+    controle = ControleDuplicados(duplicados)
+    chave = chave_cte(1)
+    primeiro = _gravar(origem, 'cte_1.xml', cte_xml(1))
+    assert controle.colocar(primeiro, os.path.join(destino, 'cte_1.xml'), chave) == COLOCADO
+
+    # Mesma chave com outro nome: o conteúdo decide entre descartar e mandar para duplicados
+    copia = _gravar(os.path.join(origem, 'a'), 'baixado.xml', cte_xml(1))
+    assert controle.colocar(copia, os.path.join(destino, 'baixado.xml'), chave) == IDENTICO
+    alterado = _gravar(os.path.join(origem, 'b'), 'baixado.xml', cte_xml(1, nome='Outro'))
+    assert controle.colocar(alterado, os.path.join(destino, 'baixado.xml'), chave) == DIVERGENTE
+
+    assert os.listdir(destino) == ['cte_1.xml']
+    assert _ler(os.path.join(duplicados, 'baixado (1).xml')) == cte_xml(1, nome='Outro')
+    assert controle.divergencias == [(chave, os.path.join(destino, 'cte_1.xml'),
+                                      os.path.join(duplicados, 'baixado (1).xml'))]
+    assert not [f for _, _, arquivos in os.walk(origem) for f in arquivos]
+    caminho_indice = controle.gravar_divergencias()
+    assert chave in _ler(caminho_indice)
+
+def test_mesmo_nome_no_destino_decide_pelo_conteudo(tmp_path):
+    origem, destino, duplicados = (str(tmp_path / nome) for nome in ('origem', 'destino', 'duplicados'))
+    # Arquivos de uma execução anterior: um igual ao que chega, outro com o mesmo nome e outro CT-e
+    _gravar(destino, 'cte_1.xml', cte_xml(1))
+    _gravar(destino, 'cte_2.xml', cte_xml(20))
+    os.makedirs(duplicados)
+    controle = ControleDuplicados(duplicados)
+
+    igual = _gravar(origem, 'cte_1.xml', cte_xml(1))
+    assert controle.colocar(igual, os.path.join(destino, 'cte_1.xml'), chave_cte(1)) == IDENTICO
+    novo = _gravar(origem, 'cte_2.xml', cte_xml(2))
+    assert controle.colocar(novo, os.path.join(destino, 'cte_2.xml'), chave_cte(2)) == SUBSTITUIDO
+
+    assert _ler(os.path.join(destino, 'cte_2.xml')) == cte_xml(2)
+    assert os.listdir(duplicados) == ['cte_2 (1).xml']
+    assert _ler(os.path.join(duplicados, 'cte_2 (1).xml')) == cte_xml(20)
+    assert not os.listdir(origem)
+    assert controle.divergencias == []
@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+from conftest import cte_xml
+from erros_cte import ARQUIVO_INDICE_ERROS
+from extrator_cte import identificar_documento
+from separacao_cte import SeparadorCte
+
+@pytest.mark.parametrize('cabeca, tipo', [
+    (b'<?xml version="1.0"?>\n<cteProc xmlns="x"><CTe><infCte><ide><mod>57</mod>', 'cte'),
+    (b'\xef\xbb\xbf<!-- baixado --><!DOCTYPE a><cteProc><CTe><infCte><ide><mod>67</mod>', 'cte_os'),
+    (b'<cteOSProc versao="4.00">', 'cte_os'),
+    (b'<procEventoCTe versao="4.00">', 'evento'),
+    (b'<ns:nfeProc xmlns:ns="http://www.portalfiscal.inf.br/nfe">', 'nfe'),
+    (b'<mdfeProc>', 'outro'),
+    (b'<planilha>', None),
+    (b'<?xml version="1.0"', None),
+])
+def test_tipo_pelo_elemento_raiz(cabeca, tipo):
+    assert identificar_documento(cabeca) == tipo
+
+def test_documentos_recusados_vao_para_a_subpasta_do_tipo(tmp_path, gerar_ctes):
+    origem, destino = str(tmp_path / 'origem'), str(tmp_path / 'destino')
+    gerar_ctes(origem, [1])
+    documentos = {
+        'evento.xml': cte_xml(2).replace('cteProc', 'procEventoCTe'),
+        'os.xml': cte_xml(3).replace('cteProc', 'cteOSProc'),
+        'modelo_67.xml': cte_xml(4).replace('<mod>57</mod>', '<mod>67</mod>'),
+        'nfe.xml': cte_xml(5).replace('cteProc', 'nfeProc'),
+        'cpf.xml': cte_xml(6).replace('<emit><CNPJ>12345678000190</CNPJ>', '<emit><CPF>12345678901</CPF>'),
+        'truncado.xml': cte_xml(7)[:-40],
+        'vazio.xml': '',
+    }
+    for nome, conteudo in documentos.items():
+        with open(os.path.join(origem, nome), 'w', encoding='utf-8') as f:
+            f.write(conteudo)
+    separador = SeparadorCte(origem, destino)
+    try:
+        resultado = separador.separar()
+    finally:
+        separador.fechar()
+
+    erros = os.path.join(destino, '0.Erros')
+    assert (resultado.processados, resultado.erros) == (1, len(documentos))
+    assert dict(resultado.erros_por_motivo) == {'evento': 1, 'cte_os': 2, 'nfe': 1, 'cpf': 1, 'invalido': 2}
+    assert sorted(os.listdir(os.path.join(erros, 'Eventos'))) == ['evento.xml']
+    assert sorted(os.listdir(os.path.join(erros, 'CT-e OS'))) == ['modelo_67.xml', 'os.xml']
+    assert sorted(os.listdir(os.path.join(erros, 'NF-e'))) == ['nfe.xml']
+    assert sorted(os.listdir(os.path.join(erros, 'CPF'))) == ['cpf.xml']
+    for nome in ('truncado.xml', 'vazio.xml'):
+        assert os.path.isfile(os.path.join(erros, nome))
+    with open(os.path.join(erros, ARQUIVO_INDICE_ERROS), encoding='utf-8') as f:
+        motivos = sorted(linha.split('\t')[1] for linha in f)
+    assert motivos == ['cpf', 'cte_os', 'cte_os', 'evento', 'invalido', 'invalido', 'nfe']
+    assert not os.listdir(origem)
@@ -0,0 +1,93 @@
+import os
+from xml.etree import ElementTree as ET
+
+import pytest
+
+from conftest import chave_cte, cte_xml
+from extrator_cte import (extrair_registro, extrair_registro_rapido, varrer_registro, DocumentoRecusado,
+                         TAMANHO_CAUDA, TAMANHO_LEITURA)
+
+ASSINATURA = ('<Signature xmlns="http://www.w3.org/2000/09/xmldsig#"><SignatureValue>'
+              + 'A' * (4 * TAMANHO_LEITURA) + '</SignatureValue></Signature>')
+
+def _assinado(numero, **kwargs):
+    """CT-e com a assinatura depois do infCte: os campos usados ficam bem antes do fim do arquivo"""
+    return cte_xml(numero, **kwargs).replace('</infCte></CTe>', f'</infCte>{ASSINATURA}</CTe>').encode('utf-8')
+
+def _gravar(pasta, nome, dados):
+    caminho = os.path.join(pasta, nome)
+    with open(caminho, 'wb') as f:
+        f.write(dados)
+    return caminho
+
+def test_le_os_campos_do_grupo_pedido(tmp_path):
+    dados = _assinado(7, recebedor='44444444000144', data='2025-09-03')
+    caminho = _gravar(str(tmp_path), 'cte_7.xml', dados)
+
+    registro = extrair_registro(caminho, 'emit')
+    assert registro[:4] == ('12345678000190', '2025-09-03', chave_cte(7, data='2025-09-03'), len(dados))
+    assert extrair_registro(caminho, 'receb').cnpj == '44444444000144'
+    assert extrair_registro('membro.xml', 'emit', dados) == registro
+
+@pytest.mark.parametrize('corte', [TAMANHO_CAUDA // 2, 2 * TAMANHO_CAUDA, 2 * TAMANHO_LEITURA])
+def test_xml_truncado_depois_dos_campos_e_recusado(tmp_path, corte):
+    dados = _assinado(1)[:-corte]
+    caminho = _gravar(str(tmp_path), 'cte_1.xml', dados)
+
+    with pytest.raises(ET.ParseError):
+        extrair_registro(caminho, 'emit')
+    with pytest.raises(ET.ParseError):
+        extrair_registro('membro.xml', 'emit', dados)
+
+def test_lixo_depois_da_raiz_e_recusado(tmp_path):
+    caminho = _gravar(str(tmp_path), 'cte_1.xml', _assinado(1) + b'<outro/>')
+
+    with pytest.raises(ET.ParseError):
+        extrair_registro(caminho, 'emit')
+
+def test_cpf_no_grupo_e_recusado(tmp_path):
+    dados = _assinado(1).replace(b'<rem><CNPJ>11111111000111</CNPJ>', b'<rem><CPF>12345678901</CPF>')
+
+    with pytest.raises(DocumentoRecusado) as erro:
+        extrair_registro('cte_1.xml', 'rem', dados)
+    assert erro.value.motivo == 'cpf'
+
+@pytest.mark.parametrize('tag', ['emit', 'rem', 'receb', 'dest'])
+def test_varredura_igual_ao_parser(tmp_path, tag):
+    for numero, dados in enumerate([cte_xml(1).encode('utf-8'), _assinado(2, data='2024-12-31'),
+                                    ('\ufeff' + cte_xml(3, nome='Transportes Á')).encode('utf-8')]):
+        caminho = _gravar(str(tmp_path), f"cte_{numero}.xml", dados)
+
+        registro = varrer_registro(caminho, tag)
+        assert registro is not None
+        assert registro == extrair_registro(caminho, tag)
+        assert varrer_registro('membro.xml', tag, dados) == registro
+        assert extrair_registro_rapido(caminho, tag, conferir=True) == (registro, 'varredura')
+
+@pytest.mark.parametrize('troca', [
+    ('<cteProc xmlns=', '<!-- baixado do portal --><cteProc xmlns='),
+    ('<xNome>E</xNome>', '<xNome><![CDATA[E & F]]></xNome>'),
+    ('<emit><CNPJ>', '<emit xmlns:x="urn:x"><CNPJ>'),
+    ('<dhEmi>', '<dhEmi> '),
+])
+def test_varredura_inconclusiva_recorre_ao_parser(tmp_path, troca):
+    caminho = _gravar(str(tmp_path), 'cte_1.xml', cte_xml(1).replace(*troca).encode('utf-8'))
+
+    assert varrer_registro(caminho, 'emit') is None
+    registro, origem = extrair_registro_rapido(caminho, 'emit')
+    assert origem == 'parser'
+    assert registro == extrair_registro(caminho, 'emit')
+
+def test_varredura_de_xml_truncado_recorre_ao_parser(tmp_path):
+    caminho = _gravar(str(tmp_path), 'cte_1.xml', _assinado(1)[:-2 * TAMANHO_CAUDA])
+
+    assert varrer_registro(caminho, 'emit') is None
+    with pytest.raises(ET.ParseError):
+        extrair_registro_rapido(caminho, 'emit')
+
+def test_varredura_recusa_outro_documento(tmp_path):
+    caminho = _gravar(str(tmp_path), 'evento.xml', cte_xml(1).replace('cteProc', 'procEventoCTe').encode('utf-8'))
+
+    with pytest.raises(DocumentoRecusado) as erro:
+        varrer_registro(caminho, 'emit')
+    assert erro.value.motivo == 'evento'
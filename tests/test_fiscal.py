@@ -0,0 +1,88 @@
+import csv
+import os
+
+import pytest
+
+from conftest import chave_cte, cte_xml
+from fiscal_cte import ExportacaoFiscal, interpretar_campos, CAMPOS_PADRAO, COLUNAS_FIXAS
+from separacao_cte import SeparadorCte
+
+CHAVES_NFE = ('35250811111111000111550010000000011000000011', '35250811111111000111550010000000021000000021')
+
+def _fiscal(numero, **kwargs):
+    """CT-e de cte_xml com CFOP, UFs, ICMS e NF-es, como nos XMLs reais"""
+    notas = ''.join(f'<infNFe><chave>{chave}</chave></infNFe>' for chave in CHAVES_NFE)
+    return (cte_xml(numero, **kwargs)
+            .replace('<mod>57</mod>', '<CFOP>5353</CFOP><mod>57</mod><modal>01</modal><UFIni>SP</UFIni>'
+                                      '<UFFim>MG</UFFim>')
+            .replace('</vPrest>', '</vPrest><imp><ICMS><ICMS00><CST>00</CST><vBC>100.00</vBC><pICMS>12.00</pICMS>'
+                                  '<vICMS>12.00</vICMS></ICMS00></ICMS></imp>')
+            .replace('</infCte>', f'<infCTeNorm><infDoc>{notas}</infDoc></infCTeNorm></infCte>'))
+
+def _linhas(caminho):
+    with open(caminho, encoding='utf-8-sig', newline='') as f:
+        return list(csv.reader(f, delimiter=';'))
+
+def test_interpretar_campos():
+    assert interpretar_campos('nCT, padrao,CFOP') == ('nCT',) + CAMPOS_PADRAO
+    with pytest.raises(ValueError):
+        interpretar_campos('nCT,valor')
+    with pytest.raises(ValueError):
+        interpretar_campos(' , ')
+
+def test_separacao_exporta_as_colunas_pedidas(tmp_path):
+    origem, destino = str(tmp_path / 'origem'), str(tmp_path / 'destino')
+    os.makedirs(origem)
+    with open(os.path.join(origem, 'cte_1.xml'), 'w', encoding='utf-8') as f:
+        f.write(_fiscal(1))
+    # Sem os grupos opcionais: as colunas ficam vazias
+    with open(os.path.join(origem, 'cte_2.xml'), 'w', encoding='utf-8') as f:
+        f.write(cte_xml(2))
+    campos = interpretar_campos('nCT,padrao')
+    separador = SeparadorCte(origem, destino, campos_fiscais=campos)
+    try:
+        resultado = separador.separar()
+    finally:
+        separador.fechar()
+
+    assert resultado.linhas_fiscais == 2
+    caminho_csv = resultado.caminhos_fiscais[0]
+    assert os.path.dirname(caminho_csv) == destino
+    linhas = _linhas(caminho_csv)
+    assert linhas[0] == list(COLUNAS_FIXAS + campos)
+    particao = '2025-08-01'
+    assert sorted(linhas[1:]) == [
+        [chave_cte(1), '12345678000190', '2025-08-01', particao, '1', '100.00', '5353', 'SP', 'MG', '01', '00',
+         '100.00', '12.00', '12.00', ';'.join(CHAVES_NFE)],
+        [chave_cte(2), '12345678000190', '2025-08-01', particao, '2', '100.00'] + [''] * 9,
+    ]
+
+class _Registro:
+    def __init__(self, numero, fiscal):
+        self.chave, self.data_emissao, self.fiscal = chave_cte(numero), '2025-08-01', fiscal
+
+def test_linhas_gravadas_em_lotes(tmp_path):
+    # Sem linhas, nenhum arquivo
+    assert ExportacaoFiscal(str(tmp_path), ('nCT',), parquet=False).fechar() == []
+    assert not os.listdir(tmp_path)
+    exportacao = ExportacaoFiscal(str(tmp_path), ('nCT',), lote=2, parquet=False)
+    for numero in range(3):
+        exportacao.registrar(_Registro(numero, (str(numero),)), '12345678000190', 'lote_1')
+    # Só o lote completo foi gravado; a terceira linha espera o fechamento
+    assert len(_linhas(exportacao.caminho_csv)) == 3
+
+    assert exportacao.fechar() == [exportacao.caminho_csv]
+    assert [linha[-1] for linha in _linhas(exportacao.caminho_csv)] == ['nCT', '0', '1', '2']
+
+def test_valores_em_decimal_no_parquet(tmp_path):
+    parquet = pytest.importorskip('pyarrow.parquet')
+    exportacao = ExportacaoFiscal(str(tmp_path), ('vTPrest', 'CFOP'))
+    exportacao.registrar(_Registro(1, ('100.5', '5353')), '12345678000190', '2025-08-01')
+    exportacao.registrar(_Registro(2, ('', '6353')), '12345678000190', '2025-08-01')
+
+    assert exportacao.fechar() == [exportacao.caminho_csv, exportacao.caminho_parquet]
+    tabela = parquet.read_table(exportacao.caminho_parquet)
+    assert str(tabela.schema.field('vTPrest').type) == 'decimal128(18, 4)'
+    assert [str(valor) if valor is not None else None for valor in tabela.column('vTPrest').to_pylist()] == \
+        ['100.5000', None]
+    assert tabela.column('CFOP').to_pylist() == ['5353', '6353']
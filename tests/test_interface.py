@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import interface_cte
+import separador_cte_emitente_linear as emitente
+from conftest import cte_xml
+from interface_cte import InterfaceNula, obter_interface, NAO
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class InterfaceConfirma(InterfaceNula):
+    """Responde Sim às confirmações e Não à escolha (compacta sem manter as pastas); guarda o que foi aberto"""
+
+    def __init__(self):
+        self.abertos = []
+
+    def confirmar(self, mensagem, titulo="Confirmação"):
+        return True
+
+    def escolher(self, mensagem, titulo="Opções"):
+        return NAO
+
+    def abrir(self, caminho):
+        self.abertos.append(caminho)
+
+def test_sem_terminal_a_interface_e_nula(monkeypatch):
+    monkeypatch.delenv(interface_cte.VARIAVEL_INTERFACE, raising=False)
+    monkeypatch.setattr(interface_cte.sys, 'platform', 'linux')
+    monkeypatch.setattr(interface_cte.sys, 'stdout', None)
+    interface = obter_interface()
+
+    assert interface.nome == 'nula'
+    assert not interface.confirmar("Compactar?")
+    with interface.barra(total=3) as barra:
+        barra.update(3)
+    assert barra.n == 3
+    monkeypatch.setenv(interface_cte.VARIAVEL_INTERFACE, 'console')
+    assert obter_interface().nome == 'console'
+    with pytest.raises(ValueError):
+        obter_interface('janela')
+
+def test_scripts_nao_importam_tqdm_nem_janelas():
+    codigo = ("import sys, separador_cte_emitente_linear, separador_cte_tomador_linear, separador_cte_visoes; "
+              "print(sorted({'tqdm', 'win32api', 'tkinter'} & set(sys.modules)))")
+    saida = subprocess.run([sys.executable, '-c', codigo], cwd=RAIZ, capture_output=True, text=True, check=True)
+    assert saida.stdout.strip() == '[]'
+
+def test_sem_xmls_compacta_os_lotes_e_abre_o_relatorio(tmp_path, monkeypatch):
+    origem, destino = str(tmp_path / '1.A Separar'), str(tmp_path / '0.Por CNPJ')
+    os.makedirs(origem)
+    lote = os.path.join(destino, '12345678000190', '2025-08-01')
+    os.makedirs(lote)
+    with open(os.path.join(lote, 'cte_1.xml'), 'w', encoding='utf-8') as f:
+        f.write(cte_xml(1))
+    monkeypatch.setattr(emitente, 'PASTA_ORIGEM', origem)
+    monkeypatch.setattr(emitente, 'PASTA_DESTINO', destino)
+    monkeypatch.setattr(emitente, 'PASTA_ERROS', os.path.join(destino, '0.Erros'))
+    monkeypatch.setattr(emitente, 'PASTA_DUPLICADOS', os.path.join(destino, '1.Duplicados'))
+    interface = InterfaceConfirma()
+
+    emitente.organizar_cte_por_emitente(interface=interface)
+
+    assert interface.abertos == [os.path.join(destino, '0.relatorio.txt')]
+    assert os.path.exists(f"{lote}.zip")
+    assert not os.path.exists(lote)
@@ -0,0 +1,60 @@
+import errno
+import os
+
+import movimentacao_cte
+from movimentacao_cte import MovimentadorArquivos, COPIA_KERNEL
+
+def _gravar(caminho, conteudo):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    with open(caminho, 'w', encoding='utf-8') as f:
+        f.write(conteudo)
+
+def _ler(caminho):
+    with open(caminho, encoding='utf-8') as f:
+        return f.read()
+
+def _volumes(movimentador, raiz):
+    """Cada pasta logo abaixo de raiz conta como um volume diferente"""
+    movimentador._dispositivo = lambda pasta: os.path.relpath(pasta, raiz).split(os.sep)[0]
+
+def test_destino_substituido_nao_e_apagado_pela_remocao_adiada(tmp_path):
+    raiz = str(tmp_path)
+    existente, duplicado = str(tmp_path / 'destino' / 'cte_1.xml'), str(tmp_path / 'duplicados' / 'cte_1.xml')
+    novo = str(tmp_path / 'origem' / 'cte_1.xml')
+    _gravar(existente, 'anterior')
+    _gravar(novo, 'novo')
+    os.makedirs(os.path.dirname(duplicado))
+    movimentador = MovimentadorArquivos()
+    _volumes(movimentador, raiz)
+
+    # O arquivo do destino vai para os duplicados (outro volume) e o novo ocupa o lugar dele
+    assert movimentador.mover(existente, duplicado) == COPIA_KERNEL
+    assert movimentador.mover(novo, existente) == COPIA_KERNEL
+    movimentador.descarregar()
+
+    assert (_ler(existente), _ler(duplicado)) == ('novo', 'anterior')
+    assert not os.path.exists(novo)
+
+def test_copy_file_range_recusado_nao_e_tentado_de_novo(tmp_path, monkeypatch):
+    if not hasattr(os, 'copy_file_range'):
+        return
+    chamadas = []
+
+    def copy_file_range(*args):
+        chamadas.append(args)
+        raise OSError(errno.EXDEV, "Cross-device link")
+
+    monkeypatch.setattr(movimentacao_cte.os, 'copy_file_range', copy_file_range)
+    monkeypatch.setattr(movimentacao_cte, 'BLOCO_COPIA', 4)
+    movimentador = MovimentadorArquivos()
+    _volumes(movimentador, str(tmp_path))
+    os.makedirs(tmp_path / 'destino')
+    for numero in range(3):
+        _gravar(str(tmp_path / 'origem' / f"{numero}.xml"), f"conteudo {numero}")
+        movimentador.mover(str(tmp_path / 'origem' / f"{numero}.xml"), str(tmp_path / 'destino' / f"{numero}.xml"))
+    movimentador.descarregar()
+
+    assert len(chamadas) == 1
+    assert [_ler(str(tmp_path / 'destino' / f"{numero}.xml")) for numero in range(3)] == \
+        [f"conteudo {numero}" for numero in range(3)]
+    assert not os.listdir(tmp_path / 'origem')
@@ -0,0 +1,47 @@
+import os
+
+from entrada_cte import ArquivoXml
+from paralelo_cte import ExtratorParalelo
+from separacao_cte import SeparadorCte
+
+def _extrair(entradas, processos):
+    extrator = ExtratorParalelo('emit', processos=processos, tamanho_bloco=3)
+    try:
+        return list(extrator.processar(iter(entradas)))
+    finally:
+        extrator.fechar()
+
+def _arvore(pasta):
+    return sorted(os.path.relpath(os.path.join(root, f), pasta) for root, _, arquivos in os.walk(pasta)
+                  for f in arquivos if f.endswith('.xml'))
+
+def test_processos_entregam_na_ordem_da_origem(tmp_path, gerar_ctes):
+    caminhos = gerar_ctes(str(tmp_path), range(10))
+    # Um XML ilegível no meio de um bloco: só ele falha
+    with open(caminhos[4], 'w', encoding='utf-8') as f:
+        f.write('<cteProc><CTe>')
+    entradas = [ArquivoXml(caminho) for caminho in caminhos]
+
+    resultados = _extrair(entradas, processos=2)
+
+    assert [entrada for entrada, _, _ in resultados] == entradas
+    assert [erro is not None for _, _, erro in resultados] == [numero == 4 for numero in range(10)]
+    assert resultados == _extrair(entradas, processos=1)
+
+def test_separacao_com_processos_igual_a_linear(tmp_path, gerar_ctes):
+    destinos = {}
+    for processos in (1, 2):
+        origem, destino = str(tmp_path / f"origem_{processos}"), str(tmp_path / f"destino_{processos}")
+        gerar_ctes(origem, range(7), data='2025-08-01')
+        gerar_ctes(origem, range(7, 12), emitente='98765432000110', data='2025-09-01')
+        separador = SeparadorCte(origem, destino, processos=processos, tamanho_bloco=2)
+        try:
+            resultado = separador.separar()
+        finally:
+            separador.fechar()
+        assert (resultado.processados, resultado.erros) == (12, 0)
+        assert not os.listdir(origem)
+        destinos[processos] = _arvore(destino)
+
+    assert destinos[1] == destinos[2]
+    assert len(destinos[2]) == 12
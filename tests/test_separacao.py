@@ -0,0 +1,44 @@
+import os
+import threading
+
+import pytest
+
+import destino_cte
+from separacao_cte import SeparadorCte
+
+class Interrupcao(BaseException):
+    """Falha no meio da chamada, com movimentações ainda nas threads de I/O"""
+
+def _threads_io():
+    return [thread for thread in threading.enumerate() if thread.name.startswith('io')]
+
+def test_descartar_caches_encerra_as_threads_de_io(tmp_path, gerar_ctes, monkeypatch):
+    origem, destino = str(tmp_path / 'origem'), str(tmp_path / 'destino')
+    gerar_ctes(origem, range(6))
+    colocar = destino_cte.DestinoPastas.colocar
+    chamadas = []
+
+    def colocar_e_falhar(self, *args, **kwargs):
+        chamadas.append(1)
+        if len(chamadas) > 3:
+            raise Interrupcao()
+        return colocar(self, *args, **kwargs)
+
+    separador = SeparadorCte(origem, destino, threads_io=2)
+    try:
+        monkeypatch.setattr(destino_cte.DestinoPastas, 'colocar', colocar_e_falhar)
+        with pytest.raises(Interrupcao):
+            separador.separar()
+        monkeypatch.undo()
+        assert _threads_io()
+
+        separador.descartar_caches()
+        assert not _threads_io()
+        assert separador.destino is None
+        resultado = separador.separar()
+    finally:
+        separador.fechar()
+
+    assert resultado.processados == 3
+    assert not os.listdir(origem)
+    assert not _threads_io()
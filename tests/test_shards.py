@@ -0,0 +1,67 @@
+import os
+import zipfile
+
+import separador_cte_emitente_linear as emitente
+from conftest import cte_xml
+from interface_cte import InterfaceNula
+from particoes_cte import ler_lotes, gravar_lotes
+from separacao_cte import SeparadorCte
+from shards_cte import Shard, mesclar_shards, shard_do_nome
+
+CNPJ = '33333333000133'
+
+def test_mescla_renumera_lotes_em_sequencia(tmp_path, gerar_ctes):
+    origem, destino = str(tmp_path / 'origem'), str(tmp_path / 'destino')
+    caminhos = gerar_ctes(origem, range(11), recebedor=CNPJ)
+    # Execução anterior parou no lote_5 do CNPJ: os shards continuam do lote_6
+    os.makedirs(destino)
+    gravar_lotes(os.path.join(destino, '0.lotes.txt'), {CNPJ: [5, 2, 0]})
+
+    for indice in (1, 2):
+        separador = SeparadorCte(origem, destino, tag_cnpj='receb', particao='lote', max_arquivos_lote=2,
+                                 shard=Shard(indice, 2))
+        try:
+            separador.separar()
+        finally:
+            separador.fechar()
+    # Lotes de cada shard intercalados: 6, 8, 10... no shard 1 e 7, 9, 11... no shard 2
+    numeros = []
+    for indice in (1, 2):
+        arquivos = sum(1 for c in caminhos if shard_do_nome(os.path.basename(c), 2) == indice)
+        numeros += [5 + indice + 2 * i for i in range((arquivos + 1) // 2)]
+    numeros.sort()
+    assert sorted(int(nome[5:]) for nome in os.listdir(os.path.join(destino, CNPJ))) == numeros
+
+    resultado = mesclar_shards(destino, 2, os.path.join(destino, '0.Erros'), os.path.join(destino, '1.Duplicados'),
+                               origem, os.path.join(destino, '0.relatorio.txt'))
+
+    lotes = len(numeros)
+    esperados = [f"lote_{numero}" for numero in range(6, 6 + lotes)]
+    assert sorted(os.listdir(os.path.join(destino, CNPJ)), key=lambda nome: int(nome[5:])) == esperados
+    arquivos = {nome for lote in esperados for nome in os.listdir(os.path.join(destino, CNPJ, lote))}
+    assert arquivos == {os.path.basename(c) for c in caminhos}
+    assert resultado.lotes_renumerados == sum(1 for novo, antigo in enumerate(numeros, 6) if novo != antigo)
+    ultimo = ler_lotes(os.path.join(destino, '0.lotes.txt'))[CNPJ]
+    assert ultimo[0] == 5 + lotes
+    assert ultimo[1] == len(os.listdir(os.path.join(destino, CNPJ, f"lote_{5 + lotes}")))
+    assert not [nome for nome in os.listdir(destino) if '.shard_' in nome and nome.startswith('0.lotes')]
+
+def test_zip_sem_membros_de_um_shard_e_apagado_na_mescla(tmp_path, monkeypatch):
+    origem, destino = str(tmp_path / '1.A Separar'), str(tmp_path / '0.Por CNPJ')
+    os.makedirs(origem)
+    # O único membro é do shard 1: o shard 2 não encontra nada para separar
+    numero = next(n for n in range(100) if shard_do_nome(f"cte_{n}.xml", 2) == 1)
+    with zipfile.ZipFile(os.path.join(origem, 'download.zip'), 'w') as z:
+        z.writestr(f"cte_{numero}.xml", cte_xml(numero))
+    monkeypatch.setattr(emitente, 'PASTA_ORIGEM', origem)
+    monkeypatch.setattr(emitente, 'PASTA_DESTINO', destino)
+    monkeypatch.setattr(emitente, 'PASTA_ERROS', os.path.join(destino, '0.Erros'))
+    monkeypatch.setattr(emitente, 'PASTA_DUPLICADOS', os.path.join(destino, '1.Duplicados'))
+
+    for indice in (1, 2):
+        emitente.organizar_cte_por_emitente(shard=Shard(indice, 2), interface=InterfaceNula())
+    resultado = mesclar_shards(destino, 2, os.path.join(destino, '0.Erros'), os.path.join(destino, '1.Duplicados'),
+                               origem, os.path.join(destino, '0.relatorio.txt'))
+
+    assert resultado.zips_removidos == 1
+    assert not os.listdir(origem)
@@ -0,0 +1,67 @@
+import os
+import zipfile
+
+from conftest import cte_xml
+import entrada_cte
+from entrada_cte import ZipsOrigem
+from separacao_cte import SeparadorCte
+
+def _zip(caminho, membros):
+    with zipfile.ZipFile(caminho, 'w') as z:
+        for nome, conteudo in membros.items():
+            z.writestr(nome, conteudo)
+
+def _origem(pasta):
+    os.makedirs(pasta)
+    _zip(os.path.join(pasta, 'so_xmls.zip'), {'a/cte_1.xml': cte_xml(1), 'a/cte_2.xml': cte_xml(2)})
+    _zip(os.path.join(pasta, 'pacote.zip'), {'cte_3.xml': cte_xml(3), 'dacte_3.pdf': b'%PDF-1.4'})
+    _zip(os.path.join(pasta, 'so_pdfs.zip'), {'dacte_4.pdf': b'%PDF-1.4'})
+
+def test_remove_so_zip_com_apenas_xmls(tmp_path):
+    origem = str(tmp_path / 'origem')
+    _origem(origem)
+    zips = ZipsOrigem()
+    entradas = list(zips.listar(origem))
+    assert sorted(e.nome for e in entradas) == ['cte_1.xml', 'cte_2.xml', 'cte_3.xml']
+    for entrada in entradas:
+        zips.concluir(entrada)
+
+    assert zips.remover_concluidos() == 1
+    assert sorted(os.listdir(origem)) == ['pacote.zip', 'so_pdfs.zip']
+
+def test_separacao_mantem_zip_com_outros_arquivos(tmp_path):
+    origem, destino = str(tmp_path / 'origem'), str(tmp_path / 'destino')
+    _origem(origem)
+    separador = SeparadorCte(origem, destino)
+    try:
+        resultado = separador.separar()
+    finally:
+        separador.fechar()
+
+    assert resultado.processados == 3
+    assert sorted(os.listdir(origem)) == ['pacote.zip', 'so_pdfs.zip']
+    with zipfile.ZipFile(os.path.join(origem, 'pacote.zip')) as z:
+        assert sorted(z.namelist()) == ['cte_3.xml', 'dacte_3.pdf']
+    colocados = [f for _, _, arquivos in os.walk(os.path.join(destino, '12345678000190')) for f in arquivos]
+    assert sorted(colocados) == ['cte_1.xml', 'cte_2.xml', 'cte_3.xml']
+
+def test_zip_que_nao_pode_ser_apagado_fica_pendente(tmp_path, monkeypatch):
+    origem, destino = str(tmp_path / 'origem'), str(tmp_path / 'destino')
+    _origem(origem)
+    remover = os.remove
+
+    def remover_bloqueado(caminho):
+        if caminho.endswith('.zip'):
+            raise PermissionError(13, "Arquivo em uso por outro processo", caminho)
+        remover(caminho)
+
+    monkeypatch.setattr(entrada_cte.os, 'remove', remover_bloqueado)
+    separador = SeparadorCte(origem, destino, processos=2, tamanho_bloco=1)
+    try:
+        resultado = separador.separar()
+    finally:
+        separador.fechar()
+
+    assert (resultado.processados, resultado.zips_removidos) == (3, 0)
+    assert os.path.join(origem, 'so_xmls.zip') in resultado.zips_pendentes
+    assert sorted(os.listdir(origem)) == ['pacote.zip', 'so_pdfs.zip', 'so_xmls.zip']
@@ -0,0 +1,275 @@
+import os
+import select
+import struct
+import threading
+import time
+
+# Silêncio (sem novos arquivos) que fecha um lote: arquivos que chegam juntos são separados juntos
+ESPERA_PADRAO = 1.0
+# Espera máxima por um lote com arquivos chegando sem parar
+ESPERA_MAXIMA = 5.0
+# Tempo sem mudar de tamanho nem de data para um arquivo ser considerado completo
+ESTABILIDADE_PADRAO = 2.0
+# Intervalo entre varreduras quando não há inotify (Windows, compartilhamentos de rede)
+INTERVALO_VARREDURA_PADRAO = 5.0
+# Arquivos (XMLs ou ZIPs) por lote no máximo; o restante fica para o lote seguinte
+LOTE_MAXIMO = 5000
+
+def _e_entrada(nome):
+    nome = nome.lower()
+    return nome.endswith('.xml') or nome.endswith('.zip')
+
+def _ignorado(caminho, pasta, ignorar):
+    """O caminho está dentro de uma pasta ignorada (em qualquer nível abaixo de pasta)?"""
+    partes = os.path.relpath(os.path.dirname(caminho), pasta).split(os.sep)
+    return any(parte in ignorar for parte in partes)
+
+def varrer_entradas(pasta, ignorar=()):
+    """Caminhos de todos os XMLs e ZIPs da pasta e subpastas, fora das pastas ignoradas"""
+    for root, dirs, files in os.walk(pasta):
+        dirs[:] = [d for d in dirs if d not in ignorar]
+        for f in files:
+            if _e_entrada(f):
+                yield os.path.join(root, f)
+
+class ObservadorVarredura:
+    """
+    Descobre as mudanças na pasta varrendo-a de tempos em tempos e comparando tamanho e data de cada
+    arquivo com a varredura anterior. Funciona em qualquer sistema e em compartilhamentos de rede,
+    onde o inotify não vê o que outras máquinas gravam.
+    """
+    modo = 'varredura'
+
+    def __init__(self, pasta, ignorar=()):
+        self.pasta = pasta
+        self.ignorar = ignorar
+        self.vistos = self._estado()
+
+    def _estado(self):
+        estado = {}
+        for caminho in varrer_entradas(self.pasta, self.ignorar):
+            try:
+                info = os.stat(caminho)
+            except FileNotFoundError:
+                continue
+            estado[caminho] = (info.st_size, info.st_mtime_ns)
+        return estado
+
+    def esperar(self, segundos):
+        """Espera e retorna os arquivos novos ou alterados desde a última chamada"""
+        time.sleep(segundos)
+        anterior, self.vistos = self.vistos, self._estado()
+        return [caminho for caminho, assinatura in self.vistos.items() if anterior.get(caminho) != assinatura]
+
+    def fechar(self):
+        pass
+
+# inotify do Linux (sys/inotify.h)
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_MASCARA = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+_EVENTO = struct.Struct('iIII')  # wd, mascara, cookie, tamanho do nome
+
+class ObservadorInotify:
+    """
+    Recebe do kernel (inotify, só Linux) os arquivos fechados após gravação, criados ou movidos para
+    a pasta e subpastas, sem varrer nada. Subpastas novas passam a ser observadas quando aparecem.
+    esperar retorna None se a fila do kernel transbordar (a pasta precisa ser varrida de novo).
+    """
+    modo = 'inotify'
+
+    def __init__(self, pasta, ignorar=()):
+        import ctypes
+        import ctypes.util
+        self.pasta = pasta
+        self.ignorar = ignorar
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._ctypes = ctypes
+        self.fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self.pastas = {}  # wd -> pasta observada
+        try:
+            self._observar_arvore(pasta)
+        except OSError:
+            self.fechar()
+            raise
+
+    def _observar(self, pasta):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(pasta), _MASCARA)
+        if wd < 0:
+            erro = self._ctypes.get_errno()
+            raise OSError(erro, f"inotify_add_watch: {os.strerror(erro)}", pasta)
+        self.pastas[wd] = pasta
+
+    def _observar_arvore(self, pasta):
+        """Observa a pasta e as subpastas; retorna os arquivos que já estavam nelas"""
+        arquivos = []
+        for root, dirs, files in os.walk(pasta):
+            dirs[:] = [d for d in dirs if d not in self.ignorar]
+            self._observar(root)
+            arquivos.extend(os.path.join(root, f) for f in files if _e_entrada(f))
+        return arquivos
+
+    def esperar(self, segundos):
+        """Espera até segundos por eventos; retorna os arquivos que mudaram (None: varrer tudo de novo)"""
+        if not select.select([self.fd], [], [], segundos)[0]:
+            return []
+        mudancas = []
+        transbordou = False
+        while True:
+            try:
+                dados = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            posicao = 0
+            while posicao < len(dados):
+                wd, mascara, _, tamanho = _EVENTO.unpack_from(dados, posicao)
+                nome = os.fsdecode(dados[posicao + _EVENTO.size:posicao + _EVENTO.size + tamanho].rstrip(b'\0'))
+                posicao += _EVENTO.size + tamanho
+                if mascara & _IN_Q_OVERFLOW:
+                    transbordou = True
+                elif mascara & _IN_IGNORED:
+                    self.pastas.pop(wd, None)  # Pasta apagada ou movida
+                elif wd in self.pastas:
+                    caminho = os.path.join(self.pastas[wd], nome)
+                    if not mascara & _IN_ISDIR:
+                        if _e_entrada(nome):
+                            mudancas.append(caminho)
+                    elif nome not in self.ignorar and mascara & (_IN_CREATE | _IN_MOVED_TO):
+                        # Arquivos gravados antes de a pasta nova ser observada vêm da varredura dela
+                        try:
+                            mudancas.extend(self._observar_arvore(caminho))
+                        except FileNotFoundError:
+                            pass
+        return None if transbordou else mudancas
+
+    def fechar(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+def criar_observador(pasta, ignorar=(), varredura=False):
+    """ObservadorInotify quando o sistema permite; senão (ou com varredura=True) ObservadorVarredura"""
+    if not varredura:
+        try:
+            return ObservadorInotify(pasta, ignorar)
+        except (OSError, AttributeError, TypeError):
+            pass  # Sem inotify (Windows, macOS) ou limite de pastas observadas atingido
+    return ObservadorVarredura(pasta, ignorar)
+
+class VigiaOrigem:
+    """
+    Acompanha a pasta de origem e entrega, em pequenos lotes, os XMLs e ZIPs que chegam nela:
+    - começa pelo que já está na pasta;
+    - eventos próximos são juntados no mesmo lote (debounce): o lote fecha depois de espera segundos
+      sem novidades, ou ESPERA_MAXIMA segundos com arquivos chegando sem parar;
+    - um arquivo só entra em um lote depois de estabilidade segundos sem mudar de tamanho nem de data
+      (gravação pela metade fica para o lote seguinte).
+    Os arquivos que ficam na origem depois de separados (ex.: ZIP com membro ilegível) só voltam a um lote
+    se mudarem.
+    """
+
+    def __init__(self, pasta, ignorar=(), espera=ESPERA_PADRAO, estabilidade=ESTABILIDADE_PADRAO,
+                 intervalo=INTERVALO_VARREDURA_PADRAO, varredura=False, lote_maximo=LOTE_MAXIMO):
+        """
+        :param intervalo: Espera quando não há nada pendente (na varredura, o intervalo entre duas varreduras)
+        :param varredura: Não usa inotify (ex.: pasta em compartilhamento gravada por outras máquinas)
+        """
+        self.pasta = pasta
+        self.ignorar = ignorar
+        self.espera = espera
+        self.estabilidade = estabilidade
+        self.intervalo = intervalo
+        self.lote_maximo = max(1, lote_maximo)
+        self.observador = criar_observador(pasta, ignorar, varredura)
+        self.candidatos = {}  # caminho -> (tamanho, data, visto em, chegada), ainda fora de um lote
+        self._parar = threading.Event()
+
+    @property
+    def modo(self):
+        return self.observador.modo
+
+    def lotes(self):
+        """Gera (caminhos, chegada) até parar(); chegada: time.monotonic() do primeiro arquivo do lote"""
+        self._registrar(varrer_entradas(self.pasta, self.ignorar))
+        while not self._parar.is_set():
+            caminhos, chegada = self._estaveis()
+            if caminhos:
+                yield caminhos, chegada
+                continue
+            limite = time.monotonic() + ESPERA_MAXIMA
+            mudancas = self._esperar(self.espera if self.candidatos else self.intervalo)
+            while mudancas and time.monotonic() < limite and not self._parar.is_set():
+                self._registrar(mudancas)
+                mudancas = self._esperar(self.espera)
+            self._registrar(mudancas)
+
+    def _esperar(self, segundos):
+        try:
+            mudancas = self.observador.esperar(segundos)
+        except OSError as e:
+            # Ex.: limite de pastas observadas pelo inotify atingido em uma subpasta nova
+            print(f"\nObservação por {self.observador.modo} falhou ({e}); seguindo por varredura")
+            self.observador.fechar()
+            self.observador = ObservadorVarredura(self.pasta, self.ignorar)
+            mudancas = None
+        if mudancas is None:
+            return list(varrer_entradas(self.pasta, self.ignorar))
+        return [caminho for caminho in mudancas if not _ignorado(caminho, self.pasta, self.ignorar)]
+
+    def _registrar(self, caminhos):
+        agora = time.monotonic()
+        for caminho in caminhos:
+            try:
+                info = os.stat(caminho)
+            except FileNotFoundError:
+                self.candidatos.pop(caminho, None)
+                continue
+            anterior = self.candidatos.get(caminho)
+            if anterior is None:
+                self.candidatos[caminho] = (info.st_size, info.st_mtime_ns, agora, agora)
+            elif anterior[:2] != (info.st_size, info.st_mtime_ns):
+                self.candidatos[caminho] = (info.st_size, info.st_mtime_ns, agora, anterior[3])
+
+    def _estaveis(self):
+        """Retira dos candidatos os arquivos completos (até lote_maximo); retorna (caminhos, chegada)"""
+        agora = time.monotonic()
+        agora_relogio = time.time()
+        caminhos = []
+        sumidos = []
+        chegada = None
+        # Sem copiar os candidatos: com a origem cheia na partida, cada lote só visita o começo deles
+        for caminho, (tamanho, data, visto, chegou) in self.candidatos.items():
+            try:
+                info = os.stat(caminho)
+            except FileNotFoundError:
+                sumidos.append(caminho)
+                continue
+            if (info.st_size, info.st_mtime_ns) != (tamanho, data):
+                self.candidatos[caminho] = (info.st_size, info.st_mtime_ns, agora, chegou)
+                continue
+            # Parado há estabilidade segundos: pela data do arquivo ou, se o relógio de quem gravou
+            # estiver adiantado (compartilhamento), desde que foi visto assim pela primeira vez
+            if agora_relogio - data / 1e9 < self.estabilidade and agora - visto < self.estabilidade:
+                continue
+            caminhos.append(caminho)
+            chegada = chegou if chegada is None else min(chegada, chegou)
+            if len(caminhos) >= self.lote_maximo:
+                break
+        for caminho in caminhos + sumidos:
+            del self.candidatos[caminho]
+        return caminhos, chegada
+
+    def parar(self):
+        """Encerra lotes() depois da espera em andamento"""
+        self._parar.set()
+
+    def fechar(self):
+        self.observador.fechar()